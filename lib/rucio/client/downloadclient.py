@@ -35,14 +35,18 @@ import random
 import shutil
 import signal
 import time
+from collections import OrderedDict
 
 try:
-    from Queue import Queue, Empty, deque
+    from Queue import Queue, deque
 except ImportError:
-    from queue import Queue, Empty, deque
-from threading import Thread
+    from queue import Queue, deque
+from threading import Condition, Thread
+
+from six.moves.urllib.parse import urlparse
 
 from rucio.client.client import Client
+from rucio.common.config import config_get_int
 from rucio.common.exception import (InputValidationError, NoFilesDownloaded, NotAllFilesDownloaded, RucioException)
 from rucio.common.didtype import DIDType
 from rucio.common.pcache import Pcache
@@ -118,6 +122,105 @@ class BaseExtractionTool:
         return False
 
 
+class DownloadScheduler(object):
+    """
+    Hands the items to download out to the download threads and limits the number
+    of concurrent transfers per storage host. An idle thread takes the next item
+    of any host with a free transfer slot, so that a slow storage only holds up
+    its own items and the number of threads is not bound to one storage.
+    """
+
+    def __init__(self, items, max_transfers_per_host):
+        """
+        :param items: list of dictionaries describing the items to download, with their sources
+        :param max_transfers_per_host: maximum number of concurrent transfers from the same host
+        """
+        self.max_transfers_per_host = max_transfers_per_host
+        self.condition = Condition()
+        self.queues = OrderedDict()
+        self.transfers = {}
+        self.slots = {}
+        self.downloaded_files = 0
+        self.downloaded_bytes = 0
+        self.start_time = time.time()
+        for item in items:
+            sources = item.get('sources')
+            self.queues.setdefault(self.source_host(sources[0]) if sources else None, deque()).append(item)
+
+    @staticmethod
+    def source_host(source):
+        """
+        :param source: dictionary with the pfn and the rse of a source
+        :returns: the host serving the source, the RSE name for local protocols
+        """
+        return urlparse(source['pfn']).hostname or source['rse']
+
+    def next_item(self):
+        """
+        Waits until the first source of one of the remaining items has a free
+        transfer slot, and gives the slot to the item.
+
+        :returns: the item, None if all the items were handed out
+        """
+        with self.condition:
+            while True:
+                hosts = [host for host, queue in self.queues.items() if queue]
+                if not hosts:
+                    return None
+                # items without sources do not transfer anything
+                free_hosts = [host for host in hosts if host is None or self.transfers.get(host, 0) < self.max_transfers_per_host]
+                if free_hosts:
+                    host = min(free_hosts, key=lambda host: self.transfers.get(host, 0))
+                    item = self.queues[host].popleft()
+                    if host is not None:
+                        self.transfers[host] = self.transfers.get(host, 0) + 1
+                        self.slots[id(item)] = host
+                    return item
+                self.condition.wait()
+
+    def use_host(self, item, host):
+        """
+        Moves the transfer slot of the item to the host of the next source to try,
+        waiting for a free slot on that host.
+
+        :param item: the item being downloaded
+        :param host: the host, as returned by source_host
+        """
+        with self.condition:
+            if self.slots.get(id(item)) == host:
+                return
+            self.__release(item)
+            while self.transfers.get(host, 0) >= self.max_transfers_per_host:
+                self.condition.wait()
+            self.transfers[host] = self.transfers.get(host, 0) + 1
+            self.slots[id(item)] = host
+
+    def finish(self, item):
+        """
+        Gives the transfer slot of a processed item back.
+
+        :param item: the item
+        """
+        with self.condition:
+            self.__release(item)
+
+    def __release(self, item):
+        host = self.slots.pop(id(item), None)
+        if host is not None:
+            self.transfers[host] -= 1
+            self.condition.notify_all()
+
+    def add_download(self, size):
+        """
+        Accounts a successful download for the throughput of the whole download.
+
+        :param size: the size of the file in bytes
+        """
+        with self.condition:
+            self.downloaded_files += 1
+            self.downloaded_bytes += size or 0
+
+
 class DownloadClient:
 
     def __init__(self, client=None, logger=None, tracing=True, check_admin=False, check_pcache=False):
@@ -354,24 +457,25 @@ class DownloadClient:
         logger = self.logger
 
         num_files = len(input_items)
-        nlimit = 5
+        nlimit = config_get_int('download', 'max_threads', raise_exception=False, default=100)
         num_threads = max(1, num_threads)
         num_threads = min(num_files, num_threads, nlimit)
 
-        input_queue = Queue()
+        max_transfers_per_host = config_get_int('download', 'max_transfers_per_host', raise_exception=False, default=5)
+        scheduler = DownloadScheduler(input_items, max_transfers_per_host)
         output_queue = Queue()
-        input_queue.queue = deque(input_items)
 
         if num_threads < 2:
             logger(logging.INFO, 'Using main thread to download %d file(s)' % num_files)
-            self._download_worker(input_queue, output_queue, trace_custom_fields, traces_copy_out, '')
+            self._download_worker(scheduler, output_queue, trace_custom_fields, traces_copy_out, '')
+            self._log_throughput(scheduler)
             return list(output_queue.queue)
 
-        logger(logging.INFO, 'Using %d threads to download %d files' % (num_threads, num_files))
+        logger(logging.INFO, 'Using %d threads to download %d files, with at most %d transfers per storage host' % (num_threads, num_files, max_transfers_per_host))
         threads = []
         for thread_num in range(0, num_threads):
             log_prefix = 'Thread %s/%s: ' % (thread_num, num_threads)
-            kwargs = {'input_queue': input_queue,
+            kwargs = {'scheduler': scheduler,
                       'output_queue': output_queue,
                       'trace_custom_fields': trace_custom_fields,
                       'traces_copy_out': traces_copy_out,
@@ -392,15 +496,16 @@ class DownloadClient:
             logger(logging.WARNING, 'You pressed Ctrl+C! Exiting gracefully')
             for thread in threads:
                 thread.kill_received = True
+        self._log_throughput(scheduler)
         return list(output_queue.queue)
 
-    def _download_worker(self, input_queue, output_queue, trace_custom_fields, traces_copy_out, log_prefix):
+    def _download_worker(self, scheduler, output_queue, trace_custom_fields, traces_copy_out, log_prefix):
         """
-        This function runs as long as there are items in the input queue,
+        This function runs as long as the scheduler has items to download,
         downloads them and stores the output in the output queue.
         (This function is meant to be used as class internal only)
 
-        :param input_queue: queue containing the input items to download
+        :param scheduler: DownloadScheduler handing out the items to download
         :param output_queue: queue where the output items will be stored
         :param trace_custom_fields: Custom key value pairs to send with the traces
         :param traces_copy_out: reference to an external list, where the traces should be uploaded
@@ -410,14 +515,13 @@ class DownloadClient:
 
         logger(logging.DEBUG, '%sStart processing queued downloads' % log_prefix)
         while True:
-            try:
-                item = input_queue.get_nowait()
-            except Empty:
+            item = scheduler.next_item()
+            if item is None:
                 break
             try:
                 trace = copy.deepcopy(self.trace_tpl)
                 trace.update(trace_custom_fields)
-                download_result = self._download_item(item, trace, traces_copy_out, log_prefix)
+                download_result = self._download_item(item, trace, traces_copy_out, log_prefix, scheduler=scheduler)
                 output_queue.put(download_result)
             except KeyboardInterrupt:
                 logger(logging.WARNING, 'You pressed Ctrl+C! Exiting gracefully')
@@ -426,6 +530,20 @@ class DownloadClient:
             except Exception as error:
                 logger(logging.ERROR, '%sFailed to download item' % log_prefix)
                 logger(logging.DEBUG, error)
+            finally:
+                scheduler.finish(item)
+
+    def _log_throughput(self, scheduler):
+        """
+        Logs the aggregate throughput of the downloads.
+        (This function is meant to be used as class internal only)
+
+        :param scheduler: DownloadScheduler which handed out the items
+        """
+        duration = round(time.time() - scheduler.start_time, 2)
+        if scheduler.downloaded_bytes and duration:
+            rate = round((scheduler.downloaded_bytes / duration) * 1e-6, 2)
+            self.logger(logging.INFO, 'Downloaded %d file(s), %s in %s seconds = %s MBps' % (scheduler.downloaded_files, sizefmt(scheduler.downloaded_bytes, self.is_human_readable), duration, rate))
 
     @staticmethod
     def _compute_actual_transfer_timeout(item):
@@ -457,7 +575,7 @@ class DownloadClient:
         timeout = bytes // transfer_speed_timeout + transfer_speed_timeout_static_increment
         return timeout
 
-    def _download_item(self, item, trace, traces_copy_out, log_prefix=''):
+    def _download_item(self, item, trace, traces_copy_out, log_prefix='', scheduler=None):
         """
         Downloads the given item and sends traces for success/failure.
         (This function is meant to be used as class internal only)
@@ -466,6 +584,7 @@ class DownloadClient:
         :param trace: dictionary representing a pattern of trace that will be send
         :param traces_copy_out: reference to an external list, where the traces should be uploaded
         :param log_prefix: string that will be put at the beginning of every log message
+        :param scheduler: Optional: DownloadScheduler limiting the concurrent transfers per storage host
 
         :returns: dictionary with all attributes from the input item and a clientState attribute
         """
@@ -587,6 +706,10 @@ class DownloadClient:
 
             logger(logging.INFO, '%sTrying to download with %s%s from %s: %s ' % (log_prefix, scheme, timeout_log_string, rse_name, did_str))
 
+            # wait for a free transfer slot on the storage host of this source
+            if scheduler:
+                scheduler.use_host(item, DownloadScheduler.source_host(source))
+
             try:
                 protocol = rsemgr.create_protocol(rse, operation='read', scheme=scheme, auth_token=self.auth_token, logger=logger)
                 protocol.connect()
@@ -631,9 +754,17 @@ class DownloadClient:
                 if not success:
                     logger(logging.WARNING, '%sDownload attempt failed. Try %s/%s' % (log_prefix, attempt, retries))
                     self._send_trace(trace)
+                    # a stalled transfer is not retried with the same PFN, the next source is tried instead
+                    if transfer_timeout and end_time - start_time >= transfer_timeout and i < len(sources):
+                        logger(logging.WARNING, '%sTransfer from %s stalled, trying the next source' % (log_prefix, rse_name))
+                        break
 
             protocol.close()
 
+        # the transfers are over, the slot can go to the next item
+        if scheduler:
+            scheduler.finish(item)
+
         if not success:
             logger(logging.ERROR, '%sFailed to download file %s' % (log_prefix, did_str))
             item['clientState'] = 'FAILED'
@@ -666,6 +797,8 @@ class DownloadClient:
 
         duration = round(end_time - start_time, 2)
         size = item.get('bytes')
+        if scheduler:
+            scheduler.add_download(size)
         size_str = sizefmt(size, self.is_human_readable)
         if size and duration:
             rate = round((size / duration) * 1e-6, 2)
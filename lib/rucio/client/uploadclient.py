@@ -48,6 +48,9 @@ import socket
 import logging
 import time
 import random
+import threading
+from multiprocessing import TimeoutError as PoolTimeoutError
+from multiprocessing.pool import ThreadPool
 
 from rucio.client.client import Client
 from rucio.common.config import config_get_int
@@ -55,11 +58,16 @@ from rucio.common.exception import (RucioException, RSEWriteBlocked, DataIdentif
                                     DataIdentifierNotFound, NoFilesUploaded, NotAllFilesUploaded, FileReplicaAlreadyExists,
                                     ResourceTemporaryUnavailable, ServiceUnavailable, InputValidationError, RSEChecksumUnavailable,
                                     ScopeNotFound)
-from rucio.common.utils import (adler32, detect_client_location, execute, generate_uuid, make_valid_did, md5, send_trace,
-                                retry, GLOBALLY_SUPPORTED_CHECKSUMS)
+from rucio.common.utils import (bulk_calculate_checksums, calculate_checksums, chunks, detect_client_location, execute, generate_uuid,
+                                make_valid_did, send_trace, retry, GLOBALLY_SUPPORTED_CHECKSUMS)
 from rucio.rse import rsemanager as rsemgr
 from rucio import version
 
+# Number of local files read in parallel for their checksums
+CHECKSUM_THREADS = 4
+# Maximum number of files registered with one call by the multithreaded upload
+REGISTRATION_BATCH_SIZE = 100
+
 
 class UploadClient:
 
@@ -85,6 +93,9 @@ class UploadClient:
         self.default_file_scope = 'user.' + self.client.account
         self.rses = {}
         self.rse_expressions = {}
+        self.rse_attributes = {}
+        # protocols kept open by the multithreaded upload, by (thread, rse, operation, scheme, domain)
+        self._protocols = None
 
         self.trace = {}
         self.trace['hostname'] = socket.getfqdn()
@@ -94,7 +105,7 @@ class UploadClient:
         self.trace['eventType'] = 'upload'
         self.trace['eventVersion'] = version.RUCIO_VERSION[0]
 
-    def upload(self, items, summary_file_path=None, traces_copy_out=None):
+    def upload(self, items, summary_file_path=None, traces_copy_out=None, num_threads=1):
         """
         :param items: List of dictionaries. Each dictionary describing a file to upload. Keys:
             path                  - path of the file that will be uploaded
@@ -112,6 +123,8 @@ class UploadClient:
             guid                  - Optional: guid of the file
         :param summary_file_path: Optional: a path where a summary in form of a json file will be stored
         :param traces_copy_out: reference to an external list, where the traces should be uploaded
+        :param num_threads: Optional: number of files uploaded in parallel. With more than one thread, the checksums
+                            of the next files are calculated during the transfers and the catalogue is updated in bulk
 
         :returns: 0 on success
 
@@ -130,7 +143,7 @@ class UploadClient:
         self.trace['uuid'] = generate_uuid()
 
         # check given sources, resolve dirs into files, and collect meta infos
-        files = self._collect_and_validate_file_info(items)
+        files = self._collect_and_validate_file_info(items, with_checksums=num_threads <= 1)
         logger(logging.DEBUG, 'Num. of files that upload client is processing: {}'.format(len(files)))
 
         # check if RSE of every file is available for writing
@@ -163,165 +176,16 @@ class UploadClient:
 
         # clear this set again to ensure that we only try to register datasets once
         registered_dataset_dids = set()
-        num_succeeded = 0
-        summary = []
-        for file in files:
-            basename = file['basename']
-            logger(logging.INFO, 'Preparing upload for file %s' % basename)
-
-            no_register = file.get('no_register')
-            register_after_upload = file.get('register_after_upload') and not no_register
-            pfn = file.get('pfn')
-            force_scheme = file.get('force_scheme')
-            delete_existing = False
-
-            trace = copy.deepcopy(self.trace)
-            # appending trace to list reference, if the reference exists
-            if traces_copy_out is not None:
-                traces_copy_out.append(trace)
-
-            rse = file['rse']
-            trace['scope'] = file['did_scope']
-            trace['datasetScope'] = file.get('dataset_scope', '')
-            trace['dataset'] = file.get('dataset_name', '')
-            trace['remoteSite'] = rse
-            trace['filesize'] = file['bytes']
-
-            file_did = {'scope': file['did_scope'], 'name': file['did_name']}
-            dataset_did_str = file.get('dataset_did_str')
-            rse_settings = self.rses[rse]
-            rse_sign_service = rse_settings.get('sign_url', None)
-            is_deterministic = rse_settings.get('deterministic', True)
-            if not is_deterministic and not pfn:
-                logger(logging.ERROR, 'PFN has to be defined for NON-DETERMINISTIC RSE.')
-                continue
-            if pfn and is_deterministic:
-                logger(logging.WARNING, 'Upload with given pfn implies that no_register is True, except non-deterministic RSEs')
-                no_register = True
-
-            # resolving local area networks
-            domain = 'wan'
-            rse_attributes = {}
-            try:
-                rse_attributes = self.client.list_rse_attributes(rse)
-            except:
-                logger(logging.WARNING, 'Attributes of the RSE: %s not available.' % rse)
-            if (self.client_location and 'lan' in rse_settings['domain'] and 'site' in rse_attributes):
-                if self.client_location['site'] == rse_attributes['site']:
-                    domain = 'lan'
-            logger(logging.DEBUG, '{} domain is used for the upload'.format(domain))
-
-            if not no_register and not register_after_upload:
-                self._register_file(file, registered_dataset_dids)
-            # if register_after_upload, file should be overwritten if it is not registered
-            # otherwise if file already exists on RSE we're done
-            if register_after_upload:
-                if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, auth_token=self.auth_token, logger=logger):
-                    try:
-                        self.client.get_did(file['did_scope'], file['did_name'])
-                        logger(logging.INFO, 'File already registered. Skipping upload.')
-                        trace['stateReason'] = 'File already exists'
-                        continue
-                    except DataIdentifierNotFound:
-                        logger(logging.INFO, 'File already exists on RSE. Previous left overs will be overwritten.')
-                        delete_existing = True
-            elif not is_deterministic and not no_register:
-                if rsemgr.exists(rse_settings, pfn, domain=domain, auth_token=self.auth_token, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE with given pfn. Skipping upload. Existing replica has to be removed first.')
-                    trace['stateReason'] = 'File already exists'
-                    continue
-                elif rsemgr.exists(rse_settings, file_did, domain=domain, auth_token=self.auth_token, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE with different pfn. Skipping upload.')
-                    trace['stateReason'] = 'File already exists'
-                    continue
-            else:
-                if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, auth_token=self.auth_token, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE. Skipping upload')
-                    trace['stateReason'] = 'File already exists'
-                    continue
-
-            # protocol handling and upload
-            protocols = rsemgr.get_protocols_ordered(rse_settings=rse_settings, operation='write', scheme=force_scheme, domain=domain)
-            protocols.reverse()
-            success = False
-            state_reason = ''
-            logger(logging.DEBUG, str(protocols))
-            while not success and len(protocols):
-                protocol = protocols.pop()
-                cur_scheme = protocol['scheme']
-                logger(logging.INFO, 'Trying upload with %s to %s' % (cur_scheme, rse))
-                lfn = {}
-                lfn['filename'] = basename
-                lfn['scope'] = file['did_scope']
-                lfn['name'] = file['did_name']
-
-                for checksum_name in GLOBALLY_SUPPORTED_CHECKSUMS:
-                    if checksum_name in file:
-                        lfn[checksum_name] = file[checksum_name]
-
-                lfn['filesize'] = file['bytes']
-
-                sign_service = None
-                if cur_scheme == 'https':
-                    sign_service = rse_sign_service
-
-                trace['protocol'] = cur_scheme
-                trace['transferStart'] = time.time()
-                logger(logging.DEBUG, 'Processing upload with the domain: {}'.format(domain))
-                try:
-                    pfn = self._upload_item(rse_settings=rse_settings,
-                                            rse_attributes=rse_attributes,
-                                            lfn=lfn,
-                                            source_dir=file['dirname'],
-                                            domain=domain,
-                                            force_scheme=cur_scheme,
-                                            force_pfn=pfn,
-                                            transfer_timeout=file.get('transfer_timeout'),
-                                            delete_existing=delete_existing,
-                                            sign_service=sign_service)
-                    logger(logging.DEBUG, 'Upload done.')
-                    success = True
-                    file['upload_result'] = {0: True, 1: None, 'success': True, 'pfn': pfn}  # needs to be removed
-                except (ServiceUnavailable, ResourceTemporaryUnavailable, RSEOperationNotSupported, RucioException) as error:
-                    logger(logging.WARNING, 'Upload attempt failed')
-                    logger(logging.INFO, 'Exception: %s' % str(error), exc_info=True)
-                    state_reason = str(error)
-
-            if success:
-                num_succeeded += 1
-                trace['transferEnd'] = time.time()
-                trace['clientState'] = 'DONE'
-                file['state'] = 'A'
-                logger(logging.INFO, 'Successfully uploaded file %s' % basename)
-                self._send_trace(trace)
-
-                if summary_file_path:
-                    summary.append(copy.deepcopy(file))
-
-                if not no_register:
-                    if register_after_upload:
-                        self._register_file(file, registered_dataset_dids)
-                    replica_for_api = self._convert_file_for_api(file)
-                    if not self.client.update_replicas_states(rse, files=[replica_for_api]):
-                        logger(logging.WARNING, 'Failed to update replica state')
-
-                # add file to dataset if needed
-                if dataset_did_str and not no_register:
-                    try:
-                        self.client.attach_dids(file['dataset_scope'], file['dataset_name'], [file_did])
-                    except Exception as error:
-                        logger(logging.WARNING, 'Failed to attach file to the dataset')
-                        logger(logging.DEBUG, 'Attaching to dataset {}'.format(str(error)))
-            else:
-                trace['clientState'] = 'FAILED'
-                trace['stateReason'] = state_reason
-                self._send_trace(trace)
-                logger(logging.ERROR, 'Failed to upload file %s' % basename)
+        if num_threads > 1:
+            uploaded_files = self._upload_multithreaded(files, num_threads, registered_dataset_dids, traces_copy_out)
+        else:
+            uploaded_files = self._upload_sequentially(files, registered_dataset_dids, traces_copy_out)
+        num_succeeded = len(uploaded_files)
 
         if summary_file_path:
             logger(logging.DEBUG, 'Summary will be available at {}'.format(summary_file_path))
             final_summary = {}
-            for file in summary:
+            for file in uploaded_files:
                 file_scope = file['did_scope']
                 file_name = file['did_name']
                 file_did_str = '%s:%s' % (file_scope, file_name)
@@ -345,6 +209,320 @@ class UploadClient:
             raise NotAllFilesUploaded()
         return 0
 
+    def _upload_sequentially(self, files, registered_dataset_dids, traces_copy_out=None):
+        """
+        Uploads and registers the files one after the other.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the files to upload
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        :param traces_copy_out: reference to an external list, where the traces should be uploaded
+
+        :returns: list of the successfully uploaded files
+        """
+        logger = self.logger
+        uploaded_files = []
+        for file in files:
+            logger(logging.INFO, 'Preparing upload for file %s' % file['basename'])
+
+            trace = self._create_trace(file, traces_copy_out)
+            if not self._resolve_registration(file):
+                continue
+            if not file['no_register'] and not file['register_after_upload']:
+                self._register_file(file, registered_dataset_dids)
+
+            if not self._upload_file(file, trace):
+                continue
+            uploaded_files.append(file)
+
+            if not file['no_register']:
+                if file['register_after_upload']:
+                    self._register_file(file, registered_dataset_dids)
+                replica_for_api = self._convert_file_for_api(file)
+                if not self.client.update_replicas_states(file['rse'], files=[replica_for_api]):
+                    logger(logging.WARNING, 'Failed to update replica state')
+
+                # add file to dataset if needed
+                if file.get('dataset_did_str'):
+                    try:
+                        self.client.attach_dids(file['dataset_scope'], file['dataset_name'], [{'scope': file['did_scope'], 'name': file['did_name']}])
+                    except Exception as error:
+                        logger(logging.WARNING, 'Failed to attach file to the dataset')
+                        logger(logging.DEBUG, 'Attaching to dataset {}'.format(str(error)))
+        return uploaded_files
+
+    def _upload_multithreaded(self, files, num_threads, registered_dataset_dids, traces_copy_out=None):
+        """
+        Uploads the files with a pool of threads. The checksums of the next files are calculated
+        while the current ones are transferred, each thread reuses its protocol connections and
+        the files are registered in batches.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the files to upload, without their checksums
+        :param num_threads: number of files transferred in parallel
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        :param traces_copy_out: reference to an external list, where the traces should be uploaded
+
+        :returns: list of the successfully uploaded files
+        """
+        logger = self.logger
+        num_threads = min(num_threads, len(files))
+        logger(logging.INFO, 'Using %d threads to upload %d files' % (num_threads, len(files)))
+
+        checksum_pool = ThreadPool(min(CHECKSUM_THREADS, len(files)))
+        upload_pool = ThreadPool(num_threads)
+        self._protocols = {}
+        uploads = []
+        try:
+            checksummed_files = checksum_pool.imap(self._calculate_file_checksums, files)
+            batch = []
+            for index in range(len(files)):
+                try:
+                    file = checksummed_files.next(timeout=0)
+                except PoolTimeoutError:
+                    # Hand over the batch now rather than let the transfers run dry
+                    if batch and all(result.ready() for _, result in uploads):
+                        uploads.extend(self._submit_uploads(batch, upload_pool, registered_dataset_dids, traces_copy_out))
+                        batch = []
+                    file = checksummed_files.next()
+                batch.append(file)
+                if len(batch) == REGISTRATION_BATCH_SIZE or index == len(files) - 1:
+                    uploads.extend(self._submit_uploads(batch, upload_pool, registered_dataset_dids, traces_copy_out))
+                    batch = []
+            uploaded_files = [file for file, result in uploads if result.get()]
+        except BaseException:
+            checksum_pool.terminate()
+            upload_pool.terminate()
+            raise
+        else:
+            checksum_pool.close()
+            upload_pool.close()
+        finally:
+            checksum_pool.join()
+            upload_pool.join()
+            for protocol in self._protocols.values():
+                protocol.close()
+            self._protocols = None
+
+        for batch in chunks(uploaded_files, REGISTRATION_BATCH_SIZE):
+            self._register_uploaded_files(batch, registered_dataset_dids)
+        return uploaded_files
+
+    def _submit_uploads(self, files, pool, registered_dataset_dids, traces_copy_out=None):
+        """
+        Registers a batch of files which have to be registered before their upload,
+        then queues the transfers of the batch.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the files to upload
+        :param pool: the thread pool doing the transfers
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        :param traces_copy_out: reference to an external list, where the traces should be uploaded
+
+        :returns: list of tuples (file, AsyncResult of _upload_file)
+        """
+        traces = [(file, self._create_trace(file, traces_copy_out)) for file in files]
+        traces = [(file, trace) for file, trace in traces if self._resolve_registration(file)]
+        self._register_files([file for file, _ in traces if not file['no_register'] and not file['register_after_upload']], registered_dataset_dids)
+        return [(file, pool.apply_async(self._upload_file, (file, trace))) for file, trace in traces]
+
+    def _register_uploaded_files(self, files, registered_dataset_dids):
+        """
+        Finishes the registration of a batch of uploaded files: registers the files which
+        are registered after their upload, marks the replicas as available and attaches
+        the files to their datasets.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the uploaded files
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        """
+        logger = self.logger
+        files = [file for file in files if not file['no_register']]
+        self._register_files([file for file in files if file['register_after_upload']], registered_dataset_dids)
+
+        replicas, dataset_dids = {}, {}
+        for file in files:
+            replicas.setdefault(file['rse'], []).append(self._convert_file_for_api(file))
+            if file.get('dataset_did_str'):
+                dataset_dids.setdefault((file['dataset_scope'], file['dataset_name']), []).append({'scope': file['did_scope'], 'name': file['did_name']})
+        for rse, rse_replicas in replicas.items():
+            if not self.client.update_replicas_states(rse, files=rse_replicas):
+                logger(logging.WARNING, 'Failed to update replica states at %s' % rse)
+        for (dataset_scope, dataset_name), dids in dataset_dids.items():
+            try:
+                self.client.attach_dids(dataset_scope, dataset_name, dids)
+            except Exception as error:
+                logger(logging.WARNING, 'Failed to attach files to the dataset %s:%s' % (dataset_scope, dataset_name))
+                logger(logging.DEBUG, 'Attaching to dataset {}'.format(str(error)))
+
+    def _create_trace(self, file, traces_copy_out=None):
+        """
+        Creates the trace of the upload of a file.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file
+        :param traces_copy_out: reference to an external list, where the trace is appended
+
+        :returns: the trace
+        """
+        trace = copy.deepcopy(self.trace)
+        # appending trace to list reference, if the reference exists
+        if traces_copy_out is not None:
+            traces_copy_out.append(trace)
+
+        trace['scope'] = file['did_scope']
+        trace['datasetScope'] = file.get('dataset_scope', '')
+        trace['dataset'] = file.get('dataset_name', '')
+        trace['remoteSite'] = file['rse']
+        trace['filesize'] = file['bytes']
+        return trace
+
+    def _resolve_registration(self, file):
+        """
+        Sets the no_register and register_after_upload options of the file
+        according to the given pfn and the RSE.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file
+
+        :returns: False if the file can not be uploaded, True otherwise
+        """
+        logger = self.logger
+        pfn = file.get('pfn')
+        is_deterministic = self.rses[file['rse']].get('deterministic', True)
+        file['no_register'] = bool(file.get('no_register'))
+        if not is_deterministic and not pfn:
+            logger(logging.ERROR, 'PFN has to be defined for NON-DETERMINISTIC RSE.')
+            return False
+        if pfn and is_deterministic:
+            logger(logging.WARNING, 'Upload with given pfn implies that no_register is True, except non-deterministic RSEs')
+            file['no_register'] = True
+        file['register_after_upload'] = bool(file.get('register_after_upload')) and not file['no_register']
+        return True
+
+    def _upload_file(self, file, trace):
+        """
+        Checks if the file already exists on the RSE and uploads it,
+        trying the protocols of the RSE by priority. Sends the trace.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file
+        :param trace: the trace of the upload
+
+        :returns: True if the file was uploaded, False otherwise
+        """
+        logger = self.logger
+        basename = file['basename']
+        rse = file['rse']
+        pfn = file.get('pfn')
+        force_scheme = file.get('force_scheme')
+        file_did = {'scope': file['did_scope'], 'name': file['did_name']}
+        rse_settings = self.rses[rse]
+        rse_sign_service = rse_settings.get('sign_url', None)
+        is_deterministic = rse_settings.get('deterministic', True)
+        delete_existing = False
+
+        # resolving local area networks
+        domain = 'wan'
+        rse_attributes = self.rse_attributes.get(rse)
+        if rse_attributes is None:
+            try:
+                rse_attributes = self.rse_attributes.setdefault(rse, self.client.list_rse_attributes(rse))
+            except:
+                logger(logging.WARNING, 'Attributes of the RSE: %s not available.' % rse)
+                rse_attributes = {}
+        if (self.client_location and 'lan' in rse_settings['domain'] and 'site' in rse_attributes):
+            if self.client_location['site'] == rse_attributes['site']:
+                domain = 'lan'
+        logger(logging.DEBUG, '{} domain is used for the upload'.format(domain))
+
+        # if register_after_upload, file should be overwritten if it is not registered
+        # otherwise if file already exists on RSE we're done
+        if file['register_after_upload']:
+            if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, auth_token=self.auth_token, logger=logger):
+                try:
+                    self.client.get_did(file['did_scope'], file['did_name'])
+                    logger(logging.INFO, 'File already registered. Skipping upload.')
+                    trace['stateReason'] = 'File already exists'
+                    return False
+                except DataIdentifierNotFound:
+                    logger(logging.INFO, 'File already exists on RSE. Previous left overs will be overwritten.')
+                    delete_existing = True
+        elif not is_deterministic and not file['no_register']:
+            if rsemgr.exists(rse_settings, pfn, domain=domain, auth_token=self.auth_token, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE with given pfn. Skipping upload. Existing replica has to be removed first.')
+                trace['stateReason'] = 'File already exists'
+                return False
+            elif rsemgr.exists(rse_settings, file_did, domain=domain, auth_token=self.auth_token, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE with different pfn. Skipping upload.')
+                trace['stateReason'] = 'File already exists'
+                return False
+        else:
+            if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, auth_token=self.auth_token, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE. Skipping upload')
+                trace['stateReason'] = 'File already exists'
+                return False
+
+        # protocol handling and upload
+        protocols = rsemgr.get_protocols_ordered(rse_settings=rse_settings, operation='write', scheme=force_scheme, domain=domain)
+        protocols.reverse()
+        success = False
+        state_reason = ''
+        logger(logging.DEBUG, str(protocols))
+        while not success and len(protocols):
+            protocol = protocols.pop()
+            cur_scheme = protocol['scheme']
+            logger(logging.INFO, 'Trying upload with %s to %s' % (cur_scheme, rse))
+            lfn = {}
+            lfn['filename'] = basename
+            lfn['scope'] = file['did_scope']
+            lfn['name'] = file['did_name']
+
+            for checksum_name in GLOBALLY_SUPPORTED_CHECKSUMS:
+                if checksum_name in file:
+                    lfn[checksum_name] = file[checksum_name]
+
+            lfn['filesize'] = file['bytes']
+
+            sign_service = None
+            if cur_scheme == 'https':
+                sign_service = rse_sign_service
+
+            trace['protocol'] = cur_scheme
+            trace['transferStart'] = time.time()
+            logger(logging.DEBUG, 'Processing upload with the domain: {}'.format(domain))
+            try:
+                pfn = self._upload_item(rse_settings=rse_settings,
+                                        rse_attributes=rse_attributes,
+                                        lfn=lfn,
+                                        source_dir=file['dirname'],
+                                        domain=domain,
+                                        force_scheme=cur_scheme,
+                                        force_pfn=pfn,
+                                        transfer_timeout=file.get('transfer_timeout'),
+                                        delete_existing=delete_existing,
+                                        sign_service=sign_service)
+                logger(logging.DEBUG, 'Upload done.')
+                success = True
+                file['upload_result'] = {0: True, 1: None, 'success': True, 'pfn': pfn}  # needs to be removed
+            except (ServiceUnavailable, ResourceTemporaryUnavailable, RSEOperationNotSupported, RucioException) as error:
+                logger(logging.WARNING, 'Upload attempt failed')
+                logger(logging.INFO, 'Exception: %s' % str(error), exc_info=True)
+                state_reason = str(error)
+
+        if success:
+            trace['transferEnd'] = time.time()
+            trace['clientState'] = 'DONE'
+            file['state'] = 'A'
+            logger(logging.INFO, 'Successfully uploaded file %s' % basename)
+            self._send_trace(trace)
+        else:
+            trace['clientState'] = 'FAILED'
+            trace['stateReason'] = state_reason
+            self._send_trace(trace)
+            logger(logging.ERROR, 'Failed to upload file %s' % basename)
+        return success
+
     def _register_file(self, file, registered_dataset_dids):
         """
         Registers the given file in Rucio. Creates a dataset if
@@ -371,23 +549,7 @@ class UploadClient:
 
         rse = file['rse']
         dataset_did_str = file.get('dataset_did_str')
-        # register a dataset if we need to
-        if dataset_did_str and dataset_did_str not in registered_dataset_dids:
-            registered_dataset_dids.add(dataset_did_str)
-            try:
-                logger(logging.DEBUG, 'Trying to create dataset: %s' % dataset_did_str)
-                self.client.add_dataset(scope=file['dataset_scope'],
-                                        name=file['dataset_name'],
-                                        rules=[{'account': self.client.account,
-                                                'copies': 1,
-                                                'rse_expression': rse,
-                                                'grouping': 'DATASET',
-                                                'lifetime': file.get('lifetime')}])
-                logger(logging.INFO, 'Successfully created dataset %s' % dataset_did_str)
-            except DataIdentifierAlreadyExists:
-                logger(logging.DEBUG, 'Dataset %s already exists' % dataset_did_str)
-        else:
-            logger(logging.DEBUG, 'Skipping dataset registration')
+        self._register_dataset(file, registered_dataset_dids)
 
         file_scope = file['did_scope']
         file_name = file['did_name']
@@ -418,6 +580,99 @@ class UploadClient:
                 self.client.add_replication_rule([file_did], copies=1, rse_expression=rse, lifetime=file.get('lifetime'))
                 logger(logging.INFO, 'Successfully added replication rule at %s' % rse)
 
+    def _register_dataset(self, file, registered_dataset_dids):
+        """
+        Creates the dataset of the given file if it was not registered yet.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        """
+        logger = self.logger
+        dataset_did_str = file.get('dataset_did_str')
+        # register a dataset if we need to
+        if dataset_did_str and dataset_did_str not in registered_dataset_dids:
+            registered_dataset_dids.add(dataset_did_str)
+            try:
+                logger(logging.DEBUG, 'Trying to create dataset: %s' % dataset_did_str)
+                self.client.add_dataset(scope=file['dataset_scope'],
+                                        name=file['dataset_name'],
+                                        rules=[{'account': self.client.account,
+                                                'copies': 1,
+                                                'rse_expression': file['rse'],
+                                                'grouping': 'DATASET',
+                                                'lifetime': file.get('lifetime')}])
+                logger(logging.INFO, 'Successfully created dataset %s' % dataset_did_str)
+            except DataIdentifierAlreadyExists:
+                logger(logging.DEBUG, 'Dataset %s already exists' % dataset_did_str)
+        else:
+            logger(logging.DEBUG, 'Skipping dataset registration')
+
+    def _register_files(self, files, registered_dataset_dids):
+        """
+        Registers the given files in Rucio like _register_file, but with
+        bulk calls for the whole list instead of several calls per file.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the files
+        :param registered_dataset_dids: set of dataset dids that were already registered
+
+        :raises DataIdentifierAlreadyExists: if a file DID is already registered and the checksums do not match
+        """
+        if not files:
+            return
+        logger = self.logger
+        logger(logging.DEBUG, 'Registering %d files' % len(files))
+
+        # verification whether the scopes exist
+        account_scopes = []
+        try:
+            account_scopes = self.client.list_scopes_for_account(self.client.account)
+        except ScopeNotFound:
+            pass
+        for scope in set(file['did_scope'] for file in files):
+            if account_scopes and scope not in account_scopes:
+                logger(logging.WARNING, 'Scope {} not found for the account {}.'.format(scope, self.client.account))
+
+        for file in files:
+            self._register_dataset(file, registered_dataset_dids)
+
+        # if the remote checksum is different these dids must not be used
+        file_dids = [{'scope': file['did_scope'], 'name': file['did_name']} for file in files]
+        metas = dict(((meta['scope'], meta['name']), meta) for meta in self.client.get_metadata_bulk(file_dids))
+        for file in files:
+            meta = metas.get((file['did_scope'], file['did_name']))
+            if meta is not None:
+                logger(logging.INFO, 'File DID %s:%s already exists' % (file['did_scope'], file['did_name']))
+                if str(meta['adler32']).lstrip('0') != str(file['adler32']).lstrip('0'):
+                    logger(logging.ERROR, 'Local checksum %s does not match remote checksum %s' % (file['adler32'], meta['adler32']))
+                    raise DataIdentifierAlreadyExists
+
+        # add the files to their rse if they are not registered there yet
+        replica_rses = {}
+        if metas:
+            existing_dids = [{'scope': scope, 'name': name} for scope, name in metas]
+            for replica in self.client.list_replicas(existing_dids, all_states=True):
+                replica_rses[(replica['scope'], replica['name'])] = replica['rses']
+        replicas, rule_dids = {}, {}
+        for file, file_did in zip(files, file_dids):
+            key = (file['did_scope'], file['did_name'])
+            if file['rse'] in replica_rses.get(key, {}):
+                continue
+            if key not in metas and key not in replica_rses and not file.get('dataset_did_str'):
+                # only need to add rules for files if no dataset is given
+                rule_dids.setdefault((file['rse'], file.get('lifetime')), []).append(file_did)
+            # the same file can be given twice
+            replica_rses.setdefault(key, {})[file['rse']] = None
+            replicas.setdefault(file['rse'], []).append(self._convert_file_for_api(file))
+
+        for rse, rse_replicas in replicas.items():
+            self.client.add_replicas(rse=rse, files=rse_replicas)
+            logger(logging.INFO, 'Successfully added %d replicas in Rucio catalogue at %s' % (len(rse_replicas), rse))
+        for (rse, lifetime), dids in rule_dids.items():
+            self.client.add_replication_rule(dids, copies=1, rse_expression=rse, lifetime=lifetime)
+            logger(logging.INFO, 'Successfully added %d replication rules at %s' % (len(dids), rse))
+
     def _get_file_guid(self, file):
         """
         Get the guid of a file, trying different strategies
@@ -444,7 +699,7 @@ class UploadClient:
             guid = generate_uuid()
         return guid
 
-    def _collect_file_info(self, filepath, item):
+    def _collect_file_info(self, filepath, item, checksums=None, with_checksums=True):
         """
         Collects infos (e.g. size, checksums, etc.) about the file and
         returns them as a dictionary
@@ -452,6 +707,8 @@ class UploadClient:
 
         :param filepath: path where the file is stored
         :param item: input options for the given file
+        :param checksums: dictionary with the adler32 and md5 of the file, calculated if not given
+        :param with_checksums: if False, the checksums are left to _calculate_file_checksums
 
         :returns: a dictionary containing all collected info and the input options
         """
@@ -461,8 +718,11 @@ class UploadClient:
         new_item['basename'] = os.path.basename(filepath)
 
         new_item['bytes'] = os.stat(filepath).st_size
-        new_item['adler32'] = adler32(filepath)
-        new_item['md5'] = md5(filepath)
+        if with_checksums:
+            if checksums is None:
+                checksums = calculate_checksums(filepath, ['adler32', 'md5'])
+            new_item['adler32'] = checksums['adler32']
+            new_item['md5'] = checksums['md5']
         new_item['meta'] = {'guid': self._get_file_guid(new_item)}
         new_item['state'] = 'C'
         if not new_item.get('did_scope'):
@@ -472,20 +732,33 @@ class UploadClient:
 
         return new_item
 
-    def _collect_and_validate_file_info(self, items):
+    def _calculate_file_checksums(self, file):
+        """
+        Calculates the adler32 and md5 of a file collected without its checksums.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file
+
+        :returns: the same dictionary, with the checksums
+        """
+        file.update(calculate_checksums(file['path'], ['adler32', 'md5']))
+        return file
+
+    def _collect_and_validate_file_info(self, items, with_checksums=True):
         """
         Checks if there are any inconsistencies within the given input
         options and stores the output of _collect_file_info for every file
         (This function is meant to be used as class internal only)
 
         :param filepath: list of dictionaries with all input files and options
+        :param with_checksums: if False, the checksums are not calculated
 
         :returns: a list of dictionaries containing all descriptions of the files to upload
 
         :raises InputValidationError: if an input option has a wrong format
         """
         logger = self.logger
-        files = []
+        file_items = []
         for item in items:
             path = item.get('path')
             pfn = item.get('pfn')
@@ -500,18 +773,22 @@ class UploadClient:
             if os.path.isdir(path):
                 dname, subdirs, fnames = next(os.walk(path))
                 for fname in fnames:
-                    file = self._collect_file_info(os.path.join(dname, fname), item)
-                    files.append(file)
+                    file_items.append((os.path.join(dname, fname), item))
                 if not len(fnames) and not len(subdirs):
                     logger(logging.WARNING, 'Skipping %s because it is empty.' % dname)
                 elif not len(fnames):
                     logger(logging.WARNING, 'Skipping %s because it has no files in it. Subdirectories are not supported.' % dname)
             elif os.path.isfile(path):
-                file = self._collect_file_info(path, item)
-                files.append(file)
+                file_items.append((path, item))
             else:
                 logger(logging.WARNING, 'No such file or directory: %s' % path)
 
+        # every file is read once for all its checksums, several files are read in parallel
+        checksums = {}
+        if with_checksums:
+            checksums = bulk_calculate_checksums(list(set(filepath for filepath, _ in file_items)), ['adler32', 'md5'], nb_threads=CHECKSUM_THREADS)
+        files = [self._collect_file_info(filepath, item, checksums=checksums.get(filepath), with_checksums=with_checksums) for filepath, item in file_items]
+
         if not len(files):
             raise InputValidationError('No valid input files given')
 
@@ -607,7 +884,7 @@ class UploadClient:
                 # Construct protocol for delete operation.
                 protocol_delete = self._create_protocol(rse_settings, 'delete', domain=domain)
                 protocol_delete.delete('%s.rucio.upload' % list(protocol_delete.lfns2pfns(make_valid_did(lfn)).values())[0])
-                protocol_delete.close()
+                self._close_protocol(protocol_delete)
             except Exception as e:
                 raise RSEOperationNotSupported('Unable to remove temporary file %s.rucio.upload: %s' % (pfn, str(e)))
 
@@ -618,7 +895,7 @@ class UploadClient:
                 # Construct protocol for delete operation.
                 protocol_delete = self._create_protocol(rse_settings, 'delete', domain=domain)
                 protocol_delete.delete('%s' % list(protocol_delete.lfns2pfns(make_valid_did(lfn)).values())[0])
-                protocol_delete.close()
+                self._close_protocol(protocol_delete)
             except Exception as error:
                 raise RSEOperationNotSupported('Unable to remove file %s: %s' % (pfn, str(error)))
 
@@ -662,8 +939,8 @@ class UploadClient:
         except Exception:
             raise RucioException('Unable to rename the tmp file %s.' % pfn_tmp)
 
-        protocol_write.close()
-        protocol_read.close()
+        self._close_protocol(protocol_write)
+        self._close_protocol(protocol_read)
 
         return pfn
 
@@ -703,6 +980,21 @@ class UploadClient:
         :param: force_scheme        custom scheme
         :param auth_token: Optionally passing JSON Web Token (OIDC) string for authentication
         """
+        if self._protocols is not None:
+            # the multithreaded upload keeps the connections open, each thread has its own protocols
+            key = (threading.current_thread().ident, rse_settings['rse'], operation, force_scheme, domain)
+            if key not in self._protocols:
+                self._protocols[key] = self._connect_protocol(rse_settings, operation, force_scheme=force_scheme, domain=domain)
+            return self._protocols[key]
+        return self._connect_protocol(rse_settings, operation, force_scheme=force_scheme, domain=domain)
+
+    def _connect_protocol(self, rse_settings, operation, force_scheme=None, domain='wan'):
+        """
+        Creates and connects a protocol.
+        :param: rse_settings        rse_settings
+        :param: operation           activity, e.g. read, write, delete etc.
+        :param: force_scheme        custom scheme
+        """
         try:
             protocol = rsemgr.create_protocol(rse_settings, operation, scheme=force_scheme, domain=domain, auth_token=self.auth_token, logger=self.logger)
             protocol.connect()
@@ -712,6 +1004,14 @@ class UploadClient:
             raise error
         return protocol
 
+    def _close_protocol(self, protocol):
+        """
+        Closes a protocol, unless it is kept open by the multithreaded upload.
+        :param protocol: the protocol
+        """
+        if self._protocols is None:
+            protocol.close()
+
     def _send_trace(self, trace):
         """
         Checks if sending trace is allowed and send the trace.
@@ -22,7 +22,10 @@
 # PY3K COMPATIBLE
 
 import datetime
+import functools
+import heapq
 import logging
+import multiprocessing
 import os
 import re
 import subprocess
@@ -34,6 +37,10 @@ from rucio.common.dumper import error, DUMPS_CACHE_DIR, data_models, path_parsin
 
 subcommands = ['consistency', 'consistency-manual']
 
+# Maximum number of records held in memory by each sort process before
+# spilling a sorted run to disk.
+EXTERNAL_SORT_BUFFER_LINES = 1000000
+
 
 class Consistency(data_models.DataModel):
     SCHEMA = (
@@ -44,7 +51,7 @@ class Consistency(data_models.DataModel):
     @classmethod
     def dump(cls, subcommand, ddm_endpoint, storage_dump, prev_date_fname=None, next_date_fname=None,
              prev_date=None, next_date=None, sort_rucio_replica_dumps=True, date=None,
-             cache_dir=DUMPS_CACHE_DIR):
+             cache_dir=DUMPS_CACHE_DIR, sort_processes=3, sort_buffer_lines=EXTERNAL_SORT_BUFFER_LINES):
         logger = logging.getLogger('auditor.consistency')
         if subcommand == 'consistency':
             prev_date_fname = data_models.Replica.download(
@@ -62,65 +69,11 @@ class Consistency(data_models.DataModel):
         )
         prefix_components = path_parsing.components(prefix)
 
-        def parser(line):
-            '''
-            Simple parser for Rucio replica dumps.
-
-            :param line: String with one line of a dump.
-            :returns: A tuple with the path and status of the replica.
-            '''
-            fields = line.split('\t')
-            path = fields[6].strip().lstrip('/')
-            status = fields[8].strip()
-
-            return ','.join((path, status))
-
-        def strip_storage_dump(line):
-            '''
-            Parser to have consistent paths in storage dumps.
-
-            :param line: String with one line of a dump.
-            :returns: Path formated as in the Rucio Replica Dumps.
-            '''
-            relative = path_parsing.remove_prefix(
-                prefix_components,
-                path_parsing.components(line),
-            )
-            if relative[0] == 'rucio':
-                relative = relative[1:]
-            return '/'.join(relative)
-
-        if sort_rucio_replica_dumps:
-            prev_date_fname_sorted = gnu_sort(
-                parse_and_filter_file(prev_date_fname, parser=parser, cache_dir=cache_dir),
-                delimiter=',',
-                fieldspec='1',
-                cache_dir=cache_dir,
-            )
-
-            next_date_fname_sorted = gnu_sort(
-                parse_and_filter_file(next_date_fname, parser=parser, cache_dir=cache_dir),
-                delimiter=',',
-                fieldspec='1',
-                cache_dir=cache_dir,
-            )
-        else:
-            prev_date_fname_sorted = parse_and_filter_file(
-                prev_date_fname,
-                parser=parser,
-                cache_dir=cache_dir,
-            )
-            next_date_fname_sorted = parse_and_filter_file(
-                next_date_fname,
-                parser=parser,
-                cache_dir=cache_dir,
-            )
-
         standard_name_re = r'(ddmendpoint_{0}_\d{{2}}-\d{{2}}-\d{{4}}_[0-9a-f]{{40}})$'.format(ddm_endpoint)
         standard_name_match = re.search(standard_name_re, storage_dump)
         if standard_name_match is not None:
             # If the original filename was generated using the expected format,
-            # just use the name as prefix for the parsed file.
+            # just use the name as prefix for the temporary files.
             sd_prefix = standard_name_match.group(0)
         elif date is not None:
             # Otherwise try to use the date information and DDMEndpoint name to
@@ -142,29 +95,87 @@ class Consistency(data_models.DataModel):
                 sd_prefix,
             )
 
-        storage_dump_fname_sorted = gnu_sort(
-            parse_and_filter_file(
-                storage_dump,
-                parser=strip_storage_dump,
-                prefix=sd_prefix,
-                cache_dir=cache_dir,
-            ),
-            prefix=sd_prefix,
+        # The dumps are parsed and sorted in parallel processes, the
+        # sorted runs are merged lazily while comparing them.
+        sort_jobs = [{
+            'filepath': storage_dump,
+            'parser': functools.partial(strip_storage_dump_line, prefix_components),
+            'prefix': sd_prefix,
+        }]
+        if sort_rucio_replica_dumps:
+            for fname in (prev_date_fname, next_date_fname):
+                sort_jobs.append({
+                    'filepath': fname,
+                    'parser': parse_replica_dump_line,
+                    'key': replica_record_path,
+                })
+
+        streams = external_sort_files(
+            sort_jobs,
+            processes=sort_processes,
+            buffer_lines=sort_buffer_lines,
             cache_dir=cache_dir,
         )
+        if sort_rucio_replica_dumps:
+            sdump, prevf, nextf = streams
+        else:
+            sdump = streams[0]
+            prevf = parse_lines(prev_date_fname, parser=parse_replica_dump_line)
+            nextf = parse_lines(next_date_fname, parser=parse_replica_dump_line)
+
+        try:
+            for path, where, status in compare3(prevf, sdump, nextf):
+                prevstatus, nextstatus = status
+
+                if where[0] and not where[1] and where[2]:
+                    if prevstatus == 'A' and nextstatus == 'A':
+                        yield cls('LOST', path)
+
+                if not where[0] and where[1] and not where[2]:
+                    yield cls('DARK', path)
+        finally:
+            # Closing the streams removes the remaining sorted runs
+            for stream in (prevf, sdump, nextf):
+                stream.close()
 
-        with open(prev_date_fname_sorted) as prevf:
-            with open(next_date_fname_sorted) as nextf:
-                with open(storage_dump_fname_sorted) as sdump:
-                    for path, where, status in compare3(prevf, sdump, nextf):
-                        prevstatus, nextstatus = status
 
-                        if where[0] and not where[1] and where[2]:
-                            if prevstatus == 'A' and nextstatus == 'A':
-                                yield cls('LOST', path)
+def parse_replica_dump_line(line):
+    '''
+    Simple parser for Rucio replica dumps.
+
+    :param line: String with one line of a dump.
+    :returns: The path and status of the replica separated by a comma.
+    '''
+    fields = line.split('\t')
+    path = fields[6].strip().lstrip('/')
+    status = fields[8].strip()
 
-                        if not where[0] and where[1] and not where[2]:
-                            yield cls('DARK', path)
+    return ','.join((path, status))
+
+
+def replica_record_path(record):
+    '''
+    Sort key of the parsed Rucio replica dump records: the path, as
+    compared by `compare3`.
+    '''
+    return record.split(',', 1)[0]
+
+
+def strip_storage_dump_line(prefix_components, line):
+    '''
+    Parser to have consistent paths in storage dumps.
+
+    :param prefix_components: Components of the path prefix of the RSE.
+    :param line: String with one line of a dump.
+    :returns: Path formated as in the Rucio Replica Dumps.
+    '''
+    relative = path_parsing.remove_prefix(
+        prefix_components,
+        path_parsing.components(line),
+    )
+    if relative[0] == 'rucio':
+        relative = relative[1:]
+    return '/'.join(relative)
 
 
 def _try_to_advance(it, default=None):
@@ -315,10 +326,10 @@ def gnu_sort(file_path, prefix=None, delimiter=None, fieldspec=None, cache_dir=D
     LC_ALL set to C as in this function.
     '''
     assert (delimiter is None and fieldspec is None) or (delimiter is not None and fieldspec is not None)
-    if delimiter is None:
-        cmd_line = 'LC_ALL=C sort {0} > {1}'
-    else:
-        cmd_line = 'LC_ALL=C sort -t {0} -k {1} {{0}} > {{1}}'.format(delimiter, fieldspec)
+    cmd = ['sort']
+    if delimiter is not None:
+        cmd.extend(['-t', delimiter, '-k', fieldspec])
+    cmd.append(file_path)
 
     prefix = os.path.basename(file_path) if prefix is None else prefix
 
@@ -328,19 +339,186 @@ def gnu_sort(file_path, prefix=None, delimiter=None, fieldspec=None, cache_dir=D
     if os.path.exists(sorted_path):
         return sorted_path
 
-    # FIXME: mktemp() is an insecure function and this may be a security
-    # threat in some scenarios. Find another way to do it.
-    tfile = tempfile.mktemp(dir=cache_dir)
+    env = dict(os.environ)
+    env['LC_ALL'] = 'C'
+    with dumper.temp_file(cache_dir, final_name=sorted_name) as (output, _):
+        subprocess.check_call(cmd, stdout=output, env=env)
 
-    subprocess.check_call(
-        cmd_line.format(file_path, tfile),
-        shell=True,
-    )
+    return sorted_path
 
-    os.link(tfile, sorted_path)
-    os.unlink(tfile)
 
-    return sorted_path
+def parse_lines(filepath, parser=lambda s: s, filter_=lambda s: s):
+    '''
+    Generator yielding the lines of `filepath` for which the `filter_`
+    function returns True, parsed with the `parser` function and
+    stripped. Nothing is written to disk.
+    '''
+    input_ = dumper.smart_open(filepath)
+    try:
+        for line in input_:
+            if filter_(line):
+                yield parser(line).strip()
+    finally:
+        input_.close()
+
+
+def _spill_run(records, key, prefix, cache_dir):
+    '''
+    Sorts `records` in place and writes them to a new temporary file in
+    `cache_dir`.
+
+    :returns: The path of the file.
+    '''
+    records.sort(key=key)
+    fd, run_path = tempfile.mkstemp(dir=cache_dir, prefix='_'.join((prefix, 'run_')))
+    with os.fdopen(fd, 'w') as run:
+        for record in records:
+            run.write(record + '\n')
+    return run_path
+
+
+def _remove_runs(runs):
+    for run in runs:
+        try:
+            os.unlink(run)
+        except OSError:
+            pass
+
+
+def sort_in_runs(filepath, parser=lambda s: s, filter_=lambda s: s, key=None, prefix=None,
+                 buffer_lines=EXTERNAL_SORT_BUFFER_LINES, cache_dir=DUMPS_CACHE_DIR):
+    '''
+    First pass of the external merge sort of `filepath`: the lines for
+    which the `filter_` function returns True are parsed with the `parser`
+    function and stripped, only these records are kept. Every
+    `buffer_lines` records are sorted in memory by `key` and spilled to a
+    temporary file (a sorted run) in `cache_dir`, named after `prefix` (by
+    default the name of the input file).
+
+    The ordering is the one of Python strings, consistent with `compare3`
+    and with GNU sort when LC_ALL is set to C.
+
+    The function is picklable, as long as `parser`, `filter_` and `key` are,
+    to be run in a separate process.
+
+    :returns: The list of paths of the sorted runs, there is at least one.
+    '''
+    prefix = os.path.basename(filepath) if prefix is None else prefix
+    runs = []
+    records = []
+    try:
+        for record in parse_lines(filepath, parser=parser, filter_=filter_):
+            records.append(record)
+            if len(records) >= buffer_lines:
+                runs.append(_spill_run(records, key, prefix, cache_dir))
+                records = []
+        if records or not runs:
+            runs.append(_spill_run(records, key, prefix, cache_dir))
+    except:
+        _remove_runs(runs)
+        raise
+    return runs
+
+
+class MergedRuns(object):
+    '''
+    Second pass of the external merge sort: iterator lazily merging the
+    sorted runs returned by `sort_in_runs`, one record at a time. The runs
+    are removed when the iterator is exhausted or closed, even if it was
+    never started.
+    '''
+
+    def __init__(self, runs, key=None):
+        '''
+        :param runs: List of paths of the sorted runs.
+        :param key: The sort key used to create the runs.
+        '''
+        self.runs = runs
+        self.key = key
+        self._files = []
+        self._merged = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._merged is None:
+            self._open()
+        try:
+            return next(self._merged)
+        except StopIteration:
+            self.close()
+            raise
+
+    next = __next__
+
+    def _open(self):
+        try:
+            for run in self.runs:
+                self._files.append(open(run))
+        except:
+            self.close()
+            raise
+        streams = [(line.rstrip('\n') for line in f) for f in self._files]
+        if self.key is None:
+            self._merged = heapq.merge(*streams)
+        else:
+            decorated = [((self.key(record), record) for record in stream) for stream in streams]
+            self._merged = (record for _, record in heapq.merge(*decorated))
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._merged = iter(())
+        _remove_runs(self.runs)
+        self.runs = []
+
+
+def external_sort_files(jobs, processes=3, buffer_lines=EXTERNAL_SORT_BUFFER_LINES, cache_dir=DUMPS_CACHE_DIR):
+    '''
+    Sorts several files with a bounded-memory external merge sort, the
+    first pass of each file running in its own process.
+
+    :param jobs: List of dictionaries with the arguments `filepath`,
+    `parser`, `filter_`, `key` and `prefix` of `sort_in_runs` for each file.
+    :param processes: Maximum number of parallel processes, the files are
+    sorted sequentially in the current process if lower than 2.
+    :param buffer_lines: Maximum number of records in memory per process.
+    :param cache_dir: Working dir where the sorted runs are placed.
+    :returns: List with one `MergedRuns` iterator per job, in order.
+    '''
+    jobs = [dict(job, buffer_lines=buffer_lines, cache_dir=cache_dir) for job in jobs]
+
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(processes, len(jobs)))
+        try:
+            results = [pool.apply_async(sort_in_runs, kwds=job) for job in jobs]
+            pool.close()
+            pool.join()
+        except:
+            pool.terminate()
+            raise
+        runs = []
+        try:
+            for result in results:
+                runs.append(result.get())
+        except:
+            for result in results:
+                if result.successful():
+                    _remove_runs(result.get())
+            raise
+    else:
+        runs = []
+        try:
+            for job in jobs:
+                runs.append(sort_in_runs(**job))
+        except:
+            for job_runs in runs:
+                _remove_runs(job_runs)
+            raise
+
+    return [MergedRuns(job_runs, key=job.get('key')) for job, job_runs in zip(jobs, runs)]
 
 
 def populate_args(argparser):
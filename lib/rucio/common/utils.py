@@ -57,6 +57,7 @@ import threading
 import time
 import zlib
 from enum import Enum
+from multiprocessing.pool import ThreadPool
 from uuid import uuid4 as uuid
 from xml.etree import ElementTree
 
@@ -224,6 +225,81 @@ def set_checksum_value(file, checksum_names_list):
                 break
 
 
+CHECKSUM_BUFFER_SIZE = 1024 * 1024
+
+
+class _ZlibChecksum(object):
+    """
+    Running zlib checksum with the update/hexdigest interface of hashlib.
+    """
+
+    def __init__(self, function, start, digest_format):
+        self.function = function
+        self.value = start
+        self.digest_format = digest_format
+
+    def update(self, data):
+        self.value = self.function(data, self.value)
+
+    def hexdigest(self):
+        # backflip on 32bit
+        return str(self.digest_format % (self.value & 0xFFFFFFFF))
+
+
+CHECKSUM_HASHER_DICT = {
+    # adler starting value is _not_ 0
+    'adler32': lambda: _ZlibChecksum(zlib.adler32, 1, '%08x'),
+    'md5': hashlib.md5,
+    'sha256': hashlib.sha256,
+    'crc32': lambda: _ZlibChecksum(zlib.crc32, 0, '%X'),
+}
+
+
+def calculate_checksums(file, checksum_names=None, buffer_size=CHECKSUM_BUFFER_SIZE):
+    """
+    Calculates several checksums of the file named file in a single read, with a fixed size buffer.
+
+    :param file: file name
+    :param checksum_names: list of checksum names from CHECKSUM_HASHER_DICT, by default GLOBALLY_SUPPORTED_CHECKSUMS
+    :param buffer_size: size of the read buffer in bytes
+    :returns: dictionary {checksum_name: hexadecimal digest}
+    """
+    checksum_names = checksum_names or GLOBALLY_SUPPORTED_CHECKSUMS
+    hashers = [(checksum_name, CHECKSUM_HASHER_DICT[checksum_name]()) for checksum_name in checksum_names]
+
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(file, 'rb') as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            chunk = view[:length] if length < buffer_size else view
+            for _, hasher in hashers:
+                hasher.update(chunk)
+
+    return dict((checksum_name, hasher.hexdigest()) for checksum_name, hasher in hashers)
+
+
+def bulk_calculate_checksums(files, checksum_names=None, nb_threads=1):
+    """
+    Calculates several checksums of several files, each file is read once.
+
+    :param files: list of file names
+    :param checksum_names: list of checksum names from CHECKSUM_HASHER_DICT, by default GLOBALLY_SUPPORTED_CHECKSUMS
+    :param nb_threads: number of files hashed in parallel
+    :returns: dictionary {file name: {checksum_name: hexadecimal digest}}
+    """
+    if nb_threads <= 1 or len(files) <= 1:
+        return dict((file, calculate_checksums(file, checksum_names)) for file in files)
+
+    pool = ThreadPool(min(nb_threads, len(files)))
+    try:
+        return dict(zip(files, pool.map(lambda file: calculate_checksums(file, checksum_names), files)))
+    finally:
+        pool.close()
+
+
 def adler32(file):
     """
     An Adler-32 checksum is obtained by calculating two 16-bit checksums A and B and concatenating their bits into a 32-bit integer. A is the sum of all bytes in the stream plus one, and B is the sum of the individual values of A from each step.
@@ -231,23 +307,11 @@ def adler32(file):
     :param file: file name
     :returns: Hexified string, padded to 8 values.
     """
-
-    # adler starting value is _not_ 0
-    adler = 1
-
     try:
-        with open(file, 'rb') as openFile:
-            for line in openFile:
-                adler = zlib.adler32(line, adler)
+        return calculate_checksums(file, ['adler32'])['adler32']
     except Exception as e:
         raise Exception('FATAL - could not get Adler32 checksum of file %s - %s' % (file, e))
 
-    # backflip on 32bit
-    if adler < 0:
-        adler = adler + 2 ** 32
-
-    return str('%08x' % adler)
-
 
 CHECKSUM_ALGO_DICT['adler32'] = adler32
 
@@ -259,15 +323,11 @@ def md5(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    hash_md5 = hashlib.md5()
     try:
-        with open(file, "rb") as f:
-            list(map(hash_md5.update, iter(lambda: f.read(4096), b"")))
+        return calculate_checksums(file, ['md5'])['md5']
     except Exception as e:
         raise Exception('FATAL - could not get MD5 checksum of file %s - %s' % (file, e))
 
-    return hash_md5.hexdigest()
-
 
 CHECKSUM_ALGO_DICT['md5'] = md5
 
@@ -279,11 +339,7 @@ def sha256(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    with open(file, "rb") as f:
-        bytes = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest()
-        print(readable_hash)
-        return readable_hash
+    return calculate_checksums(file, ['sha256'])['sha256']
 
 
 CHECKSUM_ALGO_DICT['sha256'] = sha256
@@ -296,10 +352,7 @@ def crc32(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    prev = 0
-    for eachLine in open(file, "rb"):
-        prev = zlib.crc32(eachLine, prev)
-    return "%X" % (prev & 0xFFFFFFFF)
+    return calculate_checksums(file, ['crc32'])['crc32']
 
 
 CHECKSUM_ALGO_DICT['crc32'] = crc32
@@ -23,9 +23,12 @@
 # - Brandon White <bjwhite@fnal.gov>, 2019
 # - Eli Chadwick <eli.chadwick@stfc.ac.uk>, 2020
 
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql.expression import bindparam
 
-from rucio.common.exception import CounterNotFound
+from rucio.common.exception import CounterNotFound, DatabaseException
+from rucio.common.utils import chunks
 import rucio.core.account
 import rucio.core.rse
 
@@ -132,14 +135,27 @@ def get_updated_account_counters(total_workers, worker_number, session=None):
     query = session.query(models.UpdatedAccountCounter.account, models.UpdatedAccountCounter.rse_id).\
         distinct(models.UpdatedAccountCounter.account, models.UpdatedAccountCounter.rse_id)
 
+    query = __filter_account_counter_work(query=query, total_workers=total_workers, worker_number=worker_number, session=session)
+
+    return query.all()
+
+
+def __filter_account_counter_work(query, total_workers, worker_number, session):
+    """
+    Restrict a query on the updated_account_counters to the (account, rse_id) pairs of a worker.
+
+    :param query:          The query.
+    :param total_workers:  Number of total workers.
+    :param worker_number:  id of the executing worker.
+    :param session:        Database session in use.
+    :returns:              The filtered query.
+    """
     if session.bind.dialect.name == 'oracle':
         hash_variable = 'CONCAT(account, rse_id)'''
     else:
         hash_variable = 'concat(account, rse_id)'
 
-    query = filter_thread_work(session=session, query=query, total_threads=total_workers, thread_id=worker_number, hash_variable=hash_variable)
-
-    return query.all()
+    return filter_thread_work(session=session, query=query, total_threads=total_workers, thread_id=worker_number, hash_variable=hash_variable)
 
 
 @transactional_session
@@ -168,6 +184,59 @@ def update_account_counter(account, rse_id, session=None):
         update.delete(flush=False, session=session)
 
 
+@transactional_session
+def update_account_counters_bulk(total_workers, worker_number, limit=10000, session=None):
+    """
+    Fold the updated_account_counters of a worker into the account counters with set-based statements:
+    the updates are summed per (account, rse_id) in the database, the account counters are
+    upserted in one statement per batch and the consumed updates are deleted by id.
+
+    :param total_workers:  Number of total workers.
+    :param worker_number:  id of the executing worker.
+    :param limit:          Maximum number of updates to consume.
+    :param session:        Database session in use.
+    :returns:              The number of consumed updates.
+    """
+    updated_counter = models.UpdatedAccountCounter
+    query = __filter_account_counter_work(query=session.query(updated_counter.id), total_workers=total_workers, worker_number=worker_number, session=session)
+    ids = [id_ for id_, in query.limit(limit)]
+
+    deltas = {}
+    for chunk in chunks(ids, 1000):
+        query = session.query(updated_counter.account, updated_counter.rse_id, func.sum(updated_counter.files), func.sum(updated_counter.bytes)).\
+            filter(updated_counter.id.in_(chunk)).\
+            group_by(updated_counter.account, updated_counter.rse_id)
+        for account, rse_id, files, bytes in query:
+            delta = deltas.setdefault((account, rse_id), [0, 0])
+            delta[0] += int(files or 0)
+            delta[1] += int(bytes or 0)
+
+        # the updates must not have been consumed by another worker in between, e.g. after a change of the number of workers
+        if session.query(updated_counter).filter(updated_counter.id.in_(chunk)).delete(synchronize_session=False) != len(chunk):
+            raise DatabaseException('Account counter updates were consumed concurrently')
+
+    existing = set()
+    for chunk in chunks(list(deltas), 100):
+        query = session.query(models.AccountUsage.account, models.AccountUsage.rse_id).\
+            filter(or_(*[and_(models.AccountUsage.account == account, models.AccountUsage.rse_id == rse_id) for account, rse_id in chunk]))
+        existing.update((account, rse_id) for account, rse_id in query)
+
+    updates = [{'b_account': account, 'b_rse_id': rse_id, 'b_files': files, 'b_bytes': bytes}
+               for (account, rse_id), (files, bytes) in deltas.items() if (account, rse_id) in existing]
+    if updates:
+        stmt = models.AccountUsage.__table__.update().\
+            where(and_(models.AccountUsage.account == bindparam('b_account'), models.AccountUsage.rse_id == bindparam('b_rse_id'))).\
+            values(files=models.AccountUsage.files + bindparam('b_files'), bytes=models.AccountUsage.bytes + bindparam('b_bytes'))
+        session.execute(stmt, updates)
+
+    inserts = [{'account': account, 'rse_id': rse_id, 'files': files, 'bytes': bytes}
+               for (account, rse_id), (files, bytes) in deltas.items() if (account, rse_id) not in existing]
+    if inserts:
+        session.bulk_insert_mappings(models.AccountUsage, inserts)
+
+    return len(ids)
+
+
 @transactional_session
 def update_account_counter_history(account, rse_id, session=None):
     """
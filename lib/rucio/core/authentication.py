@@ -31,17 +31,22 @@ import datetime
 import hashlib
 import random
 import sys
+import threading
+import time
 import traceback
 from base64 import b64decode
+from collections import OrderedDict
 
 import paramiko
 from dogpile.cache import make_region
 from dogpile.cache.api import NO_VALUE
 from sqlalchemy import and_, or_
 
+from rucio.common.config import config_get, config_get_int
 from rucio.common.exception import CannotAuthenticate, RucioException
 from rucio.common.utils import generate_uuid
 from rucio.core.account import account_exists
+from rucio.core.monitor import record_counter
 from rucio.core.oidc import validate_jwt
 from rucio.db.sqla import filter_thread_work
 from rucio.db.sqla import models
@@ -49,20 +54,125 @@ from rucio.db.sqla.constants import IdentityType
 from rucio.db.sqla.session import read_session, transactional_session
 
 
-def token_key_generator(namespace, fni, **kwargs):
-    """ :returns: generate key function """
-    def generate_key(token, session=None):
-        """ :returns: token """
-        return token
-    return generate_key
-
+class TokenCache(object):
+    """
+    Two-tier cache of the validated authentication tokens.
+
+    The first tier is a LRU dictionary of the process, the second tier is a dogpile
+    region shared by the processes of the node, e.g. memcached or redis. Entries
+    expire with the lifetime of the token, and at the latest after max_lifetime
+    seconds. Unknown tokens are cached as invalid for negative_lifetime seconds.
+    If the shared tier fails, it is skipped and the tokens are looked up in the
+    process tier only, then in the database.
+    """
 
-TOKENREGION = make_region(
-    function_key_generator=token_key_generator
-).configure(
-    'dogpile.cache.memory',
-    expiration_time=3600
-)
+    def __init__(self, region, max_size=10000, max_lifetime=3600, negative_lifetime=10):
+        """
+        :param region:             The dogpile region of the shared tier.
+        :param max_size:           Maximum number of tokens in the process tier.
+        :param max_lifetime:       Maximum number of seconds a valid token is cached.
+        :param negative_lifetime:  Number of seconds an invalid token is cached.
+        """
+        self.region = region
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.negative_lifetime = negative_lifetime
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'negative_hits': 0, 'misses': 0, 'shared_errors': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        # tokens are secrets and can be longer than the memcached key limit
+        return 'token_%s' % hashlib.sha256(token.encode()).hexdigest()
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+        record_counter('core.authentication.token_cache.%s' % counter)
+
+    def _shared(self, operation, *args):
+        # the shared tier is an optimisation, a failing backend must not fail the authentication
+        try:
+            return getattr(self.region, operation)(*args)
+        except Exception:
+            self._count('shared_errors')
+            return NO_VALUE
+
+    def _set_local(self, token, entry):
+        with self._lock:
+            self._entries[token] = entry
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, token):
+        """
+        Get a token from the cache.
+
+        :param token: Authentication token as a variable-length string.
+        :returns: (found, value), value is None for an invalid token.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(token)
+                else:
+                    del self._entries[token]
+                    entry = None
+        if entry is None:
+            entry = self._shared('get', self._key(token))
+            if entry is NO_VALUE or entry[0] <= now:
+                self._count('misses')
+                return False, None
+            self._set_local(token, entry)
+            self._count('shared_hits' if entry[1] is not None else 'negative_hits')
+            return True, entry[1]
+        self._count('local_hits' if entry[1] is not None else 'negative_hits')
+        return True, entry[1]
+
+    def set(self, token, value):
+        """
+        Cache a valid token until its lifetime, at the latest for max_lifetime seconds.
+
+        :param token: Authentication token as a variable-length string.
+        :param value: The token dictionary, as returned by query_token.
+        """
+        lifetime = (value.get('lifetime', datetime.datetime(1970, 1, 1)) - datetime.datetime.utcnow()).total_seconds()
+        entry = (time.time() + min(lifetime, self.max_lifetime), value)
+        self._set_local(token, entry)
+        self._shared('set', self._key(token), entry)
+
+    def set_invalid(self, token):
+        """
+        Cache an invalid token for negative_lifetime seconds.
+
+        :param token: Authentication token as a variable-length string.
+        """
+        if self.negative_lifetime <= 0:
+            return
+        entry = (time.time() + self.negative_lifetime, None)
+        self._set_local(token, entry)
+        self._shared('set', self._key(token), entry)
+
+    def delete(self, token):
+        """
+        Remove a token from both tiers.
+
+        :param token: Authentication token as a variable-length string.
+        """
+        with self._lock:
+            self._entries.pop(token, None)
+        self._shared('delete', self._key(token))
+
+
+TOKEN_CACHE = TokenCache(region=make_region().configure(config_get('cache', 'token_backend', False, 'dogpile.cache.memcached'),
+                                                        expiration_time=3600,
+                                                        arguments={'url': config_get('cache', 'url', False, '127.0.0.1:11211'), 'distributed_lock': True}),
+                         max_size=config_get_int('cache', 'token_cache_size', False, 10000),
+                         negative_lifetime=config_get_int('cache', 'token_negative_lifetime', False, 10))
 
 
 @transactional_session
@@ -444,23 +554,24 @@ def validate_auth_token(token, session=None):
     # Be gentle with bash variables, there can be whitespace
     token = token.strip()
 
-    # Check if token ca be found in cache region
-    value = TOKENREGION.get(token)
-    if value is NO_VALUE:  # no cached entry found
+    # Check if token ca be found in the cache
+    found, value = TOKEN_CACHE.get(token)
+    if not found:  # no cached entry found
         value = query_token(token, session=session)
         if not value:
             # identify JWT access token and validte
             # & save it in Rucio if scope and audience are correct
             if len(token.split(".")) == 3:
                 value = validate_jwt(token, session=session)
-                if not value:
-                    return None
-            else:
-                return None
+        if not value:
+            TOKEN_CACHE.set_invalid(token)
+            return None
         # save token in the cache
-        TOKENREGION.set(token, value)
+        TOKEN_CACHE.set(token, value)
+    elif not value:
+        return None
     if value.get('lifetime', datetime.datetime(1970, 1, 1)) < datetime.datetime.utcnow():  # check if expired
-        TOKENREGION.delete(token)
+        TOKEN_CACHE.delete(token)
         return None
     return value
 
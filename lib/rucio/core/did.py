@@ -1582,6 +1582,7 @@ def get_dataset_by_guid(guid, session=None):
 def touch_dids(dids, session=None):
     """
     Update the accessed_at timestamp and the access_cnt of the given dids.
+    All the dids are updated with one statement.
 
     :param replicas: the list of dids.
     :param session: The database session in use.
@@ -1591,14 +1592,18 @@ def touch_dids(dids, session=None):
 
     now = datetime.utcnow()
     none_value = None
+    updates = [{'b_scope': did['scope'], 'b_name': did['name'], 'b_did_type': did['type'], 'b_accessed_at': did.get('accessed_at') or now} for did in dids]
+    if not updates:
+        return True
     try:
-        for did in dids:
-            session.query(models.DataIdentifier).\
-                filter_by(scope=did['scope'], name=did['name'], did_type=did['type']).\
-                update({'accessed_at': did.get('accessed_at') or now,
-                        'access_cnt': case([(models.DataIdentifier.access_cnt == none_value, 1)],
-                                           else_=(models.DataIdentifier.access_cnt + 1))},
-                       synchronize_session=False)
+        stmt = models.DataIdentifier.__table__.update().\
+            where(and_(models.DataIdentifier.scope == bindparam('b_scope'),
+                       models.DataIdentifier.name == bindparam('b_name'),
+                       models.DataIdentifier.did_type == bindparam('b_did_type'))).\
+            values(accessed_at=bindparam('b_accessed_at'),
+                   access_cnt=case([(models.DataIdentifier.access_cnt == none_value, 1)],
+                                   else_=(models.DataIdentifier.access_cnt + 1)))
+        session.execute(stmt, updates)
     except DatabaseError:
         return False
 
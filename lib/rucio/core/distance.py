@@ -23,16 +23,63 @@
 
 from typing import TYPE_CHECKING
 
+from dogpile.cache import make_region
+from dogpile.cache.api import NoValue
 from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.orm import aliased
 
 from rucio.common import exception
+from rucio.common.config import config_get
+from rucio.common.utils import generate_uuid
 from rucio.db.sqla.models import Distance, RSE
-from rucio.db.sqla.session import transactional_session, read_session
+from rucio.db.sqla.session import transactional_session, read_session, run_after_commit
 
 if TYPE_CHECKING:
     from typing import List, Dict
 
+REGION = make_region().configure('dogpile.cache.memcached',
+                                 expiration_time=86400,
+                                 arguments={'url': config_get('cache', 'url', False, '127.0.0.1:11211'), 'distributed_lock': True})
+
+# Last version of the distance graph seen by this process
+DISTANCE_GRAPH_VERSION = None
+
+
+def get_distance_graph_version():
+    """
+    Get the version of the distance graph. The version changes whenever distance rankings or
+    RSE protocols are modified, so that in-memory copies of the graph can be invalidated.
+
+    If the cache has no version, e.g. because memcached is unreachable, the last version seen
+    by this process is used, so that the graph is not reloaded on every call.
+
+    :returns: The version as a string.
+    """
+    global DISTANCE_GRAPH_VERSION
+
+    version = REGION.get('distance_graph_version')
+    if isinstance(version, NoValue):
+        if DISTANCE_GRAPH_VERSION is None:
+            return invalidate_distance_graph()
+        version = DISTANCE_GRAPH_VERSION
+        REGION.set('distance_graph_version', version)
+    DISTANCE_GRAPH_VERSION = version
+    return version
+
+
+def invalidate_distance_graph():
+    """
+    Change the version of the distance graph.
+
+    :returns: The new version.
+    """
+    global DISTANCE_GRAPH_VERSION
+
+    version = generate_uuid()
+    REGION.set('distance_graph_version', version)
+    DISTANCE_GRAPH_VERSION = version
+    return version
+
 
 @transactional_session
 def add_distance(src_rse_id, dest_rse_id, ranking=None, agis_distance=None, geoip_distance=None,
@@ -57,6 +104,7 @@ def add_distance(src_rse_id, dest_rse_id, ranking=None, agis_distance=None, geoi
         new_distance = Distance(src_rse_id=src_rse_id, dest_rse_id=dest_rse_id, ranking=ranking, agis_distance=agis_distance, geoip_distance=geoip_distance,
                                 active=active, submitted=submitted, finished=finished, failed=failed, transfer_speed=transfer_speed)
         new_distance.save(session=session)
+        run_after_commit(session, invalidate_distance_graph)
     except IntegrityError:
         raise exception.Duplicate()
     except DatabaseError as error:
@@ -130,6 +178,7 @@ def delete_distances(src_rse_id=None, dest_rse_id=None, session=None):
             query = query.filter(Distance.dest_rse_id == dest_rse_id)
 
         query.delete()
+        run_after_commit(session, invalidate_distance_graph)
     except IntegrityError as error:
         raise exception.RucioException(error.args)
 
@@ -155,6 +204,8 @@ def update_distances(src_rse_id=None, dest_rse_id=None, parameters=None, session
         if dest_rse_id:
             query = query.filter(Distance.dest_rse_id == dest_rse_id)
         query.update(params)
+        if 'ranking' in params:
+            run_after_commit(session, invalidate_distance_graph)
     except IntegrityError as error:
         raise exception.RucioException(error.args)
 
@@ -23,18 +23,206 @@
 
 import datetime
 import hashlib
+import threading
+import time
 
-from sqlalchemy import func
 from sqlalchemy.sql import distinct
 
 from rucio.db.sqla.models import Heartbeats
-from rucio.db.sqla.session import read_session, transactional_session
+from rucio.db.sqla.session import read_session, transactional_session, run_after_commit
+from rucio.common.config import config_get_int
 from rucio.common.exception import DatabaseException
-from rucio.common.utils import pid_exists
+from rucio.common.utils import chunks, pid_exists
 
 
 DEFAULT_EXPIRATION_DELAY = datetime.timedelta(days=1).total_seconds()
 
+# Maximum number of seconds between two writes of an unchanged heartbeat, and lifetime of the
+# cached view of the live heartbeats of an executable. Capped to a tenth of older_than.
+WRITE_INTERVAL = config_get_int('heartbeat', 'write_interval', raise_exception=False, default=30)
+
+# Heartbeats of the threads of this process: {(hash_executable, hostname, pid, thread_id): _Beat}
+_BEATS = {}
+# Live heartbeats of an executable: {(hash_executable, older_than): _Members}
+_MEMBERS = {}
+# Protects _BEATS and _MEMBERS, never held during database I/O, notified at the end of a flush
+_LOCK = threading.Condition()
+
+
+class _Beat(object):
+    """
+    Last heartbeat of a thread of this process and the state last written to the database.
+    A beat being flushed is not flushed again until its transaction is committed or rolled back,
+    flushing is the ident of the thread which flushes it.
+    """
+    __slots__ = ('readable', 'thread_name', 'payload', 'beat_at', 'written_payload', 'written_at', 'flushing')
+
+    def __init__(self, readable, thread_name):
+        self.readable = readable
+        self.thread_name = thread_name
+        self.payload = None
+        self.beat_at = None
+        self.written_payload = None
+        self.written_at = None
+        self.flushing = None
+
+
+class _Members(object):
+    """
+    Snapshot of the live heartbeats of an executable, indexed in the order of the thread assignment.
+    """
+    __slots__ = ('loaded_at', 'index', 'payloads')
+
+    def __init__(self, rows):
+        self.loaded_at = time.time()
+        self.index = {}
+        self.payloads = {}
+        for hostname, pid, thread_id, payload in rows:
+            self.index[(hostname, pid, thread_id)] = len(self.index)
+            self.payloads[(hostname, pid, thread_id)] = payload
+
+    def payload_counts(self):
+        """
+        Number of threads per payload, threads without payload are not counted.
+        """
+        counts = {}
+        for payload in self.payloads.values():
+            counts[payload] = counts.get(payload, 0) + (0 if payload is None else 1)
+        return counts
+
+
+def _interval(older_than):
+    return min(WRITE_INTERVAL, older_than / 10.)
+
+
+def _load_members(hash_executable, older_than, session):
+    """
+    Read the live heartbeats of an executable and cache them.
+
+    :param hash_executable: Hash of the executable.
+    :param older_than: Ignore specified heartbeats older than specified nr of seconds.
+    :param session: The database session in use.
+
+    :returns: _Members
+    """
+    query = session.query(Heartbeats.hostname,
+                          Heartbeats.pid,
+                          Heartbeats.thread_id,
+                          Heartbeats.payload)\
+                   .with_hint(Heartbeats, "index(HEARTBEATS HEARTBEATS_PK)", 'oracle')\
+                   .filter(Heartbeats.executable == hash_executable)\
+                   .filter(Heartbeats.updated_at >= datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than))\
+                   .order_by(Heartbeats.hostname,
+                             Heartbeats.pid,
+                             Heartbeats.thread_id)
+    members = _Members(query.all())
+    with _LOCK:
+        _MEMBERS[(hash_executable, older_than)] = members
+    return members
+
+
+def _flush_beats(hash_executable, hostname, pid, session):
+    """
+    Write the pending heartbeats of all the threads of a process in one go.
+    Already registered heartbeats are updated with one statement per payload,
+    the others are inserted.
+
+    The pending beats are taken under the lock and written without it. They are
+    marked as written once the transaction is committed, and are pending again
+    if it is rolled back.
+
+    :param hash_executable: Hash of the executable.
+    :param hostname: Hostname of the process.
+    :param pid: UNIX Process ID of the process.
+    :param session: The database session in use.
+    """
+    with _LOCK:
+        # (thread_id, beat, beat_at, payload, registered)
+        pending = [(key[3], beat, beat.beat_at, beat.payload, beat.written_at is not None) for key, beat in _BEATS.items()
+                   if key[:3] == (hash_executable, hostname, pid) and beat.flushing is None and (beat.written_at is None or beat.beat_at > beat.written_at)]
+        for _, beat, _, _, _ in pending:
+            beat.flushing = threading.get_ident()
+    if not pending:
+        return
+    run_after_commit(session,
+                     lambda: _flushed(hash_executable, hostname, pid, pending),
+                     on_rollback=lambda: _flushed(hash_executable, hostname, pid, pending, committed=False))
+
+    updated_at = datetime.datetime.utcnow()
+    to_upsert, by_payload = [], {}
+    for thread_id, beat, _, payload, registered in pending:
+        if registered:
+            by_payload.setdefault(payload, []).append((thread_id, beat, payload))
+        else:
+            to_upsert.append((thread_id, beat, payload))
+
+    for payload, beats in by_payload.items():
+        for chunk in chunks(beats, 1000):
+            rowcount = session.query(Heartbeats)\
+                .filter_by(executable=hash_executable, hostname=hostname, pid=pid)\
+                .filter(Heartbeats.thread_id.in_([thread_id for thread_id, _, _ in chunk]))\
+                .update({'updated_at': updated_at, 'payload': payload}, synchronize_session=False)
+            if rowcount < len(chunk):
+                # some heartbeats were removed in between, write them again one by one
+                to_upsert.extend(chunk)
+
+    for thread_id, beat, payload in to_upsert:
+        rowcount = session.query(Heartbeats)\
+            .filter_by(executable=hash_executable,
+                       hostname=hostname,
+                       pid=pid,
+                       thread_id=thread_id)\
+            .update({'updated_at': updated_at, 'payload': payload})
+        if not rowcount:
+            Heartbeats(executable=hash_executable,
+                       readable=beat.readable,
+                       hostname=hostname,
+                       pid=pid,
+                       thread_id=thread_id,
+                       thread_name=beat.thread_name,
+                       payload=payload).save(session=session)
+
+
+def _flushed(hash_executable, hostname, pid, pending, committed=True):
+    """
+    Record the end of the transaction of a flush of heartbeats.
+
+    :param hash_executable: Hash of the executable.
+    :param hostname: Hostname of the process.
+    :param pid: UNIX Process ID of the process.
+    :param pending: The beats of the flush, as taken by _flush_beats.
+    :param committed: False if the transaction was rolled back, the beats are then pending again.
+    """
+    with _LOCK:
+        for thread_id, beat, beat_at, payload, _ in pending:
+            beat.flushing = None
+            if not committed:
+                continue
+            beat.written_at = beat_at
+            beat.written_payload = payload
+            for (executable, _), members in _MEMBERS.items():
+                if executable == hash_executable and (hostname, pid, thread_id) in members.payloads:
+                    members.payloads[(hostname, pid, thread_id)] = payload
+        _LOCK.notify_all()
+
+
+def _forget(hash_executable=None, member=None):
+    """
+    Drop the cached heartbeat views, of one executable or of all of them.
+
+    :param hash_executable: Hash of the executable, all executables if None.
+    :param member: (hostname, pid, thread_id) of a heartbeat of this process to forget.
+    """
+    with _LOCK:
+        if hash_executable is None:
+            _BEATS.clear()
+            _MEMBERS.clear()
+            return
+        if member is not None:
+            _BEATS.pop((hash_executable,) + member, None)
+        for key in [key for key in _MEMBERS if key[0] == hash_executable]:
+            del _MEMBERS[key]
+
 
 @transactional_session
 def sanity_check(executable, hostname, hash_executable=None, pid=None, thread=None,
@@ -82,6 +270,7 @@ def _sanity_check(executable, hostname, hash_executable=None, expiration_delay=D
         for pid, in session.query(distinct(Heartbeats.pid)).filter_by(hostname=hostname):
             if not pid_exists(pid):
                 session.query(Heartbeats).filter_by(hostname=hostname, pid=pid).delete()
+    _forget(hash_executable)
 
     if expiration_delay:
         cardiac_arrest(older_than=expiration_delay, session=session)
@@ -94,7 +283,9 @@ def live(executable, hostname, pid, thread, older_than=600, hash_executable=None
     The executable name is used for the calculation of thread assignments.
     Removal of stale heartbeats is done as a scheduled database job.
 
-    TODO: Returns an assignment dictionary for the given executable.
+    Unchanged heartbeats are written at most every WRITE_INTERVAL seconds, together
+    with the ones of the other threads of the process, and the thread assignment is
+    computed from a cached view of the live heartbeats of the executable.
 
     :param executable: Executable name as a string, e.g., conveyor-submitter.
     :param hostname: Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
@@ -110,47 +301,40 @@ def live(executable, hostname, pid, thread, older_than=600, hash_executable=None
     if not hash_executable:
         hash_executable = calc_hash(executable)
 
-    # upsert the heartbeat
-    rowcount = session.query(Heartbeats)\
-        .filter_by(executable=hash_executable,
-                   hostname=hostname,
-                   pid=pid,
-                   thread_id=thread.ident)\
-        .update({'updated_at': datetime.datetime.utcnow(), 'payload': payload})
-    if not rowcount:
-        Heartbeats(executable=hash_executable,
-                   readable=executable,
-                   hostname=hostname,
-                   pid=pid,
-                   thread_id=thread.ident,
-                   thread_name=thread.name,
-                   payload=payload).save(session=session)
-
-    # assign thread identifier
-    query = session.query(Heartbeats.hostname,
-                          Heartbeats.pid,
-                          Heartbeats.thread_id)\
-                   .with_hint(Heartbeats, "index(HEARTBEATS HEARTBEATS_PK)", 'oracle')\
-                   .filter(Heartbeats.executable == hash_executable)\
-                   .filter(Heartbeats.updated_at >= datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than))\
-                   .group_by(Heartbeats.hostname,
-                             Heartbeats.pid,
-                             Heartbeats.thread_id)\
-                   .order_by(Heartbeats.hostname,
-                             Heartbeats.pid,
-                             Heartbeats.thread_id)
-    result = query.all()
-
-    # there is no universally applicable rownumber in SQLAlchemy
-    # so we have to do it in Python
-    assign_thread = 0
-    for r in range(len(result)):
-        if result[r][0] == hostname and result[r][1] == pid and result[r][2] == thread.ident:
-            assign_thread = r
-            break
-
-    return {'assign_thread': assign_thread,
-            'nr_threads': len(result)}
+    interval = _interval(older_than)
+    member = (hostname, pid, thread.ident)
+    with _LOCK:
+        beat = _BEATS.get((hash_executable,) + member)
+        if beat is None:
+            beat = _BEATS[(hash_executable,) + member] = _Beat(executable, thread.name)
+        beat.payload = payload
+        beat.beat_at = time.time()
+        # the beats of all the threads of the process are written together
+        flush = beat.written_at is None or beat.written_payload != payload or beat.beat_at - beat.written_at >= interval
+
+    if flush:
+        _flush_beats(hash_executable, hostname, pid, session=session)
+    with _LOCK:
+        if beat.written_at is None and beat.flushing not in (None, threading.get_ident()):
+            # the first beat of this thread is written by the flush of another thread,
+            # wait for its transaction, the heartbeat is not visible before
+            _LOCK.wait_for(lambda: beat.flushing is None, timeout=interval)
+
+    # the assignment only changes with the membership, which is re-read when this
+    # thread is not part of it or when the cached view is older than the interval
+    with _LOCK:
+        members = _MEMBERS.get((hash_executable, older_than))
+    if members is None or member not in members.index or time.time() - members.loaded_at >= interval:
+        members = _load_members(hash_executable, older_than, session=session)
+        if member not in members.index:
+            # the heartbeat was removed in between, write it again
+            with _LOCK:
+                beat.written_at = None
+            _flush_beats(hash_executable, hostname, pid, session=session)
+            members = _load_members(hash_executable, older_than, session=session)
+
+    return {'assign_thread': members.index.get(member, 0),
+            'nr_threads': len(members.index)}
 
 
 @transactional_session
@@ -180,6 +364,7 @@ def die(executable, hostname, pid, thread, older_than=None, hash_executable=None
         query = query.filter(Heartbeats.updated_at < datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than))
 
     query.delete()
+    _forget(hash_executable, member=(hostname, pid, thread.ident))
 
 
 @transactional_session
@@ -197,6 +382,7 @@ def cardiac_arrest(older_than=None, session=None):
         query = query.filter(Heartbeats.updated_at < datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than))
 
     query.delete()
+    _forget()
 
 
 @read_session
@@ -225,25 +411,25 @@ def list_heartbeats(session=None):
 def list_payload_counts(executable, older_than=600, hash_executable=None, session=None):
     """
     Give the counts of number of threads per payload for a certain executable.
+    The counts come from the cached view of the live heartbeats, refreshed
+    like the thread assignment of live.
 
     :param executable: Executable name as a string, e.g., conveyor-submitter
     :param older_than: Removes specified heartbeats older than specified nr of seconds
     :param hash_executable: Hash of the executable.
     :param session: The database session in use.
 
-    :returns: List of tuples
+    :returns: Dictionary {payload: number of threads}
     """
 
     if not hash_executable:
         hash_executable = calc_hash(executable)
-    query = session.query(Heartbeats.payload,
-                          func.count(Heartbeats.payload))\
-                   .filter(Heartbeats.executable == hash_executable)\
-                   .filter(Heartbeats.updated_at >= datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than))\
-                   .group_by(Heartbeats.payload)\
-                   .order_by(Heartbeats.payload)
-
-    return dict(query.all())
+    with _LOCK:
+        members = _MEMBERS.get((hash_executable, older_than))
+    if members is None or time.time() - members.loaded_at >= _interval(older_than):
+        members = _load_members(hash_executable, older_than, session=session)
+    with _LOCK:
+        return members.payload_counts()
 
 
 def calc_hash(executable):
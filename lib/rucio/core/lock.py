@@ -20,11 +20,12 @@ import logging
 from datetime import datetime
 
 from sqlalchemy.exc import DatabaseError
-from sqlalchemy.sql.expression import and_, or_
+from sqlalchemy.sql.expression import and_, or_, bindparam
 
 import rucio.core.rule
 import rucio.core.did
 
+from rucio.common.utils import chunks
 from rucio.core.lifetime_exception import define_eol
 from rucio.core.rse import get_rse_name
 from rucio.db.sqla import models, filter_thread_work
@@ -411,6 +412,7 @@ def failed_transfer(scope, name, rse_id, error_message=None, broken_rule_id=None
 def touch_dataset_locks(dataset_locks, session=None):
     """
     Update the accessed_at timestamp of the given dataset locks + eol_at.
+    The locks and the rules are updated with one statement each.
 
     :param replicas: the list of dataset locks.
     :param session: The database session in use.
@@ -419,14 +421,35 @@ def touch_dataset_locks(dataset_locks, session=None):
     """
 
     now = datetime.utcnow()
+    updates = []
+    eol_ats = {}
     for dataset_lock in dataset_locks:
-        eol_at = define_eol(dataset_lock['scope'], dataset_lock['name'], rses=[{'id': dataset_lock['rse_id']}], session=session)
-        try:
-            session.query(models.DatasetLock).filter_by(scope=dataset_lock['scope'], name=dataset_lock['name'], rse_id=dataset_lock['rse_id']).\
-                update({'accessed_at': dataset_lock.get('accessed_at') or now}, synchronize_session=False)
-            for res in session.query(models.DatasetLock.rule_id).filter_by(scope=dataset_lock['scope'], name=dataset_lock['name'], rse_id=dataset_lock['rse_id']):
-                session.query(models.ReplicationRule).filter_by(id=res[0]).update({'eol_at': eol_at}, synchronize_session=False)
-        except DatabaseError:
-            return False
+        key = (dataset_lock['scope'], dataset_lock['name'], dataset_lock['rse_id'])
+        eol_ats[key] = define_eol(dataset_lock['scope'], dataset_lock['name'], rses=[{'id': dataset_lock['rse_id']}], session=session)
+        updates.append({'b_scope': dataset_lock['scope'], 'b_name': dataset_lock['name'], 'b_rse_id': dataset_lock['rse_id'], 'b_accessed_at': dataset_lock.get('accessed_at') or now})
+    if not updates:
+        return True
+
+    try:
+        stmt = models.DatasetLock.__table__.update().\
+            where(and_(models.DatasetLock.scope == bindparam('b_scope'),
+                       models.DatasetLock.name == bindparam('b_name'),
+                       models.DatasetLock.rse_id == bindparam('b_rse_id'))).\
+            values(accessed_at=bindparam('b_accessed_at'))
+        session.execute(stmt, updates)
+
+        rule_updates = []
+        for chunk in chunks(list(eol_ats), 100):
+            query = session.query(models.DatasetLock.scope, models.DatasetLock.name, models.DatasetLock.rse_id, models.DatasetLock.rule_id).\
+                filter(or_(*[and_(models.DatasetLock.scope == scope, models.DatasetLock.name == name, models.DatasetLock.rse_id == rse_id) for scope, name, rse_id in chunk]))
+            for scope, name, rse_id, rule_id in query:
+                rule_updates.append({'b_id': rule_id, 'b_eol_at': eol_ats[(scope, name, rse_id)]})
+        if rule_updates:
+            stmt = models.ReplicationRule.__table__.update().\
+                where(models.ReplicationRule.id == bindparam('b_id')).\
+                values(eol_at=bindparam('b_eol_at'))
+            session.execute(stmt, rule_updates)
+    except DatabaseError:
+        return False
 
     return True
@@ -33,7 +33,7 @@ from dogpile.cache.api import NO_VALUE
 
 from rucio.common.config import config_get
 from rucio.common.exception import InvalidObject, RucioException, ConfigNotFound
-from rucio.common.utils import APIEncoder
+from rucio.common.utils import APIEncoder, chunks
 from rucio.core.config import get
 from rucio.db.sqla import filter_thread_work
 from rucio.db.sqla.models import Message, MessageHistory
@@ -134,6 +134,7 @@ def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=Non
 
         # Step 3:
         # Assemble message object
+        nolimit_messages = {}
         for id, created_at, event_type, payload, services in query:
             message = {'id': id,
                        'created_at': created_at,
@@ -142,13 +143,18 @@ def retrieve_messages(bulk=1000, thread=None, total_threads=None, event_type=Non
 
             # Only switch SQL context when necessary
             if payload == 'nolimit':
-                nolimit_query = session.query(Message.payload_nolimit).filter(Message.id == id).one()[0]
-                message['payload'] = json.loads(str(nolimit_query))
+                nolimit_messages[id] = message
             else:
                 message['payload'] = json.loads(str(payload))
 
             messages.append(message)
 
+        # Step 4:
+        # Fetch the payloads which do not fit in the payload column, one query per chunk of messages
+        for ids in chunks(list(nolimit_messages), 1000):
+            for id, payload_nolimit in session.query(Message.id, Message.payload_nolimit).filter(Message.id.in_(ids)):
+                nolimit_messages[id]['payload'] = json.loads(str(payload_nolimit))
+
         return messages
 
     except IntegrityError as e:
@@ -45,7 +45,6 @@ import heapq
 import logging
 import random
 from collections import defaultdict
-from copy import deepcopy
 from curses.ascii import isprint
 from datetime import datetime, timedelta
 from hashlib import sha256
@@ -63,7 +62,7 @@ from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.orm import aliased
 from sqlalchemy.orm.exc import FlushError, NoResultFound
 from sqlalchemy.sql import label
-from sqlalchemy.sql.expression import case, select, text, false, true
+from sqlalchemy.sql.expression import bindparam, case, select, text, false, true
 
 import rucio.core.did
 import rucio.core.lock
@@ -955,6 +954,173 @@ def get_multi_cache_prefix(cache_site, filename, logger=logging.log):
     return ''
 
 
+class _RSEReadProtocols(object):
+    """
+    Read protocols of one RSE, resolved once per _list_replicas call.
+    """
+
+    __slots__ = ('domain', 'protocols', 'space_token', 'sign_url_service', 'outgoing')
+
+    def __init__(self, domain, protocols, space_token, sign_url_service, outgoing):
+        """
+        :param domain:            Domain used to read from the RSE, 'lan', 'wan' or 'all'.
+        :param protocols:         List of (domain, protocol, priority, scheme) tuples.
+        :param space_token:       Space token of the srm protocol, _NO_SPACE_TOKEN if the RSE has no srm protocol.
+        :param sign_url_service:  Service used to sign https urls, None if the urls are not signed.
+        :param outgoing:          True if the client is at another site and the internal proxy must be prepended.
+        """
+        self.domain = domain
+        self.protocols = protocols
+        self.space_token = space_token
+        self.sign_url_service = sign_url_service
+        self.outgoing = outgoing
+
+
+_NO_SPACE_TOKEN = object()
+
+
+def _get_rse_read_protocols(rse_id, domain, schemes, is_archive, client_location, sign_urls, session):
+    """
+    Resolve the read protocols of a RSE for _list_replicas.
+
+    :param rse_id:           The RSE id.
+    :param domain:           Domain used to read from the RSE, 'lan', 'wan' or 'all'.
+    :param schemes:          The schemes requested by the client.
+    :param is_archive:       True if the first replica listed on the RSE is an archive constituent.
+    :param client_location:  Client location dictionary.
+    :param sign_urls:        If set, the https urls of the RSE are signed.
+    :param session:          The database session in use.
+    :returns:                _RSEReadProtocols object.
+    """
+    rse_settings = rsemgr.get_rse_info(rse_id=rse_id, session=session)
+
+    # assign scheme priorities, and don't forget to exclude disabled protocols
+    # 0 in RSE protocol definition = disabled, 1 = highest priority
+    priorities = {'wan': {p['scheme']: p['domains']['wan']['read'] for p in rse_settings['protocols'] if p['domains']['wan']['read'] > 0},
+                  'lan': {p['scheme']: p['domains']['lan']['read'] for p in rse_settings['protocols'] if p['domains']['lan']['read'] > 0}}
+
+    rse_schemes = schemes or []
+    if not rse_schemes:
+        try:
+            if domain == 'all':
+                rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_settings,
+                                                          operation='read',
+                                                          domain='wan')['scheme'])
+                rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_settings,
+                                                          operation='read',
+                                                          domain='lan')['scheme'])
+            else:
+                rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_settings,
+                                                          operation='read',
+                                                          domain=domain)['scheme'])
+        except exception.RSEProtocolNotSupported:
+            pass  # no need to be verbose
+        except Exception:
+            print(format_exc())
+
+    if is_archive and 'root' not in rse_schemes:
+        rse_schemes.append('root')
+
+    protocols = []
+    for s in rse_schemes:
+        try:
+            for t_domain in (('lan', 'wan') if domain == 'all' else (domain, )):
+                protocols.append((t_domain,
+                                  rsemgr.create_protocol(rse_settings=rse_settings,
+                                                         operation='read',
+                                                         scheme=s,
+                                                         domain=t_domain),
+                                  priorities[t_domain][s],
+                                  s))
+        except exception.RSEProtocolNotSupported:
+            pass  # no need to be verbose
+        except Exception:
+            print(format_exc())
+
+    space_token = _NO_SPACE_TOKEN
+    sign_url_service = None
+    outgoing = False
+    for _, protocol, _, _ in protocols:
+        scheme = protocol.attributes['scheme']
+        if scheme == 'srm':
+            space_token = protocol.attributes.get('extended_attributes', {}).get('space_token')
+        if sign_urls and scheme == 'https' and sign_url_service is None:
+            service = get_rse_attribute('sign_url', rse_id=rse_id, session=session)
+            if service and isinstance(service, list):
+                sign_url_service = service[0]
+
+    # server side root proxy handling if location is set.
+    # cannot be pushed into protocols because we need to lookup rse attributes.
+    if domain == 'wan' and client_location and 'site' in client_location and client_location['site']:
+        # is the RSE site-configured?
+        rse_site_attr = get_rse_attribute('site', rse_id, session=session)
+        replica_site = ['']
+        if isinstance(rse_site_attr, list) and rse_site_attr:
+            replica_site = rse_site_attr[0]
+
+        # does it match with the client? if not, it's an outgoing connection
+        # therefore the internal proxy must be prepended
+        outgoing = client_location['site'] != replica_site
+
+    return _RSEReadProtocols(domain=domain, protocols=protocols, space_token=space_token,
+                             sign_url_service=sign_url_service, outgoing=outgoing)
+
+
+class _FileReplicas(object):
+    """
+    Accumulator of the replicas of one file in _list_replicas.
+    """
+
+    __slots__ = ('scope', 'name', 'bytes', 'md5', 'adler32', 'pfns', 'rses', 'states', 'space_token')
+
+    def __init__(self, scope, name, bytes, md5, adler32):
+        self.scope = scope
+        self.name = name
+        self.bytes = bytes
+        self.md5 = md5
+        self.adler32 = adler32
+        self.pfns = {}
+        self.rses = {}
+        self.states = {}
+        self.space_token = _NO_SPACE_TOKEN
+
+    def to_dict(self, resolve_parents, session):
+        """
+        Set the total order of the pfn priorities and return the file dictionary.
+
+        :param resolve_parents:  When set to true, find all parent datasets which contain the file.
+        :param session:          The database session in use.
+        :returns:                The file dictionary.
+        """
+        file = {'scope': self.scope, 'name': self.name,
+                'bytes': self.bytes, 'md5': self.md5, 'adler32': self.adler32,
+                'pfns': self.pfns, 'rses': self.rses, 'states': self.states}
+        if self.space_token is not _NO_SPACE_TOKEN:
+            file['space_token'] = self.space_token
+
+        if resolve_parents:
+            file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
+                               for parent in rucio.core.did.list_all_parent_dids(self.scope, self.name, session=session)]
+
+        if self.pfns:
+            # set the total order for the priority
+            # --> exploit that L(AN) comes before W(AN) before Z(IP) alphabetically
+            # and use 1-indexing to be compatible with metalink
+            tmp = sorted([(pfn['domain'], pfn['priority'], t_pfn) for t_pfn, pfn in self.pfns.items()])
+            for priority, (_, _, t_pfn) in enumerate(tmp, 1):
+                self.pfns[t_pfn]['priority'] = priority
+
+            # also sort the pfns inside the rse structure
+            rses = {}
+            for t_rse, _, t_pfn in sorted([(pfn['rse_id'], pfn['priority'], t_pfn) for t_pfn, pfn in self.pfns.items()]):
+                if t_rse in rses:
+                    rses[t_rse].append(t_pfn)
+                else:
+                    rses[t_rse] = [t_pfn]
+            file['rses'] = rses
+        return file
+
+
 def _list_replicas(dataset_clause, file_clause, state_clause, show_pfns,
                    schemes, files_wo_replica, rse_clause, client_location, domain,
                    sign_urls, signature_lifetime, constituent_clause, resolve_parents,
@@ -969,288 +1135,125 @@ def _list_replicas(dataset_clause, file_clause, state_clause, show_pfns,
         key=lambda t: (t[0], t[1]),  # sort by scope, name
     )
 
-    # we need to retain knowledge of the original domain selection by the user
-    # in case we have to loop over replicas with a potential outgoing proxy
-    original_domain = deepcopy(domain)
-
     # find all RSEs local to the client's location in autoselect mode (i.e., when domain is None)
-    local_rses = []
+    local_rses = set()
     if domain is None:
         if client_location and 'site' in client_location and client_location['site']:
             try:
-                local_rses = [rse['id'] for rse in parse_expression('site=%s' % client_location['site'], filter=filters, session=session)]
+                local_rses = set([rse['id'] for rse in parse_expression('site=%s' % client_location['site'], filter=filters, session=session)])
             except Exception:
                 pass  # do not hard fail if site cannot be resolved or is empty
 
-    file, tmp_protocols, rse_info, pfns_cache = {}, {}, {}, {}
+    # the proxies only depend on the client site, look them up once per call
+    cache_site, root_proxy_internal = '', ''
+    if show_pfns and domain in (None, 'wan') and client_location and 'site' in client_location and client_location['site']:
+        cache_site = config_get('clientcachemap', client_location['site'], default='', session=session)
+        if cache_site == '':
+            root_proxy_internal = config_get('root-proxy-internal',    # section
+                                             client_location['site'],  # option
+                                             default='',               # empty string to circumvent exception
+                                             session=session)
+
+    file, rse_protocols, pfns_cache = None, {}, {}
 
     for scope, name, archive_scope, archive_name, bytes, md5, adler32, path, state, rse_id, rse, rse_type, volatile in replicas:
 
-        pfns = []
+        if file is not None and (file.scope != scope or file.name != name):
+            yield file.to_dict(resolve_parents=resolve_parents, session=session)
+            file = None
 
-        # reset the domain selection to original user's choice (as this could get overwritten each iteration)
-        domain = deepcopy(original_domain)
+        if file is None:
+            file = _FileReplicas(scope, name, bytes, md5, adler32)
 
-        if show_pfns and rse_id:
-            if rse_id not in rse_info:
-                rse_info[rse_id] = rsemgr.get_rse_info(rse_id=rse_id, session=session)
+        is_archive = archive_scope and archive_name
+        if is_archive:
+            t_scope, t_name = archive_scope, archive_name
+        else:
+            t_scope, t_name = scope, name
 
-            # assign scheme priorities, and don't forget to exclude disabled protocols
-            # 0 in RSE protocol definition = disabled, 1 = highest priority
-            rse_info[rse_id]['priority_wan'] = {p['scheme']: p['domains']['wan']['read'] for p in rse_info[rse_id]['protocols'] if p['domains']['wan']['read'] > 0}
-            rse_info[rse_id]['priority_lan'] = {p['scheme']: p['domains']['lan']['read'] for p in rse_info[rse_id]['protocols'] if p['domains']['lan']['read'] > 0}
+        file.states[rse_id] = str(state.name if state else state)
+        if rse_id not in file.rses:
+            # the pfns of the RSE are filled in from file.pfns when the file is complete
+            file.rses[rse_id] = []
 
-            # select the lan door in autoselect mode, otherwise use the wan door
-            if domain is None:
-                domain = 'wan'
-                if local_rses and rse_id in local_rses:
-                    domain = 'lan'
-
-            if rse_id not in tmp_protocols:
-
-                rse_schemes = schemes or []
-                if not rse_schemes:
-                    try:
-                        if domain == 'all':
-                            rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_info[rse_id],
-                                                                      operation='read',
-                                                                      domain='wan')['scheme'])
-                            rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_info[rse_id],
-                                                                      operation='read',
-                                                                      domain='lan')['scheme'])
-                        else:
-                            rse_schemes.append(rsemgr.select_protocol(rse_settings=rse_info[rse_id],
-                                                                      operation='read',
-                                                                      domain=domain)['scheme'])
-                    except exception.RSEProtocolNotSupported:
-                        pass  # no need to be verbose
-                    except Exception:
-                        print(format_exc())
-
-                if archive_scope and archive_name and 'root' not in rse_schemes:
-                    rse_schemes.append('root')
-
-                protocols = []
-                for s in rse_schemes:
-                    try:
-                        if domain == 'all':
-                            protocols.append(('lan', rsemgr.create_protocol(rse_settings=rse_info[rse_id],
-                                                                            operation='read',
-                                                                            scheme=s,
-                                                                            domain='lan'),
-                                              rse_info[rse_id]['priority_lan'][s]))
-                            protocols.append(('wan', rsemgr.create_protocol(rse_settings=rse_info[rse_id],
-                                                                            operation='read',
-                                                                            scheme=s,
-                                                                            domain='wan'),
-                                              rse_info[rse_id]['priority_wan'][s]))
-                        else:
-                            protocols.append((domain, rsemgr.create_protocol(rse_settings=rse_info[rse_id],
-                                                                             operation='read',
-                                                                             scheme=s,
-                                                                             domain=domain),
-                                              rse_info[rse_id]['priority_%s' % domain][s]))
-                    except exception.RSEProtocolNotSupported:
-                        pass  # no need to be verbose
-                    except Exception:
-                        print(format_exc())
-
-                tmp_protocols[rse_id] = protocols
-
-            # get pfns
-            for tmp_protocol in tmp_protocols[rse_id]:
-                # If the current "replica" is a constituent inside an archive, we must construct the pfn for the
-                # parent (archive) file and append the xrdcl.unzip query string to it.
-                if archive_scope and archive_name:
-                    t_scope = archive_scope
-                    t_name = archive_name
-                else:
-                    t_scope = scope
-                    t_name = name
-                protocol = tmp_protocol[1]
-                if 'determinism_type' in protocol.attributes:  # PFN is cachable
-                    try:
-                        path = pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], t_scope.internal, t_name)]
-                    except KeyError:  # No cache entry scope:name found for this protocol
-                        path = protocol._get_path(t_scope, t_name)
-                        pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], t_scope.internal, t_name)] = path
+        if not (show_pfns and rse_id):
+            continue
 
+        read_protocols = rse_protocols.get(rse_id)
+        if read_protocols is None:
+            # select the lan door in autoselect mode, otherwise use the wan door
+            rse_domain = domain
+            if rse_domain is None:
+                rse_domain = 'lan' if rse_id in local_rses else 'wan'
+            read_protocols = _get_rse_read_protocols(rse_id=rse_id, domain=rse_domain, schemes=schemes, is_archive=is_archive,
+                                                     client_location=client_location, sign_urls=sign_urls, session=session)
+            rse_protocols[rse_id] = read_protocols
+
+        if read_protocols.space_token is not _NO_SPACE_TOKEN:
+            file.space_token = read_protocols.space_token
+
+        # get pfns
+        for t_domain, protocol, t_priority, scheme in read_protocols.protocols:
+            # If the current "replica" is a constituent inside an archive, we must construct the pfn for the
+            # parent (archive) file and append the xrdcl.unzip query string to it.
+            if 'determinism_type' in protocol.attributes:  # PFN is cachable
+                key = (protocol.attributes['determinism_type'], t_scope.internal, t_name)
                 try:
-                    pfn = list(protocol.lfns2pfns(lfns={'scope': t_scope.external,
-                                                        'name': t_name,
-                                                        'path': path}).values())[0]
-
-                    # do we need to sign the URLs?
-                    if sign_urls and protocol.attributes['scheme'] == 'https':
-                        service = get_rse_attribute('sign_url',
-                                                    rse_id=rse_id,
-                                                    session=session)
-                        if service and isinstance(service, list):
-                            pfn = get_signed_url(rse_id=rse_id, service=service[0], operation='read', url=pfn, lifetime=signature_lifetime)
-
-                    # server side root proxy handling if location is set.
-                    # supports root and http destinations
-                    # cannot be pushed into protocols because we need to lookup rse attributes.
-                    # ultra-conservative implementation.
-                    if domain == 'wan' and protocol.attributes['scheme'] in ['root', 'http', 'https'] and client_location:
-
-                        if 'site' in client_location and client_location['site']:
-                            # is the RSE site-configured?
-                            rse_site_attr = get_rse_attribute('site', rse_id, session=session)
-                            replica_site = ['']
-                            if isinstance(rse_site_attr, list) and rse_site_attr:
-                                replica_site = rse_site_attr[0]
-
-                            # does it match with the client? if not, it's an outgoing connection
-                            # therefore the internal proxy must be prepended
-                            if client_location['site'] != replica_site:
-                                cache_site = config_get('clientcachemap', client_location['site'], default='', session=session)
-                                if cache_site != '':
-                                    # print('client', client_location['site'], 'has cache:', cache_site)
-                                    # print('filename', name)
-                                    selected_prefix = get_multi_cache_prefix(cache_site, t_name)
-                                    if selected_prefix:
-                                        pfn = 'root://' + selected_prefix + '//' + pfn.replace('davs://', 'root://')
-                                else:
-                                    # print('site:', client_location['site'], 'has no cache')
-                                    # print('lets check if it has defined an internal root proxy ')
-                                    root_proxy_internal = config_get('root-proxy-internal',    # section
-                                                                     client_location['site'],  # option
-                                                                     default='',               # empty string to circumvent exception
-                                                                     session=session)
-
-                                    if root_proxy_internal:
-                                        # TODO: XCache does not seem to grab signed URLs. Doublecheck with XCache devs.
-                                        #       For now -> skip prepending XCache for GCS.
-                                        if 'storage.googleapis.com' in pfn or 'atlas-google-cloud.cern.ch' in pfn or 'amazonaws.com' in pfn:
-                                            pass  # ATLAS HACK
-                                        else:
-                                            # don't forget to mangle gfal-style davs URL into generic https URL
-                                            pfn = 'root://' + root_proxy_internal + '//' + pfn.replace('davs://', 'https://')
-
-                    # PFNs don't have concepts, therefore quickly encapsulate in a tuple
-                    # ('pfn', 'domain', 'priority', 'client_extract')
-                    t_domain = tmp_protocol[0]
-                    t_priority = tmp_protocol[2]
-                    t_client_extract = False
-                    if archive_scope and archive_name:
-                        t_domain = 'zip'
-                        pfn = add_url_query(pfn, {'xrdcl.unzip': name})
-                        if protocol.attributes['scheme'] == 'root':
-                            # xroot supports downloading files directly from inside an archive. Disable client_extract and prioritize xroot.
-                            t_client_extract = False
-                            t_priority = -1
-                        else:
-                            t_client_extract = True
-                    pfns.append((pfn, t_domain, t_priority, t_client_extract))
-                except Exception:
-                    # never end up here
-                    print(format_exc())
-
-                if protocol.attributes['scheme'] == 'srm':
-                    try:
-                        file['space_token'] = protocol.attributes['extended_attributes']['space_token']
-                    except KeyError:
-                        file['space_token'] = None
-
-        if 'scope' in file and 'name' in file:
-            if file['scope'] == scope and file['name'] == name:
-                # extract properly the pfn from the tuple
-                file['rses'][rse_id] += list(set([tmp_pfn[0] for tmp_pfn in pfns]))
-                file['states'][rse_id] = str(state.name if state else state)
-
-                if resolve_parents:
-                    file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
-                                       for parent in rucio.core.did.list_all_parent_dids(scope, name, session=session)]
-
-                for tmp_pfn in pfns:
-                    file['pfns'][tmp_pfn[0]] = {'rse_id': rse_id,
-                                                'rse': rse,
-                                                'type': str(rse_type.name),
-                                                'volatile': volatile,
-                                                'domain': tmp_pfn[1],
-                                                'priority': tmp_pfn[2],
-                                                'client_extract': tmp_pfn[3]}
-            else:
-                if resolve_parents:
-                    file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
-                                       for parent in rucio.core.did.list_all_parent_dids(file['scope'], file['name'], session=session)]
-
-                # quick exit, but don't forget to set the total order for the priority
-                # --> exploit that L(AN) comes before W(AN) before Z(IP) alphabetically
-                # and use 1-indexing to be compatible with metalink
-                tmp = sorted([(file['pfns'][p]['domain'], file['pfns'][p]['priority'], p) for p in file['pfns']])
-
-                for i in range(0, len(tmp)):
-                    file['pfns'][tmp[i][2]]['priority'] = i + 1
-                    file['rses'] = {}
-
-                    rse_pfns = []
-                    for t_rse, t_priority, t_pfn in [(file['pfns'][t_pfn]['rse_id'], file['pfns'][t_pfn]['priority'], t_pfn) for t_pfn in file['pfns']]:
-                        rse_pfns.append((t_rse, t_priority, t_pfn))
-                    rse_pfns = sorted(rse_pfns)
-
-                    for t_rse, t_priority, t_pfn in rse_pfns:
-                        if t_rse in file['rses']:
-                            file['rses'][t_rse].append(t_pfn)
-                        else:
-                            file['rses'][t_rse] = [t_pfn]
-
-                yield file
-                file = {}
+                    path = pfns_cache[key]
+                except KeyError:  # No cache entry scope:name found for this protocol
+                    path = protocol._get_path(t_scope, t_name)
+                    pfns_cache[key] = path
 
-        if not ('scope' in file and 'name' in file):
-            file['scope'], file['name'] = scope, name
-            file['bytes'], file['md5'], file['adler32'] = bytes, md5, adler32
-            file['pfns'], file['rses'] = {}, defaultdict(list)
-            file['states'] = {rse_id: str(state.name if state else state)}
-
-            if resolve_parents:
-                file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
-                                   for parent in rucio.core.did.list_all_parent_dids(scope, name, session=session)]
-
-            if rse_id:
-                # extract properly the pfn from the tuple
-                file['rses'][rse_id] = list(set([tmp_pfn[0] for tmp_pfn in pfns]))
-                for tmp_pfn in pfns:
-                    file['pfns'][tmp_pfn[0]] = {'rse_id': rse_id,
-                                                'rse': rse,
-                                                'type': str(rse_type.name),
-                                                'volatile': volatile,
-                                                'domain': tmp_pfn[1],
-                                                'priority': tmp_pfn[2],
-                                                'client_extract': tmp_pfn[3]}
-
-    # set the total order for the priority
-    # --> exploit that L(AN) comes before W(AN) before Z(IP) alphabetically
-    # and use 1-indexing to be compatible with metalink
-    if 'pfns' in file:
-        tmp = sorted([(file['pfns'][p]['domain'], file['pfns'][p]['priority'], p) for p in file['pfns']])
-        for i in range(0, len(tmp)):
-            file['pfns'][tmp[i][2]]['priority'] = i + 1
-
-    if 'scope' in file and 'name' in file:
-        file['rses'] = {}
-
-        # don't forget to resolve parents for the last replica
-        if resolve_parents:
-            file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
-                               for parent in rucio.core.did.list_all_parent_dids(file['scope'], file['name'], session=session)]
-
-        # also sort the pfns inside the rse structure
-        rse_pfns = []
-        for t_rse, t_priority, t_pfn in [(file['pfns'][t_pfn]['rse_id'], file['pfns'][t_pfn]['priority'], t_pfn) for t_pfn in file['pfns']]:
-            rse_pfns.append((t_rse, t_priority, t_pfn))
-        rse_pfns = sorted(rse_pfns)
-
-        for t_rse, t_priority, t_pfn in rse_pfns:
-            if t_rse in file['rses']:
-                file['rses'][t_rse].append(t_pfn)
-            else:
-                file['rses'][t_rse] = [t_pfn]
+            try:
+                pfn = list(protocol.lfns2pfns(lfns={'scope': t_scope.external,
+                                                    'name': t_name,
+                                                    'path': path}).values())[0]
+
+                # do we need to sign the URLs?
+                if read_protocols.sign_url_service and protocol.attributes['scheme'] == 'https':
+                    pfn = get_signed_url(rse_id=rse_id, service=read_protocols.sign_url_service, operation='read', url=pfn, lifetime=signature_lifetime)
+
+                # server side root proxy handling if location is set.
+                # supports root and http destinations
+                # ultra-conservative implementation.
+                if read_protocols.outgoing and protocol.attributes['scheme'] in ['root', 'http', 'https']:
+                    if cache_site != '':
+                        selected_prefix = get_multi_cache_prefix(cache_site, t_name)
+                        if selected_prefix:
+                            pfn = 'root://' + selected_prefix + '//' + pfn.replace('davs://', 'root://')
+                    elif root_proxy_internal:
+                        # TODO: XCache does not seem to grab signed URLs. Doublecheck with XCache devs.
+                        #       For now -> skip prepending XCache for GCS.
+                        if 'storage.googleapis.com' in pfn or 'atlas-google-cloud.cern.ch' in pfn or 'amazonaws.com' in pfn:
+                            pass  # ATLAS HACK
+                        else:
+                            # don't forget to mangle gfal-style davs URL into generic https URL
+                            pfn = 'root://' + root_proxy_internal + '//' + pfn.replace('davs://', 'https://')
+
+                t_client_extract = False
+                if is_archive:
+                    t_domain = 'zip'
+                    pfn = add_url_query(pfn, {'xrdcl.unzip': name})
+                    if protocol.attributes['scheme'] == 'root':
+                        # xroot supports downloading files directly from inside an archive. Disable client_extract and prioritize xroot.
+                        t_client_extract = False
+                        t_priority = -1
+                    else:
+                        t_client_extract = True
+
+                file.pfns[pfn] = {'rse_id': rse_id,
+                                  'rse': rse,
+                                  'type': str(rse_type.name),
+                                  'volatile': volatile,
+                                  'domain': t_domain,
+                                  'priority': t_priority,
+                                  'client_extract': t_client_extract}
+            except Exception:
+                # never end up here
+                print(format_exc())
 
-        yield file
-        file = {}
+    if file is not None:
+        yield file.to_dict(resolve_parents=resolve_parents, session=session)
 
     for scope, name, bytes, md5, adler32 in _list_files_wo_replicas(files_wo_replica, session):
         yield {
@@ -2182,6 +2185,74 @@ def touch_replica(replica, session=None):
     return True
 
 
+@transactional_session
+def touch_replicas(replicas, session=None):
+    """
+    Update the accessed_at timestamp of the given file replicas/dids but don't wait if rows are locked.
+    The replicas and the dids are locked and updated with one statement each.
+
+    :param replicas: the list of dictionaries with the information of the affected replicas.
+    :param session: The database session in use.
+
+    :returns: True, if successful, False otherwise.
+    """
+    now, none_value = datetime.utcnow(), None
+    replica_updates = {}
+    for replica in replicas:
+        accessed_at = replica.get('accessed_at') or now
+        key = (replica['scope'], replica['name'], replica['rse_id'])
+        if key not in replica_updates or replica_updates[key]['b_accessed_at'] < accessed_at:
+            replica_updates[key] = {'b_scope': replica['scope'], 'b_name': replica['name'], 'b_rse_id': replica['rse_id'], 'b_accessed_at': accessed_at}
+    if not replica_updates:
+        return True
+
+    try:
+        locked = set()
+        for chunk in chunks(list(replica_updates), 100):
+            query = session.query(models.RSEFileAssociation.scope, models.RSEFileAssociation.name, models.RSEFileAssociation.rse_id).\
+                filter(or_(*[and_(models.RSEFileAssociation.scope == scope, models.RSEFileAssociation.name == name, models.RSEFileAssociation.rse_id == rse_id) for scope, name, rse_id in chunk])).\
+                with_for_update(nowait=True)
+            locked.update((scope, name, rse_id) for scope, name, rse_id in query)
+
+        # As for a single replica, the did of a missing replica is not touched
+        replica_updates = dict((key, value) for key, value in replica_updates.items() if key in locked)
+        if not replica_updates:
+            return True
+        did_updates = {}
+        for update in replica_updates.values():
+            key = (update['b_scope'], update['b_name'])
+            if key not in did_updates or did_updates[key]['b_accessed_at'] < update['b_accessed_at']:
+                did_updates[key] = {'b_scope': update['b_scope'], 'b_name': update['b_name'], 'b_accessed_at': update['b_accessed_at']}
+
+        stmt = models.RSEFileAssociation.__table__.update().\
+            where(and_(models.RSEFileAssociation.scope == bindparam('b_scope'),
+                       models.RSEFileAssociation.name == bindparam('b_name'),
+                       models.RSEFileAssociation.rse_id == bindparam('b_rse_id'))).\
+            values(accessed_at=bindparam('b_accessed_at'),
+                   tombstone=case([(and_(models.RSEFileAssociation.tombstone != none_value,
+                                         models.RSEFileAssociation.tombstone != OBSOLETE),
+                                    bindparam('b_accessed_at'))],
+                                  else_=models.RSEFileAssociation.tombstone))
+        session.execute(stmt, list(replica_updates.values()))
+
+        for chunk in chunks(list(did_updates), 100):
+            session.query(models.DataIdentifier.name).\
+                filter(or_(*[and_(models.DataIdentifier.scope == scope, models.DataIdentifier.name == name) for scope, name in chunk])).\
+                filter(models.DataIdentifier.did_type == DIDType.FILE).\
+                with_for_update(nowait=True).all()
+
+        stmt = models.DataIdentifier.__table__.update().\
+            where(and_(models.DataIdentifier.scope == bindparam('b_scope'),
+                       models.DataIdentifier.name == bindparam('b_name'),
+                       models.DataIdentifier.did_type == DIDType.FILE)).\
+            values(accessed_at=bindparam('b_accessed_at'))
+        session.execute(stmt, list(did_updates.values()))
+    except DatabaseError:
+        return False
+
+    return True
+
+
 @transactional_session
 def update_replica_state(rse_id, scope, name, state, session=None):
     """
@@ -2467,6 +2538,7 @@ def get_replica_atime(replica, session=None):
 def touch_collection_replicas(collection_replicas, session=None):
     """
     Update the accessed_at timestamp of the given collection replicas.
+    All the collection replicas are updated with one statement.
 
     :param collection_replicas: the list of collection replicas.
     :param session: The database session in use.
@@ -2475,12 +2547,19 @@ def touch_collection_replicas(collection_replicas, session=None):
     """
 
     now = datetime.utcnow()
-    for collection_replica in collection_replicas:
-        try:
-            session.query(models.CollectionReplica).filter_by(scope=collection_replica['scope'], name=collection_replica['name'], rse_id=collection_replica['rse_id']).\
-                update({'accessed_at': collection_replica.get('accessed_at') or now}, synchronize_session=False)
-        except DatabaseError:
-            return False
+    updates = [{'b_scope': collection_replica['scope'], 'b_name': collection_replica['name'], 'b_rse_id': collection_replica['rse_id'],
+                'b_accessed_at': collection_replica.get('accessed_at') or now} for collection_replica in collection_replicas]
+    if not updates:
+        return True
+    try:
+        stmt = models.CollectionReplica.__table__.update().\
+            where(and_(models.CollectionReplica.scope == bindparam('b_scope'),
+                       models.CollectionReplica.name == bindparam('b_name'),
+                       models.CollectionReplica.rse_id == bindparam('b_rse_id'))).\
+            values(accessed_at=bindparam('b_accessed_at'))
+        session.execute(stmt, updates)
+    except DatabaseError:
+        return False
 
     return True
 
@@ -1309,7 +1309,7 @@ def update_requests_priority(priority, filter, session=None, logger=logging.log)
 
 
 @transactional_session
-def update_request_state(response, session=None, logger=logging.log):
+def update_request_state(response, session=None, logger=logging.log, raise_on_error=False):
     """
     Used by poller and consumer to update the internal state of requests,
     after the response by the external transfertool.
@@ -1318,6 +1318,7 @@ def update_request_state(response, session=None, logger=logging.log):
     :param logging_prepend_str:   String to prepend to the logging
     :param session:               The database session to use.
     :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
+    :param raise_on_error:        If True, unexpected errors are raised instead of logged, so that a caller sharing the session can roll it back.
     :returns commit_or_rollback:  Boolean.
     """
 
@@ -1380,6 +1381,8 @@ def update_request_state(response, session=None, logger=logging.log):
         logger(logging.WARNING, "Request %s doesn't exist - Error: %s" % (response['request_id'], str(error).replace('\n', '')))
         return False
     except Exception:
+        if raise_on_error:
+            raise
         logger(logging.CRITICAL, "Exception", exc_info=True)
 
 
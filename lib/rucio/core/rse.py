@@ -53,17 +53,57 @@ from sqlalchemy.sql.expression import or_, false
 import rucio.core.account_counter
 from rucio.common import exception, utils
 from rucio.common.config import get_lfn2pfn_algorithm_default, config_get
-from rucio.common.utils import CHECKSUM_KEY, is_checksum_valid, GLOBALLY_SUPPORTED_CHECKSUMS
+from rucio.common.utils import CHECKSUM_KEY, is_checksum_valid, GLOBALLY_SUPPORTED_CHECKSUMS, generate_uuid
+from rucio.core.distance import invalidate_distance_graph
 from rucio.core.rse_counter import add_counter, get_counter
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import RSEType
-from rucio.db.sqla.session import read_session, transactional_session, stream_session
+from rucio.db.sqla.session import read_session, transactional_session, stream_session, run_after_commit
 
 REGION = make_region().configure('dogpile.cache.memcached',
                                  expiration_time=3600,
                                  arguments={'url': config_get('cache', 'url', False, '127.0.0.1:11211'),
                                             'distributed_lock': True})
 
+# Last version of the RSEs and RSE attributes seen by this process
+RSE_INDEX_VERSION = None
+
+
+def get_rse_index_version():
+    """
+    Get the version of the RSEs and RSE attributes. The version changes whenever an RSE or
+    an RSE attribute is modified, so that in-memory indexes of the RSEs can be invalidated.
+
+    If the cache has no version, e.g. because memcached is unreachable, the last version seen
+    by this process is used, so that the indexes are not rebuilt on every call.
+
+    :returns: The version as a string.
+    """
+    global RSE_INDEX_VERSION
+
+    version = REGION.get('rse_index_version')
+    if version is NO_VALUE:
+        if RSE_INDEX_VERSION is None:
+            return invalidate_rse_index()
+        version = RSE_INDEX_VERSION
+        REGION.set('rse_index_version', version)
+    RSE_INDEX_VERSION = version
+    return version
+
+
+def invalidate_rse_index():
+    """
+    Change the version of the RSEs and RSE attributes.
+
+    :returns: The new version.
+    """
+    global RSE_INDEX_VERSION
+
+    version = generate_uuid()
+    REGION.set('rse_index_version', version)
+    RSE_INDEX_VERSION = version
+    return version
+
 
 @transactional_session
 def add_rse(rse, vo='def', deterministic=True, volatile=False, city=None, region_code=None, country_name=None, continent=None, time_zone=None,
@@ -179,6 +219,8 @@ def del_rse(rse_id, session=None):
         del_rse_attribute(rse_id=rse_id, key=rse, session=session)
     except exception.RSEAttributeNotFound:
         pass
+    run_after_commit(session, invalidate_distance_graph)
+    run_after_commit(session, invalidate_rse_index)
 
 
 @transactional_session
@@ -198,6 +240,8 @@ def restore_rse(rse_id, session=None):
     old_rse.deleted = False
     old_rse.deleted_at = None
     old_rse.save(session=session)
+    run_after_commit(session, invalidate_distance_graph)
+    run_after_commit(session, invalidate_rse_index)
     rse = old_rse.rse
     add_rse_attribute(rse_id=rse_id, key=rse, value=True, session=session)
 
@@ -435,6 +479,7 @@ def add_rse_attribute(rse_id, key, value, session=None):
     except IntegrityError:
         rse = get_rse_name(rse_id=rse_id, session=session)
         raise exception.Duplicate("RSE attribute '%(key)s-%(value)s\' for RSE '%(rse)s' already exists!" % locals())
+    run_after_commit(session, invalidate_rse_index)
     return True
 
 
@@ -456,6 +501,7 @@ def del_rse_attribute(rse_id, key, session=None):
     except sqlalchemy.orm.exc.NoResultFound:
         raise exception.RSEAttributeNotFound('RSE attribute \'%s\' cannot be found' % key)
     rse_attr.delete(session=session)
+    run_after_commit(session, invalidate_rse_index)
     return True
 
 
@@ -477,6 +523,26 @@ def list_rse_attributes(rse_id, session=None):
     return rse_attrs
 
 
+@read_session
+def list_rse_attributes_bulk(rse_ids, session=None):
+    """
+    List the RSE attributes of several RSEs.
+
+    :param rse_ids: The list of RSE ids.
+    :param session: The database session in use.
+
+    :returns: A dictionary {rse_id: {key: value}}, with an empty dictionary for RSEs without attributes.
+    """
+    rse_attrs = dict((rse_id, {}) for rse_id in rse_ids)
+
+    for chunk in utils.chunks(list(rse_attrs), 1000):
+        query = session.query(models.RSEAttrAssociation.rse_id, models.RSEAttrAssociation.key, models.RSEAttrAssociation.value).\
+            filter(models.RSEAttrAssociation.rse_id.in_(chunk))
+        for rse_id, key, value in query:
+            rse_attrs[rse_id][key] = value
+    return rse_attrs
+
+
 @read_session
 def has_rse_attribute(rse_id, key, session=None):
     """
@@ -616,10 +682,22 @@ def get_rse_supported_checksums(rse_id=None, session=None):
 
     checksum_support_attribute_list = get_rse_attribute(key=CHECKSUM_KEY, rse_id=rse_id, session=session)
 
-    if not checksum_support_attribute_list:
+    return parse_supported_checksums(checksum_support_attribute_list[0] if checksum_support_attribute_list else None)
+
+
+def parse_supported_checksums(checksum_support_attribute):
+    """
+    Parse the value of the supported checksums RSE attribute.
+
+    :param checksum_support_attribute: The value of the attribute, None if it is not set.
+
+    :returns: The list of checksums supported by the RSE, as returned by get_rse_supported_checksums.
+    """
+
+    if not checksum_support_attribute:
         return GLOBALLY_SUPPORTED_CHECKSUMS
     else:
-        supported_checksum_list = checksum_support_attribute_list[0].split(',')
+        supported_checksum_list = checksum_support_attribute.split(',')
         if 'none' in supported_checksum_list:
             return []
         return supported_checksum_list
@@ -940,6 +1018,7 @@ def add_protocol(rse_id, parameter, session=None):
             raise exception.InvalidObject('Missing values!')
 
         raise exception.RucioException(error.args)
+    run_after_commit(session, invalidate_distance_graph)
     return new_protocol
 
 
@@ -1153,6 +1232,7 @@ def update_protocols(rse_id, scheme, data, hostname, port, session=None):
                         val += 1
 
         up.update(data, flush=True, session=session)
+        run_after_commit(session, invalidate_distance_graph)
     except (IntegrityError, OperationalError) as error:
         if 'UNIQUE'.lower() in error.args[0].lower() or 'Duplicate' in error.args[0]:  # Covers SQLite, Oracle and MySQL error
             raise exception.Duplicate('Protocol \'%s\' on port %s already registered for  \'%s\' with hostname \'%s\'.' % (scheme, port, rse, hostname))
@@ -1214,6 +1294,7 @@ def del_protocols(rse_id, scheme, hostname=None, port=None, session=None):
                 for p in prots:
                     p.update({op_name: i})
                     i += 1
+    run_after_commit(session, invalidate_distance_graph)
 
 
 @transactional_session
@@ -1264,6 +1345,7 @@ def update_rse(rse_id, parameters, session=None):
         query = session.query(models.RSEAttrAssociation).filter_by(rse_id=rse_id).filter(models.RSEAttrAssociation.key == rse)
         rse_attr = query.one()
         rse_attr.delete(session=session)
+    run_after_commit(session, invalidate_rse_index)
 
 
 @read_session
@@ -21,9 +21,12 @@
 # - Hannes Hansen <hannes.jakob.hansen@cern.ch>, 2018-2019
 # - Brandon White <bjwhite@fnal.gov>, 2019
 
+from sqlalchemy import and_, func
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql.expression import bindparam
 
-from rucio.common.exception import CounterNotFound
+from rucio.common.exception import CounterNotFound, DatabaseException
+from rucio.common.utils import chunks
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.session import read_session, transactional_session
 
@@ -147,6 +150,56 @@ def update_rse_counter(rse_id, session=None):
         update.delete(flush=False, session=session)
 
 
+@transactional_session
+def update_rse_counters_bulk(total_workers, worker_number, limit=10000, session=None):
+    """
+    Fold the updated_rse_counters of a worker into the rse counters with set-based statements:
+    the updates are summed per rse_id in the database, the rse counters are upserted in one
+    statement per batch and the consumed updates are deleted by id.
+
+    :param total_workers:  Number of total workers.
+    :param worker_number:  id of the executing worker.
+    :param limit:          Maximum number of updates to consume.
+    :param session:        Database session in use.
+    :returns:              The number of consumed updates.
+    """
+    updated_counter = models.UpdatedRSECounter
+    query = filter_thread_work(session=session, query=session.query(updated_counter.id), total_threads=total_workers, thread_id=worker_number, hash_variable='rse_id')
+    ids = [id_ for id_, in query.limit(limit)]
+
+    deltas = {}
+    for chunk in chunks(ids, 1000):
+        query = session.query(updated_counter.rse_id, func.sum(updated_counter.files), func.sum(updated_counter.bytes)).\
+            filter(updated_counter.id.in_(chunk)).\
+            group_by(updated_counter.rse_id)
+        for rse_id, files, bytes in query:
+            delta = deltas.setdefault(rse_id, [0, 0])
+            delta[0] += int(files or 0)
+            delta[1] += int(bytes or 0)
+
+        # the updates must not have been consumed by another worker in between, e.g. after a change of the number of workers
+        if session.query(updated_counter).filter(updated_counter.id.in_(chunk)).delete(synchronize_session=False) != len(chunk):
+            raise DatabaseException('RSE counter updates were consumed concurrently')
+
+    existing = set()
+    for chunk in chunks(list(deltas), 1000):
+        query = session.query(models.RSEUsage.rse_id).filter(models.RSEUsage.source == 'rucio', models.RSEUsage.rse_id.in_(chunk))
+        existing.update(rse_id for rse_id, in query)
+
+    updates = [{'b_rse_id': rse_id, 'b_files': files, 'b_bytes': bytes} for rse_id, (files, bytes) in deltas.items() if rse_id in existing]
+    if updates:
+        stmt = models.RSEUsage.__table__.update().\
+            where(and_(models.RSEUsage.rse_id == bindparam('b_rse_id'), models.RSEUsage.source == 'rucio')).\
+            values(files=models.RSEUsage.files + bindparam('b_files'), used=models.RSEUsage.used + bindparam('b_bytes'))
+        session.execute(stmt, updates)
+
+    inserts = [{'rse_id': rse_id, 'source': 'rucio', 'files': files, 'used': bytes} for rse_id, (files, bytes) in deltas.items() if rse_id not in existing]
+    if inserts:
+        session.bulk_insert_mappings(models.RSEUsage, inserts)
+
+    return len(ids)
+
+
 @transactional_session
 def fill_rse_counter_history_table(session=None):
     """
@@ -26,17 +26,19 @@
 # - Eric Vaandering <ewv@fnal.gov>, 2020
 
 import abc
+import operator
 import re
+import threading
+import time
 
-from dogpile.cache import make_region
-from dogpile.cache.api import NoValue
-from hashlib import sha256
-from six import add_metaclass
+from enum import Enum
+from six import add_metaclass, string_types
+from sqlalchemy.sql.expression import false
 
-from rucio.common.config import config_get
 from rucio.common.exception import InvalidRSEExpression, RSEWriteBlocked
-from rucio.core.rse import list_rses, get_rses_with_attribute, get_rse_attribute
-from rucio.db.sqla.session import transactional_session
+from rucio.core.rse import list_rses, get_rse_index_version
+from rucio.db.sqla import models
+from rucio.db.sqla.session import read_session, transactional_session
 
 
 DEFAULT_RSE_ATTRIBUTE = r'([A-Z0-9]+([_-][A-Za-z0-9]+)*)'
@@ -48,10 +50,11 @@ COMPLEMENT = r'(\\%s)' % (PRIMITIVE)
 
 PATTERN = r'^%s(%s|%s|%s)*' % (PRIMITIVE, UNION, INTERSECTION, COMPLEMENT)
 
-
-REGION = make_region().configure('dogpile.cache.memcached',
-                                 expiration_time=600,
-                                 arguments={'url': config_get('cache', 'url', False, '127.0.0.1:11211'), 'distributed_lock': True})
+INDEX = None
+INDEX_LOCK = threading.Lock()
+INDEX_MAX_AGE = 600
+MAX_CACHED_EXPRESSIONS = 10000
+COMPILED_EXPRESSIONS = {}
 
 
 @transactional_session
@@ -65,63 +68,227 @@ def parse_expression(expression, filter=None, session=None):
     :returns:             A list of rse dictionaries.
     :raises:              InvalidRSEExpression, RSENotFound, RSEWriteBlocked
     """
-    result = REGION.get(sha256(expression.encode()).hexdigest())
-    if type(result) is NoValue:
-        # Evaluate the correctness of the parentheses
-        parantheses_open_count = 0
-        parantheses_close_count = 0
-        for char in expression:
-            if (char == '('):
-                parantheses_open_count += 1
-            elif (char == ')'):
-                parantheses_close_count += 1
-            if (parantheses_close_count > parantheses_open_count):
-                raise InvalidRSEExpression('Problem with parantheses.')
-        if (parantheses_open_count != parantheses_close_count):
-            raise InvalidRSEExpression('Problem with parantheses.')
-
-        # Check the expression pattern
-        match = re.match(PATTERN, expression)
-        if match is None:
-            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        else:
-            if match.group() != expression:
-                raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        result_tuple = __resolve_term_expression(expression)[0].resolve_elements(session=session)
-        # result_tuple = ([rse_ids], {rse_id: {rse_info}})
-        result = []
-        for rse in list(result_tuple[0]):
-            result.append(result_tuple[1][rse])
-        REGION.set(sha256(expression.encode()).hexdigest(), result)
+    index = get_rse_attribute_index(session=session)
+    result = index.evaluate(expression)
 
     # Filter for VO
-    vo_result = []
     if filter and filter.get('vo'):
         filter = filter.copy()  # Make a copy so we can pop('vo') without affecting the object `filter` outside this function
-        vo = filter.pop('vo')
-        for rse in result:
-            if rse.get('vo') == vo:
-                vo_result.append(rse)
-    else:
-        vo_result = result
+        result &= index.vo(filter.pop('vo'))
 
-    if not vo_result:
+    if not result:
         raise InvalidRSEExpression('RSE Expression resulted in an empty set.')
 
     # Filter
-    final_result = []
     if filter:
-        for rse in vo_result:
-            if filter.get('availability_write', False):
-                if rse.get('availability') & 2:
-                    final_result.append(rse)
-        if not final_result:
+        if filter.get('availability_write', False):
+            result &= index.writable
+        else:
+            result = 0
+        if not result:
             raise RSEWriteBlocked('RSE excluded; not available for writing.')
+
+    # [{rse-info}]
+    return index.rses(result)
+
+
+def compile_expression(expression):
+    """
+    Check the syntax of a RSE expression and compile it to a tree of BaseExpressionElement.
+    Compiled expressions are cached in the process.
+
+    :param expression:    RSE expression, e.g: 'CERN|BNL'.
+    :returns:             The root BaseExpressionElement of the expression.
+    :raises:              InvalidRSEExpression
+    """
+    compiled = COMPILED_EXPRESSIONS.get(expression)
+    if compiled is not None:
+        return compiled
+
+    # Evaluate the correctness of the parentheses
+    parantheses_open_count = 0
+    parantheses_close_count = 0
+    for char in expression:
+        if (char == '('):
+            parantheses_open_count += 1
+        elif (char == ')'):
+            parantheses_close_count += 1
+        if (parantheses_close_count > parantheses_open_count):
+            raise InvalidRSEExpression('Problem with parantheses.')
+    if (parantheses_open_count != parantheses_close_count):
+        raise InvalidRSEExpression('Problem with parantheses.')
+
+    # Check the expression pattern
+    match = re.match(PATTERN, expression)
+    if match is None:
+        raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
     else:
-        final_result = vo_result
+        if match.group() != expression:
+            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
+
+    compiled = __resolve_term_expression(expression)[0]
+    if len(COMPILED_EXPRESSIONS) >= MAX_CACHED_EXPRESSIONS:
+        COMPILED_EXPRESSIONS.clear()
+    COMPILED_EXPRESSIONS[expression] = compiled
+    return compiled
+
+
+@read_session
+def get_rse_attribute_index(session=None):
+    """
+    Return the RSE attribute index of the process. The index is rebuilt when
+    RSEs or RSE attributes changed, or when it is older than INDEX_MAX_AGE seconds.
+
+    :param session:       Database session in use.
+    :returns:             RSEAttributeIndex object.
+    """
+    global INDEX
+
+    version = get_rse_index_version()
+    index = INDEX
+    if index is None or index.is_expired(version):
+        with INDEX_LOCK:
+            index = INDEX
+            if index is None or index.is_expired(version):
+                index = RSEAttributeIndex.load(version, session=session)
+                INDEX = index
+    return index
+
+
+def _normalise_value(value):
+    """
+    Normalise an attribute or column value the same way the database compares them.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, string_types) and value.lower() in ('true', 'false'):
+        return value.lower()
+    return str(value)
+
 
-    # final_result = [{rse-info}]
-    return final_result
+class RSEAttributeIndex(object):
+    """
+    Process-local index of the RSEs and of their attributes.
+
+    Every RSE has a bit position and every set of RSEs is an integer bitset, so that
+    RSE expressions are evaluated with bitwise operations only, e.g. the index
+    attribute -> value -> bitset answers the RSEAttributeEqualCheck.
+    """
+
+    def __init__(self, version, rses, attributes):
+        """
+        :param version:     The RSE index version the data was loaded for.
+        :param rses:        List of RSE dictionaries, ordered by RSE name.
+        :param attributes:  Iterable of (rse_id, key, value).
+        """
+        self.version = version
+        self.loaded_at = time.time()
+        self.all = (1 << len(rses)) - 1
+        self.writable = 0
+        self._rses = rses
+        self._columns = {}
+        self._attributes = {}
+        self._attribute_values = {}
+        self._vos = {}
+        self._results = {}
+
+        positions = {}
+        for position, rse in enumerate(rses):
+            bit = 1 << position
+            positions[rse['id']] = bit
+            for column, value in rse.items():
+                values = self._columns.setdefault(column, {})
+                value = _normalise_value(value)
+                values[value] = values.get(value, 0) | bit
+            if (rse['availability'] or 0) & 2:
+                self.writable |= bit
+            self._vos[rse['vo']] = self._vos.get(rse['vo'], 0) | bit
+
+        for rse_id, key, value in attributes:
+            bit = positions.get(rse_id)
+            if bit is None:
+                continue
+            values = self._attributes.setdefault(key, {})
+            normalised_value = _normalise_value(value)
+            values[normalised_value] = values.get(normalised_value, 0) | bit
+            self._attribute_values.setdefault(key, []).append((bit, value))
+
+    @classmethod
+    @read_session
+    def load(cls, version, session=None):
+        """
+        Load all the RSEs and their attributes in two queries.
+
+        :param version:       The RSE index version.
+        :param session:       Database session in use.
+        :returns:             RSEAttributeIndex object.
+        """
+        rses = list_rses(session=session)
+        attributes = session.query(models.RSEAttrAssociation.rse_id,
+                                   models.RSEAttrAssociation.key,
+                                   models.RSEAttrAssociation.value)\
+                            .join(models.RSE, models.RSE.id == models.RSEAttrAssociation.rse_id)\
+                            .filter(models.RSE.deleted == false())
+        return cls(version, rses, attributes)
+
+    def is_expired(self, version):
+        return version != self.version or time.time() - self.loaded_at > INDEX_MAX_AGE
+
+    def evaluate(self, expression):
+        """
+        Evaluate a RSE expression. Results are cached for the lifetime of the index.
+
+        :param expression:    RSE expression, e.g: 'CERN|BNL'.
+        :returns:             Bitset of the matching RSEs.
+        :raises:              InvalidRSEExpression
+        """
+        result = self._results.get(expression)
+        if result is None:
+            result = compile_expression(expression).evaluate(self)
+            if len(self._results) >= MAX_CACHED_EXPRESSIONS:
+                self._results.clear()
+            self._results[expression] = result
+        return result
+
+    def equal(self, key, value):
+        """
+        Bitset of the RSEs with RSE column or attribute key equal to value.
+        """
+        if key in self._columns:
+            return self._columns[key].get(_normalise_value(value), 0)
+        return self._attributes.get(key, {}).get(_normalise_value(value), 0)
+
+    def compare(self, key, value, comparison):
+        """
+        Bitset of the RSEs with a numerical attribute key for which comparison(attribute, value) is true.
+        """
+        result = 0
+        for bit, attribute_value in self._attribute_values.get(key, []):
+            try:
+                if comparison(float(attribute_value), float(value)):
+                    result |= bit
+            except (TypeError, ValueError):
+                continue
+        return result
+
+    def vo(self, vo):
+        """
+        Bitset of the RSEs of a VO.
+        """
+        return self._vos.get(vo, 0)
+
+    def rses(self, bitset):
+        """
+        Decode a bitset to the list of RSE dictionaries, ordered by RSE name.
+        """
+        result = []
+        while bitset:
+            lowest_bit = bitset & -bitset
+            result.append(dict(self._rses[lowest_bit.bit_length() - 1]))
+            bitset ^= lowest_bit
+        return result
 
 
 def __resolve_term_expression(expression):
@@ -225,13 +392,12 @@ def __extract_term(expression):
 @add_metaclass(abc.ABCMeta)
 class BaseExpressionElement:
     @abc.abstractmethod
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Resolve the ExpressionElement and return a set of RSE ids
+        Evaluate the ExpressionElement against a RSEAttributeIndex
 
-        :param session:  Database session in use
-        :returns:        (Set of RSE ids, Dictionary of RSE dicts)
-        :rtype:          (Set of Strings, Dictionary of RSE dicts organized by rse_id)
+        :param index:    RSEAttributeIndex to use
+        :returns:        Bitset of the matching RSEs
         """
         pass
 
@@ -241,17 +407,11 @@ class RSEAll(BaseExpressionElement):
     Representation of all RSEs
     """
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        output = list_rses(session=session)
-        if not output:
-            return (set(), {})
-        rse_dict = {}
-        for rse in output:
-            rse_dict[rse['id']] = rse
-        return (set([rse['id'] for rse in output]), rse_dict)
+        return index.all
 
 
 class RSEAttributeEqualCheck(BaseExpressionElement):
@@ -269,17 +429,11 @@ class RSEAttributeEqualCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        output = list_rses({self.key: self.value}, session=session)
-        if not output:
-            return (set(), {})
-        rse_dict = {}
-        for rse in output:
-            rse_dict[rse['id']] = rse
-        return (set([rse['id'] for rse in output]), rse_dict)
+        return index.equal(self.key, self.value)
 
 
 class RSEAttributeSmallerCheck(BaseExpressionElement):
@@ -297,24 +451,11 @@ class RSEAttributeSmallerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(key=self.key, rse_id=rse['id'], session=session)[0]) < float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, self.value, operator.lt)
 
 
 class RSEAttributeLargerCheck(BaseExpressionElement):
@@ -332,24 +473,11 @@ class RSEAttributeLargerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(key=self.key, rse_id=rse['id'], session=session)[0]) > float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, self.value, operator.gt)
 
 
 @add_metaclass(abc.ABCMeta)
@@ -398,13 +526,11 @@ class ComplementOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] - right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.evaluate(index) & ~self.right_term.evaluate(index)
 
 
 class UnionOperator(BaseRSEOperator):
@@ -432,13 +558,11 @@ class UnionOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] | right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.evaluate(index) | self.right_term.evaluate(index)
 
 
 class IntersectOperator(BaseRSEOperator):
@@ -466,10 +590,8 @@ class IntersectOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def evaluate(self, index):
         """
-        Inherited from :py:func:`BaseExpressionElement.resolve_elements`
+        Inherited from :py:func:`BaseExpressionElement.evaluate`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] & right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.evaluate(index) & self.right_term.evaluate(index)
@@ -22,15 +22,74 @@
 # - Andrew Lister <andrew.lister@stfc.ac.uk>, 2019
 # - Patrick Austin <patrick.austin@stfc.ac.uk>, 2020
 
+from hashlib import md5
 from random import uniform, shuffle
 
-from rucio.common.exception import InsufficientAccountLimit, InsufficientTargetRSEs, InvalidRuleWeight, RSEOverQuota
-from rucio.core.account import has_account_attribute, get_usage, get_all_rse_usages_per_account
-from rucio.core.account_limit import get_local_account_limit, get_global_account_limits
-from rucio.core.rse import list_rse_attributes, has_rse_attribute, get_rse_limits
-from rucio.core.rse_counter import get_counter as get_rse_counter
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+
+from rucio.common.exception import InsufficientAccountLimit, InsufficientTargetRSEs, InvalidRuleWeight, RSEOverQuota, CounterNotFound
+from rucio.common.utils import chunks
+from rucio.core.account import has_account_attribute, get_all_rse_usages_per_account
+from rucio.core.account_limit import get_global_account_limits, get_local_account_limits
+from rucio.core.config import get as core_config_get
+from rucio.core.rse import list_rse_attributes_bulk
+from rucio.db.sqla import models
 from rucio.db.sqla.session import read_session
 
+REGION = make_region().configure('dogpile.cache.memory', expiration_time=60)
+
+
+@read_session
+def get_rse_selector_snapshot(account, rse_ids, ignore_account_limit=False, session=None):
+    """
+    Load the attributes, the limits and the usages of a set of RSEs needed by the RSE selector
+    of an account, with a constant number of queries independent of the number of RSEs.
+
+    The snapshot is cached per account and RSE set for the number of seconds of the
+    rules/rse_selector_snapshot_expiration configuration option, by default it is not cached.
+
+    :param account:               Account owning the rule.
+    :param rse_ids:               List of RSE ids.
+    :param ignore_account_limit:  Flag if the quota should be ignored, in which case no limit and usage is loaded.
+    :param session:               DB Session in use.
+    :returns:                     Dictionary with the keys is_admin, attributes, local_limits, global_limits, usages, space_limits and space_used.
+    """
+    rse_ids = sorted(set(rse_ids))
+    expiration_time = int(core_config_get('rules', 'rse_selector_snapshot_expiration', default=0, session=session))
+    if expiration_time > 0:
+        cache_key = 'rse_selector_snapshot_%s_%s_%s' % (account.internal, ignore_account_limit, md5(''.join(rse_ids).encode()).hexdigest())
+        snapshot = REGION.get(cache_key, expiration_time=expiration_time)
+        if snapshot is not NO_VALUE:
+            return snapshot
+
+    snapshot = {'is_admin': has_account_attribute(account=account, key='admin', session=session),
+                'attributes': list_rse_attributes_bulk(rse_ids=rse_ids, session=session),
+                'local_limits': {},
+                'global_limits': {},
+                'usages': {},
+                'space_limits': {},
+                'space_used': {}}
+
+    if not snapshot['is_admin'] and not ignore_account_limit:
+        # all the limits of the account are loaded with one query, without filtering on the RSEs
+        snapshot['local_limits'] = get_local_account_limits(account=account, session=session)
+        snapshot['global_limits'] = get_global_account_limits(account=account, session=session)
+        snapshot['usages'] = dict((usage['rse_id'], usage['bytes']) for usage in get_all_rse_usages_per_account(account=account, session=session))
+        for chunk in chunks(rse_ids, 1000):
+            query = session.query(models.RSELimit.rse_id, models.RSELimit.value).\
+                filter(models.RSELimit.rse_id.in_(chunk), models.RSELimit.name == 'MaxSpaceAvailable')
+            for rse_id, value in query:
+                snapshot['space_limits'][rse_id] = value
+            query = session.query(models.RSEUsage.rse_id, models.RSEUsage.used).\
+                filter(models.RSEUsage.rse_id.in_(chunk), models.RSEUsage.source == 'rucio')
+            for rse_id, used in query:
+                snapshot['space_used'][rse_id] = used
+
+    if expiration_time > 0:
+        REGION.set(cache_key, snapshot)
+    return snapshot
+
 
 class RSESelector():
     """
@@ -38,7 +97,7 @@ class RSESelector():
     """
 
     @read_session
-    def __init__(self, account, rses, weight, copies, ignore_account_limit=False, session=None):
+    def __init__(self, account, rses, weight, copies, ignore_account_limit=False, snapshot=None, session=None):
         """
         Initialize the RSE Selector.
 
@@ -47,15 +106,18 @@ class RSESelector():
         :param weight:                Weighting to use.
         :param copies:                Number of copies to create.
         :param ignore_account_limit:  Flag if the quota should be ignored.
+        :param snapshot:              Snapshot of the RSEs from get_rse_selector_snapshot, loaded if not given.
         :param session:               DB Session in use.
         :raises:                      InvalidRuleWeight, InsufficientAccountLimit, InsufficientTargetRSEs
         """
         self.account = account
         self.rses = []  # [{'rse_id':, 'weight':, 'staging_area'}]
         self.copies = copies
+        if snapshot is None:
+            snapshot = get_rse_selector_snapshot(account=account, rse_ids=[rse['id'] for rse in rses], ignore_account_limit=ignore_account_limit, session=session)
         if weight is not None:
             for rse in rses:
-                attributes = list_rse_attributes(rse_id=rse['id'], session=session)
+                attributes = snapshot['attributes'][rse['id']]
                 availability_write = True if rse.get('availability', 7) & 2 else False
                 if weight not in attributes:
                     continue  # The RSE does not have the required weight set, therefore it is ignored
@@ -69,7 +131,7 @@ class RSESelector():
                     raise InvalidRuleWeight('The RSE \'%s\' has a non-number specified for the weight \'%s\'' % (rse['rse'], weight))
         else:
             for rse in rses:
-                mock_rse = has_rse_attribute(rse['id'], 'mock', session=session)
+                mock_rse = 'mock' in snapshot['attributes'][rse['id']]
                 availability_write = True if rse.get('availability', 7) & 2 else False
                 self.rses.append({'rse_id': rse['id'],
                                   'weight': 1,
@@ -81,14 +143,14 @@ class RSESelector():
             raise InsufficientTargetRSEs('Target RSE set not sufficient for number of copies. (%s copies requested, RSE set size %s)' % (self.copies, len(self.rses)))
 
         rses_with_enough_quota = []
-        if has_account_attribute(account=account, key='admin', session=session) or ignore_account_limit:
+        if snapshot['is_admin'] or ignore_account_limit:
             for rse in self.rses:
                 rse['quota_left'] = float('inf')
                 rse['space_left'] = float('inf')
                 rses_with_enough_quota.append(rse)
         else:
-            global_quota_limit = get_global_account_limits(account=account, session=session)
-            all_rse_usages = {usage['rse_id']: usage['bytes'] for usage in get_all_rse_usages_per_account(account=account, session=session)}
+            global_quota_limit = snapshot['global_limits']
+            all_rse_usages = snapshot['usages']
             for rse in self.rses:
                 if rse['mock_rse']:
                     rse['quota_left'] = float('inf')
@@ -97,11 +159,11 @@ class RSESelector():
                 else:
                     # check local quota
                     local_quota_left = None
-                    quota_limit = get_local_account_limit(account=account, rse_id=rse['rse_id'], session=session)
+                    quota_limit = snapshot['local_limits'].get(rse['rse_id'])
                     if quota_limit is None:
                         local_quota_left = 0
                     else:
-                        local_quota_left = quota_limit - get_usage(rse_id=rse['rse_id'], account=account, session=session)['bytes']
+                        local_quota_left = quota_limit - all_rse_usages.get(rse['rse_id'], 0)
 
                     # check global quota
                     rse['global_quota_left'] = {}
@@ -124,11 +186,13 @@ class RSESelector():
                                 rse['global_quota_left'][rse_expression] = global_quota_left
                     if local_quota_left > 0 and all_global_quota_enough:
                         rse['quota_left'] = local_quota_left
-                        space_limit = get_rse_limits(name='MaxSpaceAvailable', rse_id=rse['rse_id'], session=session).get('MaxSpaceAvailable')
+                        space_limit = snapshot['space_limits'].get(rse['rse_id'])
                         if space_limit is None or space_limit < 0:
                             rse['space_left'] = float('inf')
                         else:
-                            rse['space_left'] = space_limit - get_rse_counter(rse_id=rse['rse_id'], session=session)['bytes']
+                            if rse['rse_id'] not in snapshot['space_used']:
+                                raise CounterNotFound()
+                            rse['space_left'] = space_limit - snapshot['space_used'][rse['rse_id']]
                         rses_with_enough_quota.append(rse)
 
         self.rses = rses_with_enough_quota
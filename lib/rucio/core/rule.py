@@ -84,7 +84,7 @@ from rucio.core.message import add_message
 from rucio.core.monitor import record_timer_block
 from rucio.core.rse import get_rse_name, list_rse_attributes, get_rse, get_rse_usage
 from rucio.core.rse_expression_parser import parse_expression
-from rucio.core.rse_selector import RSESelector
+from rucio.core.rse_selector import RSESelector, get_rse_selector_snapshot
 from rucio.core.rule_grouping import apply_rule_grouping, repair_stuck_locks_and_apply_rule_grouping, create_transfer_dict, apply_rule
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.constants import (LockState, ReplicaState, RuleState, RuleGrouping,
@@ -406,6 +406,7 @@ def add_rules(dids, rules, session=None, logger=logging.log):
 
     with record_timer_block('rule.add_rules'):
         rule_ids = {}
+        rse_selector_snapshots = {}
 
         # 1. Fetch the RSEs from the RSE expression to restrict further queries just on these RSEs
         restrict_rses = []
@@ -516,7 +517,8 @@ def add_rules(dids, rules, session=None, logger=logging.log):
 
                     # 5. Create the RSE selector
                     with record_timer_block('rule.add_rules.create_rse_selector'):
-                        rseselector = RSESelector(account=rule['account'], rses=rses, weight=rule.get('weight'), copies=rule['copies'], ignore_account_limit=rule.get('ask_approval', False), session=session)
+                        rseselector = __create_rse_selector(account=rule['account'], rses=rses, weight=rule.get('weight'), copies=rule['copies'], ignore_account_limit=rule.get('ask_approval', False),
+                                                            snapshots=rse_selector_snapshots, session=session)
 
                     # 4. Create the replication rule
                     with record_timer_block('rule.add_rules.create_rule'):
@@ -1778,6 +1780,18 @@ def delete_updated_did(id, session=None):
     session.query(models.UpdatedDID).filter(models.UpdatedDID.id == id).delete()
 
 
+@transactional_session
+def delete_updated_dids(ids, session=None):
+    """
+    Delete updated_dids by id.
+
+    :param ids:                     List of ids of the rows to delete.
+    :param session:                 The database session in use.
+    """
+    for chunk in chunks(ids, 1000):
+        session.query(models.UpdatedDID).filter(models.UpdatedDID.id.in_(chunk)).delete(synchronize_session=False)
+
+
 @transactional_session
 def update_rules_for_lost_replica(scope, name, rse_id, nowait=False, session=None, logger=logging.log):
     """
@@ -2280,15 +2294,16 @@ def examine_rule(rule_id, session=None):
 
 
 @transactional_session
-def get_evaluation_backlog(session=None):
+def get_evaluation_backlog(expiration_time=600, session=None):
     """
     Counts the number of entries in the rule evaluation backlog.
     (Number of files to be evaluated)
 
+    :param expiration_time:  Maximum age in seconds of the cached count.
     :returns:     Tuple (Count, Datetime of oldest entry)
     """
 
-    result = REGION.get('rule_evaluation_backlog', expiration_time=600)
+    result = REGION.get('rule_evaluation_backlog', expiration_time=expiration_time)
     if result is NO_VALUE:
         result = session.query(func.count(models.UpdatedDID.created_at), func.min(models.UpdatedDID.created_at)).one()
         REGION.set('rule_evaluation_backlog', result)
@@ -2316,6 +2331,26 @@ def release_parent_rule(child_rule_id, remove_parent_expiration=False, session=N
         insert_rule_history(rule=rule, recent=True, longterm=False, session=session)
 
 
+@read_session
+def __create_rse_selector(account, rses, weight, copies, ignore_account_limit, snapshots, session=None):
+    """
+    Create an RSE selector, sharing the snapshot of the RSEs between the selectors of an operation.
+
+    :param account:               Account owning the rule.
+    :param rses:                  List of rse dictionaries.
+    :param weight:                Weighting to use.
+    :param copies:                Number of copies to create.
+    :param ignore_account_limit:  Flag if the quota should be ignored.
+    :param snapshots:             Dictionary of the snapshots already loaded by the operation.
+    :param session:               The database session in use.
+    :returns:                     The RSESelector.
+    """
+    key = (account, tuple(sorted(rse['id'] for rse in rses)), ignore_account_limit)
+    if key not in snapshots:
+        snapshots[key] = get_rse_selector_snapshot(account=account, rse_ids=key[1], ignore_account_limit=ignore_account_limit, session=session)
+    return RSESelector(account=account, rses=rses, weight=weight, copies=copies, ignore_account_limit=ignore_account_limit, snapshot=snapshots[key], session=session)
+
+
 @transactional_session
 def __find_missing_locks_and_create_them(datasetfiles, locks, replicas, source_replicas, rseselector, rule, source_rses, session=None, logger=logging.log):
     """
@@ -2604,6 +2639,7 @@ def __evaluate_did_attach(eval_did, session=None, logger=logging.log):
                     # Resolve the rules to possible target rses:
                     possible_rses = []
                     source_rses = []
+                    rse_selector_snapshots = {}
                     for rule in rules:
                         try:
                             vo = rule.account.vo
@@ -2655,12 +2691,13 @@ def __evaluate_did_attach(eval_did, session=None, logger=logging.log):
 
                         # 2. Create the RSE Selector
                         try:
-                            rseselector = RSESelector(account=rule.account,
-                                                      rses=rses,
-                                                      weight=rule.weight,
-                                                      copies=rule.copies,
-                                                      ignore_account_limit=rule.ignore_account_limit,
-                                                      session=session)
+                            rseselector = __create_rse_selector(account=rule.account,
+                                                                rses=rses,
+                                                                weight=rule.weight,
+                                                                copies=rule.copies,
+                                                                ignore_account_limit=rule.ignore_account_limit,
+                                                                snapshots=rse_selector_snapshots,
+                                                                session=session)
                         except (InvalidRuleWeight, InsufficientTargetRSEs, InsufficientAccountLimit, RSEOverQuota) as error:
                             rule.state = RuleState.STUCK
                             rule.error = (str(error)[:245] + '...') if len(str(error)) > 245 else str(error)
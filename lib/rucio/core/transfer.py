@@ -42,9 +42,11 @@ from __future__ import division
 
 import copy
 import datetime
+import heapq
 import json
 import logging
 import re
+import threading
 import time
 from typing import TYPE_CHECKING
 
@@ -52,6 +54,7 @@ from dogpile.cache import make_region
 from dogpile.cache.api import NoValue
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 from sqlalchemy.sql.expression import false
 
 from rucio.common import constants
@@ -63,14 +66,15 @@ from rucio.common.exception import (InvalidRSEExpression, NoDistance,
 from rucio.common.extra import import_extras
 from rucio.common.rse_attributes import get_rse_attributes
 from rucio.common.types import InternalAccount
-from rucio.common.utils import construct_surl
+from rucio.common.utils import construct_surl, CHECKSUM_KEY
 from rucio.core import did, message as message_core, request as request_core
 from rucio.core.config import get as core_config_get
+from rucio.core.distance import get_distance_graph_version
 from rucio.core.monitor import record_counter, record_timer
 from rucio.core.oidc import get_token_for_account_operation
 from rucio.core.replica import add_replicas, tombstone_from_delay
 from rucio.core.request import queue_requests, set_requests_state
-from rucio.core.rse import get_rse_name, get_rse_vo, list_rses, get_rse_supported_checksums
+from rucio.core.rse import get_rse_name, get_rse_vo, list_rses, list_rse_attributes_bulk, parse_supported_checksums
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.constants import DIDType, RequestState, RSEType, RequestType, ReplicaState
@@ -105,6 +109,10 @@ WEBDAV_TRANSFER_MODE = config_get('conveyor', 'webdav_transfer_mode', False, Non
 
 DEFAULT_MULTIHOP_TOMBSTONE_DELAY = datetime.timedelta(hours=2)
 
+DISTANCE_GRAPH = None
+DISTANCE_GRAPH_LOCK = threading.Lock()
+DISTANCE_GRAPH_MAX_AGE = 600
+
 
 class RseData:
     """
@@ -219,24 +227,38 @@ class RequestWithSources:
         self._dict_attributes = dict_attributes
 
 
-class _RseLoaderContext:
+class RseLoaderContext:
     """
-    Helper private class used to dynamically load and cache the rse information
+    Helper class used to dynamically load and cache the rse information.
+    One context can be shared by all the steps of a submission cycle, each step
+    loads the missing information in its own session through for_session.
     """
-    def __init__(self, session):
+    def __init__(self, session=None):
         self.session = session
         self.rse_id_to_data_map = {}
+        self.supported_checksums_map = {}
+        self.protocol_factory = ProtocolFactory()
+        self.settings = {}
 
     def rse_data(self, rse_id):
         rse_data = self.rse_id_to_data_map.get(rse_id)
         if rse_data is None:
             rse_data = RseData(rse_id)
+            self.rse_id_to_data_map[rse_id] = rse_data
+        if rse_data.name is None or rse_data.info is None or rse_data.attributes is None:
             rse_data.load_name(session=self.session)
             rse_data.load_info(session=self.session)
             rse_data.load_attributes(session=self.session)
-            self.rse_id_to_data_map[rse_id] = rse_data
         return rse_data
 
+    def for_session(self, session):
+        """
+        A context sharing the caches of this one, which loads the missing RSE information in the given session.
+        """
+        ctx = copy.copy(self)
+        ctx.session = session
+        return ctx
+
     def ensure_fully_loaded(self, rse_data):
         if rse_data.name is None or rse_data.info is None or rse_data.attributes is None:
             cached_rse_data = self.rse_data(rse_data.id)
@@ -247,6 +269,27 @@ class _RseLoaderContext:
             if rse_data.attributes is None:
                 rse_data.attributes = cached_rse_data.attributes
 
+    def preload_attributes(self, rse_ids):
+        """
+        Load the attributes of all the given RSEs not known yet with one query.
+        """
+        missing_rse_ids = set(rse_id for rse_id in rse_ids if rse_id not in self.rse_id_to_data_map or self.rse_id_to_data_map[rse_id].attributes is None)
+        if missing_rse_ids:
+            for rse_id, attributes in list_rse_attributes_bulk(rse_ids=missing_rse_ids, session=self.session).items():
+                self.rse_id_to_data_map.setdefault(rse_id, RseData(rse_id)).attributes = attributes
+
+    def supported_checksums(self, rse_id):
+        """
+        The checksums supported by an RSE, as returned by get_rse_supported_checksums.
+        """
+        supported_checksums = self.supported_checksums_map.get(rse_id)
+        if supported_checksums is None:
+            self.preload_attributes([rse_id])
+            attributes = self.rse_id_to_data_map[rse_id].attributes
+            supported_checksums = parse_supported_checksums(attributes.get(CHECKSUM_KEY) if attributes else None)
+            self.supported_checksums_map[rse_id] = supported_checksums
+        return supported_checksums
+
 
 class ProtocolFactory:
     """
@@ -409,6 +452,207 @@ class DirectTransferDefinition:
         return dest_url
 
 
+class DistanceGraph:
+    """
+    In-memory copy of the distance graph, loaded at once from the distances table.
+
+    The matching schemes of an edge are computed at most once per graph, and the shortest paths are
+    computed with Dijkstra's algorithm on a priority queue. A graph is bound to the version of the
+    distances and protocols it was loaded for; get_distance_graph replaces it when the version changes.
+    """
+    def __init__(self, version, edges):
+        """
+        :param version:  The distance graph version the edges were loaded for.
+        :param edges:    Dictionary {src_rse_id: {dest_rse_id: ranking}}.
+        """
+        self.version = version
+        self.loaded_at = time.time()
+        self._outgoing = edges
+        self._inbound = {}
+        for src_rse_id, dest_edges in edges.items():
+            for dest_rse_id, ranking in dest_edges.items():
+                self._inbound.setdefault(dest_rse_id, {})[src_rse_id] = ranking
+        self._rse_settings = {}
+        self._hops = {}
+        self._paths = {}
+
+    @classmethod
+    @read_session
+    def load(cls, version, session=None):
+        """
+        Load all the edges between non-deleted RSEs in one query.
+        :param version:  The distance graph version.
+        :param session:  The DB Session to use.
+        :returns:        DistanceGraph object.
+        """
+        src_rse = aliased(models.RSE)
+        dest_rse = aliased(models.RSE)
+        query = session.query(models.Distance.src_rse_id, models.Distance.dest_rse_id, models.Distance.ranking)\
+                       .join(src_rse, src_rse.id == models.Distance.src_rse_id)\
+                       .join(dest_rse, dest_rse.id == models.Distance.dest_rse_id)\
+                       .filter(src_rse.deleted == false())\
+                       .filter(dest_rse.deleted == false())\
+                       .filter(models.Distance.ranking.isnot(None))
+        edges = {}
+        for src_rse_id, dest_rse_id, ranking in query:
+            edges.setdefault(src_rse_id, {})[dest_rse_id] = ranking if ranking >= 0 else 0
+        return cls(version, edges)
+
+    def is_expired(self, version):
+        return version != self.version or time.time() - self.loaded_at > DISTANCE_GRAPH_MAX_AGE
+
+    def outgoing_edges(self, rse_id):
+        return self._outgoing.get(rse_id, {})
+
+    def inbound_edges(self, rse_id):
+        return self._inbound.get(rse_id, {})
+
+    def rse_settings(self, rse_id, session=None):
+        settings = self._rse_settings.get(rse_id)
+        if settings is None:
+            settings = rsemgr.get_rse_info(rse_id=rse_id, session=session)
+            self._rse_settings[rse_id] = settings
+        return settings
+
+    def hop(self, source_rse_id, dest_rse_id, limit_dest_schemes=None, cumulated_distance=None, session=None):
+        """
+        Return the hop between two directly connected RSEs, with the best matching schemes.
+        The scheme matching is done only once per edge and per limit_dest_schemes.
+        :raises: RSEProtocolNotSupported if the two RSEs have no compatible protocols.
+        """
+        key = (source_rse_id, dest_rse_id, tuple(sorted(limit_dest_schemes)) if limit_dest_schemes else ())
+        matching_scheme = self._hops.get(key)
+        if matching_scheme is None:
+            try:
+                matching_scheme = rsemgr.find_matching_scheme(rse_settings_dest=self.rse_settings(dest_rse_id, session=session),
+                                                              rse_settings_src=self.rse_settings(source_rse_id, session=session),
+                                                              operation_src='third_party_copy',
+                                                              operation_dest='third_party_copy',
+                                                              domain='wan',
+                                                              scheme=list(limit_dest_schemes) if limit_dest_schemes else None)
+            except RSEProtocolNotSupported as error:
+                matching_scheme = error
+            self._hops[key] = matching_scheme
+        if isinstance(matching_scheme, RSEProtocolNotSupported):
+            raise matching_scheme
+
+        hop_distance = self._outgoing[source_rse_id][dest_rse_id]
+        return {'source_rse_id': source_rse_id,
+                'dest_rse_id': dest_rse_id,
+                'source_scheme': matching_scheme[1],
+                'dest_scheme': matching_scheme[0],
+                'source_scheme_priority': matching_scheme[3],
+                'dest_scheme_priority': matching_scheme[2],
+                'hop_distance': hop_distance,
+                'cumulated_distance': hop_distance if cumulated_distance is None else cumulated_distance}
+
+    def _dijkstra(self, source_rse_id, multihop_rses, hop_penalty, dest_rse_id=None, limit_dest_schemes=None, session=None):
+        """
+        Dijkstra's algorithm from source_rse_id. Only the source and the multihop RSEs are used as intermediate nodes.
+        If dest_rse_id is given, the search stops as soon as the shortest path to it is known.
+        :returns: Dictionary {rse_id: last hop of the shortest path towards rse_id}
+        """
+        distances = {source_rse_id: 0}
+        last_hops = {}
+        visited = set()
+        to_visit = [(0, source_rse_id)]
+        while to_visit:
+            current_distance, current_node = heapq.heappop(to_visit)
+            if current_node in visited:
+                continue
+            visited.add(current_node)
+            if current_node == dest_rse_id:
+                break
+            if current_node != source_rse_id and current_node not in multihop_rses:
+                continue
+
+            for out_v, ranking in self.outgoing_edges(current_node).items():
+                if out_v in visited:
+                    continue
+                # Check if the intermediate RSE is enabled for multihop
+                if dest_rse_id is not None and out_v != dest_rse_id and out_v not in multihop_rses:
+                    continue
+                new_adjacent_distance = current_distance + ranking + hop_penalty
+                if distances.get(out_v, new_adjacent_distance + 1) <= new_adjacent_distance:
+                    continue
+                # Check if there is a compatible protocol pair
+                try:
+                    hop = self.hop(current_node, out_v,
+                                   limit_dest_schemes=limit_dest_schemes if out_v == dest_rse_id else None,
+                                   cumulated_distance=new_adjacent_distance,
+                                   session=session)
+                except RSEProtocolNotSupported:
+                    continue
+                distances[out_v] = new_adjacent_distance
+                last_hops[out_v] = hop
+                heapq.heappush(to_visit, (new_adjacent_distance, out_v))
+        return last_hops
+
+    @staticmethod
+    def _build_path(last_hops, dest_rse_id):
+        path = []
+        hop = last_hops.get(dest_rse_id)
+        while hop is not None:
+            path.append(hop)
+            hop = last_hops.get(hop['source_rse_id'])
+        path.reverse()
+        return path
+
+    def shortest_path(self, source_rse_id, dest_rse_id, multihop_rses, hop_penalty, limit_dest_schemes=None, session=None):
+        """
+        Return the shortest multihop path between two RSEs.
+        :param source_rse_id:       Source RSE id.
+        :param dest_rse_id:         Dest RSE id.
+        :param multihop_rses:       List of RSE ids that can be used for multihop.
+        :param hop_penalty:         Penalty applied to each hop.
+        :param limit_dest_schemes:  List of destination schemes the matching scheme algorithm should be limited to for the last hop.
+        :returns:                   List of hops.
+        :raises:                    NoDistance
+        """
+        multihop_rses = frozenset(multihop_rses)
+        key = (source_rse_id, dest_rse_id, multihop_rses, hop_penalty, tuple(sorted(limit_dest_schemes)) if limit_dest_schemes else ())
+        path = self._paths.get(key)
+        if path is None:
+            last_hops = self._dijkstra(source_rse_id, multihop_rses, hop_penalty, dest_rse_id=dest_rse_id,
+                                       limit_dest_schemes=limit_dest_schemes, session=session)
+            path = self._build_path(last_hops, dest_rse_id)
+            self._paths[key] = path
+        if not path:
+            raise NoDistance()
+        return copy.deepcopy(path)
+
+    def shortest_paths(self, source_rse_id, multihop_rses, hop_penalty, session=None):
+        """
+        Return the shortest paths from one RSE towards all the RSEs reachable from it.
+        :param source_rse_id:  Source RSE id.
+        :param multihop_rses:  List of RSE ids that can be used for multihop.
+        :param hop_penalty:    Penalty applied to each hop.
+        :returns:              Dictionary {dest_rse_id: list of hops}
+        """
+        last_hops = self._dijkstra(source_rse_id, frozenset(multihop_rses), hop_penalty, session=session)
+        return {dest_rse_id: self._build_path(last_hops, dest_rse_id) for dest_rse_id in last_hops}
+
+
+@read_session
+def get_distance_graph(session=None):
+    """
+    Return the in-memory distance graph of this process, reloading it if the distances or protocols changed.
+    :param session:  The DB Session to use.
+    :returns:        DistanceGraph object.
+    """
+    global DISTANCE_GRAPH
+
+    version = get_distance_graph_version()
+    distance_graph = DISTANCE_GRAPH
+    if distance_graph is None or distance_graph.is_expired(version):
+        with DISTANCE_GRAPH_LOCK:
+            distance_graph = DISTANCE_GRAPH
+            if distance_graph is None or distance_graph.is_expired(version):
+                distance_graph = DistanceGraph.load(version, session=session)
+                DISTANCE_GRAPH = distance_graph
+    return distance_graph
+
+
 def submit_bulk_transfers(external_host, files, transfertool='fts3', job_params={}, timeout=None, user_transfer_job=False, logger=logging.log):
     """
     Submit transfer request to a transfertool.
@@ -798,113 +1042,32 @@ def get_hops(source_rse_id, dest_rse_id, include_multihop=False, multihop_rses=N
     if not limit_dest_schemes:
         limit_dest_schemes = []
 
-    # Check if there is a cached result
-    result = REGION_SHORT.get('get_hops_dist_%s_%s_%s' % (str(source_rse_id), str(dest_rse_id), ''.join(sorted(limit_dest_schemes))))
-    if not isinstance(result, NoValue):
-        return result
-
     if multihop_rses is None:
         multihop_rses = []
 
-    # TODO: Might be problematic to always load the distance_graph, since it might be expensiv
-
-    # Load the graph from the distances table
-    # distance_graph = __load_distance_graph(session=session)
-    distance_graph = {}
-    distance_graph[source_rse_id] = __load_outgoing_distances_node(rse_id=source_rse_id, session=session)
+    distance_graph = get_distance_graph(session=session)
 
     # 1. Check if there is a direct connection between source and dest:
-    if distance_graph.get(source_rse_id, {dest_rse_id: None}).get(dest_rse_id) is not None:
+    if dest_rse_id in distance_graph.outgoing_edges(source_rse_id):
         # Check if there is a protocol match between the two RSEs
         try:
-            matching_scheme = rsemgr.find_matching_scheme(rse_settings_dest=__load_rse_settings(rse_id=dest_rse_id, session=session),
-                                                          rse_settings_src=__load_rse_settings(rse_id=source_rse_id, session=session),
-                                                          operation_src='third_party_copy',
-                                                          operation_dest='third_party_copy',
-                                                          domain='wan',
-                                                          scheme=limit_dest_schemes if limit_dest_schemes else None)
-            path = [{'source_rse_id': source_rse_id,
-                     'dest_rse_id': dest_rse_id,
-                     'source_scheme': matching_scheme[1],
-                     'dest_scheme': matching_scheme[0],
-                     'source_scheme_priority': matching_scheme[3],
-                     'dest_scheme_priority': matching_scheme[2],
-                     'hop_distance': distance_graph[source_rse_id][dest_rse_id],
-                     'cumulated_distance': distance_graph[source_rse_id][dest_rse_id]}]
-            REGION_SHORT.set('get_hops_dist_%s_%s_%s' % (str(source_rse_id), str(dest_rse_id), ''.join(sorted(limit_dest_schemes))), path)
-            return path
+            return [distance_graph.hop(source_rse_id, dest_rse_id, limit_dest_schemes=limit_dest_schemes, session=session)]
         except RSEProtocolNotSupported as error:
-            if include_multihop:
-                # Delete the edge from the graph
-                del distance_graph[source_rse_id][dest_rse_id]
-            else:
+            if not include_multihop:
                 raise error
 
     if not include_multihop:
         raise NoDistance()
 
     # 2. There is no connection or no scheme match --> Try a multi hop --> Dijkstra algorithm
-    HOP_PENALTY = core_config_get('transfers', 'hop_penalty', default=10, session=session)  # Penalty to be applied to each further hop
+    hop_penalty = core_config_get('transfers', 'hop_penalty', default=10, session=session)  # Penalty to be applied to each further hop
 
     # Check if the destination RSE is an island RSE:
-    if not __load_inbound_distances_node(rse_id=dest_rse_id, session=session):
+    if not distance_graph.inbound_edges(dest_rse_id):
         raise NoDistance()
 
-    visited_nodes = {source_rse_id: {'distance': 0,
-                                     'path': []}}  # Dijkstra already visisted nodes
-    # {rse_id: {'path': [{'source_rse_id':, 'dest_rse_id':, 'source_scheme', 'dest_scheme': }],
-    #           'distance': X}
-    # }
-    to_visit = [source_rse_id]  # Nodes to visit, once list is empty, break loop
-    local_optimum = 9999  # Local optimum to accelerated search
-
-    while to_visit:
-        for current_node in copy.deepcopy(to_visit):
-            to_visit.remove(current_node)
-            current_distance = visited_nodes[current_node]['distance']
-            current_path = visited_nodes[current_node]['path']
-
-            if current_node not in distance_graph:
-                distance_graph[current_node] = __load_outgoing_distances_node(rse_id=current_node, session=session)
-
-            for out_v in distance_graph[current_node]:
-                # Check if the distance would be smaller
-                if distance_graph[current_node][out_v] is None:
-                    continue
-                new_adjacent_distance = current_distance + distance_graph[current_node][out_v] + HOP_PENALTY
-
-                if visited_nodes.get(out_v, {'distance': 9999})['distance'] > new_adjacent_distance and local_optimum > new_adjacent_distance:
-                    # Check if the intermediate RSE is enabled for multihop
-                    if out_v != dest_rse_id and out_v not in multihop_rses:
-                        continue
-                    # Check if there is a compatible protocol pair
-                    try:
-                        matching_scheme = rsemgr.find_matching_scheme(rse_settings_dest=__load_rse_settings(rse_id=out_v, session=session),
-                                                                      rse_settings_src=__load_rse_settings(rse_id=current_node, session=session),
-                                                                      operation_src='third_party_copy',
-                                                                      operation_dest='third_party_copy',
-                                                                      domain='wan',
-                                                                      scheme=limit_dest_schemes if out_v == dest_rse_id and limit_dest_schemes else None)
-                        visited_nodes[out_v] = {'distance': new_adjacent_distance,
-                                                'path': current_path + [{'source_rse_id': current_node,
-                                                                         'dest_rse_id': out_v,
-                                                                         'source_scheme': matching_scheme[1],
-                                                                         'dest_scheme': matching_scheme[0],
-                                                                         'source_scheme_priority': matching_scheme[3],
-                                                                         'dest_scheme_priority': matching_scheme[2],
-                                                                         'hop_distance': distance_graph[current_node][out_v],
-                                                                         'cumulated_distance': new_adjacent_distance}]}
-                        if out_v != dest_rse_id:
-                            to_visit.append(out_v)
-                        else:
-                            local_optimum = current_distance + distance_graph[current_node][out_v] + HOP_PENALTY
-                    except RSEProtocolNotSupported:
-                        pass
-    if dest_rse_id in visited_nodes:
-        REGION_SHORT.set('get_hops_dist_%s_%s_%s' % (str(source_rse_id), str(dest_rse_id), ''.join(sorted(limit_dest_schemes))), visited_nodes[dest_rse_id]['path'])
-        return visited_nodes[dest_rse_id]['path']
-    else:
-        raise NoDistance()
+    return distance_graph.shortest_path(source_rse_id, dest_rse_id, multihop_rses=multihop_rses, hop_penalty=hop_penalty,
+                                        limit_dest_schemes=limit_dest_schemes, session=session)
 
 
 def get_dsn(scope, name, dsn):
@@ -1042,8 +1205,8 @@ def __prepare_transfer_definition(ctx, protocol_factory, rws, source, transferto
             else:
                 verify_checksum = 'both'
 
-        src_rse_checksums = get_rse_supported_checksums(src.rse.id, session=session)
-        dst_rse_checksums = get_rse_supported_checksums(dst.rse.id, session=session)
+        src_rse_checksums = ctx.supported_checksums(src.rse.id)
+        dst_rse_checksums = ctx.supported_checksums(dst.rse.id)
 
         common_checksum_names = set(src_rse_checksums).intersection(dst_rse_checksums)
 
@@ -1148,7 +1311,7 @@ def __pick_best_transfer(candidate_paths):
 
 @transactional_session
 def get_transfer_requests_and_source_replicas(total_workers=0, worker_number=0, limit=None, activity=None, older_than=None, rses=None, schemes=None,
-                                              bring_online=43200, retry_other_fts=False, failover_schemes=None, transfertool=None, logger=logging.log, session=None):
+                                              bring_online=43200, retry_other_fts=False, failover_schemes=None, transfertool=None, ctx=None, logger=logging.log, session=None):
     """
     Get transfer requests and the associated source replicas
     :param total_workers:         Number of total workers.
@@ -1162,6 +1325,7 @@ def get_transfer_requests_and_source_replicas(total_workers=0, worker_number=0,
     :param retry_other_fts:       Retry other fts servers.
     :param failover_schemes:      Failover schemes.
     :param transfertool:          The transfer tool as specified in rucio.cfg.
+    :param ctx:                   Optional RseLoaderContext shared with the other steps of the cycle.
     :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
     :param session:               The database session in use.
     :returns:                     transfers, reqs_no_source, reqs_scheme_mismatch, reqs_only_tape_source
@@ -1189,8 +1353,8 @@ def get_transfer_requests_and_source_replicas(total_workers=0, worker_number=0,
         session=session,
     )
 
-    ctx = _RseLoaderContext(session)
-    protocol_factory = ProtocolFactory()
+    ctx = RseLoaderContext(session) if ctx is None else ctx.for_session(session)
+    protocol_factory = ctx.protocol_factory
     unavailable_read_rse_ids = __get_unavailable_rse_ids(operation='read', session=session)
     unavailable_write_rse_ids = __get_unavailable_rse_ids(operation='write', session=session)
 
@@ -1647,30 +1811,6 @@ def __load_inbound_distances_node(rse_id, session=None):
     return result
 
 
-@transactional_session
-def __load_outgoing_distances_node(rse_id, session=None):
-    """
-    Loads the outgoing edges of the distance graph for one node.
-    :param rse_id:    RSE id to load the edges for.
-    :param session:   The DB Session to use.
-    :returns:         Dictionary based graph object.
-    """
-
-    result = REGION_SHORT.get('outgoing_edges_%s' % str(rse_id))
-    if isinstance(result, NoValue):
-        outgoing_edges = {}
-        for distance in session.query(models.Distance).join(models.RSE, models.RSE.id == models.Distance.dest_rse_id)\
-                               .filter(models.Distance.src_rse_id == rse_id)\
-                               .filter(models.RSE.deleted == false()).all():
-            if distance.ranking is None:
-                continue
-            ranking = distance.ranking if distance.ranking >= 0 else 0
-            outgoing_edges[distance.dest_rse_id] = ranking
-        REGION_SHORT.set('outgoing_edges_%s' % str(rse_id), outgoing_edges)
-        result = outgoing_edges
-    return result
-
-
 @transactional_session
 def __load_rse_settings(rse_id, session=None):
     """
@@ -36,15 +36,18 @@ import rucio.db.sqla.util
 from rucio.common import exception
 from rucio.common.logging import setup_logging
 from rucio.common.utils import get_thread_with_periodic_running_function
-from rucio.core.account_counter import get_updated_account_counters, update_account_counter, fill_account_counter_history_table
+from rucio.core.account_counter import get_updated_account_counters, update_account_counter, update_account_counters_bulk, fill_account_counter_history_table
 from rucio.core.heartbeat import live, die, sanity_check
 
 graceful_stop = threading.Event()
 
 
-def account_update(once=False):
+def account_update(once=False, bulk=False):
     """
     Main loop to check and update the Account Counters.
+
+    :param once: Run only once.
+    :param bulk: Fold all the counter updates of the worker in set-based statements instead of one counter at a time.
     """
 
     logging.info('account_update: starting')
@@ -63,6 +66,18 @@ def account_update(once=False):
             # Heartbeat
             heartbeat = live(executable=executable, hostname=hostname, pid=pid, thread=current_thread)
 
+            if bulk:
+                start_time = time.time()
+                consumed = update_account_counters_bulk(total_workers=heartbeat['nr_threads'],
+                                                        worker_number=heartbeat['assign_thread'])
+                logging.debug('account_update[%s/%s]: bulk update of %d account counter updates took %f' % (heartbeat['assign_thread'], heartbeat['nr_threads'] - 1, consumed, time.time() - start_time))
+                if not consumed and not once:
+                    logging.info('account_update[%s/%s] did not get any work' % (heartbeat['assign_thread'], heartbeat['nr_threads'] - 1))
+                    time.sleep(10)
+                if once:
+                    break
+                continue
+
             # Select a bunch of rses for to update for this worker
             start = time.time()  # NOQA
             account_rse_ids = get_updated_account_counters(total_workers=heartbeat['nr_threads'],
@@ -99,7 +114,7 @@ def stop(signum=None, frame=None):
     graceful_stop.set()
 
 
-def run(once=False, threads=1, fill_history_table=False):
+def run(once=False, threads=1, fill_history_table=False, bulk=False):
     """
     Starts up the Abacus-Account threads.
     """
@@ -114,10 +129,10 @@ def run(once=False, threads=1, fill_history_table=False):
 
     if once:
         logging.info('main: executing one iteration only')
-        account_update(once)
+        account_update(once, bulk=bulk)
     else:
         logging.info('main: starting threads')
-        threads = [threading.Thread(target=account_update, kwargs={'once': once}) for i in range(0, threads)]
+        threads = [threading.Thread(target=account_update, kwargs={'once': once, 'bulk': bulk}) for i in range(0, threads)]
         if fill_history_table:
             threads.append(get_thread_with_periodic_running_function(3600, fill_account_counter_history_table, graceful_stop))
         [t.start() for t in threads]
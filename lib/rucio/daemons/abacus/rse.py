@@ -37,14 +37,17 @@ from rucio.common import exception
 from rucio.common.logging import setup_logging
 from rucio.common.utils import get_thread_with_periodic_running_function
 from rucio.core.heartbeat import live, die, sanity_check
-from rucio.core.rse_counter import get_updated_rse_counters, update_rse_counter, fill_rse_counter_history_table
+from rucio.core.rse_counter import get_updated_rse_counters, update_rse_counter, update_rse_counters_bulk, fill_rse_counter_history_table
 
 graceful_stop = threading.Event()
 
 
-def rse_update(once=False):
+def rse_update(once=False, bulk=False):
     """
     Main loop to check and update the RSE Counters.
+
+    :param once: Run only once.
+    :param bulk: Fold all the counter updates of the worker in set-based statements instead of one counter at a time.
     """
 
     logging.info('rse_update: starting')
@@ -63,6 +66,18 @@ def rse_update(once=False):
             # Heartbeat
             heartbeat = live(executable=executable, hostname=hostname, pid=pid, thread=current_thread)
 
+            if bulk:
+                start_time = time.time()
+                consumed = update_rse_counters_bulk(total_workers=heartbeat['nr_threads'],
+                                                    worker_number=heartbeat['assign_thread'])
+                logging.debug('rse_update[%s/%s]: bulk update of %d rse counter updates took %f' % (heartbeat['assign_thread'], heartbeat['nr_threads'] - 1, consumed, time.time() - start_time))
+                if not consumed and not once:
+                    logging.info('rse_update[%s/%s] did not get any work' % (heartbeat['assign_thread'], heartbeat['nr_threads'] - 1))
+                    time.sleep(10)
+                if once:
+                    break
+                continue
+
             # Select a bunch of rses for to update for this worker
             start = time.time()  # NOQA
             rse_ids = get_updated_rse_counters(total_workers=heartbeat['nr_threads'],
@@ -98,7 +113,7 @@ def stop(signum=None, frame=None):
     graceful_stop.set()
 
 
-def run(once=False, threads=1, fill_history_table=False):
+def run(once=False, threads=1, fill_history_table=False, bulk=False):
     """
     Starts up the Abacus-RSE threads.
     """
@@ -113,10 +128,10 @@ def run(once=False, threads=1, fill_history_table=False):
 
     if once:
         logging.info('main: executing one iteration only')
-        rse_update(once)
+        rse_update(once, bulk=bulk)
     else:
         logging.info('main: starting threads')
-        threads = [threading.Thread(target=rse_update, kwargs={'once': once}) for i in range(0, threads)]
+        threads = [threading.Thread(target=rse_update, kwargs={'once': once, 'bulk': bulk}) for i in range(0, threads)]
         if fill_history_table:
             threads.append(get_thread_with_periodic_running_function(3600, fill_rse_counter_history_table, graceful_stop))
         [t.start() for t in threads]
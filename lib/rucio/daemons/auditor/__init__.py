@@ -52,6 +52,24 @@ from rucio.db.sqla.constants import BadFilesStatus
 
 
 def consistency(rse, delta, configuration, cache_dir, results_dir):
+    dumps = download_dumps(rse, delta, configuration, cache_dir, results_dir)
+    if dumps is None:
+        return None
+    return compare_dumps(rse, dumps, cache_dir, results_dir)
+
+
+def download_dumps(rse, delta, configuration, cache_dir, results_dir):
+    """Download the dumps needed to check an RSE, or take them from the
+    cache.
+
+    The latest storage dump of ``rse`` is downloaded first, then the Rucio
+    replica dumps ``delta`` before and after its date, unless the check of
+    this storage dump was already done.
+
+    Returns ``None`` if the check was already done, else a ``tuple`` with
+    the path of the storage dump, its date and the paths of the previous
+    and next Rucio replica dumps.
+    """
     logger = logging.getLogger('auditor-worker')
     rsedump, rsedate = srmdumps.download_rse_dump(rse, configuration, destdir=cache_dir)
     results_path = os.path.join(results_dir, '{0}_{1}'.format(rse, rsedate.strftime('%Y%m%d')))  # pylint: disable=no-member
@@ -62,6 +80,23 @@ def consistency(rse, delta, configuration, cache_dir, results_dir):
 
     rrdump_prev = ReplicaFromHDFS.download(rse, rsedate - delta, cache_dir=cache_dir)
     rrdump_next = ReplicaFromHDFS.download(rse, rsedate + delta, cache_dir=cache_dir)
+    return rsedump, rsedate, rrdump_prev, rrdump_next
+
+
+def compare_dumps(rse, dumps, cache_dir, results_dir, sort_processes=3):
+    """Run the consistency check of an RSE and write the DARK and LOST
+    files in the results directory.
+
+    ``dumps`` should be a ``tuple`` as returned by ``download_dumps()``.
+
+    ``sort_processes`` should be an ``int`` with the number of processes
+    used to sort the dumps, 1 to sort them in the current process.
+
+    Returns an ``str`` with the path of the results file.
+    """
+    rsedump, rsedate, rrdump_prev, rrdump_next = dumps
+    results_path = os.path.join(results_dir, '{0}_{1}'.format(rse, rsedate.strftime('%Y%m%d')))  # pylint: disable=no-member
+
     results = Consistency.dump(
         'consistency-manual',
         rse,
@@ -70,6 +105,7 @@ def consistency(rse, delta, configuration, cache_dir, results_dir):
         rrdump_next,
         date=rsedate,
         cache_dir=cache_dir,
+        sort_processes=sort_processes,
     )
     mkdir(results_dir)
     with temp_file(results_dir, results_path) as (output, _):
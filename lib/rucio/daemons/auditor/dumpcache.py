@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local cache of the dumps downloaded by the auditor.
+
+The storage dumps and the Rucio replica dumps are stored in the cache
+directory under names derived from the SHA-1 of the URL they were
+downloaded from (see ``srmdumps.download_rse_dump`` and
+``ReplicaFromHDFS.download``), a dump present in the cache is never
+downloaded again. The cache is bounded by size, the least recently used
+dumps are evicted first.
+"""
+
+import logging
+import os
+import re
+
+# Complete dumps only, the temporary and intermediate files of the
+# consistency check are not part of the cache. The second group is the RSE.
+DUMP_NAME_RE = re.compile(r'^(ddmendpoint|replicafromhdfs)_(.+)_\d{2}-\d{2}-\d{4}_[0-9a-f]{40}$')
+
+
+def touch(path):
+    """Mark a cached dump as recently used.
+
+    ``path`` should be an ``str`` with the path to the dump.
+    """
+    os.utime(path, None)
+
+
+def list_dumps(cache_dir):
+    """List the dumps in the cache.
+
+    ``cache_dir`` should be an ``str`` with the path to the cache.
+
+    Returns a ``list`` of ``tuple`` (last use, size in bytes, path),
+    sorted from the least to the most recently used.
+    """
+    dumps = []
+    if not os.path.isdir(cache_dir):
+        return dumps
+    for name in os.listdir(cache_dir):
+        if DUMP_NAME_RE.match(name) is None:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Removed in the meantime by another process
+            continue
+        dumps.append((stat.st_mtime, stat.st_size, path))
+    dumps.sort()
+    return dumps
+
+
+def cache_size(cache_dir):
+    """Total size of the dumps in the cache, in bytes.
+    """
+    return sum(size for _, size, _ in list_dumps(cache_dir))
+
+
+def evict(cache_dir, max_size, keep=(), keep_rses=()):
+    """Remove the least recently used dumps until the total size of the
+    dumps in the cache is not greater than ``max_size``.
+
+    ``cache_dir`` should be an ``str`` with the path to the cache.
+
+    ``max_size`` should be an ``int`` with the size in bytes, with 0 all
+    the dumps not kept are removed.
+
+    ``keep`` should be an iterable with the paths of the dumps in use,
+    they are never removed.
+
+    ``keep_rses`` should be an iterable with the names of the RSEs whose
+    dumps are never removed, e.g. the RSEs being downloaded, whose paths
+    are not known yet.
+
+    Returns a ``list`` with the paths of the removed dumps.
+    """
+    logger = logging.getLogger('auditor.dumpcache')
+    keep = set(os.path.abspath(path) for path in keep)
+    keep_rses = set(keep_rses)
+    dumps = list_dumps(cache_dir)
+    size = sum(dump_size for _, dump_size, _ in dumps)
+    removed = []
+    for _, dump_size, path in dumps:
+        if size <= max_size:
+            break
+        if os.path.abspath(path) in keep or DUMP_NAME_RE.match(os.path.basename(path)).group(2) in keep_rses:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Removed in the meantime by another process
+            pass
+        logger.debug('Evicted "%s" from the dump cache (%d bytes)', path, dump_size)
+        size -= dump_size
+        removed.append(path)
+    return removed
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Auditor scheduler: consistency sweep over many RSEs.
+
+The dumps are downloaded by a pool of threads, at most a few RSEs ahead of
+the checks, while the consistency checks run in a pool of processes. The
+downloaded dumps are kept in the dump cache, bounded by size.
+"""
+
+import logging
+import multiprocessing
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from rucio.core.monitor import record_counter, record_gauge, record_timer
+from rucio.daemons import auditor
+from rucio.daemons.auditor import dumpcache
+
+CHECKED = 'checked'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+def _download(rse, delta, configuration, cache_dir, results_dir):
+    """Download the dumps of an RSE in a thread of the download pool.
+
+    Returns a ``tuple`` (dumps, error, duration in seconds), where
+    ``dumps`` is the value returned by ``auditor.download_dumps()``.
+    """
+    start = time.time()
+    try:
+        dumps = auditor.download_dumps(rse, delta, configuration, cache_dir, results_dir)
+    except Exception:
+        class_, desc = sys.exc_info()[0:2]
+        return None, '{0}: {1}'.format(class_.__name__, desc), time.time() - start
+    if dumps is not None:
+        for path in (dumps[0], dumps[2], dumps[3]):
+            dumpcache.touch(path)
+    return dumps, None, time.time() - start
+
+
+def _check(rse, dumps, cache_dir, results_dir, sanity_check, compress):
+    """Check an RSE in a process of the check pool.
+
+    The process is a daemon, the dumps are sorted in the process itself.
+
+    Returns a ``tuple`` (error, duration in seconds).
+    """
+    start = time.time()
+    try:
+        output = auditor.compare_dumps(rse, dumps, cache_dir, results_dir, sort_processes=1)
+        auditor.process_output(output, sanity_check=sanity_check, compress=compress)
+    except Exception:
+        class_, desc = sys.exc_info()[0:2]
+        return '{0}: {1}'.format(class_.__name__, desc), time.time() - start
+    return None, time.time() - start
+
+
+def sweep(rses, delta, configuration, cache_dir, results_dir, nprocs=1, download_threads=2,
+          max_cache_size=0, keep_dumps=False, sanity_check=True, compress=True, poll_interval=1):
+    """Check the consistency of several RSEs.
+
+    ``rses`` should be a ``list`` with the names of the RSEs.
+
+    ``delta`` should be a ``timedelta`` between the storage dump and the
+    Rucio replica dumps.
+
+    ``configuration`` should be the configuration of the storage dumps, as
+    returned by ``srmdumps.parse_configuration()``.
+
+    ``nprocs`` should be an ``int`` with the number of RSEs checked in
+    parallel, ``download_threads`` the number of parallel downloads.
+
+    ``max_cache_size`` should be an ``int`` with the maximum size in bytes
+    of the dumps kept in the cache, with 0 only the dumps in use are kept:
+    the dumps of the RSEs being downloaded or checked.
+    If ``keep_dumps`` is ``True`` no dump is ever removed.
+
+    ``sanity_check`` and ``compress`` are passed to ``process_output()``.
+
+    Returns a ``dict`` with the status of each RSE: ``CHECKED``,
+    ``SKIPPED`` if the check was already done, or ``FAILED``.
+    """
+    logger = logging.getLogger('auditor-scheduler')
+    waiting = list(rses)
+    total = len(waiting)
+    status = {}
+    downloads = {}
+    checks = {}
+    in_use = {}
+
+    def evict():
+        if not keep_dumps:
+            keep = [path for dumps in in_use.values() for path in (dumps[0], dumps[2], dumps[3])]
+            # the paths of the dumps of a download are only known once it is collected
+            dumpcache.evict(cache_dir, max_cache_size, keep=keep, keep_rses=list(downloads))
+        record_gauge('daemons.auditor.cache.size', dumpcache.cache_size(cache_dir))
+
+    def done(rse, rse_status):
+        status[rse] = rse_status
+        in_use.pop(rse, None)
+        record_counter('daemons.auditor.sweep.%s' % rse_status)
+        record_gauge('daemons.auditor.sweep.remaining', total - len(status))
+        evict()
+
+    logger.info('Starting consistency sweep of %d RSEs with %d processes and %d download threads', total, nprocs, download_threads)
+    start = time.time()
+    evict()
+    download_pool = ThreadPool(processes=download_threads)
+    check_pool = multiprocessing.Pool(processes=nprocs)
+    try:
+        while waiting or downloads or checks:
+            # Download ahead only as many RSEs as can be checked next, to
+            # bound the size of the dumps waiting in the cache.
+            while waiting and len(downloads) + len(checks) < nprocs + download_threads:
+                rse = waiting.pop(0)
+                downloads[rse] = download_pool.apply_async(_download, (rse, delta, configuration, cache_dir, results_dir))
+
+            for rse, result in list(downloads.items()):
+                if not result.ready():
+                    continue
+                del downloads[rse]
+                dumps, error, duration = result.get()
+                record_timer('daemons.auditor.download.%s' % rse, duration * 1000)
+                if error is not None:
+                    logger.error('Download of the dumps of "%s" failed in %.1f minutes: (%s)', rse, duration / 60, error)
+                    done(rse, FAILED)
+                elif dumps is None:
+                    done(rse, SKIPPED)
+                else:
+                    logger.debug('Downloaded the dumps of "%s" in %.1f minutes', rse, duration / 60)
+                    in_use[rse] = dumps
+                    checks[rse] = check_pool.apply_async(_check, (rse, dumps, cache_dir, results_dir, sanity_check, compress))
+
+            for rse, result in list(checks.items()):
+                if not result.ready():
+                    continue
+                del checks[rse]
+                error, duration = result.get()
+                record_timer('daemons.auditor.check.%s' % rse, duration * 1000)
+                if error is not None:
+                    logger.error('Check of "%s" failed in %.1f minutes: (%s)', rse, duration / 60, error)
+                    done(rse, FAILED)
+                else:
+                    done(rse, CHECKED)
+                    logger.info('SUCCESS checking "%s" in %.1f minutes (%d/%d RSEs done)', rse, duration / 60, len(status), total)
+
+            if downloads or checks:
+                time.sleep(poll_interval)
+    finally:
+        download_pool.terminate()
+        check_pool.terminate()
+
+    logger.info('Consistency sweep done in %.1f minutes: %d checked, %d skipped, %d failed', (time.time() - start) / 60,
+                list(status.values()).count(CHECKED), list(status.values()).count(SKIPPED), list(status.values()).count(FAILED))
+    return status
@@ -51,7 +51,7 @@ from rucio.common.utils import chunks, set_checksum_value
 from rucio.core import request, transfer as transfer_core
 from rucio.core.config import get
 from rucio.core.monitor import record_counter, record_timer
-from rucio.core.rse import list_rses, get_rse_supported_checksums
+from rucio.core.rse import list_rses
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.core.vo import list_vos
 from rucio.db.sqla.session import read_session
@@ -75,7 +75,21 @@ def submit_transfer(external_host, job, submitter='submitter', timeout=None, use
     :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
     """
 
-    # Prepare submitting
+    if not prepare_transfer(external_host, job, logger=logger):
+        return
+    submit_prepared_transfer(external_host, job, submitter=submitter, timeout=timeout, user_transfer_job=user_transfer_job, logger=logger, transfertool=transfertool)
+
+
+def prepare_transfer(external_host, job, logger=logging.log):
+    """
+    Move the requests of a job to the SUBMITTING state before the job is sent to the transfertool.
+
+    :param external_host:         FTS server to submit to.
+    :param job:                   Job dictionary.
+    :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:                     True if the job is ready to be submitted, False otherwise.
+    """
+
     xfers_ret = {}
 
     try:
@@ -97,10 +111,24 @@ def submit_transfer(external_host, job, submitter='submitter', timeout=None, use
         logger(logging.DEBUG, 'Finished to prepare transfer')
     except RequestNotFound as error:
         logger(logging.ERROR, str(error))
-        return
+        return False
     except Exception:
         logger(logging.ERROR, 'Failed to prepare requests %s state to SUBMITTING (Will not submit jobs but return directly) with error: %s' % (list(xfers_ret.keys())), exc_info=True)
-        return
+        return False
+    return True
+
+
+def submit_prepared_transfer(external_host, job, submitter='submitter', timeout=None, user_transfer_job=False, logger=logging.log, transfertool=TRANSFER_TOOL):
+    """
+    Submit a job whose requests were already moved to the SUBMITTING state by prepare_transfer
+
+    :param external_host:         FTS server to submit to.
+    :param job:                   Job dictionary.
+    :param submitter:             Name of the submitting entity.
+    :param timeout:               Timeout
+    :param user_transfer_job:     Parameter for transfer with user credentials
+    :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
+    """
 
     # Prepare the dictionary for xfers results
     xfers_ret = {}
@@ -226,8 +254,34 @@ def submit_transfer(external_host, job, submitter='submitter', timeout=None, use
         logger(logging.ERROR, 'Failed to submit a job with error %s', str(error), exc_info=True)
 
 
+def __get_source_strategies(ctx, logger=logging.log):
+    """
+    The default source strategy and the source strategies per activity, read once per context.
+
+    :param ctx:     The RseLoaderContext of the cycle.
+    :param logger:  Optional decorated logger that can be passed from the calling daemons or servers.
+    :return:        Tuple (default source strategy, dictionary of the source strategies per activity).
+    """
+    if 'source_strategies' not in ctx.settings:
+        try:
+            default_source_strategy = get(section='conveyor', option='default-source-strategy')
+        except ConfigNotFound:
+            default_source_strategy = 'orderly'
+
+        try:
+            activity_source_strategy = get(section='conveyor', option='activity-source-strategy')
+            activity_source_strategy = loads(activity_source_strategy)
+        except ConfigNotFound:
+            activity_source_strategy = {}
+        except ValueError:
+            logger(logging.WARNING, 'activity_source_strategy not properly defined')
+            activity_source_strategy = {}
+        ctx.settings['source_strategies'] = (default_source_strategy, activity_source_strategy)
+    return ctx.settings['source_strategies']
+
+
 @read_session
-def bulk_group_transfer(transfers, policy='rule', group_bulk=200, source_strategy=None, max_time_in_queue=None, session=None, logger=logging.log, group_by_scope=False):
+def bulk_group_transfer(transfers, policy='rule', group_bulk=200, source_strategy=None, max_time_in_queue=None, session=None, logger=logging.log, group_by_scope=False, ctx=None):
     """
     Group transfers in bulk based on certain criterias
 
@@ -237,6 +291,7 @@ def bulk_group_transfer(transfers, policy='rule', group_bulk=200, source_strateg
     :param source_strategy:       Strategy to group sources
     :param max_time_in_queue:     Maximum time in queue
     :param logger:                Optional decorated logger that can be passed from the calling daemons or servers.
+    :param ctx:                   Optional RseLoaderContext of the cycle, with the RSE information already loaded.
     :return:                      List of grouped transfers.
     """
 
@@ -246,19 +301,11 @@ def bulk_group_transfer(transfers, policy='rule', group_bulk=200, source_strateg
     # Use empty string, but any string is OK, it is internal to this function only
     _catch_all_scopes_str = ''
 
-    try:
-        default_source_strategy = get(section='conveyor', option='default-source-strategy')
-    except ConfigNotFound:
-        default_source_strategy = 'orderly'
+    ctx = transfer_core.RseLoaderContext(session) if ctx is None else ctx.for_session(session)
+    default_source_strategy, activity_source_strategy = __get_source_strategies(ctx, logger=logger)
 
-    try:
-        activity_source_strategy = get(section='conveyor', option='activity-source-strategy')
-        activity_source_strategy = loads(activity_source_strategy)
-    except ConfigNotFound:
-        activity_source_strategy = {}
-    except ValueError:
-        logger(logging.WARNING, 'activity_source_strategy not properly defined')
-        activity_source_strategy = {}
+    # Load the checksum support of all the RSEs of the batch at once
+    ctx.preload_attributes([transfer['file_metadata'][key] for transfer in transfers.values() for key in ('src_rse_id', 'dest_rse_id')])
 
     for request_id in transfers:
         transfer = transfers[request_id]
@@ -267,8 +314,8 @@ def bulk_group_transfer(transfers, policy='rule', group_bulk=200, source_strateg
         dest_rse_id = transfer['file_metadata']['dest_rse_id']
         source_rse_id = transfer['file_metadata']['src_rse_id']
 
-        dest_supported_checksums = get_rse_supported_checksums(rse_id=dest_rse_id, session=session)
-        source_supported_checksums = get_rse_supported_checksums(rse_id=source_rse_id, session=session)
+        dest_supported_checksums = ctx.supported_checksums(dest_rse_id)
+        source_supported_checksums = ctx.supported_checksums(source_rse_id)
         common_checksum_names = set(source_supported_checksums).intersection(dest_supported_checksums)
 
         if source_supported_checksums == ['none']:
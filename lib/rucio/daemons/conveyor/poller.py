@@ -42,19 +42,20 @@ import socket
 import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from requests.exceptions import RequestException
 from six.moves.configparser import NoOptionError
 from sqlalchemy.exc import DatabaseError
 
 import rucio.db.sqla.util
-from rucio.common.config import config_get
+from rucio.common.config import config_get, config_get_int
 from rucio.common.exception import DatabaseException, TransferToolTimeout, TransferToolWrongAnswer
 from rucio.common.logging import formatted_logger, setup_logging
-from rucio.common.utils import chunks
 from rucio.core import heartbeat, transfer as transfer_core, request as request_core
 from rucio.core.monitor import record_timer, record_counter
 from rucio.db.sqla.constants import RequestState, RequestType
+from rucio.db.sqla.session import transactional_session
 
 graceful_stop = threading.Event()
 
@@ -63,9 +64,13 @@ datetime.datetime.strptime('', '')
 TRANSFER_TOOL = config_get('conveyor', 'transfertool', False, None)  # NOTE: This should eventually be completely removed, as it can be fetched from the request
 FILTER_TRANSFERTOOL = config_get('conveyor', 'filter_transfertool', False, None)  # NOTE: TRANSFERTOOL to filter requests on
 
+# Current number of transfers per query of each FTS server, adapted to the latency of the server
+BULK_SIZES = {}
+MIN_BULK_SIZE = 10
+
 
 def poller(once=False, activities=None, sleep_time=60,
-           fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, partition_wait_time=10):
+           fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, partition_wait_time=10, poll_threads=4):
     """
     Main loop to check the status of a transfer primitive with a transfertool.
     """
@@ -75,6 +80,7 @@ def poller(once=False, activities=None, sleep_time=60,
         timeout = float(timeout)
     except NoOptionError:
         timeout = None
+    target_latency = config_get_int('conveyor', 'poll_target_latency', False, 10)
 
     executable = 'conveyor-poller'
     if activities:
@@ -104,6 +110,7 @@ def poller(once=False, activities=None, sleep_time=60,
     logger(logging.INFO, 'Poller started')
 
     activity_next_exe_time = defaultdict(time.time)
+    executor = ThreadPoolExecutor(max_workers=max(1, poll_threads))
 
     while not graceful_stop.is_set():
 
@@ -142,12 +149,18 @@ def poller(once=False, activities=None, sleep_time=60,
                         xfers_ids[transf['external_host']] = []
                     xfers_ids[transf['external_host']].append((transf['external_id'], transf['request_id']))
 
+                # poll all the FTS servers concurrently, so that a slow server does not delay the others
+                futures = []
                 for external_host in xfers_ids:
                     external_ids = list({trf[0] for trf in xfers_ids[external_host]})
-                    request_ids = [trf[1] for trf in xfers_ids[external_host]]
-                    for xfers in chunks(external_ids, fts_bulk):
-                        # poll transfers
-                        poll_transfers(external_host=external_host, xfers=xfers, request_ids=request_ids, timeout=timeout, logger=logger)
+                    request_ids = set(trf[1] for trf in xfers_ids[external_host])
+                    futures.append(executor.submit(poll_host_transfers, external_host=external_host, xfers=external_ids, request_ids=request_ids,
+                                                   fts_bulk=fts_bulk, target_latency=target_latency, timeout=timeout, logger=logger))
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception:
+                        logger(logging.CRITICAL, 'Exception', exc_info=True)
 
                 if len(transfs) < fts_bulk / 2:
                     logger(logging.INFO, "Only %s transfers for activity %s, which is less than half of the bulk %s, will sleep %s seconds" % (len(transfs), activity, fts_bulk, sleep_time))
@@ -159,6 +172,8 @@ def poller(once=False, activities=None, sleep_time=60,
         if once:
             break
 
+    executor.shutdown()
+
     logger(logging.INFO, 'Graceful stop requested')
 
     heartbeat.die(executable, hostname, pid, hb_thread)
@@ -175,7 +190,7 @@ def stop(signum=None, frame=None):
 
 
 def run(once=False, sleep_time=60, activities=None,
-        fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, total_threads=1):
+        fts_bulk=100, db_bulk=1000, older_than=60, activity_shares=None, total_threads=1, poll_threads=4):
     """
     Starts up the conveyer threads.
     """
@@ -205,7 +220,8 @@ def run(once=False, sleep_time=60, activities=None,
 
     if once:
         logging.info('executing one poller iteration only')
-        poller(once=once, fts_bulk=fts_bulk, db_bulk=db_bulk, older_than=older_than, activities=activities, activity_shares=activity_shares)
+        poller(once=once, fts_bulk=fts_bulk, db_bulk=db_bulk, older_than=older_than, activities=activities, activity_shares=activity_shares,
+               poll_threads=poll_threads)
 
     else:
 
@@ -216,7 +232,8 @@ def run(once=False, sleep_time=60, activities=None,
                                                            'db_bulk': db_bulk,
                                                            'sleep_time': sleep_time,
                                                            'activities': activities,
-                                                           'activity_shares': activity_shares}) for _ in range(0, total_threads)]
+                                                           'activity_shares': activity_shares,
+                                                           'poll_threads': poll_threads}) for _ in range(0, total_threads)]
 
         [thread.start() for thread in threads]
 
@@ -227,16 +244,47 @@ def run(once=False, sleep_time=60, activities=None,
             threads = [thread.join(timeout=3.14) for thread in threads if thread and thread.is_alive()]
 
 
+def poll_host_transfers(external_host, xfers, request_ids, fts_bulk=100, target_latency=10, timeout=None, logger=logging.log):
+    """
+    Poll the transfers of one FTS server, in queries sized to the latency of the server.
+
+    The number of transfers per query starts at fts_bulk. It is halved when a query fails
+    or takes longer than target_latency, and grows again by 10% up to fts_bulk when the
+    queries take less than half of target_latency.
+
+    :param external_host:    The FTS server to query from.
+    :param xfers:            List of transfers to poll.
+    :param request_ids:      Set of the request ids of the transfers.
+    :param fts_bulk:         Maximum number of transfers per query.
+    :param target_latency:   Target duration of a query in seconds.
+    :param timeout:          Timeout.
+    :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    remaining = list(xfers)
+    while remaining and not graceful_stop.is_set():
+        bulk_size = min(BULK_SIZES.get(external_host, fts_bulk), fts_bulk)
+        xfers, remaining = remaining[:bulk_size], remaining[bulk_size:]
+        duration = poll_transfers(external_host=external_host, xfers=xfers, request_ids=request_ids, timeout=timeout, logger=logger)
+
+        if duration is None or duration > target_latency:
+            bulk_size = max(min(MIN_BULK_SIZE, fts_bulk), bulk_size // 2)
+        elif duration < target_latency / 2:
+            bulk_size = min(fts_bulk, bulk_size + max(1, bulk_size // 10))
+        if bulk_size != BULK_SIZES.get(external_host, fts_bulk):
+            logger(logging.DEBUG, 'Polling %s with %i transfers per query' % (external_host, bulk_size))
+        BULK_SIZES[external_host] = bulk_size
+
+
 def poll_transfers(external_host, xfers, request_ids=None, timeout=None, logger=logging.log):
     """
     Poll a list of transfers from an FTS server
 
     :param external_host:    The FTS server to query from.
     :param xfrs:             List of transfers to poll.
-    :param process:          Process number.
-    :param thread:           Thread number.
+    :param request_ids:      The request ids of the transfers.
     :param timeout:          Timeout.
     :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:                The duration of the query in seconds, None if the FTS server could not be queried.
     """
     try:
         if TRANSFER_TOOL == 'mock':
@@ -244,28 +292,16 @@ def poll_transfers(external_host, xfers, request_ids=None, timeout=None, logger=
             for task_id in xfers:
                 ret = transfer_core.update_transfer_state(external_host=None, transfer_id=task_id, state=RequestState.DONE)
                 record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
-            return
+            return 0
         try:
             tss = time.time()
             logger(logging.INFO, 'Polling %i transfers against %s with timeout %s' % (len(xfers), external_host, timeout))
-            resps = transfer_core.bulk_query_transfers(external_host, xfers, TRANSFER_TOOL, timeout)
-            record_timer('daemons.conveyor.poller.bulk_query_transfers', (time.time() - tss) * 1000 / len(xfers))
+            resps = __bulk_query_transfers(external_host, xfers, timeout, logger=logger)
+            duration = time.time() - tss
+            record_timer('daemons.conveyor.poller.bulk_query_transfers', duration * 1000 / len(xfers))
         except TransferToolTimeout as error:
             logger(logging.ERROR, str(error))
             return
-        except TransferToolWrongAnswer as error:
-            logger(logging.ERROR, str(error))
-            logger(logging.ERROR, 'Problem querying %s on %s. All jobs are being checked individually' % (str(xfers), external_host))
-            for xfer in xfers:
-                try:
-                    logger(logging.DEBUG, 'Checking %s on %s' % (xfer, external_host))
-                    status = transfer_core.bulk_query_transfers(external_host, [xfer, ], TRANSFER_TOOL, timeout)
-                    if xfer in status and isinstance(status[xfer], Exception):
-                        logger(logging.ERROR, 'Problem querying %s on %s . Error returned : %s' % (xfer, external_host, str(status[xfer])))
-                except Exception as err:
-                    logger(logging.ERROR, 'Problem querying %s on %s . Error returned : %s' % (xfer, external_host, str(err)))
-                    break
-            return
         except RequestException as error:
             logger(logging.ERROR, "Failed to contact FTS server: %s" % (str(error)))
             return
@@ -273,46 +309,115 @@ def poll_transfers(external_host, xfers, request_ids=None, timeout=None, logger=
             logger(logging.ERROR, "Failed to query FTS info", exc_info=True)
             return
 
-        logger(logging.DEBUG, 'Polled %s transfer requests status in %s seconds' % (len(xfers), (time.time() - tss)))
+        logger(logging.DEBUG, 'Polled %s transfer requests status in %s seconds' % (len(xfers), duration))
         tss = time.time()
         logger(logging.DEBUG, 'Updating %s transfer requests status' % (len(xfers)))
-        cnt = 0
 
         if TRANSFER_TOOL == 'globus':
             for task_id in resps:
                 ret = transfer_core.update_transfer_state(external_host=None, transfer_id=task_id, state=resps[task_id])
                 record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
         else:
-            for transfer_id in resps:
-                try:
-                    transf_resp = resps[transfer_id]
-                    # transf_resp is None: Lost.
-                    #             is Exception: Failed to get fts job status.
-                    #             is {}: No terminated jobs.
-                    #             is {request_id: {file_status}}: terminated jobs.
-                    if transf_resp is None:
-                        transfer_core.update_transfer_state(external_host, transfer_id, RequestState.LOST, logger=logger)
-                        record_counter('daemons.conveyor.poller.transfer_lost')
-                    elif isinstance(transf_resp, Exception):
-                        logger(logging.WARNING, "Failed to poll FTS(%s) job (%s): %s" % (external_host, transfer_id, transf_resp))
-                        record_counter('daemons.conveyor.poller.query_transfer_exception')
-                    else:
-                        for request_id in transf_resp:
-                            if request_id in request_ids:
-                                ret = request_core.update_request_state(transf_resp[request_id], logger=logger)
-                                # if True, really update request content; if False, only touch request
-                                if ret:
-                                    cnt += 1
-                                record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
-
-                    # should touch transfers.
-                    # Otherwise if one bulk transfer includes many requests and one is not terminated, the transfer will be poll again.
-                    transfer_core.touch_transfer(external_host, transfer_id)
-                except (DatabaseException, DatabaseError) as error:
-                    if re.match('.*ORA-00054.*', error.args[0]) or re.match('.*ORA-00060.*', error.args[0]) or 'ERROR 1205 (HY000)' in error.args[0]:
-                        logger(logging.WARNING, "Lock detected when handling request %s - skipping" % request_id)
-                    else:
-                        logger(logging.ERROR, 'Exception', exc_info=True)
+            request_ids = request_ids or set()
+            try:
+                # all the states of the query are updated in one transaction
+                cnt = __update_transfer_states(external_host, resps, request_ids, logger=logger)
+            except Exception:
+                logger(logging.WARNING, 'Failed to update the states of %i transfers of %s in one transaction, updating them one by one' % (len(resps), external_host), exc_info=True)
+                cnt = 0
+                for transfer_id in resps:
+                    try:
+                        # without a session, every update is done in its own transaction
+                        cnt += __update_transfer_state(external_host, transfer_id, resps[transfer_id], request_ids, logger=logger)
+                    except (DatabaseException, DatabaseError) as error:
+                        if re.match('.*ORA-00054.*', error.args[0]) or re.match('.*ORA-00060.*', error.args[0]) or 'ERROR 1205 (HY000)' in error.args[0]:
+                            logger(logging.WARNING, "Lock detected when handling transfer %s - skipping" % transfer_id)
+                        else:
+                            logger(logging.ERROR, 'Exception', exc_info=True)
             logger(logging.DEBUG, 'Finished updating %s transfer requests status (%i requests state changed) in %s seconds' % (len(xfers), cnt, (time.time() - tss)))
+        return duration
     except Exception:
         logger(logging.ERROR, 'Exception', exc_info=True)
+        return
+
+
+def __bulk_query_transfers(external_host, xfers, timeout, logger=logging.log):
+    """
+    Query the status of a list of transfers. If the FTS server returns a wrong answer, the list is split
+    in two halves which are queried separately, to isolate the transfers causing the wrong answer.
+
+    :param external_host:    The FTS server to query from.
+    :param xfers:            List of transfers to poll.
+    :param timeout:          Timeout.
+    :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:                Dictionary of transfer id to transfer status.
+    """
+    try:
+        return transfer_core.bulk_query_transfers(external_host, xfers, TRANSFER_TOOL, timeout)
+    except TransferToolWrongAnswer as error:
+        logger(logging.ERROR, str(error))
+        if len(xfers) == 1:
+            logger(logging.ERROR, 'Problem querying %s on %s . Error returned : %s' % (xfers[0], external_host, str(error)))
+            return {}
+        logger(logging.ERROR, 'Problem querying %s on %s. The jobs are being checked in two halves' % (str(xfers), external_host))
+        resps = __bulk_query_transfers(external_host, xfers[:len(xfers) // 2], timeout, logger=logger)
+        resps.update(__bulk_query_transfers(external_host, xfers[len(xfers) // 2:], timeout, logger=logger))
+        return resps
+
+
+@transactional_session
+def __update_transfer_states(external_host, resps, request_ids, session=None, logger=logging.log):
+    """
+    Update the states of the requests of polled transfers in one transaction.
+    Any error is raised, so that the whole transaction is rolled back.
+
+    :param external_host:    The FTS server of the transfers.
+    :param resps:            Dictionary of transfer id to transfer status, as returned by bulk_query_transfers.
+    :param request_ids:      Set of the request ids of the transfers.
+    :param session:          The database session to use.
+    :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:                Number of requests whose state changed.
+    """
+    cnt = 0
+    for transfer_id in resps:
+        cnt += __update_transfer_state(external_host, transfer_id, resps[transfer_id], request_ids, session=session, logger=logger)
+    return cnt
+
+
+def __update_transfer_state(external_host, transfer_id, transf_resp, request_ids, session=None, logger=logging.log):
+    """
+    Update the states of the requests of one polled transfer.
+
+    :param external_host:    The FTS server of the transfer.
+    :param transfer_id:      The id of the transfer.
+    :param transf_resp:      The status of the transfer, as returned by bulk_query_transfers.
+    :param request_ids:      Set of the request ids of the transfers.
+    :param session:          The database session to use. If None, every update is done in its own transaction
+                             and the unexpected errors of a request are logged.
+    :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:                Number of requests whose state changed.
+    """
+    cnt = 0
+    # transf_resp is None: Lost.
+    #             is Exception: Failed to get fts job status.
+    #             is {}: No terminated jobs.
+    #             is {request_id: {file_status}}: terminated jobs.
+    if transf_resp is None:
+        transfer_core.update_transfer_state(external_host, transfer_id, RequestState.LOST, session=session, logger=logger)
+        record_counter('daemons.conveyor.poller.transfer_lost')
+    elif isinstance(transf_resp, Exception):
+        logger(logging.WARNING, "Failed to poll FTS(%s) job (%s): %s" % (external_host, transfer_id, transf_resp))
+        record_counter('daemons.conveyor.poller.query_transfer_exception')
+    else:
+        for request_id in transf_resp:
+            if request_id in request_ids:
+                ret = request_core.update_request_state(transf_resp[request_id], session=session, logger=logger, raise_on_error=session is not None)
+                # if True, really update request content; if False, only touch request
+                if ret:
+                    cnt += 1
+                record_counter('daemons.conveyor.poller.update_request_state.%s' % ret)
+
+    # should touch transfers.
+    # Otherwise if one bulk transfer includes many requests and one is not terminated, the transfer will be poll again.
+    transfer_core.touch_transfer(external_host, transfer_id, session=session)
+    return cnt
@@ -44,7 +44,9 @@ import os
 import socket
 import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from prometheus_client import Counter
 from six import iteritems
@@ -57,7 +59,7 @@ from rucio.common.logging import formatted_logger, setup_logging
 from rucio.common.schema import get_schema_value
 from rucio.core import heartbeat, request as request_core, transfer as transfer_core
 from rucio.core.monitor import record_counter, record_timer
-from rucio.daemons.conveyor.common import submit_transfer, bulk_group_transfer, get_conveyor_rses, USER_ACTIVITY
+from rucio.daemons.conveyor.common import submit_transfer, prepare_transfer, submit_prepared_transfer, bulk_group_transfer, get_conveyor_rses, USER_ACTIVITY
 from rucio.db.sqla.constants import RequestState
 
 graceful_stop = threading.Event()
@@ -73,9 +75,14 @@ GET_TRANSFERS_COUNTER = Counter('rucio_daemons_conveyor_submitter_get_transfers'
 def submitter(once=False, rses=None, partition_wait_time=10,
               bulk=100, group_bulk=1, group_policy='rule', source_strategy=None,
               activities=None, sleep_time=600, max_sources=4, retry_other_fts=False,
-              filter_transfertool=FILTER_TRANSFERTOOL, transfertool=TRANSFER_TOOL, transfertype=TRANSFER_TYPE):
+              filter_transfertool=FILTER_TRANSFERTOOL, transfertool=TRANSFER_TOOL, transfertype=TRANSFER_TYPE,
+              submit_threads=4, max_submissions_per_host=2):
     """
     Main loop to submit a new transfer primitive to a transfertool.
+
+    Jobs for different FTS servers are submitted concurrently by up to submit_threads threads,
+    with at most max_submissions_per_host jobs in flight per FTS server. While a full batch is
+    being submitted, the next batch of the same activity is fetched in the background.
     """
 
     try:
@@ -135,6 +142,10 @@ def submitter(once=False, rses=None, partition_wait_time=10,
     logger = formatted_logger(logging.log, prefix + '%s')
     logger(logging.INFO, 'Transfer submitter started')
 
+    submit_executor = ThreadPoolExecutor(max_workers=max(1, submit_threads))
+    prefetch_executor = ThreadPoolExecutor(max_workers=1)
+    prefetched = {}
+
     while not graceful_stop.is_set():
         if activities is None:
             activities = [None]
@@ -160,18 +171,25 @@ def submitter(once=False, rses=None, partition_wait_time=10,
 
                 logger(logging.INFO, 'Starting to get transfer transfers for %s', activity)
                 start_time = time.time()
-                transfers = __get_transfers(total_workers=heart_beat['nr_threads'],
-                                            worker_number=heart_beat['assign_thread'],
-                                            failover_schemes=failover_scheme,
-                                            limit=bulk,
-                                            activity=activity,
-                                            rses=rse_ids,
-                                            schemes=scheme,
-                                            max_sources=max_sources,
-                                            bring_online=bring_online,
-                                            retry_other_fts=retry_other_fts,
-                                            transfertool=filter_transfertool,
-                                            logger=logger)
+                # RSE information and settings loaded once and shared by the steps of the cycle, each step loads in its own session
+                ctx = transfer_core.RseLoaderContext()
+                get_transfers = partial(__get_transfers,
+                                        total_workers=heart_beat['nr_threads'],
+                                        worker_number=heart_beat['assign_thread'],
+                                        failover_schemes=failover_scheme,
+                                        limit=bulk,
+                                        activity=activity,
+                                        rses=rse_ids,
+                                        schemes=scheme,
+                                        max_sources=max_sources,
+                                        bring_online=bring_online,
+                                        retry_other_fts=retry_other_fts,
+                                        transfertool=filter_transfertool,
+                                        ctx=ctx,
+                                        logger=logger)
+                transfers = __get_prefetched_transfers(prefetched, activity, heart_beat, logger=logger)
+                if transfers is None:
+                    transfers = get_transfers()
 
                 record_timer('daemons.conveyor.transfer_submitter.get_transfers.per_transfer', (time.time() - start_time) * 1000 / (len(transfers) if transfers else 1))
                 record_counter('daemons.conveyor.transfer_submitter.get_transfers', len(transfers))
@@ -183,24 +201,18 @@ def submitter(once=False, rses=None, partition_wait_time=10,
                 logger(logging.INFO, 'Starting to group transfers for %s', activity)
                 start_time = time.time()
 
-                grouped_jobs = bulk_group_transfer(transfers, group_policy, group_bulk, source_strategy, max_time_in_queue, group_by_scope=user_transfer)
+                grouped_jobs = bulk_group_transfer(transfers, group_policy, group_bulk, source_strategy, max_time_in_queue, group_by_scope=user_transfer, ctx=ctx)
                 record_timer('daemons.conveyor.transfer_submitter.bulk_group_transfer', (time.time() - start_time) * 1000 / (len(transfers) if transfers else 1))
 
                 logger(logging.INFO, 'Starting to submit transfers for %s', activity)
 
                 if transfertool in ['fts3', 'mock']:
-                    for external_host in grouped_jobs:
-                        if not user_transfer:
-                            for job in grouped_jobs[external_host]:
-                                # submit transfers
-                                submit_transfer(external_host=external_host, job=job, submitter='transfer_submitter',
-                                                timeout=timeout, logger=logger, transfertool=transfertool)
-                        else:
-                            for _, jobs in iteritems(grouped_jobs[external_host]):
-                                # submit transfers
-                                for job in jobs:
-                                    submit_transfer(external_host=external_host, job=job, submitter='transfer_submitter',
-                                                    timeout=timeout, user_transfer_job=user_transfer, logger=logger, transfertool=transfertool)
+                    jobs_by_host = __group_jobs_by_host(grouped_jobs, user_transfer)
+                    on_prepared = None
+                    if not once and len(transfers) >= bulk:
+                        # Once all the requests of this batch left the QUEUED state, the next batch can be fetched during the remaining submissions
+                        on_prepared = partial(__prefetch_transfers, prefetched, activity, get_transfers, heart_beat, prefetch_executor)
+                    __submit_jobs(jobs_by_host, submit_executor, max_submissions_per_host, timeout=timeout, transfertool=transfertool, on_prepared=on_prepared, logger=logger)
                 elif transfertool == 'globus':
                     if transfertype == 'bulk':
                         # build bulk job file list per external host to send to submit_transfer
@@ -237,6 +249,9 @@ def submitter(once=False, rses=None, partition_wait_time=10,
 
     logger(logging.INFO, 'Graceful stop requested')
 
+    submit_executor.shutdown()
+    prefetch_executor.shutdown()
+
     heartbeat.die(executable, hostname, pid, hb_thread)
 
     logger(logging.INFO, 'Graceful stop done')
@@ -252,7 +267,8 @@ def stop(signum=None, frame=None):
 
 def run(once=False, group_bulk=1, group_policy='rule', mock=False,
         rses=None, include_rses=None, exclude_rses=None, vos=None, bulk=100, source_strategy=None,
-        activities=None, exclude_activities=None, sleep_time=600, max_sources=4, retry_other_fts=False, total_threads=1):
+        activities=None, exclude_activities=None, sleep_time=600, max_sources=4, retry_other_fts=False, total_threads=1,
+        submit_threads=4, max_submissions_per_host=2):
     """
     Starts up the conveyer threads.
     """
@@ -300,7 +316,9 @@ def run(once=False, group_bulk=1, group_policy='rule', mock=False,
                                                           'sleep_time': sleep_time,
                                                           'max_sources': max_sources,
                                                           'source_strategy': source_strategy,
-                                                          'retry_other_fts': retry_other_fts}) for _ in range(0, total_threads)]
+                                                          'retry_other_fts': retry_other_fts,
+                                                          'submit_threads': submit_threads,
+                                                          'max_submissions_per_host': max_submissions_per_host}) for _ in range(0, total_threads)]
 
     [thread.start() for thread in threads]
 
@@ -313,7 +331,7 @@ def run(once=False, group_bulk=1, group_policy='rule', mock=False,
 
 def __get_transfers(total_workers=0, worker_number=0, failover_schemes=None, limit=None, activity=None, older_than=None,
                     rses=None, schemes=None, max_sources=4, bring_online=43200,
-                    retry_other_fts=False, transfertool=None, logger=logging.log):
+                    retry_other_fts=False, transfertool=None, ctx=None, logger=logging.log):
     """
     Get transfers to process
 
@@ -330,6 +348,7 @@ def __get_transfers(total_workers=0, worker_number=0, failover_schemes=None, lim
     :param logger:           Optional decorated logger that can be passed from the calling daemons or servers.
     :param retry_other_fts:  Retry other fts servers if needed
     :param transfertool:     The transfer tool as specified in rucio.cfg
+    :param ctx:              Optional RseLoaderContext of the submission cycle.
     :returns:                List of transfers
     """
 
@@ -343,7 +362,8 @@ def __get_transfers(total_workers=0, worker_number=0, failover_schemes=None, lim
                                                                                                                                      bring_online=bring_online,
                                                                                                                                      retry_other_fts=retry_other_fts,
                                                                                                                                      failover_schemes=failover_schemes,
-                                                                                                                                     transfertool=transfertool)
+                                                                                                                                     transfertool=transfertool,
+                                                                                                                                     ctx=ctx)
     request_core.set_requests_state_if_possible(reqs_no_source, RequestState.NO_SOURCES, logger=logger)
     request_core.set_requests_state_if_possible(reqs_only_tape_source, RequestState.ONLY_TAPE_SOURCES, logger=logger)
     request_core.set_requests_state_if_possible(reqs_scheme_mismatch, RequestState.MISMATCH_SCHEME, logger=logger)
@@ -351,3 +371,117 @@ def __get_transfers(total_workers=0, worker_number=0, failover_schemes=None, lim
     for request_id in transfers:
         logger(logging.DEBUG, "Transfer for request(%s): %s", request_id, transfers[request_id])
     return transfers
+
+
+def __prefetch_transfers(prefetched, activity, get_transfers, heart_beat, executor):
+    """
+    Start fetching the next transfers of an activity in the background.
+
+    :param prefetched:     Dictionary of activity to (assign_thread, nr_threads, future).
+    :param activity:       The activity.
+    :param get_transfers:  Callable returning the transfers.
+    :param heart_beat:     The heartbeat of the worker the transfers are fetched for.
+    :param executor:       The thread pool used for the prefetch.
+    """
+    prefetched[activity] = (heart_beat['assign_thread'], heart_beat['nr_threads'], executor.submit(get_transfers))
+
+
+def __get_prefetched_transfers(prefetched, activity, heart_beat, logger=logging.log):
+    """
+    Return the transfers prefetched for an activity during the previous submission, if any.
+    Prefetched transfers are discarded if the partition of the worker changed in the meantime.
+
+    :param prefetched:  Dictionary of activity to (assign_thread, nr_threads, future).
+    :param activity:    The activity.
+    :param heart_beat:  The current heartbeat of the worker.
+    :param logger:      Optional decorated logger that can be passed from the calling daemons or servers.
+    :returns:           List of transfers or None if nothing usable was prefetched.
+    """
+    if activity not in prefetched:
+        return None
+    assign_thread, nr_threads, future = prefetched.pop(activity)
+    try:
+        transfers = future.result()
+    except Exception:
+        logger(logging.ERROR, 'Failed to prefetch transfers for %s', activity, exc_info=True)
+        return None
+    if (assign_thread, nr_threads) != (heart_beat['assign_thread'], heart_beat['nr_threads']):
+        logger(logging.INFO, 'Worker partition changed, discarding %s prefetched transfers for %s', len(transfers), activity)
+        return None
+    return transfers
+
+
+def __group_jobs_by_host(grouped_jobs, user_transfer):
+    """
+    Flatten the grouped jobs into one queue of jobs per external host.
+
+    :param grouped_jobs:   Jobs per external host as returned by bulk_group_transfer.
+    :param user_transfer:  True if the jobs are user transfers, grouped by scope.
+    :returns:              Dictionary of external host to (deque of jobs, user_transfer).
+    """
+    jobs_by_host = {}
+    for external_host in grouped_jobs:
+        if not user_transfer:
+            jobs = deque(grouped_jobs[external_host])
+        else:
+            jobs = deque(job for _, scope_jobs in iteritems(grouped_jobs[external_host]) for job in scope_jobs)
+        if jobs:
+            jobs_by_host[external_host] = (jobs, user_transfer)
+    return jobs_by_host
+
+
+def __submit_host_jobs(external_host, jobs, user_transfer, timeout, transfertool, job_done, logger=logging.log):
+    """
+    Prepare and submit jobs to one FTS server until the shared queue of the server is empty.
+
+    Each job is moved to the SUBMITTING state just before its own submission, so the jobs still
+    waiting in the queue stay QUEUED if the submission stops.
+    """
+    while True:
+        try:
+            job = jobs.popleft()
+        except IndexError:
+            return
+        try:
+            prepared = prepare_transfer(external_host, job, logger=logger)
+        finally:
+            job_done()
+        if prepared:
+            submit_prepared_transfer(external_host=external_host, job=job, submitter='transfer_submitter', timeout=timeout,
+                                     user_transfer_job=user_transfer, logger=logger, transfertool=transfertool)
+
+
+def __submit_jobs(jobs_by_host, executor, max_submissions_per_host, timeout, transfertool, on_prepared=None, logger=logging.log):
+    """
+    Submit jobs concurrently, with at most max_submissions_per_host jobs in flight per FTS server.
+
+    :param jobs_by_host:              Dictionary of external host to (deque of jobs, user_transfer).
+    :param executor:                  The thread pool used for the submission.
+    :param max_submissions_per_host:  Maximum number of concurrent submissions per FTS server.
+    :param timeout:                   Timeout of the submission.
+    :param transfertool:              The transfer tool.
+    :param on_prepared:               Optional callable, called once every job went through prepare_transfer.
+    :param logger:                    Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    lock = threading.Lock()
+    remaining = [sum(len(jobs) for jobs, _ in jobs_by_host.values())]
+
+    def job_done():
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and on_prepared:
+            on_prepared()
+
+    if not remaining[0] and on_prepared:
+        on_prepared()
+
+    futures = []
+    for external_host, (jobs, user_transfer) in iteritems(jobs_by_host):
+        for _ in range(min(max(1, max_submissions_per_host), len(jobs))):
+            futures.append(executor.submit(__submit_host_jobs, external_host, jobs, user_transfer, timeout, transfertool, job_done, logger=logger))
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            logger(logging.CRITICAL, 'Exception', exc_info=True)
@@ -39,6 +39,7 @@ import socket
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 
 import requests
@@ -85,6 +86,64 @@ class HermesListener(stomp.ConnectionListener):
         logging.error('[broker] [%s]: %s', self.__broker, frame.body)
 
 
+class DeliveryLane(object):
+    '''
+    Delivery lane of one service. Every lane keeps its own retry and backoff state,
+    so that a failing service does not delay the delivery to the other ones.
+    '''
+
+    def __init__(self, service, deliver, retries=1, retry_delay=1, backoff=10, max_backoff=600):
+        '''
+        :param service:      The name of the service.
+        :param deliver:      Callable taking the messages and the logger and returning the list of delivered message ids, or None on failure.
+        :param retries:      Number of retries within one batch.
+        :param retry_delay:  Time between two retries within one batch.
+        :param backoff:      Initial time during which the service is skipped after a failed batch. Doubles on each consecutive failure.
+        :param max_backoff:  Maximum backoff time.
+        '''
+        self.service = service
+        self.__deliver = deliver
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.next_attempt = 0
+
+    def deliver(self, messages, logger):
+        '''
+        Deliver a batch of messages, unless the lane is backing off.
+
+        :param messages:  The list of messages.
+        :param logger:    The logger object.
+        :returns:         The list of delivered message ids.
+        '''
+        if time.time() < self.next_attempt:
+            logger(logging.INFO, 'Delivery to %s is backing off for %s seconds', self.service, int(self.next_attempt - time.time()))
+            return []
+
+        for attempt in range(self.retries + 1):
+            t_time = time.time()
+            try:
+                delivered = self.__deliver(messages, logger)
+            except Exception as error:
+                logger(logging.ERROR, 'Error sending to %s : %s', self.service, str(error))
+                delivered = None
+            if delivered is not None:
+                logger(logging.INFO, 'Messages successfully submitted to %s in %s seconds', self.service, time.time() - t_time)
+                self.failures = 0
+                self.next_attempt = 0
+                return delivered
+            if attempt < self.retries:
+                GRACEFUL_STOP.wait(self.retry_delay)
+
+        self.failures += 1
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        self.next_attempt = time.time() + delay
+        logger(logging.INFO, 'Failure to submit to %s, will back off for %s seconds', self.service, delay)
+        return []
+
+
 def setup_activemq(logger):
     """
     Deliver messages to ActiveMQ
@@ -457,8 +516,23 @@ def hermes2(once=False, thread=0, bulk=1000, sleep_time=10):
         except Exception as err:
             logger(logging.ERROR, str(err))
 
+    lanes = []
+    lane_kwargs = {'retries': config_get_int('hermes', 'delivery_retries', False, 1),
+                   'backoff': config_get_int('hermes', 'delivery_backoff', False, 10),
+                   'max_backoff': config_get_int('hermes', 'delivery_max_backoff', False, 600)}
+    if 'influx' in services_list:
+        lanes.append(DeliveryLane('influx', lambda messages, logger: __deliver_to_influx(messages, influx_endpoint, logger), **lane_kwargs))
+    if 'elastic' in services_list:
+        lanes.append(DeliveryLane('elastic', lambda messages, logger: __deliver_to_elastic(messages, elastic_endpoint, logger), **lane_kwargs))
+    if 'emails' in services_list:
+        lanes.append(DeliveryLane('emails', lambda messages, logger: deliver_emails(messages=messages, logger=logger), **lane_kwargs))
+    if 'activemq' in services_list:
+        lanes.append(DeliveryLane('activemq', lambda messages, logger: deliver_to_activemq(messages=messages, conns=conns, destination=destination,
+                                                                                           username=username, password=password, use_ssl=use_ssl,
+                                                                                           logger=logger), **lane_kwargs))
+    executor = ThreadPoolExecutor(max_workers=max(1, len(lanes)))
+
     while not GRACEFUL_STOP.is_set():
-        message_status = copy.deepcopy(services_list)
         message_statuses = {}
         stime = time.time()
         try:
@@ -475,54 +549,17 @@ def hermes2(once=False, thread=0, bulk=1000, sleep_time=10):
                     message_statuses[message['id']] = copy.deepcopy(services_list)
                 logger(logging.DEBUG, 'Retrieved %i messages retrieved in %s seconds', len(messages), time.time() - start_time)
 
-                if 'influx' in message_status:
-                    t_time = time.time()
-                    logger(logging.DEBUG, 'Will submit to influxDB')
+                # Every service is delivered by its own lane, the statuses are merged once all lanes are done
+                futures = [(lane.service, executor.submit(lane.deliver, messages, logger)) for lane in lanes]
+                for service, future in futures:
                     try:
-                        state = aggregate_to_influx(messages=messages, bin_size='1m', endpoint=influx_endpoint, logger=logger)
+                        delivered = future.result()
                     except Exception as error:
-                        logger(logging.ERROR, 'Error sending to InfluxDB : %s', str(error))
-                        state = 500
-                    if state in [204, 200]:
-                        logger(logging.INFO, 'Messages successfully submitted to influxDB in %s seconds', time.time() - t_time)
-                        for message in messages:
-                            message_statuses[message['id']].remove('influx')
-                    else:
-                        logger(logging.INFO, 'Failure to submit to influxDB')
-
-                if 'elastic' in message_status:
-                    t_time = time.time()
-                    try:
-                        state = submit_to_elastic(messages=messages, endpoint=elastic_endpoint, logger=logger)
-                    except Exception as error:
-                        logger(logging.ERROR, 'Error sending to Elastic : %s', str(error))
-                        state = 500
-                    if state in [200, 204]:
-                        logger(logging.INFO, 'Messages successfully submitted to elastic in %s seconds', time.time() - t_time)
-                        for message in messages:
-                            message_statuses[message['id']].remove('elastic')
-                    else:
-                        logger(logging.INFO, 'Failure to submit to elastic')
-
-                if 'emails' in message_status:
-                    t_time = time.time()
-                    try:
-                        to_delete = deliver_emails(messages=messages, logger=logger)
-                        logger(logging.INFO, 'Messages successfully submitted by emails in %s seconds', time.time() - t_time)
-                        for message_id in to_delete:
-                            message_statuses[message_id].remove('emails')
-                    except Exception as error:
-                        logger(logging.ERROR, 'Error sending email : %s', str(error))
-
-                if 'activemq' in message_status:
-                    t_time = time.time()
-                    try:
-                        to_delete = deliver_to_activemq(messages=messages, conns=conns, destination=destination, username=username, password=password, use_ssl=use_ssl, logger=logger)
-                        logger(logging.INFO, 'Messages successfully submitted to ActiveMQ in %s seconds', time.time() - t_time)
-                        for message_id in to_delete:
-                            message_statuses[message_id].remove('activemq')
-                    except Exception as error:
-                        logger(logging.ERROR, 'Error sending to ActiveMQ : %s', str(error))
+                        logger(logging.ERROR, 'Error sending to %s : %s', service, str(error))
+                        continue
+                    for message_id in delivered:
+                        if service in message_statuses.get(message_id, []):
+                            message_statuses[message_id].remove(service)
 
                 to_delete = []
                 to_update = {}
@@ -559,6 +596,32 @@ def hermes2(once=False, thread=0, bulk=1000, sleep_time=10):
         except Exception:
             logger(logging.ERROR, "Failed to submit messages", exc_info=True)
 
+    executor.shutdown()
+
+
+def __deliver_to_influx(messages, endpoint, logger):
+    '''
+    Delivery function of the influx lane.
+
+    :returns: The list of delivered message ids, or None on failure.
+    '''
+    state = aggregate_to_influx(messages=messages, bin_size='1m', endpoint=endpoint, logger=logger)
+    if state in [204, 200]:
+        return [message['id'] for message in messages]
+    return None
+
+
+def __deliver_to_elastic(messages, endpoint, logger):
+    '''
+    Delivery function of the elastic lane.
+
+    :returns: The list of delivered message ids, or None on failure.
+    '''
+    state = submit_to_elastic(messages=messages, endpoint=endpoint, logger=logger)
+    if state in [200, 204]:
+        return [message['id'] for message in messages]
+    return None
+
 
 def stop(signum=None, frame=None):
     '''
@@ -34,7 +34,9 @@ import socket
 import threading
 import time
 import traceback
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from math import ceil
 from random import randint
 from re import match
 
@@ -48,14 +50,121 @@ from rucio.common.logging import setup_logging
 from rucio.common.types import InternalScope
 from rucio.core.heartbeat import live, die, sanity_check
 from rucio.core.monitor import record_counter
-from rucio.core.rule import re_evaluate_did, get_updated_dids, delete_updated_did
+from rucio.core.rule import re_evaluate_did, get_updated_dids, delete_updated_did, delete_updated_dids, get_evaluation_backlog
 
 graceful_stop = threading.Event()
 
 
-def re_evaluator(once=False):
+#: Smallest number of updated dids fetched by a worker of the batch mode
+BATCH_MIN_FETCH_SIZE = 100
+#: Largest number of updated dids fetched by a worker of the batch mode
+BATCH_MAX_FETCH_SIZE = 10000
+#: Maximum age in seconds of the backlog count used for the fetch size of the batch mode
+BATCH_BACKLOG_EXPIRATION = 30
+
+
+def handle_evaluation_error(e, scope, name, paused_dids, heartbeat):
+    """
+    Log and count a failed re-evaluation of a did, and pause the did if it is locked.
+
+    :param e:            The exception raised by the re-evaluation.
+    :param scope:        The scope of the did.
+    :param name:         The name of the did.
+    :param paused_dids:  Dictionary {(scope, name): datetime} of the paused dids of the worker.
+    :param heartbeat:    The heartbeat of the worker.
+    """
+    if isinstance(e, ReplicationRuleCreationTemporaryFailed):
+        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
+        logging.warning('re_evaluator[%s/%s]: Replica Creation temporary failed, retrying later for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], scope, name))
+    elif isinstance(e, FlushError):
+        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
+        logging.warning('re_evaluator[%s/%s]: Flush error for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], scope, name))
+    elif match('.*ORA-00054.*', str(e.args[0])):
+        paused_dids[(scope.internal, name)] = datetime.utcnow() + timedelta(seconds=randint(60, 600))
+        logging.warning('re_evaluator[%s/%s]: Locks detected for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], scope, name))
+        record_counter('rule.judge.exceptions.LocksDetected')
+    elif match('.*QueuePool.*', str(e.args[0])):
+        logging.warning(traceback.format_exc())
+        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
+    elif match('.*ORA-03135.*', str(e.args[0])):
+        logging.warning(traceback.format_exc())
+        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
+    else:
+        logging.error(traceback.format_exc())
+        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
+
+
+def get_batch_size(backlog, total_workers):
+    """
+    Fetch size per worker of the batch mode for a backlog, the share of the backlog
+    of one worker within BATCH_MIN_FETCH_SIZE and BATCH_MAX_FETCH_SIZE.
+
+    :param backlog:        Number of updated dids waiting for evaluation.
+    :param total_workers:  Number of evaluator workers.
+    :returns:              The fetch size.
+    """
+    return max(BATCH_MIN_FETCH_SIZE, min(BATCH_MAX_FETCH_SIZE, int(ceil(float(backlog) / max(1, total_workers)))))
+
+
+def re_evaluate_batch(heartbeat, paused_dids):
+    """
+    Re-evaluate the updated dids of a worker in batch mode. The updates are grouped
+    per did and action, each group is evaluated once and the consumed updates are
+    deleted at the end of the batch. The updated dids are partitioned between the
+    workers by the heartbeat, only the fetch size follows the backlog.
+
+    :param heartbeat:    The heartbeat of the worker.
+    :param paused_dids:  Dictionary {(scope, name): datetime} of the paused dids of the worker.
+    :returns:            The number of updated dids fetched.
+    """
+    start = time.time()
+    backlog = get_evaluation_backlog(expiration_time=BATCH_BACKLOG_EXPIRATION)[0] or 0
+    fetch_size = get_batch_size(backlog, heartbeat['nr_threads'])
+
+    dids = get_updated_dids(total_workers=heartbeat['nr_threads'],
+                            worker_number=heartbeat['assign_thread'],
+                            limit=fetch_size,
+                            blocked_dids=[(InternalScope(key[0], fromExternal=False), key[1]) for key in paused_dids])
+
+    groups = OrderedDict()  # {(scope, name, action): [ids]}
+    for did in dids:
+        groups.setdefault((did.scope, did.name, did.rule_evaluation_action), []).append(did.id)
+    logging.debug('re_evaluator[%s/%s]: index query time %f fetch size is %d in %d groups (backlog %d, fetch limit %d)' % (heartbeat['assign_thread'],
+                                                                                                                           heartbeat['nr_threads'],
+                                                                                                                           time.time() - start,
+                                                                                                                           len(dids),
+                                                                                                                           len(groups),
+                                                                                                                           backlog,
+                                                                                                                           fetch_size))
+
+    consumed = []
+    try:
+        for (scope, name, action), ids in iteritems(groups):
+            if graceful_stop.is_set():
+                break
+            if (scope.internal, name) in paused_dids:
+                continue
+            try:
+                start_time = time.time()
+                re_evaluate_did(scope=scope, name=name, rule_evaluation_action=action)
+                logging.debug('re_evaluator[%s/%s]: evaluation of %s:%s for %d updates took %f' % (heartbeat['assign_thread'], heartbeat['nr_threads'], scope, name, len(ids), time.time() - start_time))
+                consumed.extend(ids)
+            except DataIdentifierNotFound:
+                consumed.extend(ids)
+            except (DatabaseException, DatabaseError, ReplicationRuleCreationTemporaryFailed, FlushError) as e:
+                handle_evaluation_error(e, scope, name, paused_dids, heartbeat)
+    finally:
+        if consumed:
+            delete_updated_dids(ids=consumed)
+    return len(dids)
+
+
+def re_evaluator(once=False, batch=False):
     """
     Main loop to check the re-evaluation of dids.
+
+    :param once:   Run only once.
+    :param batch:  Coalesce the updates of the same did and adapt the fetch size to the backlog.
     """
 
     hostname = socket.gethostname()
@@ -79,6 +188,15 @@ def re_evaluator(once=False):
             # Refresh paused dids
             paused_dids = dict((k, v) for k, v in iteritems(paused_dids) if datetime.utcnow() < v)
 
+            if batch:
+                fetched = re_evaluate_batch(heartbeat=heartbeat, paused_dids=paused_dids)
+                if not fetched and not once:
+                    logging.debug('re_evaluator[%s/%s] did not get any work (paused_dids=%s)' % (heartbeat['assign_thread'], heartbeat['nr_threads'], str(len(paused_dids))))
+                    graceful_stop.wait(30)
+                if once:
+                    break
+                continue
+
             # Select a bunch of dids for re evaluation for this worker
             dids = get_updated_dids(total_workers=heartbeat['nr_threads'],
                                     worker_number=heartbeat['assign_thread'],
@@ -122,26 +240,8 @@ def re_evaluator(once=False):
                         done_dids[did_tag].append(did.rule_evaluation_action)
                     except DataIdentifierNotFound:
                         delete_updated_did(id=did.id)
-                    except (DatabaseException, DatabaseError) as e:
-                        if match('.*ORA-00054.*', str(e.args[0])):
-                            paused_dids[(did.scope.internal, did.name)] = datetime.utcnow() + timedelta(seconds=randint(60, 600))
-                            logging.warning('re_evaluator[%s/%s]: Locks detected for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], did.scope, did.name))
-                            record_counter('rule.judge.exceptions.LocksDetected')
-                        elif match('.*QueuePool.*', str(e.args[0])):
-                            logging.warning(traceback.format_exc())
-                            record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
-                        elif match('.*ORA-03135.*', str(e.args[0])):
-                            logging.warning(traceback.format_exc())
-                            record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
-                        else:
-                            logging.error(traceback.format_exc())
-                            record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
-                    except ReplicationRuleCreationTemporaryFailed as e:
-                        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
-                        logging.warning('re_evaluator[%s/%s]: Replica Creation temporary failed, retrying later for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], did.scope, did.name))
-                    except FlushError as e:
-                        record_counter('rule.judge.exceptions.%s' % e.__class__.__name__)
-                        logging.warning('re_evaluator[%s/%s]: Flush error for %s:%s' % (heartbeat['assign_thread'], heartbeat['nr_threads'], did.scope, did.name))
+                    except (DatabaseException, DatabaseError, ReplicationRuleCreationTemporaryFailed, FlushError) as e:
+                        handle_evaluation_error(e, did.scope, did.name, paused_dids, heartbeat)
         except (DatabaseException, DatabaseError) as e:
             if match('.*QueuePool.*', str(e.args[0])):
                 logging.warning(traceback.format_exc())
@@ -170,7 +270,7 @@ def stop(signum=None, frame=None):
     graceful_stop.set()
 
 
-def run(once=False, threads=1):
+def run(once=False, threads=1, batch=False):
     """
     Starts up the Judge-Eval threads.
     """
@@ -184,10 +284,10 @@ def run(once=False, threads=1):
     sanity_check(executable=executable, hostname=hostname)
 
     if once:
-        re_evaluator(once)
+        re_evaluator(once, batch=batch)
     else:
         logging.info('Evaluator starting %s threads' % str(threads))
-        threads = [threading.Thread(target=re_evaluator, kwargs={'once': once}) for i in range(0, threads)]
+        threads = [threading.Thread(target=re_evaluator, kwargs={'once': once, 'batch': batch}) for i in range(0, threads)]
         [t.start() for t in threads]
         # Interruptible joins require a timeout.
         while threads[0].is_alive():
@@ -104,8 +104,9 @@ def reaper(rses, worker_number=0, total_workers=1, chunk_size=100, once=False, s
                 deleted_replicas = []
                 try:
                     prot.connect()
+                    # Resolve all the pfns first and delete them with one bulk call
+                    pfns = []
                     for replica in replicas:
-                        nothing_to_do = False
                         scope = ''
                         if replica['scope']:
                             scope = replica['scope'].external
@@ -118,9 +119,25 @@ def reaper(rses, worker_number=0, total_workers=1, chunk_size=100, once=False, s
                                                             scheme=scheme).values())[0])
                             logging.info('Dark Reaper %s-%s: Deletion ATTEMPT of %s:%s as %s on %s',
                                          worker_number, total_workers, scope, replica['name'], pfn, rse)
-                            start = time.time()
-                            prot.delete(pfn)
-                            duration = time.time() - start
+                        except Exception as error:
+                            pfn = error
+                        pfns.append(pfn)
+                    start = time.time()
+                    deletions = {}
+                    if replicas:
+                        deletions = prot.bulk_delete([pfn for pfn in pfns if not isinstance(pfn, Exception)])
+                    duration = (time.time() - start) / max(len(replicas), 1)
+
+                    for replica, pfn in zip(replicas, pfns):
+                        nothing_to_do = False
+                        scope = ''
+                        if replica['scope']:
+                            scope = replica['scope'].external
+                        try:
+                            if isinstance(pfn, Exception):
+                                raise pfn
+                            if deletions[pfn] is not True:
+                                raise deletions[pfn]
                             logging.info('Dark Reaper %s-%s: Deletion SUCCESS of %s:%s as %s on %s in %s seconds',
                                          worker_number, total_workers, scope, replica['name'], pfn, rse, duration)
                             payload = {'scope': scope,
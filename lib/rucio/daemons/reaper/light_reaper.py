@@ -95,17 +95,22 @@ def reaper(rses=[], worker_number=0, total_workers=1, chunk_size=100, once=False
                 deleted_replicas = []
                 try:
                     prot.connect()
-                    for replica in replicas:
+                    # pfns = [str(rsemgr.lfns2pfns(rse_settings=rse_info,
+                    #                              lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}],
+                    #                              operation='delete', scheme=scheme).values()[0]) for replica in replicas]
+                    pfns = ['s3://%s%s%s' % (prot.attributes['hostname'], prot.attributes['prefix'], replica['name']) for replica in replicas]
+                    start = time.time()
+                    deletions = {}
+                    if pfns:
+                        deletions = prot.bulk_delete(pfns)
+                    duration = (time.time() - start) / max(len(pfns), 1)
+
+                    for replica, pfn in zip(replicas, pfns):
                         nothing_to_do = False
                         try:
-                            # pfn = str(rsemgr.lfns2pfns(rse_settings=rse_info,
-                            #                            lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}],
-                            #                            operation='delete', scheme=scheme).values()[0])
-                            pfn = 's3://%s%s%s' % (prot.attributes['hostname'], prot.attributes['prefix'], replica['name'])
                             # logging.debug('Light Reaper %s-%s: Deletion ATTEMPT of %s:%s as %s on %s', worker_number, total_workers, replica['scope'], replica['name'], pfn, rse)
-                            start = time.time()
-                            prot.delete(pfn)
-                            duration = time.time() - start
+                            if deletions[pfn] is not True:
+                                raise deletions[pfn]
                             logging.info('Light Reaper %s-%s: Deletion SUCCESS of %s:%s as %s on %s in %s seconds', worker_number, total_workers, replica['scope'], replica['name'], pfn, rse, duration)
                             payload = {'scope': replica['scope'].external,
                                        'name': replica['name'],
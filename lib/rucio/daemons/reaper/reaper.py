@@ -41,6 +41,7 @@ import threading
 import time
 import traceback
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from math import ceil
 
@@ -79,6 +80,29 @@ REGION = make_region().configure('dogpile.cache.memcached',
 DELETION_COUNTER = Counter('rucio_daemons_reaper_deletion_done', 'Number of deleted replicas')
 EXCLUDED_RSE_GAUGE = Gauge('rucio_daemons_reaper_excluded_rses', 'Temporarly excluded RSEs', labelnames=('rse',))
 
+DELETION_POOLS = {}
+DELETION_POOLS_LOCK = threading.Lock()
+
+
+class NoAccessCounter(object):
+    """
+    Number of NOACCESS deletion attempts on an RSE, shared by the slices of a chunk deleted in parallel.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def increment(self):
+        """
+        Count one more NOACCESS attempt.
+
+        :returns: The number of NOACCESS attempts, including this one.
+        """
+        with self.lock:
+            self.count += 1
+            return self.count
+
 
 def get_rses_to_process(rses, include_rses, exclude_rses, vos):
     """
@@ -143,14 +167,33 @@ def get_rses_to_process(rses, include_rses, exclude_rses, vos):
     return rses
 
 
-def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_threshold, logger=logging.log):
+def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_threshold, noaccess_counter=None, logger=logging.log):
     deleted_files = []
     rse_name = rse_info['rse']
     rse_id = rse_info['id']
-    noaccess_attempts = 0
-    pfns_to_bulk_delete = []
+    if noaccess_counter is None:
+        noaccess_counter = NoAccessCounter()
     try:
         prot.connect()
+        # Sign the URLs if necessary and delete the whole chunk with one bulk call, the outcome is then handled per replica
+        pfns = {}
+        if rse_id not in staging_areas:
+            for replica in replicas:
+                if replica['pfn']:
+                    logger(logging.INFO, 'Deletion ATTEMPT of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
+                    try:
+                        pfns[replica['pfn']] = replica['pfn']
+                        if prot.attributes['scheme'] == 'https' and rse_info['sign_url'] is not None:
+                            pfns[replica['pfn']] = get_signed_url(rse_id, rse_info['sign_url'], 'delete', replica['pfn'])
+                    except Exception as error:
+                        pfns[replica['pfn']] = error
+        start = time.time()
+        deletions = {}
+        if pfns:
+            deletions = prot.bulk_delete([pfn for pfn in pfns.values() if not isinstance(pfn, Exception)])
+        # The deletion time of a replica is the average over the chunk
+        duration = (time.time() - start) / max(len(pfns), 1)
+
         for replica in replicas:
             # Physical deletion
             try:
@@ -163,8 +206,6 @@ def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_th
                                  'protocol': prot.attributes['scheme']}
                 if replica['scope'].vo != 'def':
                     deletion_dict['vo'] = replica['scope'].vo
-                logger(logging.INFO, 'Deletion ATTEMPT of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
-                start = time.time()
                 # For STAGING RSEs, no physical deletion
                 if rse_id in staging_areas:
                     logger(logging.WARNING, 'Deletion STAGING of %s:%s as %s on %s, will only delete the catalog and not do physical deletion', replica['scope'], replica['name'], replica['pfn'], rse_name)
@@ -172,19 +213,15 @@ def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_th
                     continue
 
                 if replica['pfn']:
-                    pfn = replica['pfn']
-                    # sign the URL if necessary
-                    if prot.attributes['scheme'] == 'https' and rse_info['sign_url'] is not None:
-                        pfn = get_signed_url(rse_id, rse_info['sign_url'], 'delete', pfn)
-                    if prot.attributes['scheme'] == 'globus':
-                        pfns_to_bulk_delete.append(replica['pfn'])
-                    else:
-                        prot.delete(pfn)
+                    pfn = pfns[replica['pfn']]
+                    if isinstance(pfn, Exception):
+                        raise pfn
+                    if deletions[pfn] is not True:
+                        raise deletions[pfn]
                 else:
                     logger(logging.WARNING, 'Deletion UNAVAILABLE of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
 
-                monitor.record_timer('daemons.reaper.delete.%s.%s' % (prot.attributes['scheme'], rse_name), (time.time() - start) * 1000)
-                duration = time.time() - start
+                monitor.record_timer('daemons.reaper.delete.%s.%s' % (prot.attributes['scheme'], rse_name), duration * 1000)
 
                 deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
 
@@ -201,23 +238,19 @@ def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_th
                 logger(logging.WARNING, 'Deletion NOACCESS of %s:%s as %s on %s: %s', replica['scope'], replica['name'], replica['pfn'], rse_name, str(error))
                 deletion_dict['reason'] = str(error)
                 add_message('deletion-failed', deletion_dict)
-                noaccess_attempts += 1
-                if noaccess_attempts >= auto_exclude_threshold:
+                noaccess_attempts = noaccess_counter.increment()
+                # The bulk deletion is already done, the outcome of the remaining replicas is still recorded
+                if noaccess_attempts == auto_exclude_threshold:
                     logger(logging.INFO, 'Too many (%d) NOACCESS attempts for %s. RSE will be temporarly excluded.', noaccess_attempts, rse_name)
                     REGION.set('temporary_exclude_%s' % rse_id, True)
                     labels = {'rse': rse_name}
                     EXCLUDED_RSE_GAUGE.labels(**labels).set(1)
-                    break
 
             except Exception as error:
                 logger(logging.CRITICAL, 'Deletion CRITICAL of %s:%s as %s on %s: %s', replica['scope'], replica['name'], replica['pfn'], rse_name, str(traceback.format_exc()))
                 deletion_dict['reason'] = str(error)
                 add_message('deletion-failed', deletion_dict)
 
-        if pfns_to_bulk_delete and prot.attributes['scheme'] == 'globus':
-            logger(logging.DEBUG, 'Attempting bulk delete on RSE %s for scheme %s', rse_name, prot.attributes['scheme'])
-            prot.bulk_delete(pfns_to_bulk_delete)
-
     except (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable) as error:
         for replica in replicas:
             logger(logging.WARNING, 'Deletion NOACCESS of %s:%s as %s on %s: %s', replica['scope'], replica['name'], replica['pfn'], rse_name, str(error))
@@ -241,6 +274,123 @@ def delete_from_storage(replicas, prot, rse_info, staging_areas, auto_exclude_th
     return deleted_files
 
 
+def get_deletion_pool(hostname):
+    """
+    Return the thread pool used for the physical deletions on a SE. The pool is shared by all
+    the reaper threads of the process and its size is given by get_max_deletion_threads_by_hostname.
+
+    When the size changes, a new pool replaces the old one. The old pool is never shut down, as
+    other threads may still hold it and submit to it: its threads exit once its last user
+    drops its reference and the pending deletions are done.
+
+    :param hostname: the hostname of the SE
+
+    :returns: (pool, max_deletion_thread)
+    """
+    max_deletion_thread = max(1, int(get_max_deletion_threads_by_hostname(hostname)))
+    with DELETION_POOLS_LOCK:
+        pool, nb_threads = DELETION_POOLS.get(hostname, (None, 0))
+        if pool is None or nb_threads != max_deletion_thread:
+            pool = ThreadPoolExecutor(max_workers=max_deletion_thread)
+            DELETION_POOLS[hostname] = (pool, max_deletion_thread)
+    return pool, max_deletion_thread
+
+
+def resolve_pfns(replicas, rse_info, scheme=None, logger=logging.log):
+    """
+    Set the PFN of a chunk of replicas with a single lfns2pfns call.
+    Falls back to one call per replica if the bulk conversion fails.
+
+    :param replicas:  List of replicas as returned by list_and_mark_unlocked_replicas.
+    :param rse_info:  The RSE settings.
+    :param scheme:    Force the usage of a particular protocol/scheme.
+    :param logger:    Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    rse_name = rse_info['rse']
+    try:
+        pfns = rsemgr.lfns2pfns(rse_settings=rse_info,
+                                lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']} for replica in replicas],
+                                operation='delete', scheme=scheme, logger=logger)
+    except Exception as error:
+        logger(logging.WARNING, 'Bulk pfn lookup on %s failed, falling back to single lookups: %s', rse_name, str(error))
+        pfns = {}
+        for replica in replicas:
+            key = '%s:%s' % (replica['scope'].external, replica['name'])
+            try:
+                pfns.update(rsemgr.lfns2pfns(rse_settings=rse_info,
+                                             lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}],
+                                             operation='delete', scheme=scheme, logger=logger))
+            except (ReplicaUnAvailable, ReplicaNotFound) as error:
+                pfns[key] = error
+            except Exception:
+                logger(logging.CRITICAL, 'Exception', exc_info=True)
+                pfns[key] = None
+
+    for replica in replicas:
+        pfn = pfns.get('%s:%s' % (replica['scope'].external, replica['name']))
+        if pfn is None or isinstance(pfn, Exception):
+            logger(logging.WARNING, 'Failed get pfn UNAVAILABLE replica %s:%s on %s with error %s', replica['scope'], replica['name'], rse_name, str(pfn))
+            replica['pfn'] = None
+        else:
+            replica['pfn'] = str(pfn)
+
+
+def delete_from_storage_parallel(replicas, rse_info, rse_hostname, scheme, staging_areas, auto_exclude_threshold, logger=logging.log):
+    """
+    Physically delete a chunk of replicas through the deletion pool of the SE.
+    The chunk is split in as many slices as the pool has threads and every slice uses its own protocol instance.
+
+    :param replicas:               List of replicas with their PFN.
+    :param rse_info:               The RSE settings.
+    :param rse_hostname:           The hostname of the SE used for deletion.
+    :param scheme:                 Force the usage of a particular protocol/scheme.
+    :param staging_areas:          List of staging areas, no physical deletion is done on them.
+    :param auto_exclude_threshold: Number of service unavailable exceptions after which the RSE gets temporarily excluded.
+    :param logger:                 Optional decorated logger that can be passed from the calling daemons or servers.
+
+    :returns: The list of deleted files.
+    """
+    if not replicas:
+        return []
+    pool, max_deletion_thread = get_deletion_pool(rse_hostname)
+    nb_slices = min(max_deletion_thread, len(replicas))
+    # The NOACCESS threshold applies to the whole chunk, so the attempts are counted across the slices
+    noaccess_counter = NoAccessCounter()
+
+    futures = []
+    for index in range(nb_slices):
+        prot = rsemgr.create_protocol(rse_info, 'delete', scheme=scheme, logger=logger)
+        futures.append(pool.submit(delete_from_storage, replicas[index::nb_slices], prot, rse_info, staging_areas, auto_exclude_threshold, noaccess_counter=noaccess_counter, logger=logger))
+
+    deleted_files = []
+    for future in futures:
+        try:
+            deleted_files.extend(future.result())
+        except Exception:
+            logger(logging.CRITICAL, 'Exception', exc_info=True)
+    return deleted_files
+
+
+def delete_from_catalog(rse_id, rse_name, deleted_files, logger=logging.log):
+    """
+    Delete the replicas from the catalogue once they are physically deleted.
+
+    :param rse_id:         The RSE id.
+    :param rse_name:       The RSE name.
+    :param deleted_files:  List of files (scope, name) deleted from the storage.
+    :param logger:         Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    try:
+        del_start = time.time()
+        with monitor.record_timer_block('reaper.delete_replicas'):
+            delete_replicas(rse_id=rse_id, files=deleted_files)
+        logger(logging.DEBUG, 'delete_replicas successed on %s : %s replicas in %s seconds', rse_name, len(deleted_files), time.time() - del_start)
+        monitor.record_counter(counters='reaper.deletion.done', delta=len(deleted_files))
+        DELETION_COUNTER.inc(len(deleted_files))
+    except Exception:
+        logger(logging.CRITICAL, 'Exception', exc_info=True)
+
+
 def get_rses_to_hostname_mapping():
     """
     Return a dictionaries mapping the RSEs to the hostname of the SE
@@ -461,6 +611,7 @@ def reaper(rses, include_rses, exclude_rses, vos=None, chunk_size=100, once=Fals
             GRACEFUL_STOP.wait(30)
             continue
         start_time = time.time()
+        catalog_thread = None
         try:
             staging_areas = []
             dict_rses = {}
@@ -575,36 +726,27 @@ def reaper(rses, include_rses, exclude_rses, vos=None, chunk_size=100, once=Fals
                     logger(logging.CRITICAL, 'Exception', exc_info=True)
                 # Physical  deletion will take place there
                 try:
-                    prot = rsemgr.create_protocol(rse_info, 'delete', scheme=scheme, logger=logger)
                     for file_replicas in chunks(replicas, chunk_size):
                         # Refresh heartbeat
                         live(executable, hostname, pid, hb_thread, older_than=600, hash_executable=None, payload=rse_hostname_key, session=None)
                         del_start_time = time.time()
-                        for replica in file_replicas:
-                            try:
-                                replica['pfn'] = str(list(rsemgr.lfns2pfns(rse_settings=rse_info,
-                                                                           lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}],
-                                                                           operation='delete', scheme=scheme).values())[0])
-                            except (ReplicaUnAvailable, ReplicaNotFound) as error:
-                                logger(logging.WARNING, 'Failed get pfn UNAVAILABLE replica %s:%s on %s with error %s', replica['scope'], replica['name'], rse_name, str(error))
-                                replica['pfn'] = None
-
-                            except Exception:
-                                logger(logging.CRITICAL, 'Exception', exc_info=True)
-
-                        deleted_files = delete_from_storage(file_replicas, prot, rse_info, staging_areas, auto_exclude_threshold, logger=logger)
+                        resolve_pfns(file_replicas, rse_info, scheme=scheme, logger=logger)
+                        deleted_files = delete_from_storage_parallel(file_replicas, rse_info, rse_hostname, scheme, staging_areas, auto_exclude_threshold, logger=logger)
                         logger(logging.INFO, '%i files processed in %s seconds', len(file_replicas), time.time() - del_start_time)
 
-                        # Then finally delete the replicas
-                        del_start = time.time()
-                        with monitor.record_timer_block('reaper.delete_replicas'):
-                            delete_replicas(rse_id=rse_id, files=deleted_files)
-                        logger(logging.DEBUG, 'delete_replicas successed on %s : %s replicas in %s seconds', rse_name, len(deleted_files), time.time() - del_start)
-                        monitor.record_counter(counters='reaper.deletion.done', delta=len(deleted_files))
-                        DELETION_COUNTER.inc(len(deleted_files))
+                        # Then finally delete the replicas. The catalogue update runs in the background
+                        # while the storage deletion of the next chunk takes place.
+                        if catalog_thread:
+                            catalog_thread.join()
+                        catalog_thread = threading.Thread(target=delete_from_catalog, args=(rse_id, rse_name, deleted_files), kwargs={'logger': logger})
+                        catalog_thread.start()
                 except Exception:
                     logger(logging.CRITICAL, 'Exception', exc_info=True)
 
+            if catalog_thread:
+                catalog_thread.join()
+                catalog_thread = None
+
             if once:
                 break
 
@@ -618,6 +760,8 @@ def reaper(rses, include_rses, exclude_rses, vos=None, chunk_size=100, once=Fals
         except Exception:
             logger(logging.CRITICAL, 'Exception', exc_info=True)
         finally:
+            if catalog_thread:
+                catalog_thread.join()
             if once:
                 break
 
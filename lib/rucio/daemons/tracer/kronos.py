@@ -45,13 +45,14 @@ import rucio.db.sqla.util
 from rucio.common.config import config_get, config_get_bool, config_get_int
 from rucio.common.exception import ConfigNotFound, RSENotFound, DatabaseException
 from rucio.common.logging import setup_logging, formatted_logger
+from rucio.common.utils import chunks
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.core.config import get
 from rucio.core.did import touch_dids, list_parent_dids
 from rucio.core.heartbeat import live, die, sanity_check
 from rucio.core.lock import touch_dataset_locks
 from rucio.core.monitor import record_counter, record_timer
-from rucio.core.replica import touch_replica, touch_collection_replicas, declare_bad_file_replicas
+from rucio.core.replica import touch_replicas, touch_collection_replicas, declare_bad_file_replicas
 from rucio.core.rse import get_rse_id
 from rucio.db.sqla.constants import DIDType, BadFilesStatus
 
@@ -67,7 +68,7 @@ graceful_stop = Event()
 
 
 class AMQConsumer(object):
-    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue, bad_files_patterns, logger=logging.log):
+    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue, bad_files_patterns, atime_batch_size=100, atime_retries=3, logger=logging.log):
         self.__broker = broker
         self.__conn = conn
         self.__queue = queue
@@ -81,6 +82,8 @@ class AMQConsumer(object):
         self.__excluded_usrdns = excluded_usrdns
         self.__dataset_queue = dataset_queue
         self.__bad_files_patterns = bad_files_patterns
+        self.__atime_batch_size = atime_batch_size
+        self.__atime_retries = atime_retries
         self.__logger = logger
 
     def on_heartbeat_timeout(self):
@@ -286,22 +289,21 @@ class AMQConsumer(object):
 
         try:
             start_time = time()
-            for replica in replicas:
-                # if touch replica hits a locked row put the trace back into queue for later retry
-                if not touch_replica(replica):
-                    resubmit = {'filename': replica['name'],
-                                'scope': replica['scope'].external,
-                                'remoteSite': replica['rse'],
-                                'traceTimeentryUnix': replica['traceTimeentryUnix'],
-                                'eventType': 'get',
-                                'usrdn': 'someuser',
-                                'clientState': 'DONE',
-                                'eventVersion': replica['eventVersion']}
-                    if replica['scope'].vo != 'def':
-                        resubmit['vo'] = replica['scope'].vo
-                    self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
-                    record_counter('daemons.tracer.kronos.sent_resubmitted')
-                    self.__logger(logging.WARNING, 'hit locked row, resubmitted to queue')
+            # if a batch keeps hitting locked rows put its traces back into queue for later retry
+            for replica in touch_in_batches(touch_replicas, replicas, self.__atime_batch_size, self.__atime_retries):
+                resubmit = {'filename': replica['name'],
+                            'scope': replica['scope'].external,
+                            'remoteSite': replica['rse'],
+                            'traceTimeentryUnix': replica['traceTimeentryUnix'],
+                            'eventType': 'get',
+                            'usrdn': 'someuser',
+                            'clientState': 'DONE',
+                            'eventVersion': replica['eventVersion']}
+                if replica['scope'].vo != 'def':
+                    resubmit['vo'] = replica['scope'].vo
+                self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
+                record_counter('daemons.tracer.kronos.sent_resubmitted')
+                self.__logger(logging.WARNING, 'hit locked row, resubmitted to queue')
             record_timer('daemons.tracer.kronos.update_atime', (time() - start_time) * 1000)
         except Exception:
             self.__logger(logging.ERROR, "Cannot update replicas.", exc_info=True)
@@ -310,6 +312,30 @@ class AMQConsumer(object):
         self.__logger(logging.INFO, 'updated %d replica(s)' % len(replicas))
 
 
+def touch_in_batches(touch, updates, batch_size, retries):
+    """
+    Apply atime updates in batches with one of the bulk touch functions.
+    A batch which fails, e.g. because it hit a locked row, is retried.
+
+    :param touch:       The touch function, taking a list of updates and returning False on failure.
+    :param updates:     The list of updates.
+    :param batch_size:  The maximum number of updates per batch.
+    :param retries:     The number of retries of a failed batch.
+    :returns:           The list of the updates of the batches which failed all the retries.
+    """
+    failed = []
+    for batch in chunks(updates, batch_size):
+        for attempt in range(retries + 1):
+            if touch(batch):
+                break
+            record_counter('daemons.tracer.kronos.batch_conflict')
+            if attempt < retries:
+                sleep(0.1 * 2 ** attempt)
+        else:
+            failed.extend(batch)
+    return failed
+
+
 def __get_broker_conns(brokers, port, use_ssl, vhost, reconnect_attempts, ssl_key_file, ssl_cert_file, timeout, logger=logging.log):
     logger(logging.DEBUG, 'resolving broker dns alias: %s' % brokers)
 
@@ -353,6 +379,8 @@ def kronos_file(thread=0, dataset_queue=None, sleep_time=60):
     hb_thread = current_thread()
 
     chunksize = config_get_int('tracer-kronos', 'chunksize')
+    atime_batch_size = config_get_int('tracer-kronos', 'atime_batch_size', False, 100)
+    atime_retries = config_get_int('tracer-kronos', 'atime_retries', False, 3)
     prefetch_size = config_get_int('tracer-kronos', 'prefetch_size')
     subscription_id = config_get('tracer-kronos', 'subscription_id')
     try:
@@ -414,6 +442,8 @@ def kronos_file(thread=0, dataset_queue=None, sleep_time=60):
                                                                      excluded_usrdns=excluded_usrdns,
                                                                      dataset_queue=dataset_queue,
                                                                      bad_files_patterns=bad_files_patterns,
+                                                                     atime_batch_size=atime_batch_size,
+                                                                     atime_retries=atime_retries,
                                                                      logger=logger))
                 if not use_ssl:
                     conn.connect(username, password)
@@ -447,6 +477,8 @@ def kronos_dataset(thread=0, dataset_queue=None, sleep_time=60):
     hb_thread = current_thread()
 
     dataset_wait = config_get_int('tracer-kronos', 'dataset_wait')
+    atime_batch_size = config_get_int('tracer-kronos', 'atime_batch_size', False, 100)
+    atime_retries = config_get_int('tracer-kronos', 'atime_retries', False, 3)
     start = datetime.now()
     sanity_check(executable=executable, hostname=hostname)
     while not graceful_stop.is_set():
@@ -455,7 +487,7 @@ def kronos_dataset(thread=0, dataset_queue=None, sleep_time=60):
         prepend_str = 'kronos-dataset[%i/%i] ' % (heart_beat['assign_thread'], heart_beat['nr_threads'])
         logger = formatted_logger(logging.log, prepend_str + '%s')
         if (datetime.now() - start).seconds > dataset_wait:
-            __update_datasets(dataset_queue, logger=logger)
+            __update_datasets(dataset_queue, batch_size=atime_batch_size, retries=atime_retries, logger=logger)
             start = datetime.now()
 
         tottime = time() - start_time
@@ -467,10 +499,18 @@ def kronos_dataset(thread=0, dataset_queue=None, sleep_time=60):
 
     # once again for the backlog
     logger(logging.INFO, 'cleaning dataset backlog before shutdown...')
-    __update_datasets(dataset_queue)
+    __update_datasets(dataset_queue, batch_size=atime_batch_size, retries=atime_retries)
+
 
+def __update_datasets(dataset_queue, batch_size=100, retries=3, logger=logging.log):
+    """
+    Aggregate the dataset accesses in the queue and flush them in batches.
 
-def __update_datasets(dataset_queue, logger=logging.log):
+    :param dataset_queue:  The queue of dataset accesses.
+    :param batch_size:     The maximum number of rows updated per batch.
+    :param retries:        The number of retries of a failed batch.
+    :param logger:         Optional decorated logger that can be passed from the calling daemons or servers.
+    """
     len_ds = dataset_queue.qsize()
     datasets = {}
     dslocks = {}
@@ -494,44 +534,37 @@ def __update_datasets(dataset_queue, logger=logging.log):
             dslocks[did][rse] = max(dataset['accessed_at'], dslocks[did][rse])
     logger(logging.INFO, 'fetched %d datasets from queue (%ds)' % (len_ds, time() - now))
 
-    total, failed, start = 0, 0, time()
+    start = time()
+    did_updates = []
     for did, accessed_at in datasets.items():
         scope, name = did.split(':')
         scope = InternalScope(scope, fromExternal=False)
-        update_did = {'scope': scope, 'name': name, 'type': DIDType.DATASET, 'accessed_at': accessed_at}
-        # if update fails, put back in queue and retry next time
-        if not touch_dids((update_did,)):
-            update_did['rse_id'] = None
-            dataset_queue.put(update_did)
-            failed += 1
-        total += 1
-    logger(logging.INFO, 'update done for %d datasets, %d failed (%ds)' % (total, failed, time() - start))
-
-    total, failed, start = 0, 0, time()
-    for did, rses in dslocks.items():
-        scope, name = did.split(':')
-        scope = InternalScope(scope, fromExternal=False)
-        for rse, accessed_at in rses.items():
-            update_dslock = {'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at}
-            # if update fails, put back in queue and retry next time
-            if not touch_dataset_locks((update_dslock,)):
-                dataset_queue.put(update_dslock)
-                failed += 1
-            total += 1
-    logger(logging.INFO, 'update done for %d locks, %d failed (%ds)' % (total, failed, time() - start))
-
-    total, failed, start = 0, 0, time()
+        did_updates.append({'scope': scope, 'name': name, 'type': DIDType.DATASET, 'accessed_at': accessed_at})
+    # if update fails, put back in queue and retry next time
+    failed = touch_in_batches(touch_dids, did_updates, batch_size, retries)
+    for update_did in failed:
+        update_did['rse_id'] = None
+        dataset_queue.put(update_did)
+    logger(logging.INFO, 'update done for %d datasets, %d failed (%ds)' % (len(did_updates), len(failed), time() - start))
+
+    lock_updates = []
     for did, rses in dslocks.items():
         scope, name = did.split(':')
         scope = InternalScope(scope, fromExternal=False)
         for rse, accessed_at in rses.items():
-            update_dslock = {'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at}
-            # if update fails, put back in queue and retry next time
-            if not touch_collection_replicas((update_dslock,)):
-                dataset_queue.put(update_dslock)
-                failed += 1
-            total += 1
-    logger(logging.INFO, 'update done for %d collection replicas, %d failed (%ds)' % (total, failed, time() - start))
+            lock_updates.append({'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at})
+
+    start = time()
+    failed = touch_in_batches(touch_dataset_locks, lock_updates, batch_size, retries)
+    for update_dslock in failed:
+        dataset_queue.put(update_dslock)
+    logger(logging.INFO, 'update done for %d locks, %d failed (%ds)' % (len(lock_updates), len(failed), time() - start))
+
+    start = time()
+    failed = touch_in_batches(touch_collection_replicas, lock_updates, batch_size, retries)
+    for update_dslock in failed:
+        dataset_queue.put(update_dslock)
+    logger(logging.INFO, 'update done for %d collection replicas, %d failed (%ds)' % (len(lock_updates), len(failed), time() - start))
 
 
 def stop(signum=None, frame=None):
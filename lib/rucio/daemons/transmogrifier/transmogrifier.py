@@ -50,7 +50,7 @@ from rucio.common.logging import setup_logging, formatted_logger
 from rucio.common.schema import validate_schema
 from rucio.common.utils import chunks
 from rucio.core import monitor, heartbeat
-from rucio.core.did import list_new_dids, set_new_dids, get_metadata
+from rucio.core.did import list_new_dids, set_new_dids, get_metadata_bulk
 from rucio.core.rse import list_rses, rse_exists, get_rse_id, list_rse_attributes
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.core.rse_selector import RSESelector
@@ -96,69 +96,174 @@ def is_matching_subscription(subscription, did, metadata):
     param metadata: The metadata dictionnary for the DID
     return: True/False
     """
-    if metadata['hidden']:
-        return False
     try:
-        filter_string = loads(subscription['filter'])
-    except ValueError as error:
+        compiled = CompiledSubscription(subscription)
+    except (ValueError, re.error) as error:
         logging.error('%s : Subscription will be skipped' % error)
         return False
-    # Loop over the keys of filter_string for subscription
-    for key in filter_string:
-        values = filter_string[key]
-        if key == 'pattern':
-            if not re.match(values, did['name']):
-                return False
-        elif key == 'excluded_pattern':
-            if re.match(values, did['name']):
-                return False
-        elif key == 'split_rule':
-            pass
-        elif key == 'scope':
-            match_scope = False
-            for scope in values:
-                if re.match(scope, did['scope'].internal):
-                    match_scope = True
-                    break
-            if not match_scope:
-                return False
-        elif key == 'account':
-            match_account = False
-            if not isinstance(values, list):
-                values = [values]
-            for account in values:
-                if account == metadata['account'].internal:
-                    match_account = True
-                    break
-            if not match_account:
-                return False
-        elif key == 'did_type':
-            match_did_type = False
-            if not isinstance(values, list):
-                values = [values]
-            for did_type in values:
-                if did_type == metadata['did_type'].name:
-                    match_did_type = True
-                    break
-            if not match_did_type:
+    return compiled.matches(did, metadata)
+
+
+class CompiledSubscription(object):
+    """
+    A subscription with its filter and replication rules parsed and its
+    regular expressions compiled once.
+    """
+
+    def __init__(self, subscription):
+        """
+        :param subscription: The subscription dictionnary.
+        :raises ValueError: If the filter or the replication rules are not valid JSON.
+        :raises re.error: If a pattern of the filter is not a valid regular expression.
+        """
+        self.subscription = subscription
+        self.filter = loads(subscription['filter'])
+        self.rules = loads(subscription['replication_rules'])
+        self.split_rule = self.filter.get('split_rule', False)
+        self.pattern, self.excluded_pattern = None, None
+        self.scopes, self.accounts, self.did_types = None, None, None
+        # Scope values made only of scope characters match as plain prefixes and can be indexed
+        self.scope_prefixes = None
+        self.metadata = []
+        for key, values in self.filter.items():
+            if key == 'pattern':
+                self.pattern = re.compile(values)
+            elif key == 'excluded_pattern':
+                self.excluded_pattern = re.compile(values)
+            elif key == 'split_rule':
+                pass
+            elif key == 'scope':
+                self.scopes = [re.compile(scope) for scope in values]
+                if all(re.match(r'^[\w\-]*$', scope) for scope in values):
+                    self.scope_prefixes = list(values)
+            elif key == 'account':
+                self.accounts = set(values if isinstance(values, list) else [values])
+            elif key == 'did_type':
+                self.did_types = set(values if isinstance(values, list) else [values])
+            else:
+                if not isinstance(values, list):
+                    values = [values, ]
+                self.metadata.append((str(key), [re.compile(str(value)) for value in values]))
+
+    def matches(self, did, metadata):
+        """
+        Method to identify if a DID matches the subscription.
+
+        :param did: The DID dictionnary.
+        :param metadata: The metadata dictionnary for the DID.
+        :returns: True/False
+        """
+        if metadata['hidden']:
+            return False
+        if self.pattern is not None and not self.pattern.match(did['name']):
+            return False
+        if self.excluded_pattern is not None and self.excluded_pattern.match(did['name']):
+            return False
+        if self.scopes is not None and not any(scope.match(did['scope'].internal) for scope in self.scopes):
+            return False
+        if self.accounts is not None and metadata['account'].internal not in self.accounts:
+            return False
+        if self.did_types is not None and metadata['did_type'].name not in self.did_types:
+            return False
+        for key, values in self.metadata:
+            if key not in metadata:
                 return False
-        else:
-            if not isinstance(values, list):
-                values = [values, ]
-            has_metadata = False
-            for meta in metadata:
-                if str(meta) == str(key):
-                    has_metadata = True
-                    match_meta = False
-                    for value in values:
-                        if re.match(str(value), str(metadata[meta])):
-                            match_meta = True
-                            break
-                    if not match_meta:
-                        return False
-            if not has_metadata:
+            if not any(value.match(str(metadata[key])) for value in values):
                 return False
-    return True
+        return True
+
+
+class SubscriptionIndex(object):
+    """
+    Index of the active subscriptions, kept across the cycles of a worker.
+
+    The subscriptions are only compiled again when their filter or replication
+    rules change, and a DID is only tested against the subscriptions whose
+    scope, account and did_type constraints can match it.
+    """
+
+    def __init__(self, logger=logging.log):
+        """
+        :param logger: Optional decorated logger that can be passed from the calling daemons or servers.
+        """
+        self.logger = logger
+        self.subscriptions = []
+        self.__ids = []
+        self.__compiled = {}
+        self.__did_types = {}
+        self.__accounts = {}
+        self.__scope_prefixes = {}
+        self.__any_did_type = set()
+        self.__any_account = set()
+        self.__any_scope = set()
+
+    def refresh(self, subscriptions):
+        """
+        Update the index with the current list of subscriptions.
+
+        :param subscriptions: The list of active subscriptions ordered by priority.
+        :returns: True if the index had to be rebuilt.
+        """
+        ids = [sub['id'] for sub in subscriptions]
+        changed = ids != self.__ids
+        compiled_subscriptions = {}
+        for sub in subscriptions:
+            definition = (sub['filter'], sub['replication_rules'])
+            entry = self.__compiled.get(sub['id'])
+            if entry is None or entry[0] != definition:
+                changed = True
+                try:
+                    entry = (definition, CompiledSubscription(sub))
+                except (ValueError, re.error) as error:
+                    self.logger(logging.ERROR, '%s : Subscription %s will be skipped' % (error, sub['name']))
+                    entry = (definition, None)
+            elif entry[1] is not None:
+                entry[1].subscription = sub
+            compiled_subscriptions[sub['id']] = entry
+        self.__compiled, self.__ids = compiled_subscriptions, ids
+        if not changed:
+            return False
+
+        self.subscriptions = [self.__compiled[sub['id']][1] for sub in subscriptions if self.__compiled[sub['id']][1] is not None]
+        self.__did_types, self.__accounts, self.__scope_prefixes = {}, {}, {}
+        self.__any_did_type, self.__any_account, self.__any_scope = set(), set(), set()
+        for position, compiled in enumerate(self.subscriptions):
+            if compiled.did_types is None:
+                self.__any_did_type.add(position)
+            else:
+                for did_type in compiled.did_types:
+                    self.__did_types.setdefault(did_type, set()).add(position)
+            if compiled.accounts is None:
+                self.__any_account.add(position)
+            else:
+                for account in compiled.accounts:
+                    self.__accounts.setdefault(account, set()).add(position)
+            if compiled.scope_prefixes is None:
+                self.__any_scope.add(position)
+            else:
+                for prefix in compiled.scope_prefixes:
+                    self.__scope_prefixes.setdefault(prefix, set()).add(position)
+        return True
+
+    def candidates(self, did, metadata):
+        """
+        The subscriptions which can match a DID, ordered by priority.
+        Each of them still has to be checked with CompiledSubscription.matches.
+
+        :param did: The DID dictionnary.
+        :param metadata: The metadata dictionnary for the DID.
+        :returns: List of CompiledSubscription.
+        """
+        positions = self.__any_did_type | self.__did_types.get(metadata['did_type'].name, set())
+        if positions:
+            positions &= self.__any_account | self.__accounts.get(metadata['account'].internal, set())
+        if positions:
+            scope = did['scope'].internal
+            scope_positions = set(self.__any_scope)
+            for length in range(len(scope) + 1):
+                scope_positions.update(self.__scope_prefixes.get(scope[:length], ()))
+            positions &= scope_positions
+        return [self.subscriptions[position] for position in sorted(positions)]
 
 
 def select_algorithm(algorithm, rule_ids, params):
@@ -214,6 +319,7 @@ def transmogrifier(bulk=5, once=False, sleep_time=60):
     pid = os.getpid()
     hb_thread = threading.current_thread()
     heartbeat.sanity_check(executable=executable, hostname=hostname)
+    index = SubscriptionIndex()
 
     while not graceful_stop.is_set():
 
@@ -248,6 +354,9 @@ def transmogrifier(bulk=5, once=False, sleep_time=60):
             #  Order the subscriptions according to their priority
             for priority in priorities:
                 subscriptions.extend(sub_dict[priority])
+            index.logger = logger
+            if index.refresh(subscriptions):
+                logger(logging.DEBUG, 'Subscription index rebuilt with %i subscriptions' % len(index.subscriptions))
         except SubscriptionNotFound as error:
             logger(logging.WARNING, 'No subscriptions defined: %s' % (str(error)))
             time.sleep(10)
@@ -261,6 +370,11 @@ def transmogrifier(bulk=5, once=False, sleep_time=60):
             blocklisted_rse_id = [rse['id'] for rse in list_rses({'availability_write': False})]
             logger(logging.DEBUG, 'In transmogrifier worker')
             identifiers = []
+            #  Get the metadata of all the new datasets and containers in bulk
+            dids_metadata = {}
+            collections = [{'scope': did['scope'], 'name': did['name']} for did in dids if did['did_type'] in (str(DIDType.DATASET), str(DIDType.CONTAINER))]
+            for metadata in get_metadata_bulk(collections):
+                dids_metadata[(metadata['scope'], metadata['name'])] = metadata
             #  Loop over all the new dids
             for did in dids:
                 did_success = True
@@ -268,17 +382,19 @@ def transmogrifier(bulk=5, once=False, sleep_time=60):
                     did_tag = '%s:%s' % (did['scope'].internal, did['name'])
                     results[did_tag] = []
                     try:
-                        metadata = get_metadata(did['scope'], did['name'])
-                        # Loop over all the subscriptions
-                        for subscription in subscriptions:
+                        metadata = dids_metadata.get((did['scope'], did['name']))
+                        if metadata is None:
+                            raise DataIdentifierNotFound("Data identifier '%s:%s' not found" % (did['scope'], did['name']))
+                        # Loop over the subscriptions which can match the DID
+                        for compiled in index.candidates(did, metadata):
                             #  Check if the DID match the subscription
-                            if is_matching_subscription(subscription, did, metadata) is True:
-                                filter_string = loads(subscription['filter'])
-                                split_rule = filter_string.get('split_rule', False)
+                            if compiled.matches(did, metadata):
+                                subscription = compiled.subscription
+                                split_rule = compiled.split_rule
                                 stime = time.time()
                                 results[did_tag].append(subscription['id'])
                                 logger(logging.INFO, '%s:%s matches subscription %s' % (did['scope'], did['name'], subscription['name']))
-                                rules = loads(subscription['replication_rules'])
+                                rules = compiled.rules
                                 created_rules = {}
                                 cnt = 0
                                 for rule_dict in rules:
@@ -24,6 +24,7 @@
 
 from __future__ import print_function
 
+import logging
 import os
 import sys
 
@@ -36,7 +37,7 @@ from os.path import basename
 from sqlalchemy import create_engine, event
 from sqlalchemy.exc import DatabaseError, DisconnectionError, OperationalError, TimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 
 from rucio.common.config import config_get
 from rucio.common.exception import RucioException, DatabaseException
@@ -270,6 +271,52 @@ def retry_if_db_connection_error(exception):
     return False
 
 
+AFTER_COMMIT_KEY = 'rucio_after_commit'
+
+
+def run_after_commit(session, callback, on_rollback=None):
+    """
+    Call a function once the current transaction of the session is committed.
+    The function is never called if the transaction is rolled back, and is called only once
+    even if it is registered several times in the same transaction.
+
+    :param session: The database session to use.
+    :param callback: Function without arguments.
+    :param on_rollback: Optional function without arguments, called instead of callback if the
+                        transaction ends without a commit.
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    callbacks = session.info.setdefault(AFTER_COMMIT_KEY, [])
+    if (callback, on_rollback) not in callbacks:
+        callbacks.append((callback, on_rollback))
+
+
+def _run_callbacks(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            # The transaction is already over, the caller must not see it as failed
+            logging.exception('Callback %s failed at the end of the transaction', callback)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit_listener(session):
+    if session.in_nested_transaction():
+        # released savepoint, the outer transaction can still be rolled back
+        return
+    _run_callbacks([callback for callback, _ in session.info.pop(AFTER_COMMIT_KEY, [])])
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end_listener(session, transaction):
+    # The callbacks still registered when the outermost transaction ends were not committed,
+    # a rolled back savepoint keeps them and they run if the outer transaction is committed
+    if transaction.parent is None:
+        _run_callbacks([on_rollback for _, on_rollback in session.info.pop(AFTER_COMMIT_KEY, []) if on_rollback is not None])
+
+
 def read_session(function):
     '''
     decorator that set the session variable to use inside a function.
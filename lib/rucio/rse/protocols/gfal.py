@@ -292,6 +292,35 @@ class Default(protocol.RSEProtocol):
         except Exception as error:
             raise exception.ServiceUnavailable(error)
 
+    def bulk_delete(self, paths):
+        """
+        Deletes files from the connected RSE with one bulk gfal2 unlink call.
+
+        :param paths: List of physical file names
+
+        :returns: Dictionary {path: True if the file was deleted, else SourceNotFound or ServiceUnavailable}
+        """
+        self.logger(logging.DEBUG, 'deleting {} files'.format(len(paths)))
+
+        paths = list(set(paths))
+        if not paths:
+            return {}
+        ctx = self.__ctx
+        try:
+            errors = ctx.unlink([str(path) for path in paths])
+        except Exception as error:
+            return dict((path, exception.ServiceUnavailable(error)) for path in paths)
+
+        ret = {}
+        for path, error in zip(paths, errors):
+            if not error:
+                ret[path] = True
+            elif error.code == errno.ENOENT or 'No such file' in str(error):
+                ret[path] = exception.SourceNotFound(str(error))
+            else:
+                ret[path] = exception.ServiceUnavailable(str(error))
+        return ret
+
     def rename(self, path, new_path):
         """
         Allows to rename a file stored inside the connected RSE.
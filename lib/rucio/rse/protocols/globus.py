@@ -221,8 +221,9 @@ class GlobusRSEProtocol(RSEProtocol):
 
             :param pfns: list of pfns to delete
 
-            :raises TransferAPIError: if unexpected response from the service.
+            :returns: Dictionary {pfn: True if the deletion task was accepted, else ServiceUnavailable}
         """
+        bulk_delete_response = None
         if self.globus_endpoint_id:
             try:
                 bulk_delete_response = send_bulk_delete_task(endpoint_id=self.globus_endpoint_id[0], pfns=pfns)
@@ -231,9 +232,11 @@ class GlobusRSEProtocol(RSEProtocol):
         else:
             self.logger(logging.WARNING, 'No rse attribute found for globus endpoint id.')
 
-        if bulk_delete_response['code'] != 'Accepted':
+        if not bulk_delete_response or bulk_delete_response['code'] != 'Accepted':
             self.logger(logging.WARNING, 'delete_task not accepted by Globus')
             self.logger(logging.WARNING, 'delete_response: %s' % bulk_delete_response)
+            return dict((pfn, exception.ServiceUnavailable('delete_task not accepted by Globus')) for pfn in pfns)
+        return dict((pfn, True) for pfn in pfns)
 
     def connect(self):
         """
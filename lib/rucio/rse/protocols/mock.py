@@ -107,9 +107,9 @@ class Default(protocol.RSEProtocol):
 
             :param pfns: list of pfns to delete
 
-            :raises TransferAPIError: if unexpected response from the service.
+            :returns: Dictionary {pfn: True}
         """
-        pass
+        return dict((pfn, True) for pfn in pfns)
 
     def rename(self, pfn, new_pfn):
         """ Allows to rename a file stored inside the connected RSE.
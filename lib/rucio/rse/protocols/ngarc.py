@@ -54,6 +54,9 @@ class DataPoint:
 class Default(protocol.RSEProtocol):
     """ Implementing access to RSEs using ARC client."""
 
+    # the ARC data points cannot be shared among threads
+    bulk_threads = 1
+
     def __init__(self, protocol_attr, rse_settings, logger=None):
         """
         Set up UserConfig object.
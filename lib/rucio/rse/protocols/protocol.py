@@ -39,6 +39,7 @@ along with some of the default methods for LFN2PFN translations.
 
 import hashlib
 import logging
+from multiprocessing.pool import ThreadPool
 
 try:
     # PY2
@@ -266,6 +267,10 @@ RSEDeterministicTranslation._module_init_()  # pylint: disable=protected-access
 class RSEProtocol(object):
     """ This class is virtual and acts as a base to inherit new protocols from. It further provides some common functionality which applies for the amjority of the protocols."""
 
+    # Number of threads of the default implementation of the bulk operations.
+    # Protocols whose connection cannot be shared among threads set it to 1.
+    bulk_threads = 4
+
     def __init__(self, protocol_attr, rse_settings, logger=logging.log):
         """ Initializes the object with information about the referred RSE.
 
@@ -441,6 +446,72 @@ class RSEProtocol(object):
         """
         raise NotImplementedError
 
+    def _bulk_call(self, function, paths):
+        """
+            Calls a single file operation for every path, with a pool of bulk_threads threads.
+
+            :param function: The single file operation, e.g. self.exists
+            :param paths: List of physical file names
+
+            :returns: Dictionary {path: result of the operation or the exception it raised}
+        """
+        def call(path):
+            try:
+                return path, function(path)
+            except Exception as error:
+                return path, error
+
+        paths = list(set(paths))
+        if self.bulk_threads <= 1 or len(paths) <= 1:
+            return dict(call(path) for path in paths)
+        pool = ThreadPool(min(self.bulk_threads, len(paths)))
+        try:
+            return dict(pool.map(call, paths))
+        finally:
+            pool.close()
+            pool.join()
+
+    def bulk_exists(self, paths):
+        """
+            Checks if the requested files are known by the referred RSE.
+            Protocols able to check several files at once override it.
+
+            :param paths: List of physical file names
+
+            :returns: Dictionary {path: True if the file exists, False if it doesn't}
+
+            :raises ServiceUnavailable: if some generic error occured in the library.
+        """
+        ret = self._bulk_call(self.exists, paths)
+        for exists in ret.values():
+            if isinstance(exists, Exception):
+                raise exists
+        return ret
+
+    def bulk_delete(self, paths):
+        """
+            Deletes files from the connected RSE.
+            Protocols able to delete several files at once override it.
+
+            :param paths: List of physical file names
+
+            :returns: Dictionary {path: True if the file was deleted, else the exception of the deletion,
+                      e.g. SourceNotFound if the file was not found on the referred storage}
+        """
+        ret = self._bulk_call(self.delete, paths)
+        return dict((path, result if isinstance(result, Exception) else True) for path, result in ret.items())
+
+    def bulk_stat(self, paths):
+        """
+            Returns the stats of files.
+            Protocols able to stat several files at once override it.
+
+            :param paths: List of physical file names
+
+            :returns: Dictionary {path: the stats as returned by stat, else the exception of the call}
+        """
+        return self._bulk_call(self.stat, paths)
+
     def connect(self):
         """
             Establishes the actual connection to the referred RSE.
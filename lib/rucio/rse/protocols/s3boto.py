@@ -29,6 +29,7 @@ from boto.s3.key import Key
 
 from rucio.common import exception
 from rucio.common.config import get_rse_credentials
+from rucio.common.utils import chunks
 
 from rucio.rse.protocols import protocol
 
@@ -38,6 +39,9 @@ logging.getLogger('boto').setLevel(logging.INFO)
 class Default(protocol.RSEProtocol):
     """ Implementing access to RSEs using the S3 protocol."""
 
+    # boto connections are not thread safe
+    bulk_threads = 1
+
     def __init__(self, protocol_attr, rse_settings, logger=None):
         super(Default, self).__init__(protocol_attr, rse_settings, logger=logger)
         if 'determinism_type' in self.attributes:
@@ -279,6 +283,46 @@ class Default(protocol.RSEProtocol):
         except Exception as e:
             raise exception.ServiceUnavailable(e)
 
+    def bulk_delete(self, pfns):
+        """
+            Deletes files from the connected RSE with S3 multi-object delete requests,
+            one request per bucket and 1000 keys. S3 reports missing keys as deleted.
+
+            :param pfns: List of physical file names
+
+            :returns: Dictionary {pfn: True if the file was deleted, else SourceNotFound or ServiceUnavailable}
+        """
+        ret = {}
+        keys = {}
+        for pfn in set(pfns):
+            try:
+                bucket_name, key_name = self.get_bucket_key_name(pfn)
+                keys.setdefault(bucket_name, {})[key_name] = pfn
+            except Exception as e:
+                ret[pfn] = exception.ServiceUnavailable(e)
+
+        for bucket_name, bucket_keys in keys.items():
+            key_names = list(bucket_keys)
+            for chunk in chunks(key_names, 1000):
+                try:
+                    bucket = self.__conn.get_bucket(bucket_name, validate=False)
+                    result = bucket.delete_keys(chunk, quiet=False)
+                except Exception as e:
+                    for key_name in chunk:
+                        ret[bucket_keys[key_name]] = exception.ServiceUnavailable(e)
+                    continue
+                for deleted in result.deleted:
+                    ret[bucket_keys[deleted.key]] = True
+                for error in result.errors:
+                    if error.code == 'NoSuchKey':
+                        ret[bucket_keys[error.key]] = exception.SourceNotFound(error.message)
+                    else:
+                        ret[bucket_keys[error.key]] = exception.ServiceUnavailable('%s: %s' % (error.code, error.message))
+        for pfn in pfns:
+            if pfn not in ret:
+                ret[pfn] = exception.ServiceUnavailable('No answer from S3 for %s' % pfn)
+        return ret
+
     def rename(self, pfn, new_pfn):
         """ Allows to rename a file stored inside the connected RSE.
 
@@ -35,6 +35,9 @@ from rucio.rse.protocols import protocol
 class Default(protocol.RSEProtocol):
     """ Implementing access to RSEs using the SFTP protocol."""
 
+    # a pysftp connection cannot be shared among threads
+    bulk_threads = 1
+
     def exists(self, pfn):
         """
             Checks if the requested file is known by the referred RSE.
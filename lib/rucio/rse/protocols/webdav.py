@@ -159,6 +159,10 @@ class Default(protocol.RSEProtocol):
 
     """ Implementing access to RSEs using the webDAV protocol."""
 
+    # The bulk operations run concurrent requests over the keep-alive connections of the session,
+    # requests does not support HTTP pipelining. Matches the default size of the connection pool.
+    bulk_threads = 10
+
     def connect(self, credentials={}):
         """ Establishes the actual connection to the referred RSE.
 
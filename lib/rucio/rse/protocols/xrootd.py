@@ -28,10 +28,47 @@
 
 import os
 import logging
+import threading
 
 from rucio.common import exception
 from rucio.rse.protocols import protocol
-from rucio.common.utils import execute, PREFERRED_CHECKSUM
+from rucio.common.utils import chunks, execute, PREFERRED_CHECKSUM
+
+try:
+    from XRootD import client as xrootd_client  # pylint: disable=import-error
+    from XRootD.client.flags import MkDirFlags, QueryCode  # pylint: disable=import-error
+    from XRootD.client.utils import AsyncResponseHandler  # pylint: disable=import-error
+except ImportError:
+    xrootd_client = None
+
+# One XRootD session per endpoint, shared by all the protocol objects of the process
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+# Maximum number of requests in flight on a session during a bulk operation
+BULK_WINDOW = 100
+# kXR_NotFound
+XRD_NOT_FOUND = 3011
+# Security protocol of the sessions, the same as the xrdfs and xrdcp commands
+DEFAULT_SECURITY_PROTOCOL = 'gsi'
+
+
+def get_session(hostname, port, security_protocol=DEFAULT_SECURITY_PROTOCOL):
+    """
+    Returns the XRootD session of an endpoint, created on first use.
+
+    :param hostname: The hostname of the endpoint.
+    :param port: The port of the endpoint.
+    :param security_protocol: The XRootD security protocol of the session, e.g. gsi.
+
+    :returns: XRootD.client.FileSystem, None if the XRootD python bindings are not installed.
+    """
+    if xrootd_client is None:
+        return None
+    with SESSIONS_LOCK:
+        if (hostname, port, security_protocol) not in SESSIONS:
+            # the protocol is set in the URL of the session, not with XrdSecPROTOCOL in the environment of the process
+            SESSIONS[(hostname, port, security_protocol)] = xrootd_client.FileSystem('root://%s:%s/?xrd.wantprot=%s' % (hostname, port, security_protocol))
+        return SESSIONS[(hostname, port, security_protocol)]
 
 
 class Default(protocol.RSEProtocol):
@@ -48,6 +85,34 @@ class Default(protocol.RSEProtocol):
         self.hostname = self.attributes['hostname']
         self.port = str(self.attributes['port'])
         self.logger = logger
+        extended_attributes = self.attributes.get('extended_attributes') or {}
+        # without the XRootD python bindings, every operation runs the xrdfs command
+        self.session = get_session(self.hostname, self.port, extended_attributes.get('security_protocol', DEFAULT_SECURITY_PROTOCOL))
+
+    def _bulk_request(self, request, paths):
+        """
+        Submits one asynchronous request per path through the session of the endpoint,
+        with at most BULK_WINDOW requests in flight.
+
+        :param request: Method of the session taking a path and a callback, e.g. stat or rm.
+        :param paths: List of paths.
+
+        :returns: Dictionary {path: (XRootDStatus, response)}
+        """
+        results = {}
+        for chunk in chunks(paths, BULK_WINDOW):
+            handlers = []
+            for path in chunk:
+                handler = AsyncResponseHandler()
+                status = request(path, callback=handler)
+                if status.ok:
+                    handlers.append((path, handler))
+                else:
+                    results[path] = (status, None)
+            for path, handler in handlers:
+                status, response, _ = handler.wait()
+                results[path] = (status, response)
+        return results
 
     def path2pfn(self, path):
         """
@@ -77,6 +142,8 @@ class Default(protocol.RSEProtocol):
             :raise  ServiceUnavailable
         """
         self.logger(logging.DEBUG, 'xrootd.exists: pfn: {}'.format(pfn))
+        if self.session is not None:
+            return self.bulk_exists([pfn])[pfn]
         try:
             path = self.pfn2path(pfn)
             cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s stat %s' % (self.hostname, self.port, path)
@@ -89,6 +156,26 @@ class Default(protocol.RSEProtocol):
 
         return True
 
+    def bulk_exists(self, pfns):
+        """ Checks if the requested files are known by the referred RSE, with one stat
+            request per file through the session of the endpoint.
+
+            :param pfns: List of physical file names
+
+            :returns: Dictionary {pfn: True if the file exists, False if it doesn't}
+
+            :raise  ServiceUnavailable
+        """
+        if self.session is None:
+            return super(Default, self).bulk_exists(pfns)
+        self.logger(logging.DEBUG, 'xrootd.bulk_exists: {} pfns'.format(len(pfns)))
+        try:
+            paths = dict((pfn, self.pfn2path(pfn)) for pfn in pfns)
+            results = self._bulk_request(self.session.stat, list(set(paths.values())))
+        except Exception as e:
+            raise exception.ServiceUnavailable(e)
+        return dict((pfn, results[path][0].ok) for pfn, path in paths.items())
+
     def stat(self, path):
         """
         Returns the stats of a file.
@@ -106,24 +193,86 @@ class Default(protocol.RSEProtocol):
             path = self.pfn2path(path)
 
         try:
-            # xrdfs stat for getting filesize
-            cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s stat %s' % (self.hostname, self.port, path)
-            self.logger(logging.INFO, 'xrootd.stat: filesize cmd: {}'.format(cmd))
-            status_stat, out, err = execute(cmd)
-            if status_stat == 0:
-                ret['filesize'] = out.split('\n')[2].split()[-1]
-
-            # xrdfs query checksum for getting checksum
-            cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s query checksum %s' % (self.hostname, self.port, path)
-            self.logger(logging.INFO, 'xrootd.stat: checksum cmd: {}'.format(cmd))
-            status_query, out, err = execute(cmd)
-            if status_query == 0:
-                chsum, value = out.strip('\n').split()
-                ret[chsum] = value
+            if self.session is not None:
+                # stat for getting filesize and query checksum through the session
+                status, info = self.session.stat(path)
+                if status.ok:
+                    ret['filesize'] = str(info.size)
+                status, response = self.session.query(QueryCode.CHECKSUM, path)
+                if status.ok:
+                    chsum, value = response.decode('utf-8').strip('\x00\n').split()
+                    ret[chsum] = value
+            else:
+                # xrdfs stat for getting filesize
+                cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s stat %s' % (self.hostname, self.port, path)
+                self.logger(logging.INFO, 'xrootd.stat: filesize cmd: {}'.format(cmd))
+                status_stat, out, err = execute(cmd)
+                if status_stat == 0:
+                    ret['filesize'] = out.split('\n')[2].split()[-1]
+
+                # xrdfs query checksum for getting checksum
+                cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s query checksum %s' % (self.hostname, self.port, path)
+                self.logger(logging.INFO, 'xrootd.stat: checksum cmd: {}'.format(cmd))
+                status_query, out, err = execute(cmd)
+                if status_query == 0:
+                    chsum, value = out.strip('\n').split()
+                    ret[chsum] = value
 
         except Exception as e:
             raise exception.ServiceUnavailable(e)
 
+        return self.__check_stat(ret, chsum)
+
+    def bulk_stat(self, pfns):
+        """
+        Returns the stats of files, with one stat and one checksum query request per file
+        through the session of the endpoint.
+
+        :param pfns: List of physical file names
+
+        :returns: Dictionary {pfn: the stats as returned by stat, else the exception of the call}
+        """
+        if self.session is None:
+            return super(Default, self).bulk_stat(pfns)
+        self.logger(logging.DEBUG, 'xrootd.bulk_stat: {} pfns'.format(len(pfns)))
+        try:
+            paths = dict((pfn, self.pfn2path(pfn) if pfn.startswith('root:') else pfn) for pfn in pfns)
+            unique_paths = list(set(paths.values()))
+            stats = self._bulk_request(self.session.stat, unique_paths)
+            checksums = self._bulk_request(lambda path, callback: self.session.query(QueryCode.CHECKSUM, path, callback=callback), unique_paths)
+        except Exception as e:
+            raise exception.ServiceUnavailable(e)
+
+        ret = {}
+        for pfn, path in paths.items():
+            stat, chsum = {}, None
+            try:
+                status, info = stats[path]
+                if status.ok:
+                    stat['filesize'] = str(info.size)
+                status, response = checksums[path]
+                if status.ok:
+                    chsum, value = response.decode('utf-8').strip('\x00\n').split()
+                    stat[chsum] = value
+                ret[pfn] = self.__check_stat(stat, chsum)
+            except exception.RucioException as e:
+                ret[pfn] = e
+            except Exception as e:
+                ret[pfn] = exception.ServiceUnavailable(e)
+        return ret
+
+    def __check_stat(self, ret, chsum):
+        """
+        Validates the stats of a file.
+
+        :param ret: Dictionary with the filesize and the checksum of the file.
+        :param chsum: Name of the checksum returned by the storage.
+
+        :returns: ret
+
+        :raises ServiceUnavailable: if the filesize could not be retrieved.
+        :raises RSEChecksumUnavailable: if the checksum is not the preferred one.
+        """
         if 'filesize' not in ret:
             raise exception.ServiceUnavailable('Filesize could not be retrieved.')
         if PREFERRED_CHECKSUM != chsum or not chsum:
@@ -191,6 +340,11 @@ class Default(protocol.RSEProtocol):
         try:
             # The query stats call is not implemented on some xroot doors.
             # Workaround: fail, if server does not reply within 10 seconds for static config query
+            if self.session is not None:
+                status, _ = self.session.query(QueryCode.CONFIG, '%s:%s' % (self.hostname, self.port), timeout=10)
+                if not status.ok:
+                    raise exception.RSEAccessDenied(status.message)
+                return
             cmd = 'XrdSecPROTOCOL=gsi XRD_REQUESTTIMEOUT=10 xrdfs %s:%s query config %s:%s' % (self.hostname, self.port, self.hostname, self.port)
             self.logger(logging.INFO, 'xrootd.connect: cmd: {}'.format(cmd))
             status, out, err = execute(cmd)
@@ -263,6 +417,11 @@ class Default(protocol.RSEProtocol):
             :raises SourceNotFound: if the source file was not found on the referred storage.
         """
         self.logger(logging.DEBUG, 'xrootd.delete: pfn: {}'.format(pfn))
+        if self.session is not None:
+            result = self.bulk_delete([pfn])[pfn]
+            if result is not True:
+                raise result
+            return
         if not self.exists(pfn):
             raise exception.SourceNotFound()
         try:
@@ -275,6 +434,35 @@ class Default(protocol.RSEProtocol):
         except Exception as e:
             raise exception.ServiceUnavailable(e)
 
+    def bulk_delete(self, pfns):
+        """
+            Deletes files from the connected RSE, with one rm request per file
+            through the session of the endpoint.
+
+            :param pfns: List of physical file names
+
+            :returns: Dictionary {pfn: True if the file was deleted, else SourceNotFound or ServiceUnavailable}
+        """
+        self.logger(logging.DEBUG, 'xrootd.bulk_delete: {} pfns'.format(len(pfns)))
+        if self.session is None:
+            return super(Default, self).bulk_delete(pfns)
+
+        ret = {}
+        try:
+            paths = dict((pfn, self.pfn2path(pfn)) for pfn in pfns)
+            results = self._bulk_request(self.session.rm, list(set(paths.values())))
+        except Exception as e:
+            raise exception.ServiceUnavailable(e)
+        for pfn, path in paths.items():
+            status, _ = results[path]
+            if status.ok:
+                ret[pfn] = True
+            elif status.errno == XRD_NOT_FOUND:
+                ret[pfn] = exception.SourceNotFound(status.message)
+            else:
+                ret[pfn] = exception.ServiceUnavailable(status.message)
+        return ret
+
     def rename(self, pfn, new_pfn):
         """ Allows to rename a file stored inside the connected RSE.
 
@@ -291,6 +479,12 @@ class Default(protocol.RSEProtocol):
             path = self.pfn2path(pfn)
             new_path = self.pfn2path(new_pfn)
             new_dir = new_path[:new_path.rindex('/') + 1]
+            if self.session is not None:
+                self.session.mkdir(new_dir, MkDirFlags.MAKEPATH)
+                status, _ = self.session.mv(path, new_path)
+                if not status.ok:
+                    raise exception.RucioException(status.message)
+                return
             cmd = 'XrdSecPROTOCOL=gsi xrdfs %s:%s mkdir -p %s' % (self.hostname, self.port, new_dir)
             self.logger(logging.INFO, 'xrootd.stat: mkdir cmd: {}'.format(cmd))
             status, out, err = execute(cmd)
@@ -286,11 +286,10 @@ def exists(rse_settings, files, domain='wan', auth_token=None, logger=logging.lo
         pass
 
     files = [files] if not type(files) is list else files
+    pfns = []
     for f in files:
-        exists = None
         if isinstance(f, STRING_TYPES):
-            exists = protocol.exists(f)
-            ret[f] = exists
+            pfns.append((f, f))
         elif 'scope' in f:  # a LFN is provided
             pfn = list(protocol.lfns2pfns(f).values())[0]
             if isinstance(pfn, exception.RucioException):
@@ -299,12 +298,15 @@ def exists(rse_settings, files, domain='wan', auth_token=None, logger=logging.lo
             # deal with URL signing if required
             if rse_settings['sign_url'] is not None and pfn[:5] == 'https':
                 pfn = __get_signed_url(rse_settings['rse'], rse_settings['sign_url'], 'read', pfn)    # NOQA pylint: disable=undefined-variable
-            exists = protocol.exists(pfn)
-            ret[f['scope'] + ':' + f['name']] = exists
+            pfns.append((f['scope'] + ':' + f['name'], pfn))
         else:
-            exists = protocol.exists(f['name'])
-            ret[f['name']] = exists
-        if not exists:
+            pfns.append((f['name'], f['name']))
+
+    # protocols supporting it check all the files at once
+    exists = protocol.bulk_exists([pfn for _, pfn in pfns])
+    for key, pfn in pfns:
+        ret[key] = exists[pfn]
+        if not exists[pfn]:
             gs = False
 
     protocol.close()
@@ -538,13 +540,12 @@ def delete(rse_settings, lfns, domain='wan', auth_token=None, logger=logging.log
     protocol.connect()
 
     lfns = [lfns] if not type(lfns) is list else lfns
-    for lfn in lfns:
-        pfn = list(protocol.lfns2pfns(lfn).values())[0]
-        try:
-            protocol.delete(pfn)
-            ret['%s:%s' % (lfn['scope'], lfn['name'])] = True
-        except Exception as e:
-            ret['%s:%s' % (lfn['scope'], lfn['name'])] = e
+    pfns = [('%s:%s' % (lfn['scope'], lfn['name']), list(protocol.lfns2pfns(lfn).values())[0]) for lfn in lfns]
+    # protocols supporting it delete all the files at once
+    deleted = protocol.bulk_delete([pfn for _, pfn in pfns])
+    for key, pfn in pfns:
+        ret[key] = deleted[pfn]
+        if deleted[pfn] is not True:
             gs = False
 
     protocol.close()
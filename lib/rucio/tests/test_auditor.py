@@ -29,6 +29,8 @@ import multiprocessing
 import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from datetime import datetime
 from datetime import timedelta
@@ -36,6 +38,8 @@ from datetime import timedelta
 import pytest
 
 from rucio.daemons import auditor
+from rucio.daemons.auditor import dumpcache
+from rucio.daemons.auditor import scheduler
 
 if sys.version_info >= (3, 3):
     from unittest import mock
@@ -149,3 +153,107 @@ def test_auditor_check_survives_failures_and_queues_failed_rses(mock_auditor):
     assert retry.get() == ('RSE_WITH_EXCEPTION', 0)
     assert retry.get() == ('RSE_WITH_ERROR', 0)
     assert retry.empty()
+
+
+def test_auditor_dumpcache_evict():
+    tmp_dir = tempfile.mkdtemp()
+    dumps = []
+    for i, name in enumerate(['ddmendpoint_RSE_01-01-2015', 'replicafromhdfs_RSE_29-12-2014', 'replicafromhdfs_RSE_04-01-2015']):
+        path = os.path.join(tmp_dir, '{0}_{1}'.format(name, '0' * 40))
+        with open(path, 'w') as f:
+            f.write('x' * 10)
+        os.utime(path, (1000 + i, 1000 + i))
+        dumps.append(path)
+    other = os.path.join(tmp_dir, 'ddmendpoint_RSE_01-01-2015_{0}_run_xyz'.format('0' * 40))
+    with open(other, 'w') as f:
+        f.write('x' * 100)
+
+    assert dumpcache.cache_size(tmp_dir) == 30
+    dumpcache.touch(dumps[0])
+    assert [path for _, _, path in dumpcache.list_dumps(tmp_dir)] == [dumps[1], dumps[2], dumps[0]]
+
+    assert dumpcache.evict(tmp_dir, 20) == [dumps[1]]
+    assert dumpcache.evict(tmp_dir, 0, keep_rses=['RSE']) == []
+    assert dumpcache.evict(tmp_dir, 0, keep=[dumps[0]]) == [dumps[2]]
+    assert sorted(os.listdir(tmp_dir)) == sorted(os.path.basename(path) for path in (dumps[0], other))
+
+
+def mocked_download_dumps(rse, delta, configuration, cache_dir, results_dir):
+    if rse == 'RSE_ALREADY_CHECKED':
+        return None
+    elif rse == 'RSE_WITHOUT_DUMP':
+        raise Exception('no dump')
+    paths = []
+    for name in ('ddmendpoint_{0}_01-01-2015', 'replicafromhdfs_{0}_29-12-2014', 'replicafromhdfs_{0}_04-01-2015'):
+        path = os.path.join(cache_dir, '{0}_{1}'.format(name.format(rse), '0' * 40))
+        with open(path, 'w') as f:
+            f.write(rse)
+        paths.append(path)
+    return paths[0], date, paths[1], paths[2]
+
+
+def mocked_compare_dumps(rse, dumps, cache_dir, results_dir, sort_processes=3):
+    if rse == 'RSE_WITH_ERROR':
+        return 1 / 0
+    return os.path.join(results_dir, '{0}_20150101'.format(rse))
+
+
+@mock.patch('rucio.daemons.auditor.process_output')
+@mock.patch('rucio.daemons.auditor.compare_dumps', side_effect=mocked_compare_dumps)
+@mock.patch('rucio.daemons.auditor.download_dumps', side_effect=mocked_download_dumps)
+def test_auditor_sweep(mock_download, mock_compare, mock_process):
+    tmp_dir = tempfile.mkdtemp()
+    rses = ['RSE_SHOULD_WORK', 'RSE_ALREADY_CHECKED', 'RSE_WITHOUT_DUMP', 'RSE_WITH_ERROR', 'RSE_SHOULD_WORK_TOO']
+
+    status = scheduler.sweep(rses, timedelta(days=3), None, cache_dir=tmp_dir, results_dir=tmp_dir,
+                             nprocs=2, download_threads=2, poll_interval=0.01)
+
+    assert status == {'RSE_SHOULD_WORK': scheduler.CHECKED,
+                      'RSE_ALREADY_CHECKED': scheduler.SKIPPED,
+                      'RSE_WITHOUT_DUMP': scheduler.FAILED,
+                      'RSE_WITH_ERROR': scheduler.FAILED,
+                      'RSE_SHOULD_WORK_TOO': scheduler.CHECKED}
+    # Without cache size, the dumps are removed once checked
+    assert dumpcache.list_dumps(tmp_dir) == []
+
+
+def test_auditor_sweep_overlapping_downloads():
+    tmp_dir = tempfile.mkdtemp()
+    downloaded = threading.Event()
+    evictions = []
+    real_evict = dumpcache.evict
+
+    def evict(*args, **kwargs):
+        evictions.append(real_evict(*args, **kwargs))
+        return evictions[-1]
+
+    def download_dumps(rse, delta, configuration, cache_dir, results_dir):
+        if rse == 'RSE_WITHOUT_DUMP':
+            # fails while the dumps of the other RSE are downloaded but not collected
+            downloaded.wait(10)
+            raise Exception('no dump')
+        dumps = mocked_download_dumps(rse, delta, configuration, cache_dir, results_dir)
+        downloaded.set()
+        for _ in range(1000):
+            # the initial eviction and the one after the failed download
+            if len(evictions) >= 2:
+                break
+            time.sleep(0.01)
+        return dumps
+
+    def compare_dumps(rse, dumps, cache_dir, results_dir, sort_processes=3):
+        for path in (dumps[0], dumps[2], dumps[3]):
+            if not os.path.exists(path):
+                raise IOError('{0} was evicted'.format(path))
+        return os.path.join(results_dir, '{0}_20150101'.format(rse))
+
+    with mock.patch('rucio.daemons.auditor.process_output'), \
+            mock.patch('rucio.daemons.auditor.compare_dumps', side_effect=compare_dumps), \
+            mock.patch('rucio.daemons.auditor.download_dumps', side_effect=download_dumps), \
+            mock.patch('rucio.daemons.auditor.scheduler.dumpcache.evict', side_effect=evict):
+        status = scheduler.sweep(['RSE_SHOULD_WORK', 'RSE_WITHOUT_DUMP'], timedelta(days=3), None, cache_dir=tmp_dir, results_dir=tmp_dir,
+                                 nprocs=1, download_threads=2, poll_interval=0.01)
+
+    assert status == {'RSE_SHOULD_WORK': scheduler.CHECKED, 'RSE_WITHOUT_DUMP': scheduler.FAILED}
+    assert all(removed == [] for removed in evictions[:2])
+    assert dumpcache.list_dumps(tmp_dir) == []
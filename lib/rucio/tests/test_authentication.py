@@ -28,9 +28,11 @@
 # - Simon Fayer <simon.fayer05@imperial.ac.uk>, 2021
 
 import base64
+import datetime
 import unittest
 
 import pytest
+from dogpile.cache import make_region
 from requests import session
 
 from rucio.api.authentication import get_auth_token_user_pass, get_auth_token_ssh, get_ssh_challenge_token, \
@@ -39,6 +41,7 @@ from rucio.common.config import config_get_bool
 from rucio.common.exception import Duplicate, AccessDenied
 from rucio.common.types import InternalAccount
 from rucio.common.utils import ssh_sign
+from rucio.core.authentication import TokenCache
 from rucio.core.identity import add_account_identity, del_account_identity
 from rucio.db.sqla.constants import IdentityType
 from rucio.tests.common import headers, hdrdict, loginhdr, vohdr
@@ -194,6 +197,54 @@ class TestAuthCoreApi(unittest.TestCase):
         del_account_identity('ddmlab', IdentityType.SAML, root)
 
 
+def test_token_cache():
+    """AUTHENTICATION (CORE): Two-tier token cache with negative caching."""
+    region = make_region().configure('dogpile.cache.memory')
+    cache = TokenCache(region=region, max_size=1, negative_lifetime=10)
+    value = {'account': 'root', 'lifetime': datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+
+    assert cache.get('token1') == (False, None)
+    cache.set('token1', value)
+    assert cache.get('token1') == (True, value)
+    assert cache.counters['local_hits'] == 1
+
+    # token1 is evicted from the process tier, but still in the shared tier
+    cache.set_invalid('token2')
+    assert cache.get('token2') == (True, None)
+    assert cache.get('token1') == (True, value)
+    assert cache.counters['shared_hits'] == 1
+    assert cache.counters['negative_hits'] == 1
+
+    cache.delete('token1')
+    assert cache.get('token1') == (False, None)
+
+    # expired tokens are not cached
+    cache.set('token3', {'account': 'root', 'lifetime': datetime.datetime.utcnow() - datetime.timedelta(seconds=1)})
+    assert cache.get('token3') == (False, None)
+    assert cache.counters['misses'] == 3
+
+
+def test_token_cache_shared_tier_failure():
+    """AUTHENTICATION (CORE): Token cache falls back to the process tier when the shared tier fails."""
+    class FailingRegion(object):
+        def get(self, *args):
+            raise IOError('memcached is down')
+
+        set = delete = get
+
+    cache = TokenCache(region=FailingRegion(), max_size=10)
+    value = {'account': 'root', 'lifetime': datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+
+    assert cache.get('token1') == (False, None)
+    cache.set('token1', value)
+    assert cache.get('token1') == (True, value)
+    cache.delete('token1')
+    assert cache.get('token1') == (False, None)
+    assert cache.counters['local_hits'] == 1
+    assert cache.counters['misses'] == 2
+    assert cache.counters['shared_errors'] == 4
+
+
 def test_userpass_fail(vo, rest_client):
     """AUTHENTICATION (REST): Username and password (wrong credentials)."""
     response = rest_client.get('/auth/userpass', headers=headers(loginhdr('wrong', 'wrong', 'wrong'), vohdr(vo)))
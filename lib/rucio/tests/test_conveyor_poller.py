@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import patch
+
+from rucio.common.exception import DatabaseException, TransferToolWrongAnswer
+from rucio.common.utils import generate_uuid
+from rucio.core import config as core_config
+from rucio.daemons.conveyor import poller
+
+
+@patch.dict('rucio.daemons.conveyor.poller.BULK_SIZES', clear=True)
+def test_poll_host_transfers_bulk_size():
+    """ POLLER: the number of transfers per query shrinks on slow or failed queries and grows on fast ones """
+    external_host = 'https://fts:8446'
+    sizes = []
+    durations = iter([20, None, None, 1, 1, 7])
+
+    def poll_transfers(external_host, xfers, request_ids, timeout, logger):
+        sizes.append(len(xfers))
+        return next(durations)
+
+    with patch('rucio.daemons.conveyor.poller.poll_transfers', side_effect=poll_transfers):
+        poller.poll_host_transfers(external_host, list(range(100)), set(), fts_bulk=40, target_latency=10)
+
+    # halved when slow or failed, down to MIN_BULK_SIZE, then grown by 10% when fast
+    assert sizes == [40, 20, 10, 10, 11, 9]
+    assert poller.BULK_SIZES == {external_host: 12}
+
+
+def test_bulk_query_transfers_bisection():
+    """ POLLER: a query with a wrong answer is split in halves until the failing transfers are isolated """
+    queries = []
+
+    def bulk_query_transfers(external_host, xfers, transfertool, timeout):
+        queries.append(list(xfers))
+        if 'bad' in xfers:
+            raise TransferToolWrongAnswer()
+        return dict((xfer, {}) for xfer in xfers)
+
+    with patch('rucio.core.transfer.bulk_query_transfers', side_effect=bulk_query_transfers):
+        resps = poller.__bulk_query_transfers('https://fts:8446', ['a', 'b', 'bad', 'c', 'd'], timeout=None)
+
+    assert resps == {'a': {}, 'b': {}, 'c': {}, 'd': {}}
+    assert queries == [['a', 'b', 'bad', 'c', 'd'], ['a', 'b'], ['bad', 'c', 'd'], ['bad'], ['c', 'd']]
+
+
+@patch('rucio.daemons.conveyor.poller.TRANSFER_TOOL', 'fts3')
+def test_poll_transfers_rollback():
+    """ POLLER: the states of a query are updated in one transaction, rolled back on error and then updated one by one """
+    option = generate_uuid()
+    resps = {'transfer_1': {'request_1': {'request_id': 'request_1'}},
+             'transfer_2': {'request_2': {'request_id': 'request_2'}}}
+    updates = []
+
+    def update_request_state(response, session=None, logger=None, raise_on_error=False):
+        updates.append((response['request_id'], session is not None))
+        if session is not None:
+            if response['request_id'] == 'request_2':
+                raise DatabaseException('failure')
+            # written in the transaction of the query, must be rolled back
+            core_config.set('poller_test', option, 'updated', session=session)
+        return True
+
+    with patch('rucio.core.transfer.bulk_query_transfers', return_value=resps), \
+            patch('rucio.core.transfer.touch_transfer'), \
+            patch('rucio.core.request.update_request_state', side_effect=update_request_state):
+        duration = poller.poll_transfers('https://fts:8446', ['transfer_1', 'transfer_2'], request_ids={'request_1', 'request_2'})
+
+    assert duration is not None
+    assert updates == [('request_1', True), ('request_2', True), ('request_1', False), ('request_2', False)]
+    assert not core_config.has_option('poller_test', option, use_cache=False)
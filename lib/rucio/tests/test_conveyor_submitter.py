@@ -18,6 +18,10 @@
 import pytest
 
 import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from random import randint
 from unittest.mock import patch
@@ -28,6 +32,7 @@ from rucio.core import rse as rse_core
 from rucio.core import replica as replica_core
 from rucio.core import rule as rule_core
 from rucio.core import config as core_config
+from rucio.daemons.conveyor import submitter as submitter_module
 from rucio.daemons.conveyor.submitter import submitter
 from rucio.db.sqla.models import Request, Source
 from rucio.db.sqla.constants import RequestState
@@ -168,3 +173,95 @@ def test_multihop_sources_created(rse_factory, did_factory, root_account, core_c
 
     replica = replica_core.get_replica(jump_rse3_id, **did)
     assert replica['tombstone'] is None
+
+
+def __mock_submission(jobs_by_host, max_submissions_per_host, not_prepared=(), on_prepared=None):
+    """
+    Run the concurrent submission of the jobs with a mocked preparation and submission.
+    Returns the ordered events and the maximum number of concurrent submissions per host.
+    """
+    lock = threading.Lock()
+    events = []
+    in_flight = dict((host, 0) for host in jobs_by_host)
+    max_in_flight = dict((host, 0) for host in jobs_by_host)
+
+    def prepare_transfer(external_host, job, logger=None):
+        with lock:
+            events.append(('prepare', job['id']))
+        return job['id'] not in not_prepared
+
+    def submit_prepared_transfer(external_host, job, **kwargs):
+        with lock:
+            events.append(('submit', job['id']))
+            in_flight[external_host] += 1
+            max_in_flight[external_host] = max(max_in_flight[external_host], in_flight[external_host])
+        time.sleep(0.05)
+        with lock:
+            in_flight[external_host] -= 1
+
+    def prefetch():
+        with lock:
+            events.append(('prefetch', None))
+
+    with patch('rucio.daemons.conveyor.submitter.prepare_transfer', side_effect=prepare_transfer), \
+            patch('rucio.daemons.conveyor.submitter.submit_prepared_transfer', side_effect=submit_prepared_transfer):
+        executor = ThreadPoolExecutor(max_workers=8)
+        try:
+            submitter_module.__submit_jobs(jobs_by_host, executor, max_submissions_per_host, timeout=None, transfertool='mock',
+                                           on_prepared=prefetch if on_prepared else None)
+        finally:
+            executor.shutdown()
+    return events, max_in_flight
+
+
+def test_submit_jobs_concurrency_per_host():
+    """ SUBMITTER: the jobs of each FTS server are submitted with at most max_submissions_per_host in flight """
+    grouped_jobs = {'https://fts1:8446': [{'id': 'fts1_%d' % i} for i in range(6)],
+                    'https://fts2:8446': [{'id': 'fts2_%d' % i} for i in range(6)],
+                    'https://fts3:8446': []}
+    jobs_by_host = submitter_module.__group_jobs_by_host(grouped_jobs, user_transfer=False)
+    assert sorted(jobs_by_host) == ['https://fts1:8446', 'https://fts2:8446']
+
+    events, max_in_flight = __mock_submission(jobs_by_host, max_submissions_per_host=2)
+
+    assert sorted(job_id for event, job_id in events if event == 'submit') == sorted(job['id'] for jobs in grouped_jobs.values() for job in jobs)
+    assert max_in_flight == {'https://fts1:8446': 2, 'https://fts2:8446': 2}
+
+
+def test_submit_jobs_prepare_before_submit_and_prefetch():
+    """ SUBMITTER: each job is prepared before its submission, the prefetch starts once all the jobs are prepared """
+    jobs_by_host = {'https://fts1:8446': (deque({'id': 'job_%d' % i} for i in range(5)), False)}
+
+    events, _ = __mock_submission(jobs_by_host, max_submissions_per_host=2, not_prepared=['job_3'], on_prepared=True)
+
+    for i in range(5):
+        if i == 3:
+            # a job which failed its preparation is not submitted
+            assert ('submit', 'job_3') not in events
+        else:
+            assert events.index(('prepare', 'job_%d' % i)) < events.index(('submit', 'job_%d' % i))
+    assert events.count(('prefetch', None)) == 1
+    prefetch_index = events.index(('prefetch', None))
+    assert all(index < prefetch_index for index, (event, _) in enumerate(events) if event == 'prepare')
+
+    # without any job, the prefetch starts right away
+    events, _ = __mock_submission({}, max_submissions_per_host=2, on_prepared=True)
+    assert events == [('prefetch', None)]
+
+
+def test_prefetched_transfers():
+    """ SUBMITTER: the prefetched transfers are used by the next cycle unless the partition of the worker changed """
+    prefetched = {}
+    heart_beat = {'assign_thread': 0, 'nr_threads': 2}
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        assert submitter_module.__get_prefetched_transfers(prefetched, 'User Subscriptions', heart_beat) is None
+
+        submitter_module.__prefetch_transfers(prefetched, 'User Subscriptions', lambda: {'request_id': {}}, heart_beat, executor)
+        assert submitter_module.__get_prefetched_transfers(prefetched, 'User Subscriptions', heart_beat) == {'request_id': {}}
+        assert prefetched == {}
+
+        submitter_module.__prefetch_transfers(prefetched, 'User Subscriptions', lambda: {'request_id': {}}, heart_beat, executor)
+        assert submitter_module.__get_prefetched_transfers(prefetched, 'User Subscriptions', {'assign_thread': 1, 'nr_threads': 2}) is None
+    finally:
+        executor.shutdown()
@@ -95,6 +95,31 @@ class TestCoreRSECounter(unittest.TestCase):
             del cnt['updated_at']
             assert cnt == {'files': count, 'bytes': sum}
 
+    def test_bulk_update_counter(self):
+        """ RSE COUNTER (CORE): Fold the counter updates in bulk """
+        rse_id = get_rse_id(rse='MOCK', **self.vo)
+        rse_update(once=True)
+        rse_counter.del_counter(rse_id=rse_id)
+        rse_counter.add_counter(rse_id=rse_id)
+
+        for i in range(10):
+            rse_counter.increase(rse_id=rse_id, files=1, bytes=2.147e+9)
+        for i in range(4):
+            rse_counter.decrease(rse_id=rse_id, files=1, bytes=2.147e+9)
+        rse_update(once=True, bulk=True)
+        cnt = rse_counter.get_counter(rse_id=rse_id)
+        del cnt['updated_at']
+        assert cnt == {'files': 6, 'bytes': 6 * 2.147e+9}
+        assert rse_counter.update_rse_counters_bulk(total_workers=1, worker_number=0) == 0
+
+        # The counter is created if it does not exist
+        rse_counter.del_counter(rse_id=rse_id)
+        rse_counter.increase(rse_id=rse_id, files=2, bytes=10)
+        assert rse_counter.update_rse_counters_bulk(total_workers=1, worker_number=0) >= 1
+        cnt = rse_counter.get_counter(rse_id=rse_id)
+        del cnt['updated_at']
+        assert cnt == {'files': 2, 'bytes': 10}
+
     def test_fill_counter_history(self):
         """RSE COUNTER (CORE): Fill the usage history with the current value."""
         db_session = session.get_session()
@@ -163,6 +188,32 @@ class TestCoreAccountCounter(unittest.TestCase):
             del cnt['updated_at']
             assert cnt == {'files': count, 'bytes': sum}
 
+    def test_bulk_update_counter(self):
+        """ACCOUNT COUNTER (CORE): Fold the counter updates in bulk """
+        account_update(once=True)
+        rse_id = get_rse_id(rse='MOCK', **self.vo)
+        account = InternalAccount('jdoe', **self.vo)
+        account_counter.del_counter(rse_id=rse_id, account=account)
+        account_counter.add_counter(rse_id=rse_id, account=account)
+
+        for i in range(10):
+            account_counter.increase(rse_id=rse_id, account=account, files=1, bytes=2.147e+9)
+        for i in range(4):
+            account_counter.decrease(rse_id=rse_id, account=account, files=1, bytes=2.147e+9)
+        account_update(once=True, bulk=True)
+        cnt = get_usage(rse_id=rse_id, account=account)
+        del cnt['updated_at']
+        assert cnt == {'files': 6, 'bytes': 6 * 2.147e+9}
+        assert account_counter.update_account_counters_bulk(total_workers=1, worker_number=0) == 0
+
+        # The counter is created if it does not exist
+        account_counter.del_counter(rse_id=rse_id, account=account)
+        account_counter.increase(rse_id=rse_id, account=account, files=2, bytes=10)
+        assert account_counter.update_account_counters_bulk(total_workers=1, worker_number=0) >= 1
+        cnt = get_usage(rse_id=rse_id, account=account)
+        del cnt['updated_at']
+        assert cnt == {'files': 2, 'bytes': 10}
+
     def test_fill_counter_history(self):
         """ACCOUNT COUNTER (CORE): Fill the usage history with the current value."""
         db_session = session.get_session()
@@ -9,7 +9,7 @@
   Authors:
   - Vincent Garonne, <vincent.garonne@cern.ch>, 2013-2017
 '''
-from rucio.db.sqla.session import get_session
+from rucio.db.sqla.session import get_session, run_after_commit
 
 
 def test_db_connection():
@@ -20,3 +20,31 @@ def test_db_connection():
     else:
         session.execute('select 1')
     session.close()
+
+
+def test_db_run_after_commit():
+    """ DB (CORE): Test callbacks run only after a commit, or on rollback """
+    calls = []
+
+    def callback():
+        calls.append(1)
+
+    session = get_session()
+    query = 'select 1 from dual' if session.bind.dialect.name == 'oracle' else 'select 1'
+    try:
+        session.execute(query)
+        run_after_commit(session, callback)
+        run_after_commit(session, callback)
+        assert calls == []
+        session.commit()
+        assert calls == [1]
+
+        session.execute(query)
+        run_after_commit(session, callback, on_rollback=lambda: calls.append(0))
+        session.rollback()
+        assert calls == [1, 0]
+        session.execute(query)
+        session.commit()
+        assert calls == [1, 0]
+    finally:
+        session.remove()
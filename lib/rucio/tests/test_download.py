@@ -33,7 +33,7 @@ from zipfile import ZipFile
 
 import pytest
 
-from rucio.client.downloadclient import DownloadClient
+from rucio.client.downloadclient import DownloadClient, DownloadScheduler
 from rucio.common.exception import InputValidationError, NoFilesDownloaded
 from rucio.common.utils import generate_uuid
 from rucio.core import did as did_core
@@ -496,3 +496,26 @@ def test_transfer_timeout(rse_factory, did_factory, download_client):
             mocks_get.clear()
             download_client.download_dids([{'did': did_str, 'base_dir': tmp_dir, 'transfer_speed_timeout': 0}])
             mocks_get[0].assert_called_with(ANY, ANY, transfer_timeout=60)
+
+
+def test_download_scheduler_transfers_per_host():
+    """ DOWNLOAD (CLIENT): The scheduler limits the concurrent transfers per storage host """
+    items = [{'name': 'slow_%d' % i, 'sources': [{'pfn': 'root://slow.example.com:1094//file_%d' % i, 'rse': 'SLOW'}]} for i in range(10)]
+    items += [{'name': 'fast_%d' % i, 'sources': [{'pfn': 'https://fast.example.com//file_%d' % i, 'rse': 'FAST'}]} for i in range(10)]
+    items.append({'name': 'no_source', 'sources': []})
+    scheduler = DownloadScheduler(items, max_transfers_per_host=2)
+
+    # the transfer slots are spread over the hosts, the item without source does not need any
+    running = [scheduler.next_item() for _ in range(5)]
+    assert sorted(item['name'].split('_')[0] for item in running) == ['fast', 'fast', 'no', 'slow', 'slow']
+    assert scheduler.transfers == {'slow.example.com': 2, 'fast.example.com': 2}
+
+    # the failover of a slow item to the fast host frees a slot on the slow host
+    slow_item = [item for item in running if item['name'].startswith('slow_')][0]
+    fast_item = [item for item in running if item['name'].startswith('fast_')][0]
+    scheduler.finish(fast_item)
+    scheduler.use_host(slow_item, 'fast.example.com')
+    assert scheduler.next_item()['name'].startswith('slow_')
+
+    scheduler.add_download(10)
+    assert scheduler.downloaded_files == 1 and scheduler.downloaded_bytes == 10
@@ -31,9 +31,13 @@ from six import PY3
 from rucio.common.dumper.consistency import Consistency
 from rucio.common.dumper.consistency import _try_to_advance
 from rucio.common.dumper.consistency import compare3
+from rucio.common.dumper.consistency import external_sort_files
 from rucio.common.dumper.consistency import gnu_sort
 from rucio.common.dumper.consistency import min3
 from rucio.common.dumper.consistency import parse_and_filter_file
+from rucio.common.dumper.consistency import parse_replica_dump_line
+from rucio.common.dumper.consistency import replica_record_path
+from rucio.common.dumper.consistency import sort_in_runs
 from rucio.tests.common import make_temp_file
 
 if sys.version_info >= (3, 3):
@@ -227,6 +231,35 @@ class TestConsistency(unittest.TestCase):
 
         assert len(consistency) == 0
 
+    @mock.patch('rucio.common.dumper.agis_endpoints_data')
+    def test_consistency_manual_external_sort(self, mock_get):
+        ''' DUMPER '''
+        line = 'MOCK_SCRATCHDISK\tuser.someuser\tuser.someuser.{0}\t19028d77\t189468\t2015-09-20 21:22:04\tuser/someuser/aa/bb/user.someuser.{0}\t2015-09-20 21:22:17\t{1}\n'
+        names = ['file{0:02d}'.format(i) for i in range(20)]
+        rucio_dump_1 = ''.join(line.format(name, 'A') for name in reversed(names))
+        rucio_dump_2 = ''.join(line.format(name, 'A') for name in names[5:] + names[:5])
+        storage_dump = ''.join('/pnfs/example.com/atlas/atlasdatadisk/rucio/user/someuser/aa/bb/user.someuser.{0}\n'.format(name) for name in names[3:] + ['dark'])
+
+        rrdf1 = make_temp_file(self.tmp_dir, rucio_dump_1)
+        rrdf2 = make_temp_file(self.tmp_dir, rucio_dump_2)
+        sdf = make_temp_file(self.tmp_dir, storage_dump)
+
+        mock_get.return_value = self.fake_agis_data
+
+        consistency = Consistency.dump(
+            'consistency-manual',
+            'MOCK_SCRATCHDISK',
+            sdf,
+            prev_date_fname=rrdf1,
+            next_date_fname=rrdf2,
+            cache_dir=self.tmp_dir,
+            sort_buffer_lines=3,
+        )
+        consistency = sorted((entry.apparent_status, entry.path) for entry in consistency)
+
+        assert consistency == [('DARK', 'user/someuser/aa/bb/user.someuser.dark')] + [('LOST', 'user/someuser/aa/bb/user.someuser.' + name) for name in names[:3]]
+        assert sorted(os.listdir(self.tmp_dir)) == sorted(os.path.basename(path) for path in (rrdf1, rrdf2, sdf))
+
     @mock.patch('requests.Session.head', side_effect=mocked_requests)
     @mock.patch('requests.Session.get', side_effect=mocked_requests)
     @mock.patch('rucio.common.dumper.agis_endpoints_data')
@@ -394,6 +427,43 @@ class TestConsistency(unittest.TestCase):
         os.unlink(path)
         os.unlink(parsed_file)
 
+    def test_sort_in_runs_spills_sorted_runs(self):
+        ''' DUMPER '''
+        path = make_temp_file(self.tmp_dir, 'd,A\nc,U\nb,A\na,A\ne,U\n')
+
+        runs = sort_in_runs(path, parser=str.strip, filter_=lambda s: not s.startswith('e'), key=replica_record_path, buffer_lines=2, cache_dir=self.tmp_dir)
+
+        data = []
+        for run in runs:
+            with open(run) as f:
+                data.append(f.read())
+        assert data == ['c,U\nd,A\n', 'a,A\nb,A\n']
+
+    def test_external_sort_files(self):
+        ''' DUMPER '''
+        storage_dump = ['path{0}\n'.format(i) for i in (3, 10, 1, 22, 2, 0, 15)]
+        rucio_dump = 'MOCK_SCRATCHDISK\tuser.someuser\tuser.someuser.filename\t19028d77\t189468\t2015-09-20 21:22:04\t{0}\t2015-09-20 21:22:17\t{1}\n'
+        rucio_dump = [rucio_dump.format(path, status) for path, status in (('path-b', 'A'), ('path', 'U'), ('path+a', 'A'))]
+        sdf = make_temp_file(self.tmp_dir, ''.join(storage_dump))
+        rrdf = make_temp_file(self.tmp_dir, ''.join(rucio_dump))
+
+        for processes in (1, 2):
+            sdump, rrdump = external_sort_files([
+                {'filepath': sdf, 'parser': str.strip},
+                {'filepath': rrdf, 'parser': parse_replica_dump_line, 'key': replica_record_path},
+            ], processes=processes, buffer_lines=2, cache_dir=self.tmp_dir)
+
+            assert list(sdump) == sorted(path.strip() for path in storage_dump)
+            # Sorted by path only, as compared by compare3
+            assert list(rrdump) == ['path,U', 'path+a,A', 'path-b,A']
+            assert sorted(os.listdir(self.tmp_dir)) == sorted(os.path.basename(path) for path in (sdf, rrdf))
+
+        # The sorted runs of a stream never consumed are removed on close
+        sdump, = external_sort_files([{'filepath': sdf}], buffer_lines=2, cache_dir=self.tmp_dir)
+        assert len(os.listdir(self.tmp_dir)) == 6
+        sdump.close()
+        assert sorted(os.listdir(self.tmp_dir)) == sorted(os.path.basename(path) for path in (sdf, rrdf))
+
     def test_gnu_sort_and_the_current_version_of_python_sort_strings_using_byte_value(self):
         ''' DUMPER '''
         unsorted_data_list = ['z\n', 'a\n', '\xc3\xb1\n']
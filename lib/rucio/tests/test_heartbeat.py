@@ -23,11 +23,14 @@
 
 import random
 import threading
+import time
 import unittest
 from datetime import datetime, timedelta
+from unittest import mock
 
 import pytest
 
+from rucio.core import heartbeat
 from rucio.core.heartbeat import live, die, cardiac_arrest, list_payload_counts, list_heartbeats, sanity_check
 from rucio.db.sqla.models import Heartbeats
 from rucio.db.sqla.session import transactional_session
@@ -115,6 +118,79 @@ class TestHeartbeat(unittest.TestCase):
 
         assert list_payload_counts('test5') == {}
 
+    def test_heartbeat_cache(self):
+        """ HEARTBEAT (CORE): Cached payloads and heartbeats removed behind the cache """
+        pid = self.__pid()
+        threads = [self.__thread() for _ in range(2)]
+
+        live('test6', 'host0', pid, threads[0], payload='payload1')
+        live('test6', 'host1', pid, threads[1], payload='payload1')
+        assert list_payload_counts('test6') == {'payload1': 2}
+        live('test6', 'host0', pid, threads[0], payload='payload2')
+        assert list_payload_counts('test6') == {'payload1': 1, 'payload2': 1}
+
+        @transactional_session
+        def __remove(thread, session=None):
+            session.query(Heartbeats).filter_by(hostname='host1', pid=pid, thread_id=thread.ident).delete()
+
+        __remove(threads[1])
+        assert live('test6', 'host1', pid, threads[1], payload='payload2') == {'assign_thread': 1, 'nr_threads': 2}
+        assert len(list_heartbeats()) == 2
+        assert list_payload_counts('test6') == {'payload2': 2}
+
+    def test_heartbeat_rollback(self):
+        """ HEARTBEAT (CORE): Heartbeats of a rolled back transaction are written again """
+        pid = self.__pid()
+        thread = self.__thread()
+
+        @transactional_session
+        def __live_and_fail(session=None):
+            live('test7', 'host0', pid, thread, session=session)
+            raise RuntimeError('rollback')
+
+        with pytest.raises(RuntimeError):
+            __live_and_fail()
+        assert len(list_heartbeats()) == 0
+        assert live('test7', 'host0', pid, thread) == {'assign_thread': 0, 'nr_threads': 1}
+        assert len(list_heartbeats()) == 1
+
+    def test_heartbeat_first_beat_flushed_by_other_thread(self):
+        """ HEARTBEAT (CORE): The first beat of a thread written by the flush of another thread is waited for """
+        pid = self.__pid()
+        threads = [self.__thread() for _ in range(2)]
+        registered, flushed = threading.Event(), threading.Event()
+        flush_beats = heartbeat._flush_beats
+        result = {}
+
+        def __flush_beats(hash_executable, hostname, pid, session):
+            if threading.current_thread().name == 'second' and not registered.is_set():
+                # the beat of the second thread is registered, let the first thread flush it
+                registered.set()
+                flushed.wait()
+            flush_beats(hash_executable, hostname, pid, session=session)
+
+        def __second_thread():
+            result['second'] = live('test8', 'host0', pid, threads[1])
+
+        @transactional_session
+        def __first_thread(session=None):
+            registered.wait()
+            # the payload changed, the beats of both threads are flushed
+            live('test8', 'host0', pid, threads[0], payload='payload', session=session)
+            flushed.set()
+            # the second thread must wait for this transaction
+            time.sleep(1)
+
+        assert live('test8', 'host0', pid, threads[0]) == {'assign_thread': 0, 'nr_threads': 1}
+        with mock.patch('rucio.core.heartbeat._flush_beats', side_effect=__flush_beats):
+            second = threading.Thread(target=__second_thread, name='second')
+            second.start()
+            __first_thread()
+            second.join()
+
+        assert result['second']['nr_threads'] == 2
+        assert len(list_heartbeats()) == 2
+
     def test_old_heartbeat_cleanup(self):
         pids = [self.__pid() for _ in range(2)]
         thread = self.__thread()
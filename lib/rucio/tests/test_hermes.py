@@ -39,3 +39,31 @@ class TestHermes(object):
                                   Thank you, and have a very safe, and productive day.'''})
 
         hermes.run(once=True, send_email=False)
+
+
+class TestHermes2DeliveryLane(object):
+    ''' Test the delivery lanes of hermes2. '''
+
+    def test_delivery_lane_backoff(self):
+        ''' HERMES2 (DAEMON): A failing lane backs off without affecting the other lanes. '''
+        from rucio.daemons.hermes.hermes2 import DeliveryLane
+
+        messages = [{'id': 1}, {'id': 2}]
+        calls = []
+
+        def failing(messages, logger):
+            calls.append(len(messages))
+            raise Exception('Service down')
+
+        working = DeliveryLane('working', lambda messages, logger: [message['id'] for message in messages], retries=0)
+        broken = DeliveryLane('broken', failing, retries=1, retry_delay=0, backoff=60)
+
+        assert working.deliver(messages, logger=lambda *args, **kwargs: None) == [1, 2]
+        assert broken.deliver(messages, logger=lambda *args, **kwargs: None) == []
+        assert len(calls) == 2
+        assert broken.failures == 1
+
+        # The broken lane is skipped while backing off
+        assert broken.deliver(messages, logger=lambda *args, **kwargs: None) == []
+        assert len(calls) == 2
+        assert working.deliver(messages, logger=lambda *args, **kwargs: None) == [1, 2]
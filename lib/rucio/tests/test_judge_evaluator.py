@@ -39,6 +39,7 @@ from rucio.core.rse import add_rse_attribute, get_rse_id
 from rucio.core.rule import add_rule, get_rule
 from rucio.daemons.abacus.account import account_update
 from rucio.daemons.judge.evaluator import re_evaluator
+from rucio.db.sqla import models, session
 from rucio.db.sqla.constants import DIDType
 from rucio.tests.common_server import get_vo
 from rucio.tests.test_rule import create_files, tag_generator
@@ -115,6 +116,26 @@ class TestJudgeEvaluator(unittest.TestCase):
         for file in files:
             assert(len(get_replica_locks(scope=file['scope'], name=file['name'])) == 2)
 
+    def test_judge_add_files_to_dataset_batch(self):
+        """ JUDGE EVALUATOR: Test the judge in batch mode when adding files to dataset one by one"""
+        scope = InternalScope('mock', **self.vo)
+        dataset = 'dataset_' + str(uuid())
+        add_did(scope, dataset, DIDType.DATASET, self.jdoe)
+        add_rule(dids=[{'scope': scope, 'name': dataset}], account=self.jdoe, copies=2, rse_expression=self.T1, grouping='DATASET', weight=None, lifetime=None, locked=False, subscription_id=None)
+
+        files = create_files(3, scope, self.rse1_id)
+        for file in files:
+            attach_dids(scope, dataset, [file], self.jdoe)
+        assert session.get_session().query(models.UpdatedDID).filter_by(scope=scope, name=dataset).count() == 3
+
+        # Fake judge
+        re_evaluator(once=True, batch=True)
+
+        # Check if the Locks are created properly and the updates are consumed
+        for file in files:
+            assert(len(get_replica_locks(scope=file['scope'], name=file['name'])) == 2)
+        assert session.get_session().query(models.UpdatedDID).filter_by(scope=scope, name=dataset).count() == 0
+
     def test_judge_add_dataset_to_container(self):
         """ JUDGE EVALUATOR: Test the judge when adding dataset to container"""
         scope = InternalScope('mock', **self.vo)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from datetime import datetime
+from queue import Queue
+from unittest import mock
+
+from rucio.common.types import InternalScope
+from rucio.daemons.tracer import kronos
+from rucio.daemons.tracer.kronos import AMQConsumer, touch_in_batches
+
+
+@mock.patch('rucio.daemons.tracer.kronos.sleep')
+def test_kronos_touch_in_batches(mock_sleep):
+    """ KRONOS: A failed batch is retried, the updates of a batch failing all the retries are returned """
+    attempts = {1: [False, True], 3: [False, False, False]}
+    batches = []
+
+    def touch(batch):
+        batches.append(list(batch))
+        return attempts[batch[0]].pop(0) if batch[0] in attempts else True
+
+    assert touch_in_batches(touch, [1, 2, 3, 4, 5], batch_size=2, retries=2) == [3, 4]
+    assert batches == [[1, 2], [1, 2], [3, 4], [3, 4], [3, 4], [5]]
+    assert mock_sleep.call_count == 3
+
+
+@mock.patch('rucio.daemons.tracer.kronos.sleep')
+@mock.patch('rucio.daemons.tracer.kronos.touch_collection_replicas', return_value=True)
+@mock.patch('rucio.daemons.tracer.kronos.touch_dataset_locks', return_value=False)
+@mock.patch('rucio.daemons.tracer.kronos.touch_dids', return_value=True)
+def test_kronos_update_datasets_requeue(mock_touch_dids, mock_touch_dataset_locks, mock_touch_collection_replicas, mock_sleep):
+    """ KRONOS: The dataset lock updates failing all the retries go back to the dataset queue """
+    scope = InternalScope('mock', fromExternal=False)
+    accessed_at = datetime.utcnow()
+    dataset_queue = Queue()
+    for name in ('dataset_1', 'dataset_2'):
+        dataset_queue.put({'scope': scope, 'name': name, 'rse_id': 'rse_id', 'accessed_at': accessed_at})
+
+    kronos.__update_datasets(dataset_queue, batch_size=1, retries=1)
+
+    assert mock_touch_dids.call_count == 2
+    assert mock_touch_dataset_locks.call_count == 4
+    assert mock_touch_collection_replicas.call_count == 2
+    requeued = sorted((dataset_queue.get() for _ in range(dataset_queue.qsize())), key=lambda update: update['name'])
+    assert requeued == [{'scope': scope, 'name': 'dataset_1', 'rse_id': 'rse_id', 'accessed_at': accessed_at},
+                        {'scope': scope, 'name': 'dataset_2', 'rse_id': 'rse_id', 'accessed_at': accessed_at}]
+
+
+@mock.patch('rucio.daemons.tracer.kronos.sleep')
+@mock.patch('rucio.daemons.tracer.kronos.touch_replicas', return_value=False)
+@mock.patch('rucio.daemons.tracer.kronos.list_parent_dids', return_value=[])
+@mock.patch('rucio.daemons.tracer.kronos.get_rse_id', return_value='rse_id')
+def test_kronos_resubmit_locked_replicas(mock_get_rse_id, mock_list_parent_dids, mock_touch_replicas, mock_sleep):
+    """ KRONOS: The file traces of a batch failing all the retries are resubmitted to the broker """
+    conn = mock.MagicMock()
+    consumer = AMQConsumer(broker='broker', conn=conn, queue='/queue/trace', chunksize=2, subscription_id='id', excluded_usrdns=[],
+                           dataset_queue=Queue(), bad_files_patterns=[], atime_batch_size=1, atime_retries=1)
+    for i in range(2):
+        report = {'eventType': 'get', 'eventVersion': 'pilot', 'clientState': 'DONE', 'usrdn': 'someuser', 'scope': 'mock',
+                  'filename': 'file_%d' % i, 'remoteSite': 'MOCK', 'traceTimeentryUnix': 1600000000 + i}
+        frame = mock.MagicMock(headers={'message-id': 'msg_%d' % i, 'appversion': 'rucio'}, body=json.dumps(report))
+        consumer.on_message(frame)
+
+    assert mock_touch_replicas.call_count == 4
+    resubmitted = [call[1] for call in conn.send.call_args_list]
+    assert [json.loads(kwargs['body'])['filename'] for kwargs in resubmitted] == ['file_0', 'file_1']
+    assert all(kwargs['destination'] == '/queue/trace' and kwargs['headers']['resubmitted'] == '1' for kwargs in resubmitted)
+    assert conn.ack.call_count == 2
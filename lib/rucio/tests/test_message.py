@@ -69,3 +69,18 @@ class TestMessagesCore:
         delete_messages(to_delete)
 
         assert retrieve_messages() == []
+
+    def test_pop_messages_nolimit(self):
+        """ MESSAGE (CORE): Test retrieve messages with and without payload_nolimit """
+
+        truncate_messages()
+        for i in range(10):
+            add_message(event_type='TEST', payload={'number': i,
+                                                    'long': 'x' * 4000 * (i % 2)})
+
+        messages = retrieve_messages(10)
+        assert len(messages) == 10
+        for message in messages:
+            assert len(message['payload']['long']) == 4000 * (message['payload']['number'] % 2)
+
+        truncate_messages()
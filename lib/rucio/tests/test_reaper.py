@@ -22,13 +22,14 @@
 # - Matt Snyder <msnyder@bnl.gov>, 2021
 
 from datetime import datetime, timedelta
+from unittest import mock
 
 import pytest
 
 from rucio.api import replica as replica_api
 from rucio.api import rse as rse_api
 from rucio.common.config import config_get_bool
-from rucio.common.exception import ReplicaNotFound, DataIdentifierNotFound
+from rucio.common.exception import ReplicaNotFound, DataIdentifierNotFound, ServiceUnavailable, SourceNotFound
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.common.utils import generate_uuid
 from rucio.core import did as did_core
@@ -37,7 +38,7 @@ from rucio.core import rse as rse_core
 from rucio.core import rule as rule_core
 from rucio.core import scope as scope_core
 from rucio.core import vo as vo_core
-from rucio.daemons.reaper.reaper import reaper, REGION
+from rucio.daemons.reaper.reaper import reaper, delete_from_storage, delete_from_storage_parallel, get_deletion_pool, REGION
 from rucio.daemons.reaper.reaper import run as run_reaper
 from rucio.db.sqla.models import ConstituentAssociationHistory
 from rucio.db.sqla.session import read_session
@@ -364,3 +365,69 @@ def test_archive_removal_impact_on_constituents(rse_factory, did_factory, mock_s
     assert len(list(did_core.list_archive_content(**archive2))) == 0
     assert __get_archive_contents_history_count(archive1) == 4
     assert __get_archive_contents_history_count(archive2) == 3
+
+
+def test_reaper_deletion_pool_resize():
+    """ REAPER (DAEMON): A replaced deletion pool stays usable by the threads holding it """
+    hostname = 'reaper-%s.example.com' % generate_uuid()
+    with mock.patch('rucio.daemons.reaper.reaper.get_max_deletion_threads_by_hostname', return_value=2):
+        old_pool, max_deletion_thread = get_deletion_pool(hostname)
+        assert max_deletion_thread == 2
+        assert get_deletion_pool(hostname)[0] is old_pool
+
+    with mock.patch('rucio.daemons.reaper.reaper.get_max_deletion_threads_by_hostname', return_value=3):
+        new_pool, max_deletion_thread = get_deletion_pool(hostname)
+    assert max_deletion_thread == 3
+    assert new_pool is not old_pool
+
+    # A thread which fetched the pool before the resize can still submit its deletions
+    assert old_pool.submit(lambda: 'old').result() == 'old'
+    assert new_pool.submit(lambda: 'new').result() == 'new'
+
+
+def test_reaper_delete_from_storage_noaccess_threshold():
+    """ REAPER (DAEMON): The outcome of every replica of a bulk deletion is kept after the RSE is excluded """
+    rse_info = {'rse': 'MOCK_%s' % generate_uuid()[:8].upper(), 'id': generate_uuid(), 'sign_url': None}
+    scope = InternalScope('mock', vo='def')
+    replicas = [{'scope': scope, 'name': 'file_%d' % i, 'bytes': 1, 'pfn': 'mock://mock.example.com/file_%d' % i} for i in range(6)]
+    outcomes = [True, ServiceUnavailable('no access'), ServiceUnavailable('no access'), True, ServiceUnavailable('no access'), SourceNotFound('not found')]
+    prot = mock.MagicMock()
+    prot.attributes = {'scheme': 'MOCK'}
+    prot.bulk_delete.return_value = dict((replica['pfn'], outcome) for replica, outcome in zip(replicas, outcomes))
+
+    with mock.patch('rucio.daemons.reaper.reaper.add_message') as add_message, \
+            mock.patch.object(REGION, 'set') as region_set:
+        deleted_files = delete_from_storage(replicas, prot, rse_info, staging_areas=[], auto_exclude_threshold=2)
+
+    # the replicas deleted or not found after the threshold are still reported as deleted
+    assert sorted(deleted['name'] for deleted in deleted_files) == ['file_0', 'file_3', 'file_5']
+    region_set.assert_called_once_with('temporary_exclude_%s' % rse_info['id'], True)
+    assert [call[0][0] for call in add_message.call_args_list].count('deletion-failed') == 3
+    assert [call[0][0] for call in add_message.call_args_list].count('deletion-done') == 2
+
+
+def test_reaper_delete_from_storage_parallel_noaccess_threshold():
+    """ REAPER (DAEMON): The NOACCESS attempts of the slices of a chunk are counted against the same threshold """
+    rse_info = {'rse': 'MOCK_%s' % generate_uuid()[:8].upper(), 'id': generate_uuid(), 'sign_url': None}
+    scope = InternalScope('mock', vo='def')
+    replicas = [{'scope': scope, 'name': 'file_%d' % i, 'bytes': 1, 'pfn': 'mock://mock.example.com/file_%d' % i} for i in range(4)]
+
+    def create_protocol(rse_settings, operation, scheme=None, logger=None):
+        prot = mock.MagicMock()
+        prot.attributes = {'scheme': 'MOCK'}
+        prot.bulk_delete.side_effect = lambda pfns: dict((pfn, ServiceUnavailable('no access') if pfn in failing else True) for pfn in pfns)
+        return prot
+
+    for failing, excluded in ((replicas[0]['pfn'], replicas[1]['pfn']), False), ([replica['pfn'] for replica in replicas[:3]], True):
+        with mock.patch('rucio.daemons.reaper.reaper.get_max_deletion_threads_by_hostname', return_value=4), \
+                mock.patch('rucio.daemons.reaper.reaper.rsemgr.create_protocol', side_effect=create_protocol), \
+                mock.patch('rucio.daemons.reaper.reaper.add_message'), \
+                mock.patch.object(REGION, 'set') as region_set:
+            deleted_files = delete_from_storage_parallel(replicas, rse_info, 'reaper-%s.example.com' % generate_uuid(), None, staging_areas=[], auto_exclude_threshold=3)
+
+        # one failure per slice, the RSE is only excluded once the failures of all the slices reach the threshold
+        assert len(deleted_files) == len(replicas) - len(failing)
+        if excluded:
+            region_set.assert_called_once_with('temporary_exclude_%s' % rse_info['id'], True)
+        else:
+            region_set.assert_not_called()
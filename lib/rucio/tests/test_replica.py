@@ -49,13 +49,13 @@ from rucio.client.ruleclient import RuleClient
 from rucio.common.exception import (DataIdentifierNotFound, AccessDenied, UnsupportedOperation,
                                     RucioException, ReplicaIsLocked, ReplicaNotFound, ScopeNotFound,
                                     DatabaseException)
-from rucio.common.utils import generate_uuid, clean_surls, parse_response
+from rucio.common.utils import generate_uuid, clean_surls, parse_response, APIEncoder
 from rucio.core.config import set as cconfig_set
 from rucio.core.did import add_did, attach_dids, get_did, set_status, list_files, get_did_atime
 from rucio.core.replica import (add_replica, add_replicas, delete_replicas, get_replicas_state,
                                 get_replica, list_replicas, declare_bad_file_replicas, list_bad_replicas,
                                 update_replica_state, get_RSEcoverage_of_dataset, get_replica_atime,
-                                touch_replica, get_bad_pfns, set_tombstone)
+                                touch_replica, touch_replicas, get_bad_pfns, set_tombstone)
 from rucio.core.rse import add_protocol, add_rse_attribute, del_rse_attribute
 from rucio.daemons.badreplicas.minos import run as minos_run
 from rucio.daemons.badreplicas.minos_temporary_expiration import run as minos_temp_run
@@ -65,6 +65,7 @@ from rucio.db.sqla.constants import DIDType, ReplicaState, BadPFNStatus, OBSOLET
 from rucio.db.sqla.session import transactional_session
 from rucio.rse import rsemanager as rsemgr
 from rucio.tests.common import execute, headers, auth, Mime, accept
+from rucio.web.rest.flaskapi.v1.common import buffered_stream, json_stream
 
 
 def mocked_VP_requests_get(*args, **kwargs):
@@ -307,6 +308,33 @@ class TestReplicaCore:
         for i in range(0, nbfiles - 1):
             assert get_replica_atime({'scope': files2[i]['scope'], 'name': files2[i]['name'], 'rse_id': rse_id}) is None
 
+    def test_touch_replicas_bulk(self, rse_factory, mock_scope, root_account):
+        """ REPLICA (CORE): Touch several replicas accessed_at timestamp at once"""
+
+        _, rse_id = rse_factory.make_mock_rse()
+        _, other_rse_id = rse_factory.make_mock_rse()
+
+        files = [{'scope': mock_scope, 'name': 'file_%s' % generate_uuid(), 'bytes': 1, 'adler32': '0cc737eb', 'meta': {'events': 10}} for _ in range(3)]
+        add_replicas(rse_id=rse_id, files=files, account=root_account, ignore_availability=True)
+
+        now = datetime.utcnow()
+        now -= timedelta(microseconds=now.microsecond)
+        before = now - timedelta(hours=1)
+
+        assert touch_replicas([{'scope': files[0]['scope'], 'name': files[0]['name'], 'rse_id': rse_id, 'accessed_at': now},
+                               {'scope': files[0]['scope'], 'name': files[0]['name'], 'rse_id': rse_id, 'accessed_at': before},
+                               {'scope': files[1]['scope'], 'name': files[1]['name'], 'rse_id': rse_id, 'accessed_at': before},
+                               {'scope': files[2]['scope'], 'name': files[2]['name'], 'rse_id': other_rse_id, 'accessed_at': now}])
+
+        # The latest access of a replica is kept
+        assert now == get_replica_atime({'scope': files[0]['scope'], 'name': files[0]['name'], 'rse_id': rse_id})
+        assert now == get_did_atime(scope=mock_scope, name=files[0]['name'])
+        assert before == get_replica_atime({'scope': files[1]['scope'], 'name': files[1]['name'], 'rse_id': rse_id})
+        assert before == get_did_atime(scope=mock_scope, name=files[1]['name'])
+        assert get_replica_atime({'scope': files[2]['scope'], 'name': files[2]['name'], 'rse_id': rse_id}) is None
+        # The did of a missing replica is not touched
+        assert get_did_atime(scope=mock_scope, name=files[2]['name']) is None
+
     def test_list_replicas_all_states(self, rse_factory, mock_scope, root_account):
         """ REPLICA (CORE): list file replicas with all_states"""
         _, rse1_id = rse_factory.make_mock_rse()
@@ -805,6 +833,7 @@ def test_rest_list_replicas_content_type(rse_factory, mock_scope, replica_client
     # content type metalink4
     response = rest_client.get('/replicas/%s/%s' % (scope, name), headers=headers(auth(auth_token), accept(Mime.METALINK)))
     assert [header[1] for header in response.headers if header[0] == 'Content-Type'][0] == Mime.METALINK
+    assert '  <glfn name="/atlas/rucio/%s:%s"></glfn>\n' % (scope, name) in response.get_data(as_text=True)
 
     # no requested content type
     response = rest_client.get('/replicas/%s/%s' % (scope, name), headers=headers(auth(auth_token)))
@@ -822,6 +851,30 @@ def test_rest_list_replicas_content_type(rse_factory, mock_scope, replica_client
     assert [header[1] for header in response.headers if header[0] == 'Content-Type'][0] == Mime.JSON_STREAM
 
 
+def test_rest_buffered_stream():
+    """ REPLICA (REST): join the strings of a stream into chunks of at least chunk_size characters"""
+    strings = ['a' * 3, 'b' * 4, 'c' * 10, 'd', 'e' * 2]
+    assert list(buffered_stream(iter(strings), chunk_size=5)) == ['aaabbbb', 'c' * 10, 'dee']
+    assert list(buffered_stream(iter(strings), chunk_size=100)) == [''.join(strings)]
+    assert list(buffered_stream(iter([]), chunk_size=5)) == []
+
+    def failing():
+        yield 'a'
+        raise DataIdentifierNotFound()
+
+    # the error of the generator is raised when the first chunk is read, before any output
+    with pytest.raises(DataIdentifierNotFound):
+        next(buffered_stream(failing(), chunk_size=5))
+
+
+def test_rest_json_stream():
+    """ REPLICA (REST): serialize rows to a JSON stream, one document per line"""
+    rows = [{'scope': 'mock', 'name': 'file_1', 'created_at': datetime(2021, 1, 2, 3, 4, 5)},
+            {'scope': 'mock', 'name': 'file_2', 'bytes': 1}]
+    assert list(json_stream(iter(rows))) == [dumps(row, cls=APIEncoder) + '\n' for row in rows]
+    assert list(json_stream([])) == []
+
+
 def test_client_add_list_replicas(rse_factory, replica_client, mock_scope):
     """ REPLICA (CLIENT): Add, change state and list file replicas """
     rse1, _ = rse_factory.make_posix_rse()
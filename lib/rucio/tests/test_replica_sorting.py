@@ -54,9 +54,6 @@ def protocols_setup(vo):
         add_rse_attribute(rse_id=rse_info[idx]['id'], key='site', value=base_rse_info[idx]['site'])
         add_replicas(rse_id=rse_info[idx]['id'], files=files, account=root)
 
-    # invalidate cache for parse_expression('site=…')
-    rse_expression_parser.REGION.invalidate()
-
     # check sites
     for idx in range(len(rse_info)):
         site_rses = rse_expression_parser.parse_expression('site=' + base_rse_info[idx]['site'])
@@ -217,9 +214,6 @@ def test_sort_geoip_lan_before_wan(vo, rest_client, auth_token, protocols_setup,
         'sort': 'geoip',
     }
 
-    # invalidate cache for parse_expression('site=…')
-    rse_expression_parser.REGION.invalidate()
-
     with mock.patch('rucio.core.replica_sorter.__get_distance', side_effect=fake_get_distance):
         response = rest_client.post(
             '/replicas/list',
@@ -290,9 +284,6 @@ def test_not_sorting_lan_replicas(vo, rest_client, auth_token, protocols_setup,
         assert not dictreplica
         return []
 
-    # invalidate cache for parse_expression('site=…')
-    rse_expression_parser.REGION.invalidate()
-
     with mock.patch('rucio.web.rest.flaskapi.v1.replicas.sort_replicas', side_effect=fake_sort_replicas):
         response = rest_client.post(
             '/replicas/list',
@@ -26,8 +26,10 @@
 import unittest
 from random import choice
 from string import ascii_uppercase, digits, ascii_lowercase
+from unittest import mock
 
 import pytest
+from dogpile.cache.api import NO_VALUE
 
 from rucio.client.rseclient import RSEClient
 from rucio.common.config import config_get_bool
@@ -231,6 +233,31 @@ class TestRSEExpressionParserCore(unittest.TestCase):
         expected = sorted([self.rse4_id, self.rse5_id])
         assert value == expected
 
+    def test_attribute_change_is_visible(self):
+        """ RSE_EXPRESSION_PARSER (CORE) Test that RSE attribute changes invalidate the evaluated expressions """
+        value = [t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=uk" % self.attribute, **self.filter)]
+        assert value == [self.rse4_id]
+        rse.del_rse_attribute(self.rse4_id, self.attribute)
+        rse.add_rse_attribute(self.rse4_id, self.attribute, "fr")
+        pytest.raises(InvalidRSEExpression, rse_expression_parser.parse_expression, "%s=uk" % self.attribute, **self.filter)
+        value = sorted([t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=fr" % self.attribute, **self.filter)])
+        assert value == sorted([self.rse3_id, self.rse4_id])
+
+    def test_index_version_without_cache(self):
+        """ RSE_EXPRESSION_PARSER (CORE) Test that without a version in the cache the last version of the process is kept """
+        with mock.patch('rucio.core.rse.REGION') as region:
+            region.get.return_value = NO_VALUE
+            version = rse.get_rse_index_version()
+            assert rse.get_rse_index_version() == version
+            index = rse_expression_parser.get_rse_attribute_index()
+            assert rse_expression_parser.get_rse_attribute_index() is index
+
+            # the changes of the process are still visible to itself
+            rse.del_rse_attribute(self.rse4_id, self.attribute)
+            rse.add_rse_attribute(self.rse4_id, self.attribute, "uk")
+            assert rse.get_rse_index_version() != version
+            assert rse_expression_parser.get_rse_attribute_index() is not index
+
 
 @pytest.mark.noparallel(reason='uses pre-defined RSE')
 class TestRSEExpressionParserClient(unittest.TestCase):
@@ -241,3 +241,21 @@ class TestRsePOSIX(unittest.TestCase):
     def test_change_scope_mgr_ok_single_pfn(self):
         """POSIX (RSE/PROTOCOLS): Change the scope of a single file on storage using PFN (Success)"""
         self.mtc.test_change_scope_mgr_ok_single_pfn()
+
+    def test_bulk_delete(self):
+        """POSIX (RSE/PROTOCOLS): Delete and check several files with the default bulk operations of the protocol"""
+        rse_info = mgr.get_rse_info(self.rse_id)
+        protocol = mgr.create_protocol(rse_info, 'delete')
+        pfns = list(mgr.lfns2pfns(rse_info, [{'name': 'bulk_%s' % uuid(), 'scope': 'user.%s' % self.user} for _ in range(3)]).values())
+        for pfn in pfns[:2]:
+            path = protocol.pfn2path(pfn)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            shutil.copy(self.static_file, path)
+
+        assert protocol.bulk_exists(pfns) == {pfns[0]: True, pfns[1]: True, pfns[2]: False}
+        deletions = protocol.bulk_delete(pfns)
+        assert deletions[pfns[0]] is True
+        assert deletions[pfns[1]] is True
+        assert isinstance(deletions[pfns[2]], exception.SourceNotFound)
+        assert protocol.bulk_exists(pfns) == {pfn: False for pfn in pfns}
@@ -268,3 +268,22 @@ class TestRseXROOTD(unittest.TestCase):
     def test_change_scope_mgr_ok_single_pfn(self):
         """XROOTD (RSE/PROTOCOLS): Change the scope of a single file on storage using PFN (Success)"""
         self.mtc.test_change_scope_mgr_ok_single_pfn()
+
+    # Protocol-Tests: bulk operations
+    def test_bulk_delete(self):
+        """XROOTD (RSE/PROTOCOLS): Delete and check multiple files at once """
+        protocol = rsemanager.create_protocol(rsemanager.get_rse_info(self.rse_id), 'delete')
+        protocol.connect()
+        pfns = []
+        for index in range(2):
+            pfn = protocol.path2pfn(self.prefix + protocol._get_path('user.%s' % TestRseXROOTD.user, 'bulk_%d_%s' % (index, uuid())))
+            execute('xrdcp %s/data.raw %s' % (self.tmpdir, pfn))
+            pfns.append(pfn)
+        missing = protocol.path2pfn(self.prefix + protocol._get_path('user.%s' % TestRseXROOTD.user, 'bulk_missing_%s' % uuid()))
+
+        assert protocol.bulk_exists(pfns + [missing]) == {pfns[0]: True, pfns[1]: True, missing: False}
+        deleted = protocol.bulk_delete(pfns + [missing])
+        assert deleted[pfns[0]] is True
+        assert deleted[pfns[1]] is True
+        assert isinstance(deleted[missing], exception.SourceNotFound)
+        assert protocol.bulk_exists(pfns) == {pfns[0]: False, pfns[1]: False}
@@ -30,7 +30,7 @@ from rucio.common.types import InternalAccount
 from rucio.core.account_counter import update_account_counter, increase
 from rucio.core.account_limit import set_local_account_limit, set_global_account_limit
 from rucio.core.rse import get_rse_id
-from rucio.core.rse_selector import RSESelector
+from rucio.core.rse_selector import RSESelector, get_rse_selector_snapshot
 from rucio.db.sqla import session, models
 from rucio.tests.common_server import get_vo
 
@@ -135,6 +135,23 @@ class TestRSESelectorInit(unittest.TestCase):
         rse_selector = RSESelector(self.account, rses, None, copies)
         assert len(rse_selector.rses) == 1
 
+    def test_7(self):
+        # snapshot of the RSEs shared between selectors -> same selection as without snapshot
+        rses = [self.rse_1, self.rse_2]
+        set_global_account_limit(account=self.account, rse_expression=self.rse_1_name, bytes=10)
+        set_local_account_limit(account=self.account, rse_id=self.mock1_id, bytes=20)
+        set_local_account_limit(account=self.account, rse_id=self.mock2_id, bytes=20)
+        increase(self.mock1_id, self.account, 10, 10)
+        update_account_counter(account=self.account, rse_id=self.mock1_id)
+        snapshot = get_rse_selector_snapshot(account=self.account, rse_ids=[self.mock1_id, self.mock2_id])
+        assert snapshot['local_limits'][self.mock1_id] == 20
+        assert snapshot['usages'][self.mock1_id] == 10
+        assert self.rse_1_name in snapshot['global_limits']
+        rse_selector = RSESelector(self.account, rses, None, 1, snapshot=snapshot)
+        assert [rse['rse_id'] for rse in rse_selector.rses] == [rse['rse_id'] for rse in RSESelector(self.account, rses, None, 1).rses] == [self.mock2_id]
+        with pytest.raises(InsufficientAccountLimit):
+            RSESelector(self.account, rses, None, 2, snapshot=snapshot)
+
 
 @pytest.mark.dirty
 @pytest.mark.noparallel(reason='uses pre-defined rses, deletes database content on setUp and tearDownClass')
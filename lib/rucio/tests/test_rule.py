@@ -35,7 +35,9 @@ import json
 import random
 import string
 import unittest
+from datetime import datetime, timedelta
 from logging import getLogger
+from unittest import mock
 
 import pytest
 
@@ -57,7 +59,7 @@ from rucio.common.utils import generate_uuid as uuid
 from rucio.core.account import add_account_attribute, get_usage
 from rucio.core.account_limit import set_local_account_limit, set_global_account_limit
 from rucio.core.did import add_did, attach_dids, set_status
-from rucio.core.lock import get_replica_locks, get_dataset_locks, successful_transfer
+from rucio.core.lock import get_replica_locks, get_dataset_locks, successful_transfer, touch_dataset_locks
 from rucio.core.replica import add_replica, get_replica
 from rucio.core.request import get_request_by_did
 from rucio.core.rse import add_rse_attribute, add_rse, update_rse, get_rse_id, del_rse_attribute, set_rse_limits
@@ -390,6 +392,27 @@ class TestReplicationRuleCore(unittest.TestCase):
         for file in files:
             get_request_by_did(scope=file['scope'], name=file['name'], rse_id=self.rse5_id)
 
+    def test_touch_dataset_locks(self):
+        """ REPLICATION RULE (CORE): Touch several dataset locks and update the eol_at of their rules at once"""
+        scope = InternalScope('mock', **self.vo)
+        now = datetime.utcnow()
+        now -= timedelta(microseconds=now.microsecond)
+        datasets = []
+        for _ in range(2):
+            dataset = 'dataset_' + str(uuid())
+            add_did(scope, dataset, DIDType.DATASET, self.jdoe)
+            attach_dids(scope, dataset, create_files(2, scope, self.rse1_id), self.jdoe)
+            rule_id = add_rule(dids=[{'scope': scope, 'name': dataset}], account=self.jdoe, copies=1, rse_expression=self.rse1, grouping='DATASET', weight=None, lifetime=None, locked=False, subscription_id=None)[0]
+            datasets.append((dataset, rule_id, now + timedelta(days=len(datasets) + 1)))
+        eol_ats = dict((dataset, eol_at) for dataset, _, eol_at in datasets)
+
+        with mock.patch('rucio.core.lock.define_eol', side_effect=lambda scope, name, rses, session=None: eol_ats[name]):
+            assert touch_dataset_locks([{'scope': scope, 'name': dataset, 'rse_id': self.rse1_id, 'accessed_at': now} for dataset, _, _ in datasets])
+
+        for dataset, rule_id, eol_at in datasets:
+            assert [lock['accessed_at'] for lock in get_dataset_locks(scope, dataset)] == [now]
+            assert get_rule(rule_id)['eol_at'] == eol_at
+
     def test_add_rule_container_dataset(self):
         """ REPLICATION RULE (CORE): Add a replication rule on a container, DATASET Grouping"""
         scope = InternalScope('mock', **self.vo)
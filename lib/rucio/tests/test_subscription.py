@@ -30,7 +30,7 @@
 from __future__ import print_function
 
 import unittest
-from json import loads
+from json import dumps, loads
 
 import pytest
 
@@ -48,7 +48,7 @@ from rucio.core.did import add_did, set_new_dids
 from rucio.core.rse import add_rse
 from rucio.core.rule import add_rule
 from rucio.core.scope import add_scope
-from rucio.daemons.transmogrifier.transmogrifier import run
+from rucio.daemons.transmogrifier.transmogrifier import run, is_matching_subscription, SubscriptionIndex
 from rucio.db.sqla.constants import AccountType, DIDType
 from rucio.tests.common import headers, auth
 from rucio.tests.common_server import get_vo
@@ -315,6 +315,33 @@ def test_list_rules_states(vo, rest_client, auth_token):
     assert rulestates[3] == 2
 
 
+def test_subscription_index(vo):
+    """ SUBSCRIPTION (DAEMON): Test the preselection of the subscriptions matching a DID """
+    def subscription(sub_id, sub_filter):
+        return {'id': sub_id, 'name': 'subscription_%d' % sub_id, 'filter': dumps(sub_filter), 'replication_rules': dumps([])}
+
+    subscriptions = [subscription(1, {'scope': ['data18'], 'pattern': 'dataset-.*'}),
+                     subscription(2, {'account': ['root'], 'did_type': ['CONTAINER']}),
+                     subscription(3, {'scope': ['mc.*'], 'datatype': ['AOD']}),
+                     subscription(4, {'pattern': '('}),
+                     subscription(5, {})]
+    did = {'scope': InternalScope('data18_13TeV', vo=vo), 'name': 'dataset-%s' % uuid()}
+    metadata = {'hidden': False, 'account': InternalAccount('root', vo=vo), 'did_type': DIDType.DATASET, 'datatype': 'AOD'}
+
+    index = SubscriptionIndex()
+    assert index.refresh(subscriptions)
+    assert not index.refresh(subscriptions)
+    candidates = index.candidates(did, metadata)
+    assert [compiled.subscription['id'] for compiled in candidates] == [1, 3, 5]
+    assert [compiled.subscription['id'] for compiled in candidates if compiled.matches(did, metadata)] == [1, 5]
+    assert [sub['id'] for sub in subscriptions if is_matching_subscription(sub, did, metadata)] == [1, 5]
+
+    subscriptions[0] = subscription(1, {'scope': ['data17']})
+    metadata['did_type'] = DIDType.CONTAINER
+    assert index.refresh(subscriptions)
+    assert [compiled.subscription['id'] for compiled in index.candidates(did, metadata)] == [2, 3, 5]
+
+
 class TestSubscriptionClient(unittest.TestCase):
 
     @classmethod
@@ -16,19 +16,22 @@
 # Authors:
 # - Radu Carpa <radu.carpa@cern.ch>, 2021
 
+from unittest import mock
+
 import pytest
+from dogpile.cache.api import NO_VALUE
 
 from rucio.common.exception import NoDistance
-from rucio.core.distance import add_distance
+from rucio.core.distance import add_distance, delete_distances, get_distance_graph_version, invalidate_distance_graph
 from rucio.core.replica import add_replicas
-from rucio.core.transfer import get_hops, get_transfer_requests_and_source_replicas
+from rucio.core.transfer import get_hops, get_distance_graph, get_transfer_requests_and_source_replicas, RseLoaderContext
 from rucio.core import rule as rule_core
 from rucio.core import request as request_core
 from rucio.core import rse as rse_core
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import RSEType
-from rucio.db.sqla.session import transactional_session
-from rucio.common.utils import generate_uuid
+from rucio.db.sqla.session import get_session, transactional_session
+from rucio.common.utils import generate_uuid, CHECKSUM_KEY, GLOBALLY_SUPPORTED_CHECKSUMS
 
 
 def test_get_hops(rse_factory):
@@ -147,6 +150,78 @@ def test_get_hops(rse_factory):
     assert hop4['dest_rse_id'] == rse6_id
 
 
+def test_distance_graph_invalidation(rse_factory):
+    """ TRANSFER (CORE): the in-memory distance graph is reloaded when distances change """
+    _, rse0_id = rse_factory.make_mock_rse()
+    _, rse1_id = rse_factory.make_mock_rse()
+    _, rse2_id = rse_factory.make_mock_rse()
+
+    with pytest.raises(NoDistance):
+        get_hops(source_rse_id=rse0_id, dest_rse_id=rse1_id)
+
+    add_distance(rse0_id, rse1_id, ranking=10)
+    [hop] = get_hops(source_rse_id=rse0_id, dest_rse_id=rse1_id)
+    assert hop['hop_distance'] == 10
+
+    # The graph is shared between calls as long as nothing changes
+    distance_graph = get_distance_graph()
+    assert get_distance_graph() is distance_graph
+
+    add_distance(rse1_id, rse2_id, ranking=5)
+    assert get_distance_graph() is not distance_graph
+    paths = get_distance_graph().shortest_paths(rse0_id, multihop_rses=[rse1_id], hop_penalty=10)
+    assert [hop['dest_rse_id'] for hop in paths[rse2_id]] == [rse1_id, rse2_id]
+    assert paths[rse2_id][-1]['cumulated_distance'] == 35
+
+    delete_distances(rse0_id, rse1_id)
+    with pytest.raises(NoDistance):
+        get_hops(source_rse_id=rse0_id, dest_rse_id=rse1_id)
+
+
+def test_distance_graph_version_without_cache():
+    """ TRANSFER (CORE): without a version in the cache the last version of the process is kept """
+    with mock.patch('rucio.core.distance.REGION') as region:
+        region.get.return_value = NO_VALUE
+        version = get_distance_graph_version()
+        assert get_distance_graph_version() == version
+
+        # the changes of the process are still visible to itself
+        new_version = invalidate_distance_graph()
+        assert new_version != version
+        assert get_distance_graph_version() == new_version
+
+
+def test_rse_loader_context_supported_checksums(rse_factory):
+    """ TRANSFER (CORE): the checksums supported by the RSEs of a batch are loaded once """
+    _, rse1_id = rse_factory.make_mock_rse()
+    _, rse2_id = rse_factory.make_mock_rse()
+    _, rse3_id = rse_factory.make_mock_rse()
+    rse_core.add_rse_attribute(rse1_id, CHECKSUM_KEY, 'md5')
+    rse_core.add_rse_attribute(rse2_id, CHECKSUM_KEY, 'none')
+
+    ctx = RseLoaderContext()
+    ctx.preload_attributes([rse1_id, rse2_id, rse3_id])
+    for rse_id in (rse1_id, rse2_id, rse3_id):
+        assert ctx.supported_checksums(rse_id) == rse_core.get_rse_supported_checksums(rse_id)
+    assert ctx.supported_checksums(rse1_id) == ['md5']
+    assert ctx.supported_checksums(rse2_id) == []
+    assert ctx.supported_checksums(rse3_id) == GLOBALLY_SUPPORTED_CHECKSUMS
+
+    # The partially loaded RSEs are completed on demand
+    rse_data = ctx.rse_data(rse1_id)
+    assert rse_data.name is not None and rse_data.info is not None
+
+    # A step of the cycle loads in its own session, into the caches of the cycle
+    session = get_session()
+    try:
+        step_ctx = ctx.for_session(session)
+        assert step_ctx.session is session and ctx.session is None
+        rse_data = step_ctx.rse_data(rse3_id)
+        assert ctx.rse_id_to_data_map[rse3_id] is rse_data
+    finally:
+        session.remove()
+
+
 def test_disk_vs_tape_priority(rse_factory, root_account, mock_scope):
     tape1_rse_name, tape1_rse_id = rse_factory.make_posix_rse(rse_type=RSEType.TAPE)
     tape2_rse_name, tape2_rse_id = rse_factory.make_posix_rse(rse_type=RSEType.TAPE)
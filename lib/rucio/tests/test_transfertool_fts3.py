@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import patch
+
+import pytest
+
+from rucio.common.exception import InputValidationError
+from rucio.transfertool.fts3 import FTS3Session, get_session
+
+
+@patch.dict('rucio.transfertool.fts3.SESSIONS', clear=True)
+def test_fts3_get_session():
+    """ FTS3: one session is shared per host and client certificate """
+    session = get_session('https://fts1.example.org:8446', cert=('cert.pem', 'key.pem'))
+    assert isinstance(session, FTS3Session)
+    assert session.host == 'fts1_example_org'
+    assert get_session('https://fts1.example.org:8446', cert=('cert.pem', 'key.pem')) is session
+
+    # other hosts and certificates get their own sessions
+    other_host = get_session('https://fts2.example.org:8446', cert=('cert.pem', 'key.pem'))
+    other_cert = get_session('https://fts1.example.org:8446', cert=('other_cert.pem', 'other_key.pem'))
+    assert other_host is not session and other_host.host == 'fts2_example_org'
+    assert other_cert is not session and other_cert is not other_host
+    assert get_session('https://fts2.example.org:8446', cert=('cert.pem', 'key.pem')) is other_host
+
+
+@patch.dict('rucio.transfertool.fts3.SESSIONS', clear=True)
+def test_fts3_get_session_invalid_host():
+    """ FTS3: a host which is not a URL is rejected """
+    for external_host in ('fts1.example.org:8446', 'fts1.example.org', ''):
+        with pytest.raises(InputValidationError):
+            get_session(external_host)
@@ -125,6 +125,38 @@ def test_upload_multi(rse, scope, upload_client, download_client, file_factory):
     assert adler32(local_file2) == adler32(downloaded_file2)
 
 
+def test_upload_multithreaded(rse, scope, upload_client, download_client, file_factory):
+    """ Upload (CLIENT): Upload several files into a dataset with several threads """
+    local_files = [file_factory.file_generator(use_basedir=True) for _ in range(4)]
+    download_dir = file_factory.base_dir
+    dataset_name = 'dataset_%s' % generate_uuid()
+
+    items = [{'path': local_file,
+              'rse': rse,
+              'did_scope': scope,
+              'did_name': os.path.basename(local_file),
+              'dataset_scope': scope,
+              'dataset_name': dataset_name,
+              'guid': generate_uuid()} for local_file in local_files]
+    summary_path = file_factory.base_dir / 'summary'
+    status = upload_client.upload(items, summary_file_path=summary_path, num_threads=3)
+    assert status == 0
+
+    with open(summary_path) as json_file:
+        data = json.load(json_file)
+    for local_file in local_files:
+        assert data['{}:{}'.format(scope, os.path.basename(local_file))]['adler32'] == adler32(local_file)
+
+    content = upload_client.client.list_content(scope, dataset_name)
+    assert sorted(did['name'] for did in content) == sorted(os.path.basename(local_file) for local_file in local_files)
+
+    # download the files
+    download_client.download_dids([{'did': f"{scope}:{os.path.basename(local_file)}", 'base_dir': download_dir} for local_file in local_files])
+    for local_file in local_files:
+        downloaded_file = f"{download_dir}/{scope}/{os.path.basename(local_file)}"
+        assert adler32(local_file) == adler32(downloaded_file)
+
+
 def test_upload_file_already_exists_single(rse, scope, upload_client, file_factory):
     traces = []
     local_file = file_factory.file_generator()
@@ -28,7 +28,7 @@ from re import match
 import pytest
 
 from rucio.common.exception import InvalidType
-from rucio.common.utils import md5, adler32, parse_did_filter_from_string
+from rucio.common.utils import md5, adler32, parse_did_filter_from_string, calculate_checksums, bulk_calculate_checksums
 from rucio.common.logging import formatted_logger
 
 
@@ -65,6 +65,14 @@ class TestUtils(unittest.TestCase):
         with pytest.raises(Exception, match='FATAL - could not get Adler32 checksum of file no_file - \\[Errno 2\\] No such file or directory: \'no_file\''):
             adler32('no_file')
 
+    def test_utils_calculate_checksums(self):
+        """(COMMON/UTILS): test calculating several checksums of a file in one read"""
+        ret = calculate_checksums(self.temp_file_1.name, ['adler32', 'md5', 'crc32'], buffer_size=4)
+        assert ret == {'adler32': '198d03ff', 'md5': '31d50dd6285b9ff9f8611d0762265d04', 'crc32': 'C843500'}
+
+        ret = bulk_calculate_checksums([self.temp_file_1.name, self.temp_file_1.name], nb_threads=2)
+        assert ret == {self.temp_file_1.name: {'adler32': '198d03ff', 'md5': '31d50dd6285b9ff9f8611d0762265d04'}}
+
     def test_parse_did_filter_string(self):
         """(COMMON/UTILS): test parsing of did filter string"""
         test_cases = [{
@@ -38,6 +38,7 @@ try:
 except ImportError:
     JSONDecodeError = ValueError
 import logging
+import threading
 import time
 import traceback
 try:
@@ -47,16 +48,16 @@ except ImportError:
 import uuid
 
 import requests
-from requests.adapters import ReadTimeout
+from requests.adapters import HTTPAdapter, ReadTimeout
 from requests.packages.urllib3 import disable_warnings  # pylint: disable=import-error
 
 from dogpile.cache import make_region
 from dogpile.cache.api import NoValue
 from prometheus_client import Counter, Summary
 
-from rucio.common.config import config_get, config_get_bool
+from rucio.common.config import config_get, config_get_bool, config_get_int
 from rucio.common.constants import FTS_STATE
-from rucio.common.exception import TransferToolTimeout, TransferToolWrongAnswer, DuplicateFileTransferSubmission
+from rucio.common.exception import TransferToolTimeout, TransferToolWrongAnswer, DuplicateFileTransferSubmission, InputValidationError
 from rucio.common.utils import APIEncoder
 from rucio.core.monitor import record_counter, record_timer
 from rucio.transfertool.transfertool import Transfertool
@@ -78,6 +79,61 @@ QUERY_LATEST_COUNTER = Counter('rucio_transfertool_fts3_query_latest', 'Number o
 BULK_QUERY_COUNTER = Counter('rucio_transfertool_fts3_bulk_query', 'Number of bulk queries', labelnames=('state', 'host'))
 QUERY_DETAILS_COUNTER = Counter('rucio_transfertool_fts3_query_details', 'Number of detailed status queries', labelnames=('state', 'host'))
 SUBMISSION_TIMER = Summary('rucio_transfertool_fts3_submit_transfer', 'Timer for transfer submission', labelnames=('host',))
+REQUEST_TIMER = Summary('rucio_transfertool_fts3_request', 'Latency of the requests to FTS3', labelnames=('host', 'method'))
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+
+class FTS3Session(requests.Session):
+    """
+    Keep-alive session to one FTS3 host, which records the latency of every request.
+    """
+
+    def __init__(self, external_host, pool_size=10):
+        """
+        :param external_host: The FTS3 host.
+        :param pool_size:     Maximum number of connections kept open to the host.
+        :raises InputValidationError: If the host is not a URL.
+        """
+        hostname = urlparse(external_host).hostname
+        if not hostname:
+            raise InputValidationError('Invalid FTS3 host %s, expected a URL such as https://fts3.example.org:8446' % external_host)
+        super(FTS3Session, self).__init__()
+        self.host = hostname.replace('.', '_')
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        start_time = time.time()
+        try:
+            return super(FTS3Session, self).request(method, url, *args, **kwargs)
+        finally:
+            duration = time.time() - start_time
+            record_timer('transfertool.fts3.%s.request.%s' % (self.host, method.lower()), duration * 1000)
+            REQUEST_TIMER.labels(host=self.host, method=method.lower()).observe(duration)
+
+
+def get_session(external_host, cert=None):
+    """
+    Returns the session of the process to a FTS3 host. Sessions are shared by all threads
+    and transfertools, so that the TLS connections to the host are reused.
+
+    :param external_host: The FTS3 host.
+    :param cert:          The client certificate of the requests.
+    :returns:             FTS3Session object.
+    :raises InputValidationError: If the host is not a URL.
+    """
+    key = (external_host, cert)
+    session = SESSIONS.get(key)
+    if session is None:
+        with SESSIONS_LOCK:
+            session = SESSIONS.get(key)
+            if session is None:
+                session = FTS3Session(external_host, pool_size=config_get_int('conveyor', 'fts_pool_size', False, 10))
+                SESSIONS[key] = session
+    return session
 
 
 class FTS3Transfertool(Transfertool):
@@ -110,6 +166,7 @@ class FTS3Transfertool(Transfertool):
         else:
             self.cert = None
             self.verify = True  # True is the default setting of a requests.* method
+        self.session = get_session(self.external_host, cert=self.cert)
 
     def submit(self, files, job_params, timeout=None):
         """
@@ -158,12 +215,12 @@ class FTS3Transfertool(Transfertool):
         post_result = None
         try:
             start_time = time.time()
-            post_result = requests.post('%s/jobs' % self.external_host,
-                                        verify=self.verify,
-                                        cert=self.cert,
-                                        data=params_str,
-                                        headers=self.headers,
-                                        timeout=timeout)
+            post_result = self.session.post('%s/jobs' % self.external_host,
+                                            verify=self.verify,
+                                            cert=self.cert,
+                                            data=params_str,
+                                            headers=self.headers,
+                                            timeout=timeout)
             record_timer('transfertool.fts3.submit_transfer.%s' % self.__extract_host(self.external_host), (time.time() - start_time) * 1000 / len(files))
             labels = {'host': self.__extract_host(self.external_host)}
             SUBMISSION_TIMER.labels(**labels).observe((time.time() - start_time) * 1000 / len(files))
@@ -213,11 +270,11 @@ class FTS3Transfertool(Transfertool):
 
         job = None
 
-        job = requests.delete('%s/jobs/%s' % (self.external_host, transfer_id),
-                              verify=self.verify,
-                              cert=self.cert,
-                              headers=self.headers,
-                              timeout=timeout)
+        job = self.session.delete('%s/jobs/%s' % (self.external_host, transfer_id),
+                                  verify=self.verify,
+                                  cert=self.cert,
+                                  headers=self.headers,
+                                  timeout=timeout)
 
         if job and job.status_code == 200:
             record_counter('transfertool.fts3.%s.cancel.success' % self.__extract_host(self.external_host))
@@ -244,12 +301,12 @@ class FTS3Transfertool(Transfertool):
         params_dict = {"params": {"priority": priority}}
         params_str = json.dumps(params_dict, cls=APIEncoder)
 
-        job = requests.post('%s/jobs/%s' % (self.external_host, transfer_id),
-                            verify=self.verify,
-                            data=params_str,
-                            cert=self.cert,
-                            headers=self.headers,
-                            timeout=timeout)  # TODO set to 3 in conveyor
+        job = self.session.post('%s/jobs/%s' % (self.external_host, transfer_id),
+                                verify=self.verify,
+                                data=params_str,
+                                cert=self.cert,
+                                headers=self.headers,
+                                timeout=timeout)  # TODO set to 3 in conveyor
 
         if job and job.status_code == 200:
             record_counter('transfertool.fts3.%s.update_priority.success' % self.__extract_host(self.external_host))
@@ -281,11 +338,11 @@ class FTS3Transfertool(Transfertool):
 
         job = None
 
-        job = requests.get('%s/jobs/%s' % (self.external_host, transfer_id),
-                           verify=self.verify,
-                           cert=self.cert,
-                           headers=self.headers,
-                           timeout=timeout)  # TODO Set to 5 in conveyor
+        job = self.session.get('%s/jobs/%s' % (self.external_host, transfer_id),
+                               verify=self.verify,
+                               cert=self.cert,
+                               headers=self.headers,
+                               timeout=timeout)  # TODO Set to 5 in conveyor
         if job and job.status_code == 200:
             record_counter('transfertool.fts3.%s.query.success' % self.__extract_host(self.external_host))
             labels = {'state': 'success', 'host': self.__extract_host(self.external_host)}
@@ -308,10 +365,10 @@ class FTS3Transfertool(Transfertool):
 
         get_result = None
 
-        get_result = requests.get('%s/whoami' % self.external_host,
-                                  verify=self.verify,
-                                  cert=self.cert,
-                                  headers=self.headers)
+        get_result = self.session.get('%s/whoami' % self.external_host,
+                                      verify=self.verify,
+                                      cert=self.cert,
+                                      headers=self.headers)
 
         if get_result and get_result.status_code == 200:
             record_counter('transfertool.fts3.%s.whoami.success' % self.__extract_host(self.external_host))
@@ -333,10 +390,10 @@ class FTS3Transfertool(Transfertool):
 
         get_result = None
 
-        get_result = requests.get('%s/' % self.external_host,
-                                  verify=self.verify,
-                                  cert=self.cert,
-                                  headers=self.headers)
+        get_result = self.session.get('%s/' % self.external_host,
+                                      verify=self.verify,
+                                      cert=self.cert,
+                                      headers=self.headers)
 
         if get_result and get_result.status_code == 200:
             record_counter('transfertool.fts3.%s.version.success' % self.__extract_host(self.external_host))
@@ -360,22 +417,22 @@ class FTS3Transfertool(Transfertool):
         jobs = None
 
         try:
-            whoami = requests.get('%s/whoami' % (self.external_host),
-                                  verify=self.verify,
-                                  cert=self.cert,
-                                  headers=self.headers)
+            whoami = self.session.get('%s/whoami' % (self.external_host),
+                                      verify=self.verify,
+                                      cert=self.cert,
+                                      headers=self.headers)
             if whoami and whoami.status_code == 200:
                 delegation_id = whoami.json()['delegation_id']
             else:
                 raise Exception('Could not retrieve delegation id: %s', whoami.content)
             state_string = ','.join(state)
-            jobs = requests.get('%s/jobs?dlg_id=%s&state_in=%s&time_window=%s' % (self.external_host,
-                                                                                  delegation_id,
-                                                                                  state_string,
-                                                                                  last_nhours),
-                                verify=self.verify,
-                                cert=self.cert,
-                                headers=self.headers)
+            jobs = self.session.get('%s/jobs?dlg_id=%s&state_in=%s&time_window=%s' % (self.external_host,
+                                                                                      delegation_id,
+                                                                                      state_string,
+                                                                                      last_nhours),
+                                    verify=self.verify,
+                                    cert=self.cert,
+                                    headers=self.headers)
         except ReadTimeout as error:
             raise TransferToolTimeout(error)
         except JSONDecodeError as error:
@@ -415,13 +472,12 @@ class FTS3Transfertool(Transfertool):
             transfer_ids = [transfer_ids]
 
         responses = {}
-        fts_session = requests.Session()
         xfer_ids = ','.join(transfer_ids)
-        jobs = fts_session.get('%s/jobs/%s?files=file_state,dest_surl,finish_time,start_time,staging_start,staging_finished,reason,source_surl,file_metadata' % (self.external_host, xfer_ids),
-                               verify=self.verify,
-                               cert=self.cert,
-                               headers=self.headers,
-                               timeout=timeout)
+        jobs = self.session.get('%s/jobs/%s?files=file_state,dest_surl,finish_time,start_time,staging_start,staging_finished,reason,source_surl,file_metadata' % (self.external_host, xfer_ids),
+                                verify=self.verify,
+                                cert=self.cert,
+                                headers=self.headers,
+                                timeout=timeout)
 
         if jobs is None:
             record_counter('transfertool.fts3.%s.bulk_query.failure' % self.__extract_host(self.external_host))
@@ -457,11 +513,11 @@ class FTS3Transfertool(Transfertool):
         """
 
         try:
-            result = requests.get('%s/ban/se' % self.external_host,
-                                  verify=self.verify,
-                                  cert=self.cert,
-                                  headers=self.headers,
-                                  timeout=None)
+            result = self.session.get('%s/ban/se' % self.external_host,
+                                      verify=self.verify,
+                                      cert=self.cert,
+                                      headers=self.headers,
+                                      timeout=None)
         except Exception as error:
             raise Exception('Could not retrieve transfer information: %s', error)
         if result and result.status_code == 200:
@@ -476,11 +532,11 @@ class FTS3Transfertool(Transfertool):
         """
 
         try:
-            result = requests.get('%s/config/se' % (self.external_host),
-                                  verify=self.verify,
-                                  cert=self.cert,
-                                  headers=self.headers,
-                                  timeout=None)
+            result = self.session.get('%s/config/se' % (self.external_host),
+                                      verify=self.verify,
+                                      cert=self.cert,
+                                      headers=self.headers,
+                                      timeout=None)
         except Exception:
             logging.warning('Could not get config of %s on %s - %s', storage_element, self.external_host, str(traceback.format_exc()))
         if result and result.status_code == 200:
@@ -534,12 +590,12 @@ class FTS3Transfertool(Transfertool):
         params_str = json.dumps(params_dict, cls=APIEncoder)
 
         try:
-            result = requests.post('%s/config/se' % (self.external_host),
-                                   verify=self.verify,
-                                   cert=self.cert,
-                                   data=params_str,
-                                   headers=self.headers,
-                                   timeout=None)
+            result = self.session.post('%s/config/se' % (self.external_host),
+                                       verify=self.verify,
+                                       cert=self.cert,
+                                       data=params_str,
+                                       headers=self.headers,
+                                       timeout=None)
 
         except Exception:
             logging.warning('Could not set the config of %s on %s - %s', storage_element, self.external_host, str(traceback.format_exc()))
@@ -573,12 +629,12 @@ class FTS3Transfertool(Transfertool):
         result = None
         if ban:
             try:
-                result = requests.post('%s/ban/se' % self.external_host,
-                                       verify=self.verify,
-                                       cert=self.cert,
-                                       data=params_str,
-                                       headers=self.headers,
-                                       timeout=None)
+                result = self.session.post('%s/ban/se' % self.external_host,
+                                           verify=self.verify,
+                                           cert=self.cert,
+                                           data=params_str,
+                                           headers=self.headers,
+                                           timeout=None)
             except Exception:
                 logging.warning('Could not ban %s on %s - %s', storage_element, self.external_host, str(traceback.format_exc()))
             if result and result.status_code == 200:
@@ -587,12 +643,12 @@ class FTS3Transfertool(Transfertool):
         else:
 
             try:
-                result = requests.delete('%s/ban/se?storage=%s' % (self.external_host, storage_element),
-                                         verify=self.verify,
-                                         cert=self.cert,
-                                         data=params_str,
-                                         headers=self.headers,
-                                         timeout=None)
+                result = self.session.delete('%s/ban/se?storage=%s' % (self.external_host, storage_element),
+                                             verify=self.verify,
+                                             cert=self.cert,
+                                             data=params_str,
+                                             headers=self.headers,
+                                             timeout=None)
             except Exception:
                 logging.warning('Could not unban %s on %s - %s', storage_element, self.external_host, str(traceback.format_exc()))
             if result and result.status_code == 204:
@@ -621,11 +677,11 @@ class FTS3Transfertool(Transfertool):
 
                 get_result = None
                 try:
-                    get_result = requests.get('%s/whoami' % self.external_host,
-                                              verify=self.verify,
-                                              cert=self.cert,
-                                              headers=self.headers,
-                                              timeout=5)
+                    get_result = self.session.get('%s/whoami' % self.external_host,
+                                                  verify=self.verify,
+                                                  cert=self.cert,
+                                                  headers=self.headers,
+                                                  timeout=5)
                 except ReadTimeout as error:
                     raise TransferToolTimeout(error)
                 except JSONDecodeError as error:
@@ -828,11 +884,11 @@ class FTS3Transfertool(Transfertool):
 
         files = None
 
-        files = requests.get('%s/jobs/%s/files' % (self.external_host, transfer_id),
-                             verify=self.verify,
-                             cert=self.cert,
-                             headers=self.headers,
-                             timeout=5)
+        files = self.session.get('%s/jobs/%s/files' % (self.external_host, transfer_id),
+                                 verify=self.verify,
+                                 cert=self.cert,
+                                 headers=self.headers,
+                                 timeout=5)
         if files and (files.status_code == 200 or files.status_code == 207):
             record_counter('transfertool.fts3.%s.query_details.success' % self.__extract_host(self.external_host))
             labels = {'state': 'success', 'host': self.__extract_host(self.external_host)}
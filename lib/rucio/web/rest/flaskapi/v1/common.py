@@ -41,7 +41,7 @@ from werkzeug.exceptions import HTTPException
 from rucio.api.authentication import validate_auth_token
 from rucio.common.exception import RucioException, CannotAuthenticate, UnsupportedRequestedContentType
 from rucio.common.schema import get_schema_value
-from rucio.common.utils import generate_uuid, render_json
+from rucio.common.utils import generate_uuid, render_json, APIEncoder
 from rucio.core.vo import map_vo
 
 if TYPE_CHECKING:
@@ -189,6 +189,50 @@ def try_stream(generator, content_type=None) -> "flask.Response":
         return flask.Response('', content_type=content_type)
 
 
+#: Minimum size in characters of the chunks of a buffered stream, a chunk can be larger
+STREAM_CHUNK_SIZE = 64 * 1024
+#: Encoder of the JSON streams, an encoder instance holds no state between two calls
+STREAM_JSON_ENCODER = APIEncoder()
+
+
+def json_stream(rows):
+    """
+    Serializes the rows to JSON, one document per line, reusing the same encoder instance.
+
+    :param rows: an iterable of JSON serializable objects.
+    :returns: a generator of strings.
+    """
+    encode = STREAM_JSON_ENCODER.encode
+    for row in rows:
+        yield encode(row) + '\n'
+
+
+def buffered_stream(generator, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Joins the strings of a generator into chunks of at least chunk_size
+    characters, so that a response made of many small strings is written
+    with few WSGI write calls and chunk frames. Meant to be passed to
+    try_stream, which then peeks at the first chunk.
+
+    The strings are never split: a chunk is yielded as soon as it reaches
+    chunk_size, so it exceeds chunk_size by less than the size of its last
+    string, and a single string longer than chunk_size is a chunk by itself.
+
+    :param generator: a generator function or an iterator of strings.
+    :param chunk_size: the minimum size of a chunk, except for the last one. Not an upper bound.
+    :returns: a generator of strings.
+    """
+    chunk, size = [], 0
+    for data in generator:
+        chunk.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
 def error_headers(exc_cls: str, exc_msg):
     def strip_newlines(msg):
         if msg is None:
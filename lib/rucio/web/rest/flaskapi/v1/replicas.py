@@ -36,11 +36,66 @@ from rucio.common.config import config_get
 from rucio.common.constants import SUPPORTED_PROTOCOLS
 from rucio.common.exception import AccessDenied, DataIdentifierAlreadyExists, InvalidType, DataIdentifierNotFound, \
     Duplicate, InvalidPath, ResourceTemporaryUnavailable, RSENotFound, ReplicaNotFound, InvalidObject, ScopeNotFound, ReplicaIsLocked
-from rucio.common.utils import parse_response, APIEncoder, render_json_list
+from rucio.common.utils import parse_response, render_json_list
 from rucio.core.replica_sorter import sort_replicas
 from rucio.db.sqla.constants import BadFilesStatus
 from rucio.web.rest.flaskapi.v1.common import check_accept_header_wrapper_flask, try_stream, parse_scope_name, \
-    request_auth_env, response_headers, generate_http_error_flask, ErrorHandlingMethodView, json_parameters, param_get
+    request_auth_env, response_headers, generate_http_error_flask, ErrorHandlingMethodView, json_parameters, param_get, \
+    buffered_stream, json_stream, STREAM_JSON_ENCODER
+
+METALINK_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
+METALINK_FOOTER = '</metalink>\n'
+
+
+def metalink_file(rfile, client_location, policy_schema, select=None, limit=None):
+    """
+    Renders the metalink file element of a replica listed by list_replicas with pfns.
+
+    :param rfile: the file, as returned by list_replicas.
+    :param client_location: the location of the client, to sort the replicas.
+    :param policy_schema: the policy schema, prefix of the glfn.
+    :param select: the sorting of the wan replicas, see sort_replicas.
+    :param limit: the maximum number of urls.
+    :returns: the element as one string.
+    """
+    dictreplica = {}
+    for replica in rfile['pfns'].keys():
+        dictreplica[replica] = (rfile['pfns'][replica]['domain'],
+                                rfile['pfns'][replica]['priority'],
+                                rfile['pfns'][replica]['rse'],
+                                rfile['pfns'][replica]['client_extract'])
+
+    out = [' <file name="', rfile['name'], '">\n']
+
+    if 'parents' in rfile and rfile['parents']:
+        out.append('  <parents>\n')
+        for parent in rfile['parents']:
+            out += ['   <did>', parent, '</did>\n']
+        out.append('  </parents>\n')
+
+    out += ['  <identity>', rfile['scope'], ':', rfile['name'], '</identity>\n']
+    if rfile['adler32'] is not None:
+        out += ['  <hash type="adler32">', rfile['adler32'], '</hash>\n']
+    if rfile['md5'] is not None:
+        out += ['  <hash type="md5">', rfile['md5'], '</hash>\n']
+    out += ['  <size>', str(rfile['bytes']), '</size>\n',
+            '  <glfn name="/', policy_schema, '/rucio/', rfile['scope'], ':', rfile['name'], '"></glfn>\n']
+
+    lanreplicas = [replica for replica, v in dictreplica.items() if v[0] == 'lan']
+    # sort lan by priority
+    lanreplicas.sort(key=lambda rep: dictreplica[rep][1])
+    replicas = lanreplicas + sort_replicas({k: v for k, v in dictreplica.items() if v[0] != 'lan'}, client_location, selection=select)
+
+    for idx, replica in enumerate(replicas, start=1):
+        out += ['  <url location="', str(dictreplica[replica][2]),
+                '" domain="', str(dictreplica[replica][0]),
+                '" priority="', str(idx),
+                '" client_extract="', str(dictreplica[replica][3]).lower(),
+                '">', escape(replica), '</url>\n']
+        if limit and limit == idx:
+            break
+    out.append(' </file>\n')
+    return ''.join(out)
 
 
 class Replicas(ErrorHandlingMethodView):
@@ -102,7 +157,7 @@ class Replicas(ErrorHandlingMethodView):
                 for rfile in list_replicas(dids=dids, schemes=schemes, vo=vo):
                     if first and metalink:
                         # first, set the appropriate content type, and stream the header
-                        yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
+                        yield METALINK_HEADER
                         first = False
 
                     replicas = []
@@ -139,12 +194,12 @@ class Replicas(ErrorHandlingMethodView):
                 if metalink:
                     if first:
                         # if still first output, i.e. there were no replicas
-                        yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n</metalink>\n'
+                        yield METALINK_HEADER + METALINK_FOOTER
                     else:
                         # don't forget to send the metalink footer
-                        yield '</metalink>\n'
+                        yield METALINK_FOOTER
 
-            return try_stream(generate(vo=request.environ.get('vo')), content_type=content_type)
+            return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))), content_type=content_type)
         except DataIdentifierNotFound as error:
             return generate_http_error_flask(404, error)
 
@@ -338,6 +393,8 @@ class ListReplicas(ErrorHandlingMethodView):
                 # we need to call list_replicas before starting to reply
                 # otherwise the exceptions won't be propagated correctly
                 first = metalink
+                encode = STREAM_JSON_ENCODER.encode
+                policy_schema = config_get('policy', 'schema', raise_exception=False, default='generic')
 
                 for rfile in list_replicas(dids=dids, schemes=schemes,
                                            unavailable=unavailable,
@@ -356,65 +413,25 @@ class ListReplicas(ErrorHandlingMethodView):
 
                     # in first round, set the appropriate content type, and stream the header
                     if first and metalink:
-                        yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
+                        yield METALINK_HEADER
                     first = False
 
                     if not metalink:
-                        yield dumps(rfile, cls=APIEncoder) + '\n'
+                        yield encode(rfile) + '\n'
                     else:
-                        replicas = []
-                        dictreplica = {}
-                        for replica in rfile['pfns'].keys():
-                            replicas.append(replica)
-                            dictreplica[replica] = (rfile['pfns'][replica]['domain'],
-                                                    rfile['pfns'][replica]['priority'],
-                                                    rfile['pfns'][replica]['rse'],
-                                                    rfile['pfns'][replica]['client_extract'])
-
-                        yield ' <file name="' + rfile['name'] + '">\n'
-
-                        if 'parents' in rfile and rfile['parents']:
-                            yield '  <parents>\n'
-                            for parent in rfile['parents']:
-                                yield '   <did>' + parent + '</did>\n'
-                            yield '  </parents>\n'
-
-                        yield '  <identity>' + rfile['scope'] + ':' + rfile['name'] + '</identity>\n'
-                        if rfile['adler32'] is not None:
-                            yield '  <hash type="adler32">' + rfile['adler32'] + '</hash>\n'
-                        if rfile['md5'] is not None:
-                            yield '  <hash type="md5">' + rfile['md5'] + '</hash>\n'
-                        yield '  <size>' + str(rfile['bytes']) + '</size>\n'
-
-                        policy_schema = config_get('policy', 'schema', raise_exception=False, default='generic')
-                        yield f'  <glfn name="/{policy_schema}/rucio/{rfile["scope"]}:{rfile["name"]}"></glfn>\n'
-
-                        lanreplicas = [replica for replica, v in dictreplica.items() if v[0] == 'lan']
-                        # sort lan by priority
-                        lanreplicas.sort(key=lambda rep: dictreplica[rep][1])
-                        replicas = lanreplicas + sort_replicas({k: v for k, v in dictreplica.items() if v[0] != 'lan'}, client_location, selection=select)
-
-                        for idx, replica in enumerate(replicas, start=1):
-                            yield '  <url location="' + str(dictreplica[replica][2]) \
-                                + '" domain="' + str(dictreplica[replica][0]) \
-                                + '" priority="' + str(idx) \
-                                + '" client_extract="' + str(dictreplica[replica][3]).lower() \
-                                + '">' + escape(replica) + '</url>\n'
-                            if limit and limit == idx:
-                                break
-                        yield ' </file>\n'
+                        yield metalink_file(rfile, client_location, policy_schema, select=select, limit=limit)
 
                 if metalink:
                     if first:
                         # if still first output, i.e. there were no replicas
-                        yield '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n</metalink>\n'
+                        yield METALINK_HEADER + METALINK_FOOTER
                     else:
                         # don't forget to send the metalink footer
-                        yield '</metalink>\n'
+                        yield METALINK_FOOTER
 
-            return try_stream(generate(request_id=request.environ.get('request_id'),
-                                       issuer=request.environ.get('issuer'),
-                                       vo=request.environ.get('vo')),
+            return try_stream(buffered_stream(generate(request_id=request.environ.get('request_id'),
+                                                       issuer=request.environ.get('issuer'),
+                                                       vo=request.environ.get('vo'))),
                               content_type=content_type)
         except InvalidObject as error:
             return generate_http_error_flask(400, error)
@@ -448,7 +465,7 @@ class ReplicasDIDs(ErrorHandlingMethodView):
                 for pfn in get_did_from_pfns(pfns, rse, vo=vo):
                     yield dumps(pfn) + '\n'
 
-            return try_stream(generate(vo=request.environ.get('vo')))
+            return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))))
         except AccessDenied as error:
             return generate_http_error_flask(401, error)
 
@@ -588,12 +605,11 @@ class BadReplicasStates(ErrorHandlingMethodView):
                 list_pfns = bool(params['list_pfns'][0])
 
         def generate(vo):
-            for row in list_bad_replicas_status(state=state, rse=rse, younger_than=younger_than,
-                                                older_than=older_than, limit=limit, list_pfns=list_pfns,
-                                                vo=vo):
-                yield dumps(row, cls=APIEncoder) + '\n'
+            yield from json_stream(list_bad_replicas_status(state=state, rse=rse, younger_than=younger_than,
+                                                            older_than=older_than, limit=limit, list_pfns=list_pfns,
+                                                            vo=vo))
 
-        return try_stream(generate(vo=request.environ.get('vo')))
+        return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))))
 
 
 class BadReplicasSummary(ErrorHandlingMethodView):
@@ -629,11 +645,10 @@ class BadReplicasSummary(ErrorHandlingMethodView):
                 to_date = datetime.strptime(params['to_date'][0], "%Y-%m-%d")
 
         def generate(vo):
-            for row in get_bad_replicas_summary(rse_expression=rse_expression, from_date=from_date,
-                                                to_date=to_date, vo=vo):
-                yield dumps(row, cls=APIEncoder) + '\n'
+            yield from json_stream(get_bad_replicas_summary(rse_expression=rse_expression, from_date=from_date,
+                                                            to_date=to_date, vo=vo))
 
-        return try_stream(generate(vo=request.environ.get('vo')))
+        return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))))
 
 
 class DatasetReplicas(ErrorHandlingMethodView):
@@ -657,12 +672,11 @@ class DatasetReplicas(ErrorHandlingMethodView):
             scope, name = parse_scope_name(scope_name, request.environ.get('vo'))
 
             def generate(_deep, vo):
-                for row in list_dataset_replicas(scope=scope, name=name, deep=_deep, vo=vo):
-                    yield dumps(row, cls=APIEncoder) + '\n'
+                yield from json_stream(list_dataset_replicas(scope=scope, name=name, deep=_deep, vo=vo))
 
             deep = request.args.get('deep', default=False)
 
-            return try_stream(generate(_deep=deep, vo=request.environ.get('vo')))
+            return try_stream(buffered_stream(generate(_deep=deep, vo=request.environ.get('vo'))))
         except ValueError as error:
             return generate_http_error_flask(400, error)
 
@@ -691,10 +705,9 @@ class DatasetReplicasBulk(ErrorHandlingMethodView):
 
         try:
             def generate(vo):
-                for row in list_dataset_replicas_bulk(dids=dids, vo=vo):
-                    yield dumps(row, cls=APIEncoder) + '\n'
+                yield from json_stream(list_dataset_replicas_bulk(dids=dids, vo=vo))
 
-            return try_stream(generate(vo=request.environ.get('vo')))
+            return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))))
         except InvalidObject as error:
             return generate_http_error_flask(400, error, f'Cannot validate DIDs: {error}')
 
@@ -721,12 +734,11 @@ class DatasetReplicasVP(ErrorHandlingMethodView):
             scope, name = parse_scope_name(scope_name, request.environ.get('vo'))
 
             def generate(_deep, vo):
-                for row in list_dataset_replicas_vp(scope=scope, name=name, deep=_deep, vo=vo):
-                    yield dumps(row, cls=APIEncoder) + '\n'
+                yield from json_stream(list_dataset_replicas_vp(scope=scope, name=name, deep=_deep, vo=vo))
 
             deep = request.args.get('deep', default=False)
 
-            return try_stream(generate(_deep=deep, vo=request.environ.get('vo')))
+            return try_stream(buffered_stream(generate(_deep=deep, vo=request.environ.get('vo'))))
         except ValueError as error:
             return generate_http_error_flask(400, error)
 
@@ -748,10 +760,9 @@ class ReplicasRSE(ErrorHandlingMethodView):
         """
 
         def generate(vo):
-            for row in list_datasets_per_rse(rse=rse, vo=vo):
-                yield dumps(row, cls=APIEncoder) + '\n'
+            yield from json_stream(list_datasets_per_rse(rse=rse, vo=vo))
 
-        return try_stream(generate(vo=request.environ.get('vo')))
+        return try_stream(buffered_stream(generate(vo=request.environ.get('vo'))))
 
 
 class BadDIDs(ErrorHandlingMethodView):
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of rucio.core.replica.list_replicas.
+
+Fills the configured database with one dataset of --files files, each with a
+replica on --rses RSEs, and measures the replica rows per second listed by
+list_replicas. On SQLite the time is dominated by the per-row work of
+list_replicas in Python (protocol lookups and pfn resolution), it does not tell
+how the queries perform on Oracle, MySQL or PostgreSQL.
+
+The fixture is never removed, so the benchmark is meant to be run against a
+throw-away database, e.g. the SQLite one of the unit tests
+(tools/reset_database.py).
+"""
+
+import os.path
+import sys
+import time
+base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_path)
+os.chdir(base_path)
+
+from argparse import ArgumentParser  # noqa: E402
+
+from rucio.common.config import config_get  # noqa: E402
+from rucio.common.types import InternalAccount, InternalScope  # noqa: E402
+from rucio.common.utils import generate_uuid  # noqa: E402
+from rucio.core.did import add_did  # noqa: E402
+from rucio.core.replica import list_replicas  # noqa: E402
+from rucio.core.rse import add_protocol, add_rse  # noqa: E402
+from rucio.core.scope import add_scope  # noqa: E402
+from rucio.db.sqla import models  # noqa: E402
+from rucio.db.sqla.constants import DIDType, ReplicaState  # noqa: E402
+from rucio.db.sqla.session import get_session  # noqa: E402
+
+
+def create_fixture(files, rses, chunk_size, vo='def'):
+    """
+    Create the dataset and its replicas with bulk inserts.
+
+    :param files:       Number of files in the dataset.
+    :param rses:        Number of RSEs with a replica of every file.
+    :param chunk_size:  Number of rows per insert.
+    :param vo:          The VO.
+    :returns:           The dataset DID.
+    """
+    account = InternalAccount('root', vo=vo)
+    scope = InternalScope('bench_%s' % generate_uuid()[:8], vo=vo)
+    add_scope(scope, account)
+    dataset = 'dataset_%s' % generate_uuid()
+    add_did(scope=scope, name=dataset, type=DIDType.DATASET, account=account)
+
+    rse_ids = []
+    for _ in range(rses):
+        rse_id = add_rse('BENCH_%s' % generate_uuid()[:8].upper(), vo=vo)
+        add_protocol(rse_id, {'scheme': 'root',
+                              'hostname': 'root.bench.example.com',
+                              'port': 1094,
+                              'prefix': '//bench/',
+                              'impl': 'rucio.rse.protocols.xrootd.Default',
+                              'domains': {'lan': {'read': 1, 'write': 1, 'delete': 1},
+                                          'wan': {'read': 1, 'write': 1, 'delete': 1}}})
+        rse_ids.append(rse_id)
+
+    session = get_session()
+    for start in range(0, files, chunk_size):
+        names = ['file_%09d' % i for i in range(start, min(start + chunk_size, files))]
+        session.bulk_insert_mappings(models.DataIdentifier, [{'scope': scope, 'name': name, 'account': account, 'did_type': DIDType.FILE,
+                                                              'bytes': 1, 'adler32': '0cc737eb'} for name in names])
+        session.bulk_insert_mappings(models.DataIdentifierAssociation, [{'scope': scope, 'name': dataset, 'child_scope': scope, 'child_name': name,
+                                                                         'did_type': DIDType.DATASET, 'child_type': DIDType.FILE,
+                                                                         'bytes': 1, 'adler32': '0cc737eb'} for name in names])
+        for rse_id in rse_ids:
+            session.bulk_insert_mappings(models.RSEFileAssociation, [{'rse_id': rse_id, 'scope': scope, 'name': name, 'bytes': 1,
+                                                                      'adler32': '0cc737eb', 'state': ReplicaState.AVAILABLE} for name in names])
+        session.commit()
+    session.close()
+    return {'scope': scope, 'name': dataset}
+
+
+def run_benchmark(did, show_pfns, domain):
+    """
+    List the replicas of the dataset.
+
+    :param did:        The dataset DID.
+    :param show_pfns:  If set, the pfns are resolved.
+    :param domain:     The network domain for the call.
+    :returns:          (number of files, number of replica rows, seconds)
+    """
+    nfiles, nrows = 0, 0
+    start = time.time()
+    for replica in list_replicas(dids=[did], pfns=show_pfns, domain=domain):
+        nfiles += 1
+        nrows += len(replica['states'])
+    return nfiles, nrows, time.time() - start
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Benchmark of the replica listing of the server.')
+    parser.add_argument('--files', type=int, default=1000000, help='Number of files in the dataset')
+    parser.add_argument('--rses', type=int, default=1, help='Number of replicas per file')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Number of rows per insert when creating the fixture')
+    parser.add_argument('--no-pfns', action='store_true', default=False, help='Do not resolve the pfns')
+    parser.add_argument('--domain', default=None, help='Network domain: wan, lan or all. Default is the automatic selection')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of listings')
+    parser.add_argument('--force', action='store_true', default=False, help='Also run against a throw-away database which is not SQLite')
+    args = parser.parse_args()
+
+    if not config_get('database', 'default').startswith('sqlite') and not args.force:
+        print('The configured database is not SQLite. The fixture is never removed, so only run against a throw-away database. Use --force to run anyway.')
+        sys.exit(1)
+
+    start = time.time()
+    did = create_fixture(files=args.files, rses=args.rses, chunk_size=args.chunk_size)
+    print('Created %d replicas of %d files in %.1f seconds' % (args.files * args.rses, args.files, time.time() - start))
+
+    for iteration in range(args.repeat):
+        nfiles, nrows, duration = run_benchmark(did, show_pfns=not args.no_pfns, domain=args.domain)
+        print('Run %d: listed %d replicas of %d files in %.1f seconds, %.0f rows/s' % (iteration + 1, nrows, nfiles, duration, nrows / duration))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2021 CERN
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the streaming serializers of the replica listing endpoints.
+
+Serializes --files synthetic replicas, as returned by list_replicas, to the
+JSON stream and to metalink, once as the endpoints did before, with one
+string per row or per metalink tag, and once through the buffered stream of
+the web tier. Reports the files per second and the
+number of chunks handed to the WSGI server. No database is needed.
+"""
+
+import os.path
+import sys
+import time
+base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(base_path)
+os.chdir(base_path)
+
+from argparse import ArgumentParser  # noqa: E402
+from json import dumps  # noqa: E402
+from xml.sax.saxutils import escape  # noqa: E402
+
+from rucio.common.config import config_get  # noqa: E402
+from rucio.common.utils import APIEncoder  # noqa: E402
+from rucio.core.replica_sorter import sort_replicas  # noqa: E402
+from rucio.web.rest.flaskapi.v1.common import buffered_stream, json_stream  # noqa: E402
+from rucio.web.rest.flaskapi.v1.replicas import metalink_file, METALINK_HEADER, METALINK_FOOTER  # noqa: E402
+
+
+def create_files(files, rses):
+    """
+    Create the synthetic replicas.
+
+    :param files:  Number of files.
+    :param rses:   Number of replicas per file.
+    :returns:      List of dictionaries as returned by list_replicas.
+    """
+    rfiles = []
+    for i in range(files):
+        name = 'file_%09d' % i
+        pfns = {}
+        for j in range(rses):
+            pfn = 'root://storage%d.example.com:1094//rucio/bench/%s' % (j, name)
+            pfns[pfn] = {'domain': 'lan', 'priority': j + 1, 'rse': 'BENCH_%d' % j, 'rse_id': '%032x' % j,
+                         'type': 'DISK', 'volatile': False, 'client_extract': False}
+        rfiles.append({'scope': 'bench', 'name': name, 'bytes': 1048576, 'adler32': '0cc737eb', 'md5': None,
+                       'pfns': pfns, 'rses': dict((pfn['rse_id'], [url]) for url, pfn in pfns.items()),
+                       'states': dict((pfn['rse_id'], 'AVAILABLE') for pfn in pfns.values())})
+    return rfiles
+
+
+def metalink_stream_per_tag(rfiles):
+    """
+    Metalink document of the replicas, one string per tag, as rendered by
+    the replica listing before metalink_file.
+    """
+    yield METALINK_HEADER
+    for rfile in rfiles:
+        dictreplica = {}
+        for replica in rfile['pfns'].keys():
+            dictreplica[replica] = (rfile['pfns'][replica]['domain'],
+                                    rfile['pfns'][replica]['priority'],
+                                    rfile['pfns'][replica]['rse'],
+                                    rfile['pfns'][replica]['client_extract'])
+
+        yield ' <file name="' + rfile['name'] + '">\n'
+        yield '  <identity>' + rfile['scope'] + ':' + rfile['name'] + '</identity>\n'
+        if rfile['adler32'] is not None:
+            yield '  <hash type="adler32">' + rfile['adler32'] + '</hash>\n'
+        if rfile['md5'] is not None:
+            yield '  <hash type="md5">' + rfile['md5'] + '</hash>\n'
+        yield '  <size>' + str(rfile['bytes']) + '</size>\n'
+
+        policy_schema = config_get('policy', 'schema', raise_exception=False, default='generic')
+        yield f'  <glfn name="/{policy_schema}/rucio/{rfile["scope"]}:{rfile["name"]}"></glfn>\n'
+
+        lanreplicas = [replica for replica, v in dictreplica.items() if v[0] == 'lan']
+        lanreplicas.sort(key=lambda rep: dictreplica[rep][1])
+        replicas = lanreplicas + sort_replicas({k: v for k, v in dictreplica.items() if v[0] != 'lan'}, {}, selection=None)
+
+        for idx, replica in enumerate(replicas, start=1):
+            yield '  <url location="' + str(dictreplica[replica][2]) \
+                + '" domain="' + str(dictreplica[replica][0]) \
+                + '" priority="' + str(idx) \
+                + '" client_extract="' + str(dictreplica[replica][3]).lower() \
+                + '">' + escape(replica) + '</url>\n'
+        yield ' </file>\n'
+    yield METALINK_FOOTER
+
+
+def metalink_stream(rfiles):
+    """
+    Metalink document of the replicas, one string per file.
+    """
+    yield METALINK_HEADER
+    for rfile in rfiles:
+        yield metalink_file(rfile, client_location={}, policy_schema='generic')
+    yield METALINK_FOOTER
+
+
+def run_benchmark(stream):
+    """
+    Consume a stream as the WSGI server would.
+
+    :param stream:  An iterator of strings.
+    :returns:       (number of chunks, number of characters, seconds)
+    """
+    chunks, size = 0, 0
+    start = time.time()
+    for chunk in stream:
+        chunks += 1
+        size += len(chunk.encode())
+    return chunks, size, time.time() - start
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='Benchmark of the streamed serialization of the replica listings.')
+    parser.add_argument('--files', type=int, default=100000, help='Number of files')
+    parser.add_argument('--rses', type=int, default=3, help='Number of replicas per file')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per serializer')
+    args = parser.parse_args()
+
+    rfiles = create_files(files=args.files, rses=args.rses)
+    serializers = [('json, per row', lambda: (dumps(rfile, cls=APIEncoder) + '\n' for rfile in rfiles)),
+                   ('json, buffered', lambda: buffered_stream(json_stream(rfiles))),
+                   ('metalink, per tag', lambda: metalink_stream_per_tag(rfiles)),
+                   ('metalink, buffered', lambda: buffered_stream(metalink_stream(rfiles)))]
+
+    for label, serializer in serializers:
+        for iteration in range(args.repeat):
+            chunks, size, duration = run_benchmark(serializer())
+            print('%s, run %d: %d files in %d chunks, %.1f MB in %.2f seconds, %.0f files/s' % (label, iteration + 1, args.files, chunks, size / 1e6, duration, args.files / duration))